@@ -13,6 +13,7 @@ import emby_handler
 from db_handler import get_db_connection # ★★★ 核心修改：导入新的数据库连接函数
 import moviepilot_handler
 import db_handler
+import task_context
 import constants
 
 logger = logging.getLogger(__name__)
@@ -39,13 +40,13 @@ class ActorSubscriptionProcessor:
         self._quota_warning_logged = False
 
     def signal_stop(self):
-        self._stop_event.set()
+        task_context.stop_event_or(self._stop_event).set()
 
     def is_stop_requested(self) -> bool:
-        return self._stop_event.is_set()
+        return task_context.stop_event_or(self._stop_event).is_set()
 
     def clear_stop_signal(self):
-        self._stop_event.clear()
+        task_context.stop_event_or(self._stop_event).clear()
 
     def close(self):
         logger.trace("ActorSubscriptionProcessor closed.")
@@ -7,6 +7,7 @@ import emby_handler
 import logging
 from db_handler import get_db_connection as get_central_db_connection, get_all_emby_person_ids_from_map, delete_persons_by_emby_ids
 from db_handler import ActorDBManager
+from task_progress import ProgressReporter
 logger = logging.getLogger(__name__)
 
 class UnifiedSyncHandler:
@@ -69,13 +70,12 @@ class UnifiedSyncHandler:
                 cursor = conn.cursor()
                 emby_config_for_upsert = {"url": self.emby_url, "api_key": self.emby_api_key, "user_id": self.emby_user_id}
 
+                reporter = ProgressReporter(update_status_callback, total_from_emby, start=30, end=100)
                 for i, person_emby in enumerate(all_persons_from_emby):
                     if stop_event and stop_event.is_set(): raise InterruptedError("任务在写入阶段被中止")
                     
                     stats["processed"] += 1
-                    if i % 50 == 0 and update_status_callback:
-                        progress = 30 + int((i / total_from_emby) * 70)
-                        update_status_callback(progress, f"同步中 ({i}/{total_from_emby})...")
+                    reporter.update(i, f"同步中 ({i}/{total_from_emby})...")
 
                     emby_pid = str(person_emby.get("Id", "")).strip()
                     person_name = str(person_emby.get("Name", "")).strip()
@@ -15,6 +15,9 @@ import tmdb_handler
 from douban import DoubanApi
 from ai_translator import AITranslator
 from utils import contains_chinese
+from task_checkpoints import TaskCheckpoint, TaskPreempted
+import task_metrics
+import task_context
 
 logger = logging.getLogger(__name__)
 
@@ -403,6 +406,8 @@ def enrich_all_actor_aliases_task(
     - 新增 force_full_update 参数。
     - 深度模式下，将扫描所有含TMDb ID的演员，无视其是否已有IMDb ID。
     - 深度模式下，遇到IMDb ID冲突时，将强制以TMDb数据为准，清除旧记录的IMDb ID。
+    - 检查点：记录当前阶段和本轮开始时间。继续时跳过本轮开始后已更新过的演员（阶段一看 actor_metadata.last_updated_at，
+      阶段二看 last_synced_at），已进入阶段二时直接跳过阶段一。
     """
     task_mode = "(全量)" if force_full_update else "(增量)"
     logger.info(f"--- 开始执行“演员数据补充”计划任务 [{task_mode}] ---")
@@ -417,12 +422,24 @@ def enrich_all_actor_aliases_task(
     SYNC_INTERVAL_DAYS = sync_interval_days
     logger.info(f"  -> 同步冷却时间为 {SYNC_INTERVAL_DAYS} 天。")
 
+    checkpoint = TaskCheckpoint(f"enrich_actor_aliases:{'full' if force_full_update else 'incremental'}")
+    phase = 1
+    stats = {"tmdb_processed": 0, "douban_processed": 0}
+    resume_params = ()
+    if checkpoint.resumed:
+        phase = (checkpoint.cursor or {}).get("phase", 1)
+        stats.update(checkpoint.stats)
+        resume_params = (checkpoint.started_at,)
+        logger.info(f"  -> 从检查点继续：阶段 {phase}，跳过本轮 ({checkpoint.started_at}) 开始后已更新过的演员。")
+
     conn = None
+    douban_api = None
     try:
         with db_handler.get_db_connection() as conn:
             # --- 阶段一：从 TMDb 补充元数据 (并发执行) ---
             logger.info("  -> 阶段一：从 TMDb 补充演员元数据 (IMDb ID, 头像等) ---")
             cursor = conn.cursor()
+            resume_clause = "AND (m.last_updated_at IS NULL OR m.last_updated_at < %s)" if resume_params else ""
             
             # ▼▼▼ 2. 根据 force_full_update 选择不同的SQL查询语句 ▼▼▼
             if force_full_update:
@@ -431,7 +448,7 @@ def enrich_all_actor_aliases_task(
                 sql_find_actors = f"""
                     SELECT p.* FROM person_identity_map p
                     LEFT JOIN actor_metadata m ON p.tmdb_person_id = m.tmdb_id
-                    WHERE p.tmdb_person_id IS NOT NULL
+                    WHERE p.tmdb_person_id IS NOT NULL {resume_clause}
                     ORDER BY m.last_updated_at ASC NULLS FIRST
                 """
             else:
@@ -441,12 +458,16 @@ def enrich_all_actor_aliases_task(
                     SELECT p.* FROM person_identity_map p
                     LEFT JOIN actor_metadata m ON p.tmdb_person_id = m.tmdb_id
                     WHERE p.tmdb_person_id IS NOT NULL AND (p.imdb_id IS NULL OR m.tmdb_id IS NULL OR m.profile_path IS NULL OR m.gender IS NULL OR m.original_name IS NULL)
-                    AND (m.last_updated_at IS NULL OR m.last_updated_at < NOW() - INTERVAL '{sync_interval_days} days')
+                    AND (m.last_updated_at IS NULL OR m.last_updated_at < NOW() - INTERVAL '{sync_interval_days} days') {resume_clause}
                     ORDER BY m.last_updated_at ASC
                 """
             
-            cursor.execute(sql_find_actors)
-            actors_for_tmdb = cursor.fetchall()
+            if phase == 1:
+                cursor.execute(sql_find_actors, resume_params)
+                actors_for_tmdb = cursor.fetchall()
+            else:
+                logger.info("  -> 上次已完成阶段一，直接进入阶段二。")
+                actors_for_tmdb = []
             
             if actors_for_tmdb:
                 total_tmdb = len(actors_for_tmdb)
@@ -475,7 +496,7 @@ def enrich_all_actor_aliases_task(
                     
                     tmdb_success_count, imdb_found_count, metadata_added_count, not_found_count = 0, 0, 0, 0
 
-                    with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_TMDB_WORKERS) as executor:
+                    with task_context.ContextThreadPoolExecutor(max_workers=MAX_TMDB_WORKERS) as executor:
                         future_to_actor = {executor.submit(fetch_tmdb_details_for_actor, dict(actor), tmdb_api_key): actor for actor in chunk}
                         
                         for future in concurrent.futures.as_completed(future_to_actor):
@@ -611,22 +632,29 @@ def enrich_all_actor_aliases_task(
                         except Exception as db_e:
                             logger.error(f"数据库操作失败: {db_e}", exc_info=True)
                             conn.rollback()
-            else:
+
+                    stats["tmdb_processed"] += len(chunk)
+                    task_metrics.record_items(len(chunk))
+                    checkpoint.boundary({"phase": 1}, stats)
+            elif phase == 1:
                 logger.info("  -> 没有需要从 TMDb 补充或清理的演员。")
 
             # --- 阶段二：从 豆瓣 补充 IMDb ID (串行执行) ---
             if (stop_event and stop_event.is_set()) or (time.time() >= end_time): raise InterruptedError("任务中止")
+            phase = 2
+            checkpoint.save({"phase": phase}, stats)
             
             douban_api = DoubanApi()
             logger.info("  -> 阶段二：从 豆瓣 补充 IMDb ID ---")
             cursor = conn.cursor()
+            resume_clause = "AND (last_synced_at IS NULL OR last_synced_at < %s)" if resume_params else ""
             sql_find_douban_needy = f"""
                 SELECT * FROM person_identity_map 
                 WHERE douban_celebrity_id IS NOT NULL AND imdb_id IS NULL AND tmdb_person_id IS NULL
-                AND (last_synced_at IS NULL OR last_synced_at < NOW() - INTERVAL '{SYNC_INTERVAL_DAYS} days')
+                AND (last_synced_at IS NULL OR last_synced_at < NOW() - INTERVAL '{SYNC_INTERVAL_DAYS} days') {resume_clause}
                 ORDER BY last_synced_at ASC
             """
-            cursor.execute(sql_find_douban_needy)
+            cursor.execute(sql_find_douban_needy, resume_params)
             actors_for_douban = cursor.fetchall()
 
             if actors_for_douban:
@@ -638,6 +666,7 @@ def enrich_all_actor_aliases_task(
                     if (stop_event and stop_event.is_set()) or (time.time() >= end_time): break
                     
                     processed_count = i + 1
+                    task_metrics.record_items()
                     actor_map_id = actor['map_id']
                     actor_douban_id = actor['douban_celebrity_id']
                     actor_primary_name = actor['primary_name']
@@ -692,6 +721,8 @@ def enrich_all_actor_aliases_task(
                         if (i + 1) % 50 == 0:
                             logger.info(f"  -> 已处理50条，提交数据库事务...")
                             conn.commit()
+                            stats["douban_processed"] += 50
+                            checkpoint.boundary({"phase": 2}, stats)
 
                     except Exception as e:
                         conn.rollback()
@@ -705,8 +736,17 @@ def enrich_all_actor_aliases_task(
             if douban_api:
                 douban_api.close()
 
+            if (stop_event and stop_event.is_set()) or (time.time() >= end_time):
+                checkpoint.save({"phase": phase}, stats)
+            else:
+                checkpoint.clear()
+
+    except TaskPreempted:
+        if douban_api: douban_api.close()
+        raise
     except InterruptedError:
         logger.info("演员数据补充任务被中止。")
+        checkpoint.save({"phase": phase}, stats)
         # ★★★ 核心修复 5/5：移除 .in_transaction 检查 ★★★
         if conn: conn.rollback()
     except Exception as e:
@@ -4,6 +4,7 @@ import re
 import time
 from typing import Optional, Dict, Any, List
 import logging
+import task_metrics
 
 logger = logging.getLogger(__name__)
 def _safe_json_loads(text: str) -> Optional[Dict]:
@@ -316,6 +317,7 @@ class AITranslator:
         return all_results
     # --- 底层员工：具体实现各种模式和提供商的组合 ---
     # --- OpenAI 员工 ---
+    @task_metrics.counts_api_call(task_metrics.API_AI)
     def _fast_openai(self, texts: List[str]) -> Dict[str, str]:
         if not self.client: return {}
         system_prompt = FAST_MODE_SYSTEM_PROMPT
@@ -337,6 +339,7 @@ class AITranslator:
             logger.error(f"[翻译模式-OpenAI] 翻译时发生错误: {e}", exc_info=True)
             return {}
 
+    @task_metrics.counts_api_call(task_metrics.API_AI)
     def _quality_openai(self, texts: List[str], title: Optional[str], year: Optional[int]) -> Dict[str, str]:
         if not self.client: return {}
         system_prompt = QUALITY_MODE_SYSTEM_PROMPT
@@ -360,6 +363,7 @@ class AITranslator:
             return {}
 
     # --- 智谱AI 员工 ---
+    @task_metrics.counts_api_call(task_metrics.API_AI)
     def _fast_zhipuai(self, texts: List[str]) -> Dict[str, str]:
         if not self.client: return {}
         system_prompt = FAST_MODE_SYSTEM_PROMPT
@@ -380,6 +384,7 @@ class AITranslator:
             logger.error(f"[翻译模式-智谱AI] 翻译时发生错误: {e}", exc_info=True)
             return {}
 
+    @task_metrics.counts_api_call(task_metrics.API_AI)
     def _quality_zhipuai(self, texts: List[str], title: Optional[str], year: Optional[int]) -> Dict[str, str]:
         if not self.client: return {}
         system_prompt = QUALITY_MODE_SYSTEM_PROMPT
@@ -402,6 +407,7 @@ class AITranslator:
             return {}
 
     # --- Gemini 员工 ---
+    @task_metrics.counts_api_call(task_metrics.API_AI)
     def _fast_gemini(self, texts: List[str]) -> Dict[str, str]:
         if not self.client: return {}
         # Gemini的System Prompt需要通过GenerationConfig传递
@@ -432,6 +438,7 @@ class AITranslator:
                 return _safe_json_loads(e.last_response.text) or {}
             return {}
 
+    @task_metrics.counts_api_call(task_metrics.API_AI)
     def _quality_gemini(self, texts: List[str], title: Optional[str], year: Optional[int]) -> Dict[str, str]:
         if not self.client: return {}
         system_prompt = QUALITY_MODE_SYSTEM_PROMPT
@@ -458,6 +465,7 @@ class AITranslator:
             return {}
         
     # ★★★ OpenAI 音译实现 ★★★
+    @task_metrics.counts_api_call(task_metrics.API_AI)
     def _transliterate_openai(self, texts: List[str]) -> Dict[str, str]:
         if not self.client: return {}
         system_prompt = FORCE_TRANSLITERATE_PROMPT
@@ -480,6 +488,7 @@ class AITranslator:
             return {}
 
     # ★★★ 智谱AI 音译实现 ★★★
+    @task_metrics.counts_api_call(task_metrics.API_AI)
     def _transliterate_zhipuai(self, texts: List[str]) -> Dict[str, str]:
         if not self.client: return {}
         system_prompt = FORCE_TRANSLITERATE_PROMPT
@@ -501,6 +510,7 @@ class AITranslator:
             return {}
 
     # ★★★ Gemini 音译实现 ★★★
+    @task_metrics.counts_api_call(task_metrics.API_AI)
     def _transliterate_gemini(self, texts: List[str]) -> Dict[str, str]:
         if not self.client: return {}
         system_prompt = FORCE_TRANSLITERATE_PROMPT
@@ -0,0 +1,66 @@
+# benchmarks/cover_blur_benchmark.py
+"""
+封面背景模糊基准测试：对比 blur_mode='quality'（全分辨率模糊 + float64 混色）与 'fast'（降采样模糊 + uint8 混色）。
+- 输出两种模式的平均耗时与加速比；
+- 以 PSNR 和平均绝对误差衡量输出相似度，低于阈值时以非零状态退出。
+
+用法: python benchmarks/cover_blur_benchmark.py [--images 10] [--repeat 3] [--blur 50] [--min-psnr 32]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+# 直接导入 render_primitives，避免加载整个服务包（数据库、Emby 等依赖）
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'services', 'cover_generator'))
+import render_primitives  # noqa: E402
+from cover_color_benchmark import make_reference_image  # noqa: E402
+
+CANVAS_SIZE = (1920, 1080)
+
+def render_background(image, blur_size, color, color_ratio, mode):
+    bg = render_primitives.blurred_background(image, CANVAS_SIZE, blur_size, mode)
+    return render_primitives.blend_with_color(bg, color, color_ratio, mode)
+
+def psnr(a, b):
+    mse = np.mean((a.astype(np.float64) - b.astype(np.float64)) ** 2)
+    return float('inf') if mse == 0 else 10 * np.log10(255.0 ** 2 / mse)
+
+def main():
+    parser = argparse.ArgumentParser(description="封面背景模糊：quality vs fast")
+    parser.add_argument("--images", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--blur", type=int, default=50, help="blur_size")
+    parser.add_argument("--color-ratio", type=float, default=0.8)
+    parser.add_argument("--min-psnr", type=float, default=32.0, help="允许的最低 PSNR (dB)")
+    args = parser.parse_args()
+
+    timings = {render_primitives.BLUR_MODE_QUALITY: 0.0, render_primitives.BLUR_MODE_FAST: 0.0}
+    worst_psnr, worst_mae = float('inf'), 0.0
+    for seed in range(args.images):
+        image = make_reference_image(seed)
+        color = tuple(int(c) for c in np.random.default_rng(seed).integers(0, 256, size=3))
+        outputs = {}
+        for mode in timings:
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                outputs[mode] = np.asarray(render_background(image, args.blur, color, args.color_ratio, mode))
+            timings[mode] += (time.perf_counter() - start) / args.repeat
+        quality, fast = outputs[render_primitives.BLUR_MODE_QUALITY], outputs[render_primitives.BLUR_MODE_FAST]
+        worst_psnr = min(worst_psnr, psnr(quality, fast))
+        worst_mae = max(worst_mae, float(np.mean(np.abs(quality.astype(np.int16) - fast.astype(np.int16)))))
+
+    quality_ms = timings[render_primitives.BLUR_MODE_QUALITY] / args.images * 1000
+    fast_ms = timings[render_primitives.BLUR_MODE_FAST] / args.images * 1000
+    print(f"画布 {CANVAS_SIZE[0]}x{CANVAS_SIZE[1]}, blur_size={args.blur}, color_ratio={args.color_ratio}, 图片 {args.images} 张")
+    print(f"quality: {quality_ms:.1f} ms / 张")
+    print(f"fast   : {fast_ms:.1f} ms / 张  (加速 {quality_ms / max(fast_ms, 1e-9):.1f}x)")
+    print(f"相似度 : 最差 PSNR {worst_psnr:.2f} dB, 最大平均绝对误差 {worst_mae:.2f} / 255")
+    if worst_psnr < args.min_psnr:
+        print(f"PSNR 低于阈值 {args.min_psnr} dB。")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
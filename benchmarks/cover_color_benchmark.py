@@ -0,0 +1,166 @@
+# benchmarks/cover_color_benchmark.py
+"""
+封面取色基准测试：对比原逐像素实现（list(getdata()) + Counter + colorsys）与 color_utils 的向量化实现。
+- 在一组可复现的合成海报上校验两者输出完全一致；
+- 输出每种实现的平均耗时与加速比。
+
+用法: python benchmarks/cover_color_benchmark.py [--images 20] [--repeat 5]
+"""
+import argparse
+import colorsys
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+
+import numpy as np
+from PIL import Image
+
+# 直接导入 styles 目录下的 color_utils，避免加载整个服务包（数据库、Emby 等依赖）
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'services', 'cover_generator', 'styles'))
+import color_utils  # noqa: E402
+
+# ========== 原实现（作为参考基准） ==========
+def _is_not_black_white_gray_near(color, threshold=20):
+    r, g, b = color
+    if (r < threshold and g < threshold and b < threshold) or \
+       (r > 255 - threshold and g > 255 - threshold and b > 255 - threshold):
+        return False
+    gray_diff_threshold = 10
+    if abs(r - g) < gray_diff_threshold and abs(g - b) < gray_diff_threshold and abs(r - b) < gray_diff_threshold:
+        return False
+    return True
+
+def _rgb_to_hsv(color):
+    r, g, b = [x / 255.0 for x in color]
+    return colorsys.rgb_to_hsv(r, g, b)
+
+def _hsv_to_rgb(h, s, v):
+    r, g, b = colorsys.hsv_to_rgb(h, s, v)
+    return (int(r * 255), int(g * 255), int(b * 255))
+
+def legacy_find_dominant_vibrant_colors(image, num_colors=5):
+    img = image.copy()
+    img.thumbnail((100, 100))
+    img = img.convert('RGB')
+    pixels = list(img.getdata())
+    filtered_pixels = [p for p in pixels if _is_not_black_white_gray_near(p)]
+    if not filtered_pixels: return []
+    dominant_colors = Counter(filtered_pixels).most_common(num_colors * 3)
+    macaron_colors = []
+    seen_hues = set()
+    for color, count in dominant_colors:
+        h, s, v = _rgb_to_hsv(color)
+        adjusted_s = min(max(s, 0.2), 0.7)
+        adjusted_v = min(max(v, 0.55), 0.85)
+        adjusted_rgb = _hsv_to_rgb(h, adjusted_s, adjusted_v)
+        hue_degree = int(h * 360)
+        is_similar_hue = any(abs(hue_degree - seen) < 15 for seen in seen_hues)
+        if not is_similar_hue and adjusted_rgb not in macaron_colors:
+            macaron_colors.append(adjusted_rgb)
+            seen_hues.add(hue_degree)
+            if len(macaron_colors) >= num_colors: break
+    return macaron_colors
+
+def _adjust_color_macaron(color):
+    h, s, v = _rgb_to_hsv(color)
+    s = min(max(s, 0.3), 0.7)
+    v = min(max(v, 0.6), 0.85)
+    return _hsv_to_rgb(h, s, v)
+
+def _color_distance(color1, color2):
+    h1, s1, v1 = _rgb_to_hsv(color1)
+    h2, s2, v2 = _rgb_to_hsv(color2)
+    h_dist = min(abs(h1 - h2), 1 - abs(h1 - h2))
+    return h_dist * 5 + abs(s1 - s2) + abs(v1 - v2)
+
+def legacy_find_dominant_macaron_colors(image, num_colors=5):
+    img = image.copy()
+    img.thumbnail((150, 150))
+    img = img.convert('RGB')
+    pixels = list(img.getdata())
+    filtered_pixels = [p for p in pixels if _is_not_black_white_gray_near(p)]
+    if not filtered_pixels: return []
+    candidate_colors = Counter(filtered_pixels).most_common(num_colors * 5)
+    macaron_colors = []
+    for color, _ in candidate_colors:
+        adjusted_color = _adjust_color_macaron(color)
+        if not any(_color_distance(adjusted_color, existing) < 0.15 for existing in macaron_colors):
+            macaron_colors.append(adjusted_color)
+            if len(macaron_colors) >= num_colors: break
+    return macaron_colors
+
+def legacy_poster_primary_colors(image_path):
+    img = Image.open(image_path).resize((100, 150), Image.LANCZOS).convert('RGBA')
+    pixels = list(img.getdata())
+    filtered_pixels = [(r, g, b, 255) for r, g, b, a in pixels if a > 200 and not (r < 30 and g < 30 and b < 30) and not (r > 220 and g > 220 and b > 220)]
+    if not filtered_pixels: filtered_pixels = [(p[0], p[1], p[2], 255) for p in pixels if p[3] > 100]
+    if not filtered_pixels: return [(150, 100, 50, 255)]
+    return Counter(filtered_pixels).most_common(10)
+
+# ========== 合成参考图 ==========
+def make_reference_image(seed, size=(1000, 1500)):
+    """生成可复现的“海报”：渐变底色 + 若干纯色块 + 噪声，既有大量重复色也有长尾颜色。"""
+    rng = np.random.default_rng(seed)
+    width, height = size
+    base = rng.integers(0, 256, size=3)
+    tint = rng.integers(0, 256, size=3)
+    y = np.linspace(0.0, 1.0, height)[:, None, None]
+    img = (base * (1 - y) + tint * y).repeat(width, axis=1)
+    for _ in range(rng.integers(3, 8)):
+        x0, y0 = rng.integers(0, width - 50), rng.integers(0, height - 50)
+        w, h = rng.integers(50, width // 2), rng.integers(50, height // 3)
+        img[y0:y0 + h, x0:x0 + w] = rng.integers(0, 256, size=3)
+    img += rng.normal(0, rng.uniform(0, 12), img.shape)
+    return Image.fromarray(np.clip(img, 0, 255).astype(np.uint8), 'RGB')
+
+def _time(func, args, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func(*args)
+    return (time.perf_counter() - start) / repeat, result
+
+def main():
+    parser = argparse.ArgumentParser(description="封面取色：原实现 vs 向量化实现")
+    parser.add_argument("--images", type=int, default=20, help="参考图数量")
+    parser.add_argument("--repeat", type=int, default=5, help="每张图重复次数")
+    args = parser.parse_args()
+
+    cases = [
+        ("find_dominant_vibrant_colors", legacy_find_dominant_vibrant_colors, color_utils.find_dominant_vibrant_colors, False),
+        ("find_dominant_macaron_colors", legacy_find_dominant_macaron_colors, color_utils.find_dominant_macaron_colors, False),
+        ("poster_primary_colors", legacy_poster_primary_colors, color_utils.poster_primary_colors, True),
+    ]
+    totals = {name: [0.0, 0.0] for name, *_ in cases}
+    kmeans_time = 0.0
+    mismatches = 0
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for seed in range(args.images):
+            image = make_reference_image(seed)
+            image_path = os.path.join(tmp_dir, f"{seed}.png")
+            image.save(image_path)
+            for name, legacy, vectorised, takes_path in cases:
+                call_args = (image_path,) if takes_path else (image,)
+                legacy_time, legacy_result = _time(legacy, call_args, args.repeat)
+                new_time, new_result = _time(vectorised, call_args, args.repeat)
+                totals[name][0] += legacy_time
+                totals[name][1] += new_time
+                if legacy_result != new_result:
+                    mismatches += 1
+                    print(f"[不一致] 图 {seed} / {name}:\n  原实现: {legacy_result}\n  向量化: {new_result}")
+            kmeans_time += _time(lambda img: color_utils.find_dominant_vibrant_colors(img, palette_mode=color_utils.PALETTE_MODE_KMEANS), (image,), args.repeat)[0]
+
+    print(f"{'函数':<32}{'原实现(ms)':>12}{'向量化(ms)':>12}{'加速比':>10}")
+    for name, (legacy_total, new_total) in totals.items():
+        legacy_ms = legacy_total / args.images * 1000
+        new_ms = new_total / args.images * 1000
+        print(f"{name:<32}{legacy_ms:>12.2f}{new_ms:>12.2f}{legacy_ms / max(new_ms, 1e-9):>9.1f}x")
+    print(f"{'vibrant (kmeans 调色板)':<32}{'-':>12}{kmeans_time / args.images * 1000:>12.2f}")
+    if mismatches:
+        print(f"共 {mismatches} 处结果不一致。")
+        sys.exit(1)
+    print("所有参考图的取色结果与原实现一致。")
+
+if __name__ == "__main__":
+    main()
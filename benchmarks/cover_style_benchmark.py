@@ -0,0 +1,237 @@
+# benchmarks/cover_style_benchmark.py
+"""
+封面风格基准测试与回归校验（可离线运行）。
+
+- 在仓库自带的固定海报 benchmarks/fixtures/（poster.jpg 与 multi/1..9.jpg）和 fonts/ 上
+  渲染 create_style_single_1 / create_style_single_2 / create_style_multi_1；
+- 统计各阶段耗时：open / fit / blur / composite / text / encode（其余计入 other），以及峰值内存；
+- 与 benchmarks/golden/ 下的基准图比较（灰度 SSIM），低于容差时以非零状态退出；
+  基准图按 GOLDEN_WIDTH 缩小后保存和比较，控制仓库体积；
+  夹具或基准图缺失时同样以非零状态退出，不会静默跳过校验。
+
+用法:
+    python benchmarks/cover_style_benchmark.py                    # 计时 + 与基准图比较
+    python benchmarks/cover_style_benchmark.py --update-golden    # 重新生成基准图（确认改动符合预期后使用）
+    python benchmarks/cover_style_benchmark.py --update-fixtures  # 重新生成夹具海报（按种子合成，之后需更新基准图）
+    python benchmarks/cover_style_benchmark.py --styles multi_1 --repeat 5 --config blur_mode=quality
+"""
+import argparse
+import base64
+import io
+import os
+import random
+import resource
+import sys
+import time
+import tracemalloc
+import types
+from collections import defaultdict
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageOps
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+COVER_PKG_DIR = os.path.join(REPO_ROOT, 'services', 'cover_generator')
+GOLDEN_DIR = os.path.join(BENCH_DIR, 'golden')
+FIXTURES_DIR = os.path.join(BENCH_DIR, 'fixtures')
+GOLDEN_WIDTH = 640
+FONTS_DIR = os.path.join(REPO_ROOT, 'fonts')
+
+# 只加载封面风格模块，不执行 services/cover_generator/__init__.py（它依赖数据库与 Emby 配置）
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, BENCH_DIR)
+_pkg = types.ModuleType('services.cover_generator')
+_pkg.__path__ = [COVER_PKG_DIR]
+sys.modules.setdefault('services.cover_generator', _pkg)
+
+from services.cover_generator.styles import style_single_1, style_single_2, style_multi_1  # noqa: E402
+from cover_color_benchmark import make_reference_image  # noqa: E402
+
+TITLE = ("华语电影", "CHINESE MOVIES")
+BASE_CONFIG = {"show_item_count": True, "badge_style": "badge", "badge_size_ratio": 0.12}
+STAGES = ("open", "fit", "blur", "composite", "text", "encode")
+
+# ========== 阶段计时 ==========
+class StageTimer:
+    """包装 PIL / 风格模块中的关键调用，按阶段累计耗时；嵌套调用只计最外层。"""
+    def __init__(self):
+        self.totals = defaultdict(float)
+        self._depth = 0
+        self._patches = []
+
+    def _wrap(self, owner, name, stage):
+        original = getattr(owner, name)
+        timer = self
+
+        def wrapper(*args, **kwargs):
+            if timer._depth:
+                return original(*args, **kwargs)
+            timer._depth += 1
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                timer.totals[stage] += time.perf_counter() - start
+                timer._depth -= 1
+
+        setattr(owner, name, wrapper)
+        self._patches.append((owner, name, original))
+
+    def __enter__(self):
+        self._wrap(Image, 'open', 'open')
+        self._wrap(ImageOps, 'fit', 'fit')
+        self._wrap(Image.Image, 'resize', 'fit')
+        self._wrap(Image.Image, 'filter', 'blur')
+        for name in ('alpha_composite', 'composite', 'blend'):
+            self._wrap(Image, name, 'composite')
+        for name in ('paste', 'rotate'):
+            self._wrap(Image.Image, name, 'composite')
+        for name in ('text', 'textbbox'):
+            self._wrap(ImageDraw.ImageDraw, name, 'text')
+        for module in (style_single_1, style_single_2, style_multi_1):
+            self._wrap(module, 'image_to_base64', 'encode')
+        return self
+
+    def __exit__(self, *exc):
+        for owner, name, original in reversed(self._patches):
+            setattr(owner, name, original)
+        self._patches.clear()
+
+# ========== 夹具 ==========
+def fixture_paths():
+    """single 风格用 poster.jpg，multi_1 用 1..9.jpg 的目录。"""
+    return os.path.join(FIXTURES_DIR, 'poster.jpg'), os.path.join(FIXTURES_DIR, 'multi')
+
+def missing_fixtures():
+    poster_path, multi_dir = fixture_paths()
+    expected = [poster_path] + [os.path.join(multi_dir, f'{index}.jpg') for index in range(1, 10)]
+    return [path for path in expected if not os.path.isfile(path)]
+
+def build_fixtures():
+    """按固定种子合成夹具海报（cover_color_benchmark.make_reference_image），写入 benchmarks/fixtures/。"""
+    poster_path, multi_dir = fixture_paths()
+    os.makedirs(multi_dir, exist_ok=True)
+    make_reference_image(1000, size=(1000, 1500)).save(poster_path, quality=85)
+    for index in range(1, 10):
+        make_reference_image(2000 + index, size=(600, 900)).save(os.path.join(multi_dir, f'{index}.jpg'), quality=85)
+
+def style_cases(poster_path, multi_dir, config):
+    zh_font = os.path.join(FONTS_DIR, 'zh_font.ttf')
+    en_font = os.path.join(FONTS_DIR, 'en_font.ttf')
+    en_font_multi = os.path.join(FONTS_DIR, 'en_font_multi_1.otf')
+    return {
+        'single_1': lambda: style_single_1.create_style_single_1(poster_path, TITLE, (zh_font, en_font), item_count=128, config=config),
+        'single_2': lambda: style_single_2.create_style_single_2(poster_path, TITLE, (zh_font, en_font), item_count=128, config=config),
+        'multi_1': lambda: style_multi_1.create_style_multi_1(multi_dir, TITLE, (zh_font, en_font_multi), is_blur=True, item_count=128, config=config),
+    }
+
+# ========== 相似度 ==========
+def mean_ssim(a, b, block=8):
+    """灰度图按 block×block 不重叠窗口计算的平均 SSIM。"""
+    a = np.asarray(a.convert('L'), dtype=np.float64)
+    b = np.asarray(b.convert('L'), dtype=np.float64)
+    h, w = (a.shape[0] // block) * block, (a.shape[1] // block) * block
+    a = a[:h, :w].reshape(h // block, block, w // block, block).swapaxes(1, 2).reshape(-1, block * block)
+    b = b[:h, :w].reshape(h // block, block, w // block, block).swapaxes(1, 2).reshape(-1, block * block)
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+    mu_a, mu_b = a.mean(axis=1), b.mean(axis=1)
+    var_a, var_b = a.var(axis=1), b.var(axis=1)
+    cov = ((a - mu_a[:, None]) * (b - mu_b[:, None])).mean(axis=1)
+    ssim = ((2 * mu_a * mu_b + c1) * (2 * cov + c2)) / ((mu_a ** 2 + mu_b ** 2 + c1) * (var_a + var_b + c2))
+    return float(ssim.mean())
+
+def decode_output(image_data):
+    return Image.open(io.BytesIO(base64.b64decode(image_data))).convert('RGB')
+
+def golden_view(image):
+    """缩小到 GOLDEN_WIDTH 宽，用于保存基准图和比较。"""
+    height = max(1, round(image.height * GOLDEN_WIDTH / image.width))
+    return image.resize((GOLDEN_WIDTH, height), Image.LANCZOS)
+
+# ========== 主流程 ==========
+def parse_config_overrides(pairs):
+    config = dict(BASE_CONFIG)
+    for pair in pairs or []:
+        key, _, value = pair.partition('=')
+        config[key] = value
+    return config
+
+def run_style(name, render, repeat):
+    timings = []
+    stage_totals = defaultdict(float)
+    tracemalloc.start()
+    output = None
+    for _ in range(repeat):
+        # 风格内部有随机元素（颜色洗牌、胶片颗粒），固定种子保证输出可复现
+        random.seed(0)
+        np.random.seed(0)
+        with StageTimer() as timer:
+            start = time.perf_counter()
+            output = render()
+            timings.append(time.perf_counter() - start)
+        for stage, seconds in timer.totals.items():
+            stage_totals[stage] += seconds
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    if not output:
+        raise RuntimeError(f"风格 {name} 渲染失败")
+    stages = {stage: stage_totals[stage] / repeat for stage in STAGES}
+    stages['other'] = max(0.0, sum(timings) / repeat - sum(stages.values()))
+    return output, min(timings), sum(timings) / repeat, stages, peak
+
+def main():
+    parser = argparse.ArgumentParser(description="封面风格基准测试与回归校验")
+    parser.add_argument("--styles", nargs="*", default=["single_1", "single_2", "multi_1"])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--tolerance", type=float, default=0.97, help="与基准图的最低平均 SSIM")
+    parser.add_argument("--update-golden", action="store_true", help="用本次输出覆盖基准图")
+    parser.add_argument("--update-fixtures", action="store_true", help="重新生成夹具海报")
+    parser.add_argument("--config", nargs="*", help="覆盖风格配置，如 blur_mode=quality palette_mode=kmeans")
+    args = parser.parse_args()
+
+    config = parse_config_overrides(args.config)
+    if args.update_fixtures:
+        build_fixtures()
+        print(f"夹具海报已更新: {FIXTURES_DIR}")
+    missing = missing_fixtures()
+    if missing:
+        print(f"缺少夹具海报: {', '.join(os.path.relpath(path, REPO_ROOT) for path in missing)}，可使用 --update-fixtures 生成。")
+        sys.exit(2)
+    if not args.update_golden:
+        missing = [name for name in args.styles if not os.path.isfile(os.path.join(GOLDEN_DIR, f"{name}.png"))]
+        if missing:
+            print(f"缺少基准图: {', '.join(missing)}，确认输出符合预期后使用 --update-golden 生成。")
+            sys.exit(2)
+
+    failures = 0
+    poster_path, multi_dir = fixture_paths()
+    cases = style_cases(poster_path, multi_dir, config)
+    header = f"{'风格':<10}{'最快(ms)':>10}{'平均(ms)':>10}" + ''.join(f"{s:>11}" for s in STAGES + ('other',)) + f"{'峰值内存(MB)':>14}{'SSIM':>8}"
+    print(header)
+    for name in args.styles:
+        output, best, mean, stages, peak = run_style(name, cases[name], args.repeat)
+        image = golden_view(decode_output(output))
+        golden_path = os.path.join(GOLDEN_DIR, f"{name}.png")
+        similarity = '-'
+        if args.update_golden:
+            os.makedirs(GOLDEN_DIR, exist_ok=True)
+            image.save(golden_path, optimize=True)
+        else:
+            score = mean_ssim(image, Image.open(golden_path))
+            similarity = f"{score:.4f}"
+            if score < args.tolerance:
+                failures += 1
+                image.save(os.path.join(BENCH_DIR, f"{name}.actual.png"))
+        row = f"{name:<10}{best * 1000:>10.1f}{mean * 1000:>10.1f}" + ''.join(f"{stages[s] * 1000:>11.1f}" for s in STAGES + ('other',))
+        print(row + f"{peak / 1024 / 1024:>14.1f}{similarity:>8}")
+
+    print(f"进程峰值 RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MB（Pillow 的图像缓冲区不计入上表的 Python 峰值内存）")
+    if args.update_golden:
+        print(f"基准图已更新: {GOLDEN_DIR}")
+    if failures:
+        print(f"{failures} 个风格与基准图的差异超出容差，实际输出已保存为 benchmarks/<风格>.actual.png。")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -103,6 +103,7 @@ constants.CONFIG_OPTION_EMBY_ADMIN_PASS: (constants.CONFIG_SECTION_EMBY, 'passwo
     constants.CONFIG_OPTION_MIN_SCORE_FOR_REVIEW: ("General", 'float', constants.DEFAULT_MIN_SCORE_FOR_REVIEW),
     constants.CONFIG_OPTION_AUTO_LOCK_CAST: ("General", 'boolean', True),
     constants.CONFIG_OPTION_MAX_ACTORS_TO_PROCESS: ("General", 'int', constants.DEFAULT_MAX_ACTORS_TO_PROCESS),
+    constants.CONFIG_OPTION_CUSTOM_COLLECTION_MAX_WORKERS: ("General", 'int', constants.DEFAULT_CUSTOM_COLLECTION_MAX_WORKERS),
 
     # [Network] 
     constants.CONFIG_OPTION_NETWORK_PROXY_ENABLED: (constants.CONFIG_SECTION_NETWORK, 'boolean', False),
@@ -123,6 +124,10 @@ constants.CONFIG_OPTION_EMBY_ADMIN_PASS: (constants.CONFIG_SECTION_EMBY, 'passwo
     constants.CONFIG_OPTION_TASK_CHAIN_CRON: (constants.CONFIG_SECTION_SCHEDULER, 'string', "0 2 * * *"),
     constants.CONFIG_OPTION_TASK_CHAIN_SEQUENCE: (constants.CONFIG_SECTION_SCHEDULER, 'list', []),
     constants.CONFIG_OPTION_TASK_CHAIN_MAX_RUNTIME_MINUTES: (constants.CONFIG_SECTION_SCHEDULER, 'int', 0),
+    constants.CONFIG_OPTION_TASK_CHAIN_MAX_PARALLEL: (constants.CONFIG_SECTION_SCHEDULER, 'int', 2),
+    constants.CONFIG_OPTION_SCHEDULER_JITTER_SECONDS: (constants.CONFIG_SECTION_SCHEDULER, 'int', 0),
+    constants.CONFIG_OPTION_SCHEDULER_MISFIRE_GRACE_MINUTES: (constants.CONFIG_SECTION_SCHEDULER, 'int', 60),
+    constants.CONFIG_OPTION_SCHEDULER_RUN_WHEN_IDLE: (constants.CONFIG_SECTION_SCHEDULER, 'boolean', False),
     
     # [Actor]
     constants.CONFIG_OPTION_ACTOR_ROLE_ADD_PREFIX: (constants.CONFIG_SECTION_ACTOR, 'boolean', False),
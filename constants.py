@@ -60,6 +60,8 @@ CONFIG_OPTION_MAX_ACTORS_TO_PROCESS = "max_actors_to_process"   # 每个媒体
 DEFAULT_MAX_ACTORS_TO_PROCESS = 50                              # 默认的演员数量上限
 CONFIG_OPTION_MIN_SCORE_FOR_REVIEW = "min_score_for_review"     # 低于此评分的项目将进入手动处理列表
 DEFAULT_MIN_SCORE_FOR_REVIEW = 6.0                              # 默认的最低分
+CONFIG_OPTION_CUSTOM_COLLECTION_MAX_WORKERS = "custom_collection_max_workers" # 批量同步自建合集时的并发数
+DEFAULT_CUSTOM_COLLECTION_MAX_WORKERS = 3                       # 默认同时处理 3 个合集
 
 # ==============================================================================
 # ✨ 外部API与数据源配置 (External APIs & Data Sources)
@@ -122,6 +124,10 @@ CONFIG_OPTION_TASK_CHAIN_ENABLED = "task_chain_enabled"
 CONFIG_OPTION_TASK_CHAIN_CRON = "task_chain_cron"
 CONFIG_OPTION_TASK_CHAIN_SEQUENCE = "task_chain_sequence"
 CONFIG_OPTION_TASK_CHAIN_MAX_RUNTIME_MINUTES = "task_chain_max_runtime_minutes"
+CONFIG_OPTION_TASK_CHAIN_MAX_PARALLEL = "task_chain_max_parallel"
+CONFIG_OPTION_SCHEDULER_JITTER_SECONDS = "scheduler_jitter_seconds"
+CONFIG_OPTION_SCHEDULER_MISFIRE_GRACE_MINUTES = "scheduler_misfire_grace_minutes"
+CONFIG_OPTION_SCHEDULER_RUN_WHEN_IDLE = "scheduler_run_when_idle"
 
 
 # --- 演员前缀 ---
@@ -24,8 +24,14 @@ from ai_translator import AITranslator
 from utils import LogDBManager, get_override_path_for_item, translate_country_list, get_unified_rating
 from watchlist_processor import WatchlistProcessor
 from douban import DoubanApi
+from task_checkpoints import TaskCheckpoint
+from task_progress import ProgressReporter
+import task_metrics
+import task_context
 
 logger = logging.getLogger(__name__)
+# 全量处理每处理多少个项目保存一次检查点
+FULL_SCAN_CHECKPOINT_INTERVAL = 10
 try:
     from douban import DoubanApi
     DOUBAN_API_AVAILABLE = True
@@ -369,18 +375,19 @@ class MediaProcessor:
         except Exception as e_watchlist:
             logger.error(f"  -> 在自动添加 '{item_name_for_log}' 到追剧列表时发生错误: {e_watchlist}", exc_info=True)
 
+    # 停止信号作用于当前任务自己的停止事件（见 task_context），不会影响同时使用本处理器的其它任务
     def signal_stop(self):
-        self._stop_event.set()
+        task_context.stop_event_or(self._stop_event).set()
 
     def clear_stop_signal(self):
-        self._stop_event.clear()
+        task_context.stop_event_or(self._stop_event).clear()
 
     def get_stop_event(self) -> threading.Event:
-        """返回内部的停止事件对象，以便传递给其他函数。"""
-        return self._stop_event
+        """返回当前任务的停止事件对象，以便传递给其他函数。"""
+        return task_context.stop_event_or(self._stop_event)
 
     def is_stop_requested(self) -> bool:
-        return self._stop_event.is_set()
+        return task_context.stop_event_or(self._stop_event).is_set()
 
     def _load_processed_log_from_db(self) -> Dict[str, str]:
         log_dict = {}
@@ -632,10 +639,13 @@ class MediaProcessor:
     # --- 核心处理总管 ---
     def process_single_item(self, emby_item_id: str,
                             force_reprocess_this_item: bool = False,
-                            force_fetch_from_tmdb: bool = False):
+                            force_fetch_from_tmdb: bool = False,
+                            prefetched_details: Optional[Dict[str, Any]] = None):
         """
         【V-API-Ready 最终版 - 带跳过功能】
         这个函数是API模式的入口，它会先检查是否需要跳过已处理的项目。
+        prefetched_details: 调用方已按默认字段获取的 Emby 详情（如 Webhook 批量任务），
+        提供时跳过类型预检；电影直接复用，剧集仍需聚合全部分集演员。
         """
         # 1. 除非强制，否则跳过已处理的
         if not force_reprocess_this_item and emby_item_id in self.processed_items_cache:
@@ -648,12 +658,14 @@ class MediaProcessor:
             return False
 
         # 3. 获取Emby详情，这是后续所有操作的基础
-        item_details_precheck = emby_handler.get_emby_item_details(emby_item_id, self.emby_url, self.emby_api_key, self.emby_user_id, fields="Type")
-        if not item_details_precheck:
-            logger.error(f"process_single_item: 无法获取 Emby 项目 {emby_item_id} 的基础详情。")
-            return False
-
-        item_type = item_details_precheck.get("Type")
+        if prefetched_details and prefetched_details.get("Type"):
+            item_type = prefetched_details.get("Type")
+        else:
+            item_details_precheck = emby_handler.get_emby_item_details(emby_item_id, self.emby_url, self.emby_api_key, self.emby_user_id, fields="Type")
+            if not item_details_precheck:
+                logger.error(f"process_single_item: 无法获取 Emby 项目 {emby_item_id} 的基础详情。")
+                return False
+            item_type = item_details_precheck.get("Type")
         item_details = None
 
         if item_type == "Series":
@@ -664,6 +676,8 @@ class MediaProcessor:
                 emby_api_key=self.emby_api_key,
                 user_id=self.emby_user_id
             )
+        elif prefetched_details and "People" in prefetched_details:
+            item_details = prefetched_details
         else:
             # 如果是电影或其他类型，使用原来的函数
             item_details = emby_handler.get_emby_item_details(
@@ -1685,12 +1699,14 @@ class MediaProcessor:
         """
         【V3 - 最终完整版】
         这是所有全量处理的唯一入口，它自己处理所有与“强制”相关的逻辑。
+        每处理 FULL_SCAN_CHECKPOINT_INTERVAL 个项目保存一次检查点，中断或让位后从检查点继续。
         """
-        self.clear_stop_signal()
-        
         logger.info(f"进入核心执行层: process_full_library, 接收到的 force_reprocess_all = {force_reprocess_all}, force_fetch_from_tmdb = {force_fetch_from_tmdb}")
 
-        if force_reprocess_all:
+        checkpoint = TaskCheckpoint(f"full_scan:{'force' if force_reprocess_all else 'standard'}")
+        if force_reprocess_all and checkpoint.resumed:
+            logger.info("检测到上次未完成的强制重处理，保留已处理日志，从检查点继续...")
+        elif force_reprocess_all:
             logger.info("检测到“强制重处理”选项，正在清空已处理日志...")
             try:
                 self.clear_processed_log()
@@ -1758,10 +1774,30 @@ class MediaProcessor:
         
         if update_status_callback: update_status_callback(30, "已删除媒体项清理完成，开始处理现有媒体...")
 
+        # --- 检查点：定位上次完成的项目，从它之后继续 ---
+        start_index = 0
+        processed_in_run = 0
+        if checkpoint.resumed and isinstance(checkpoint.cursor, dict):
+            last_id = checkpoint.cursor.get("item_id")
+            last_index = next((idx for idx, item in enumerate(all_items) if item.get('Id') == last_id), None)
+            if last_index is None:
+                # 媒体库有变动、找不到上次的项目时，按序号继续
+                last_index = min(int(checkpoint.cursor.get("index", -1)), total - 1)
+            start_index = last_index + 1
+            processed_in_run = checkpoint.stats.get("processed", 0)
+            logger.info(f"从检查点继续全量处理：跳过前 {start_index} 个项目。")
+
         # --- 现有媒体项处理循环 ---
+        last_done = None # 最后一个已完整处理（或跳过）的项目，作为检查点游标
+        # 进度从清理阶段之后的 30% 开始，按时间节流上报（跳过已处理项目时不再逐项刷新状态）
+        reporter = ProgressReporter(update_status_callback, total, start=30, end=100, initial_done=start_index)
         for i, item in enumerate(all_items):
+            if i < start_index:
+                continue
             if self.is_stop_requested():
                 logger.warning("全库扫描任务已被用户中止。")
+                if last_done:
+                    checkpoint.save(last_done, {"processed": processed_in_run})
                 break # 使用 break 优雅地退出循环
             
             item_id = item.get('Id')
@@ -1769,28 +1805,31 @@ class MediaProcessor:
 
             if not force_reprocess_all and item_id in self.processed_items_cache:
                 logger.info(f"正在跳过已处理的项目: {item_name}")
-                if update_status_callback:
-                    # 调整进度条的起始点，使其在清理后从 30% 开始
-                    progress_after_cleanup = 30
-                    current_progress = progress_after_cleanup + int(((i + 1) / total) * (100 - progress_after_cleanup))
-                    update_status_callback(current_progress, f"跳过: {item_name}")
+                reporter.update(i + 1, f"跳过: {item_name}")
+                last_done = {"index": i, "item_id": item_id}
                 continue
 
-            if update_status_callback:
-                progress_after_cleanup = 30
-                current_progress = progress_after_cleanup + int(((i + 1) / total) * (100 - progress_after_cleanup))
-                update_status_callback(current_progress, f"处理中 ({i+1}/{total}): {item_name}")
+            reporter.update(i + 1, f"处理中 ({i+1}/{total}): {item_name}")
             
             self.process_single_item(
                 item_id, 
                 force_reprocess_this_item=force_reprocess_all,
                 force_fetch_from_tmdb=force_fetch_from_tmdb
             )
+            if self.is_stop_requested():
+                # 当前项目可能未处理完，不计入检查点
+                continue
+            last_done = {"index": i, "item_id": item_id}
+            processed_in_run += 1
+            task_metrics.record_items()
+            if processed_in_run % FULL_SCAN_CHECKPOINT_INTERVAL == 0:
+                checkpoint.boundary(last_done, {"processed": processed_in_run})
             
             time_module.sleep(float(self.config.get("delay_between_items_sec", 0.5)))
         
-        if not self.is_stop_requested() and update_status_callback:
-            update_status_callback(100, "全量处理完成")
+        if not self.is_stop_requested():
+            checkpoint.clear()
+            reporter.finish("全量处理完成")
     # --- 一键翻译 ---
     def translate_cast_list_for_editing(self, 
                                     cast_list: List[Dict[str, Any]], 
@@ -2261,7 +2300,8 @@ class MediaProcessor:
                     logger.error(f"处理项目 (ID: {item_id}) 时发生错误: {e}", exc_info=True)
                     return "failed"
 
-            with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
+            reporter = ProgressReporter(update_status_callback, total_to_process, start=30, end=100)
+            with task_context.ContextThreadPoolExecutor(max_workers=5) as executor:
                 future_to_id = {executor.submit(worker_process_item, item_id): item_id for item_id in items_to_process_ids}
 
                 for future in concurrent.futures.as_completed(future_to_id):
@@ -2278,10 +2318,7 @@ class MediaProcessor:
                         elif result == "failed":
                             stats["failed"] += 1
                         
-                        processed_count = sum(stats.values())
-                        progress = 30 + int((processed_count / total_to_process) * 70)
-                        if update_status_callback:
-                            update_status_callback(progress, f"进度: {processed_count}/{total_to_process}")
+                        reporter.update(sum(stats.values()))
 
         except Exception as e:
             logger.error(f"执行 '{task_name}' 时发生严重错误: {e}", exc_info=True)
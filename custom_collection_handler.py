@@ -3,32 +3,95 @@ import logging
 import requests
 import xml.etree.ElementTree as ET
 import re
-import os
-import sys
+import threading
 from typing import List, Dict, Any, Optional, Tuple
 import json
+import hashlib
 from datetime import datetime, timedelta, date
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import as_completed
+from urllib.parse import urlparse
 from bs4 import BeautifulSoup
 
-# ★★★ 核心修正：再次回归 gevent.subprocess ★★★
-from gevent import subprocess, Timeout
-
 import tmdb_handler
+import maoyan_fetcher
 import emby_handler
 import config_manager
 import db_handler 
+import task_context
 from douban import DoubanApi
 from tmdb_handler import search_media, get_tv_details_tmdb
 
 logger = logging.getLogger(__name__)
 
+# ★★★ 按主机的并发礼貌限制：分页并发抓取时，同一主机同时在途的请求数不超过此值 ★★★
+HOST_CONCURRENCY_LIMITS = {
+    'douban.com': 2,
+    'themoviedb.org': 4,
+}
+DEFAULT_HOST_CONCURRENCY = 2
+_host_semaphores: Dict[str, threading.BoundedSemaphore] = {}
+
+# ★★★ 榜单源指纹的有效期：超过后即使源未变化也重新匹配一次标题 ★★★
+# 上次匹配留下了未匹配的标题（可能只是 TMDb 暂时不可用），指纹在较短的时间后失效，重新尝试匹配
+FINGERPRINT_UNMATCHED_RETRY_HOURS = 24
+FINGERPRINT_MAX_AGE_HOURS = 24 * 7
+_host_semaphores_lock = threading.Lock()
+
+def _get_host_semaphore(url: str) -> threading.BoundedSemaphore:
+    """按 URL 的主机名（归并到主域名）返回一个共享的并发信号量。"""
+    host = (urlparse(url).hostname or '').lower()
+    host_key = next((domain for domain in HOST_CONCURRENCY_LIMITS if host == domain or host.endswith('.' + domain)), host)
+    with _host_semaphores_lock:
+        semaphore = _host_semaphores.get(host_key)
+        if semaphore is None:
+            semaphore = threading.BoundedSemaphore(HOST_CONCURRENCY_LIMITS.get(host_key, DEFAULT_HOST_CONCURRENCY))
+            _host_semaphores[host_key] = semaphore
+        return semaphore
+
+
+class SourceFetchCache:
+    """
+    同一次批量任务内共享的榜单源抓取缓存。
+    - 相同 key（通常是源 URL）只会真正抓取一次；
+    - 并发的其它 worker 会等待首个抓取完成，然后直接复用结果；
+    - 首个抓取抛出异常时，等待的 worker 收到同一个异常（与自己抓取失败的行为一致）。
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._events: Dict[Any, threading.Event] = {}
+        self._results: Dict[Any, Any] = {}
+        self._errors: Dict[Any, BaseException] = {}
+
+    def get_or_fetch(self, key, fetch_func):
+        with self._lock:
+            event = self._events.get(key)
+            is_owner = event is None
+            if is_owner:
+                event = threading.Event()
+                self._events[key] = event
+
+        if not is_owner:
+            event.wait()
+            error = self._errors.get(key)
+            if error is not None:
+                raise error
+            logger.debug(f"  -> 复用同一任务内已抓取的榜单源: {key}")
+            return self._results.get(key)
+
+        try:
+            self._results[key] = fetch_func()
+        except BaseException as e:
+            self._errors[key] = e
+            raise
+        finally:
+            event.set()
+        return self._results.get(key)
+
 
 class ListImporter:
     """
-    (V9.1 - 最终异步版)
-    使用 gevent.subprocess，并确保在独立的 greenlet 中运行，
-    从而实现真正的非阻塞异步执行。
+    (V10 - 进程内猫眼版)
+    榜单抓取与 TMDb 匹配均在调用方的 worker 中完成，猫眼榜单直接调用 maoyan_fetcher 的进程内接口。
     """
     
     SEASON_PATTERN = re.compile(r'(.*?)\s*[（(]?\s*(第?[一二三四五六七八九十百]+)\s*季\s*[)）]?')
@@ -42,15 +105,25 @@ class ListImporter:
     }
     VALID_MAOYAN_PLATFORMS = {'tencent', 'iqiyi', 'youku', 'mango'}
 
-    def __init__(self, tmdb_api_key: str):
+    def __init__(self, tmdb_api_key: str, source_cache: Optional[SourceFetchCache] = None):
         self.tmdb_api_key = tmdb_api_key
         self.session = requests.Session()
         self.session.headers.update({'User-Agent': 'Mozilla/5.0'})
+        # 可选：批量任务传入的共享缓存，相同的源 URL 在一次任务内只抓取一次
+        self.source_cache = source_cache
+        # 最近一次 process() 得到的源指纹，以及源内容是否与上次同步时相同
+        self.source_fingerprint: Optional[Dict[str, Any]] = None
+        self.source_unchanged = False
 
-    # ★★★ 核心修改：这个函数现在是纯粹的阻塞执行逻辑 ★★★
     def _execute_maoyan_fetch(self, definition: Dict) -> List[Dict[str, str]]:
+        if self.source_cache is None:
+            return self._execute_maoyan_fetch_uncached(definition)
+        cache_key = ('maoyan', definition.get('url', ''), definition.get('limit') or 50)
+        return list(self.source_cache.get_or_fetch(cache_key, lambda: self._execute_maoyan_fetch_uncached(definition)) or [])
+
+    def _execute_maoyan_fetch_uncached(self, definition: Dict) -> List[Dict[str, str]]:
+        """【V2 - 进程内版】解析猫眼URL，并在当前 worker 中直接调用 maoyan_fetcher（自带结果缓存）。"""
         maoyan_url = definition.get('url', '')
-        temp_output_file = os.path.join(config_manager.PERSISTENT_DATA_PATH, f"maoyan_temp_output_{hash(maoyan_url)}.json")
         
         content_key = maoyan_url.replace('maoyan://', '')
         parts = content_key.split('-')
@@ -72,54 +145,13 @@ class ListImporter:
         if not limit:
             limit = 50
 
-        fetcher_script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'maoyan_fetcher.py')
-        if not os.path.exists(fetcher_script_path):
-            logger.error(f"严重错误：无法找到猫眼获取脚本 '{fetcher_script_path}'。")
-            return []
-
-        command = [
-            sys.executable,
-            fetcher_script_path,
-            '--api-key', self.tmdb_api_key,
-            '--output-file', temp_output_file,
-            '--num', str(limit),
-            '--platform', platform,
-            '--types', *types_to_fetch
-        ]
-        
         try:
-            logger.debug(f"  -> (在一个独立的 Greenlet 中) 执行命令: {' '.join(command)}")
-            
-            result_bytes = subprocess.check_output(
-                command, 
-                stderr=subprocess.STDOUT, 
-                timeout=600
-            )
-            
-            result_output = result_bytes.decode('utf-8', errors='ignore')
-            logger.info("  -> 猫眼获取脚本成功完成。")
-            if result_output:
-                logger.debug(f"  -> 脚本输出:\n{result_output}")
-            
-            with open(temp_output_file, 'r', encoding='utf-8') as f:
-                results = json.load(f)
-            
+            results = maoyan_fetcher.fetch_maoyan_items(types_to_fetch, platform, limit, self.tmdb_api_key)
+            logger.info(f"  -> 猫眼榜单获取完成，共匹配到 {len(results)} 个项目。")
             return results
-
-        except Timeout:
-            logger.error("执行猫眼获取脚本超时（超过10分钟）。")
-            return []
-        except subprocess.CalledProcessError as e:
-            error_output = e.output.decode('utf-8', errors='ignore') if e.output else "No output captured."
-            logger.error(f"执行猫眼获取脚本失败。返回码: {e.returncode}")
-            logger.error(f"  -> 脚本的完整错误输出:\n{error_output}")
-            return []
         except Exception as e:
             logger.error(f"处理猫眼榜单时发生未知错误: {e}", exc_info=True)
             return []
-        finally:
-            if os.path.exists(temp_output_file):
-                os.remove(temp_output_file)
 
     # ... 其他所有方法 (_match_by_ids, process, FilterEngine等) 保持完全不变 ...
     def _match_by_ids(self, imdb_id: Optional[str], tmdb_id: Optional[str], item_type: str) -> Optional[str]:
@@ -150,128 +182,194 @@ class ListImporter:
             tmdb_id = tmdb_match.group(1)
         return imdb_id, tmdb_id
     
-    def _get_items_from_douban_doulist(self, url: str) -> List[Dict[str, str]]:
-        """专门用于解析和分页获取豆瓣豆列内容的函数"""
-        all_items = []
+    def _polite_get(self, url: str, timeout: int = 20) -> requests.Response:
+        """通过共享会话发起请求，并遵守该主机的并发礼貌限制。"""
+        with _get_host_semaphore(url):
+            return self.session.get(url, timeout=timeout)
+
+    def _fetch_pages_concurrently(self, page_numbers: List[int], fetch_page, max_workers: int, on_page=None) -> Dict[int, List[Dict[str, str]]]:
+        """
+        并发获取剩余页面。fetch_page(page) 返回该页解析出的项目列表。
+        每页到达后立即通过 on_page(page, items) 交给调用方（例如匹配器），
+        返回 {页码: 项目列表}，由调用方按页码顺序拼接。
+        """
+        pages_data = {}
+        if not page_numbers:
+            return pages_data
+        with task_context.ContextThreadPoolExecutor(max_workers=max(1, min(max_workers, len(page_numbers)))) as executor:
+            future_to_page = {executor.submit(fetch_page, page): page for page in page_numbers}
+            for future in as_completed(future_to_page):
+                page = future_to_page[future]
+                try:
+                    page_items = future.result() or []
+                except Exception as e:
+                    logger.error(f"    -> 获取第 {page} 页时出错: {e}")
+                    continue
+                pages_data[page] = page_items
+                if on_page and page_items:
+                    on_page(page, page_items)
+        return pages_data
+
+    def _parse_doulist_page(self, html: str) -> Tuple[List[Dict[str, str]], int]:
+        """解析一页豆列，返回 (项目列表, 总页数)。"""
+        soup = BeautifulSoup(html, 'lxml')
+        page_items = []
+        for item in soup.find_all('div', class_='doulist-item'):
+            title_div = item.find('div', class_='title')
+            if not title_div: continue
+            
+            link_tag = title_div.find('a')
+            if not link_tag: continue
+            
+            # 提取标题
+            title = link_tag.get_text(strip=True)
+            # 提取豆瓣链接
+            douban_link = link_tag.get('href')
+            
+            # 尝试提取年份
+            year = None
+            abstract_div = item.find('div', class_='abstract')
+            if abstract_div:
+                # 年份通常在 abstract 内容中以 (YYYY) 或 YYYY-MM-DD 的形式出现
+                year_match = re.search(r'\b(19\d{2}|20\d{2})\b', abstract_div.get_text())
+                if year_match:
+                    year = year_match.group(1)
+            
+            if title:
+                page_items.append({
+                    'title': title,
+                    'imdb_id': None, # 豆列页面不直接提供IMDb ID
+                    'year': year,
+                    'douban_link': douban_link # ✨ 关键信息：我们拿到了每个条目的豆瓣链接
+                })
+
+        # 从分页器中读取总页数：优先使用 data-total-page，其次取页码链接中的最大值
+        total_pages = 1
+        paginator = soup.find('div', class_='paginator')
+        if paginator:
+            this_page = paginator.find('span', class_='thispage')
+            if this_page and str(this_page.get('data-total-page', '')).isdigit():
+                total_pages = int(this_page['data-total-page'])
+            else:
+                page_numbers = [int(a.get_text(strip=True)) for a in paginator.find_all('a') if a.get_text(strip=True).isdigit()]
+                if page_numbers:
+                    total_pages = max(page_numbers)
+        return page_items, total_pages
+
+    def _get_items_from_douban_doulist(self, url: str, on_page=None, max_items: Optional[int] = None) -> List[Dict[str, str]]:
+        """
+        【V2 - 并发分页版】专门用于解析和分页获取豆瓣豆列内容的函数。
+        先获取第一页以得知总页数，再并发获取其余页面（受豆瓣主机并发限制约束）。
+        """
         # 从URL中移除分页参数，得到基础URL
         base_url = url.split('?')[0]
-        page_start = 0
         # 设置一个最大页数限制，防止意外的无限循环
         max_pages = 50 
         items_per_page = 25
 
+        def build_page_url(page: int) -> str:
+            return f"{base_url}?start={(page - 1) * items_per_page}&sort=seq&playable=0&sub_type="
+
+        def fetch_page(page: int) -> List[Dict[str, str]]:
+            paginated_url = build_page_url(page)
+            logger.debug(f"    -> 正在获取第 {page} 页: {paginated_url}")
+            response = self._polite_get(paginated_url)
+            response.raise_for_status()
+            page_items, _ = self._parse_doulist_page(response.text)
+            return page_items
+
         logger.info(f"  -> 检测到豆瓣豆列链接，开始分页获取: {base_url}")
 
-        for page in range(max_pages):
-            current_start = page * items_per_page
-            paginated_url = f"{base_url}?start={current_start}&sort=seq&playable=0&sub_type="
-            
-            try:
-                logger.debug(f"    -> 正在获取第 {page + 1} 页: {paginated_url}")
-                response = self.session.get(paginated_url, timeout=20)
-                response.raise_for_status()
-                
-                soup = BeautifulSoup(response.text, 'lxml')
-                
-                # 查找页面上所有的条目容器
-                doulist_items = soup.find_all('div', class_='doulist-item')
+        try:
+            response = self._polite_get(build_page_url(1))
+            response.raise_for_status()
+            first_page_items, total_pages = self._parse_doulist_page(response.text)
+        except Exception as e:
+            logger.error(f"获取或解析豆瓣豆列首页 '{base_url}' 时出错: {e}")
+            return []
 
-                # 如果当前页没有找到任何条目，说明到达了最后一页
-                if not doulist_items:
-                    logger.info(f"  -> 在第 {page + 1} 页未发现更多项目，获取结束。")
-                    break
+        if not first_page_items:
+            logger.info("  -> 豆列首页未发现任何项目，获取结束。")
+            return []
+        if on_page:
+            on_page(1, first_page_items)
 
-                for item in doulist_items:
-                    title_div = item.find('div', class_='title')
-                    if not title_div: continue
-                    
-                    link_tag = title_div.find('a')
-                    if not link_tag: continue
-                    
-                    # 提取标题
-                    title = link_tag.get_text(strip=True)
-                    # 提取豆瓣链接
-                    douban_link = link_tag.get('href')
-                    
-                    # 尝试提取年份
-                    year = None
-                    abstract_div = item.find('div', class_='abstract')
-                    if abstract_div:
-                        # 年份通常在 abstract 内容中以 (YYYY) 或 YYYY-MM-DD 的形式出现
-                        year_match = re.search(r'\b(19\d{2}|20\d{2})\b', abstract_div.get_text())
-                        if year_match:
-                            year = year_match.group(1)
-                    
-                    if title:
-                        all_items.append({
-                            'title': title,
-                            'imdb_id': None, # 豆列页面不直接提供IMDb ID
-                            'year': year,
-                            'douban_link': douban_link # ✨ 关键信息：我们拿到了每个条目的豆瓣链接
-                        })
+        total_pages = min(total_pages, max_pages)
+        if max_items and max_items > 0:
+            total_pages = min(total_pages, -(-max_items // items_per_page))
 
-            except Exception as e:
-                logger.error(f"获取或解析豆瓣豆列页面 '{paginated_url}' 时出错: {e}")
-                # 出现错误时，中断后续所有页面的获取
-                break
-        
-        logger.info(f"  -> 豆瓣豆列获取完成，从 {page} 个页面中总共解析出 {len(all_items)} 个项目。")
+        pages_data = self._fetch_pages_concurrently(
+            list(range(2, total_pages + 1)), fetch_page, HOST_CONCURRENCY_LIMITS['douban.com'], on_page
+        )
+        pages_data[1] = first_page_items
+
+        all_items = [item for page in sorted(pages_data) for item in pages_data[page]]
+        logger.info(f"  -> 豆瓣豆列获取完成，从 {len(pages_data)} 个页面中总共解析出 {len(all_items)} 个项目。")
         return all_items
     
-    def _get_items_from_tmdb_list(self, url: str) -> List[Dict[str, str]]:
-        """【新】专门用于解析和分页获取TMDb片单内容的函数"""
+    def _get_items_from_tmdb_list(self, url: str, on_page=None, max_items: Optional[int] = None) -> List[Dict[str, str]]:
+        """【V2 - 并发分页版】专门用于解析和分页获取TMDb片单内容的函数"""
         match = re.search(r'themoviedb\.org/list/(\d+)', url)
         if not match:
             logger.error(f"无法从URL '{url}' 中解析出TMDb片单ID。")
             return []
 
         list_id = int(match.group(1))
-        all_items = []
-        current_page = 1
-        total_pages = 1 # 先假设只有一页
 
-        logger.info(f"  -> 检测到TMDb片单链接，开始分页获取: {url}")
+        def parse_items(list_data: Optional[Dict]) -> List[Dict[str, str]]:
+            page_items = []
+            for item in (list_data or {}).get('items') or []:
+                media_type = item.get('media_type')
+                tmdb_id = item.get('id')
+                # 将TMDb的 'tv' 映射为我们系统内部的 'Series'
+                item_type_mapped = 'Series' if media_type == 'tv' else 'Movie'
+                if tmdb_id:
+                    # ★★★ 直接生成包含精确ID和类型的字典，无需后续匹配 ★★★
+                    page_items.append({'id': str(tmdb_id), 'type': item_type_mapped})
+            return page_items
+
+        def fetch_page(page: int) -> List[Dict[str, str]]:
+            logger.debug(f"    -> 正在获取TMDb片单第 {page} 页...")
+            return parse_items(tmdb_handler.get_list_details_tmdb(list_id, self.tmdb_api_key, page=page))
 
-        while current_page <= total_pages:
-            try:
-                logger.debug(f"    -> 正在获取第 {current_page} / {total_pages} 页...")
-                list_data = tmdb_handler.get_list_details_tmdb(list_id, self.tmdb_api_key, page=current_page)
-
-                if not list_data or not list_data.get('items'):
-                    logger.warning(f"  -> 在第 {current_page} 页未发现更多项目，获取结束。")
-                    break
-
-                # 从第一页的返回结果中更新总页数
-                if current_page == 1:
-                    total_pages = list_data.get('total_pages', 1)
+        logger.info(f"  -> 检测到TMDb片单链接，开始分页获取: {url}")
 
-                for item in list_data['items']:
-                    media_type = item.get('media_type')
-                    tmdb_id = item.get('id')
-                    
-                    # 将TMDb的 'tv' 映射为我们系统内部的 'Series'
-                    item_type_mapped = 'Series' if media_type == 'tv' else 'Movie'
+        # 第一页：同时得知总页数
+        first_page_data = tmdb_handler.get_list_details_tmdb(list_id, self.tmdb_api_key, page=1)
+        first_page_items = parse_items(first_page_data)
+        if not first_page_items:
+            logger.warning("  -> TMDb片单第 1 页未发现任何项目，获取结束。")
+            return []
+        if on_page:
+            on_page(1, first_page_items)
 
-                    if tmdb_id:
-                        # ★★★ 直接生成包含精确ID和类型的字典，无需后续匹配 ★★★
-                        all_items.append({'id': str(tmdb_id), 'type': item_type_mapped})
+        total_pages = first_page_data.get('total_pages', 1) or 1
+        if max_items and max_items > 0:
+            total_pages = min(total_pages, -(-max_items // max(len(first_page_items), 1)))
 
-                current_page += 1
+        pages_data = self._fetch_pages_concurrently(
+            list(range(2, total_pages + 1)), fetch_page, HOST_CONCURRENCY_LIMITS['themoviedb.org'], on_page
+        )
+        pages_data[1] = first_page_items
 
-            except Exception as e:
-                logger.error(f"获取或解析TMDb片单页面 {current_page} 时出错: {e}")
-                break
-        
-        logger.info(f"  -> TMDb片单获取完成，从 {total_pages} 个页面中总共解析出 {len(all_items)} 个项目。")
+        all_items = [item for page in sorted(pages_data) for item in pages_data[page]]
+        logger.info(f"  -> TMDb片单获取完成，从 {len(pages_data)} 个页面中总共解析出 {len(all_items)} 个项目。")
         return all_items
     
-    def _get_items_from_tmdb_discover(self, url: str) -> List[Dict[str, str]]:
-        """【V4.1 - 最终确认版】专门用于解析TMDb Discover URL并获取结果的函数，支持自动分页获取所有项目"""
+    def _get_items_from_tmdb_discover(self, url: str, on_page=None, max_items: Optional[int] = None) -> List[Dict[str, str]]:
+        """【V5 - 并发分页版】专门用于解析TMDb Discover URL并获取结果的函数，先取第一页得知总页数，再并发获取其余页面"""
         from urllib.parse import urlparse, parse_qs
-        from datetime import datetime, timedelta
-        import re
 
         logger.info(f"  -> 检测到TMDb Discover链接，开始动态获取 (支持分页): {url}")
+
+        # ★★★ 使用最健壮的判断逻辑 ★★★
+        if '/discover/movie' in url:
+            discover_func, item_type_for_result = tmdb_handler.discover_movie_tmdb, 'Movie'
+        elif '/discover/tv' in url:
+            discover_func, item_type_for_result = tmdb_handler.discover_tv_tmdb, 'Series'
+        else:
+            logger.warning(f"无法从URL '{url}' 判断是电影还是电视剧，discover任务中止。")
+            return []
         
         parsed_url = urlparse(url)
         query_params = parse_qs(parsed_url.query)
@@ -290,70 +388,147 @@ class ListImporter:
                     target_date = today + timedelta(days=days)
                 params[key] = value.replace(match.group(0), target_date.strftime('%Y-%m-%d'))
 
-        all_items = []
-        current_page = 1
-        total_pages = 1
         MAX_PAGES_TO_FETCH = 10
 
-        while current_page <= total_pages and current_page <= MAX_PAGES_TO_FETCH:
-            try:
-                params['page'] = current_page
-                logger.debug(f"    -> 正在获取第 {current_page} / {total_pages} 页...")
-
-                discover_data = None
-                item_type_for_result = None
-
-                # ★★★ 使用最健壮的判断逻辑 ★★★
-                if '/discover/movie' in url:
-                    discover_data = tmdb_handler.discover_movie_tmdb(self.tmdb_api_key, params)
-                    item_type_for_result = 'Movie'
-                elif '/discover/tv' in url:
-                    discover_data = tmdb_handler.discover_tv_tmdb(self.tmdb_api_key, params)
-                    item_type_for_result = 'Series'
-                else:
-                    # 如果URL格式意外，直接跳出循环
-                    logger.warning(f"无法从URL '{url}' 判断是电影还是电视剧，discover任务中止。")
-                    break
+        def fetch_page_data(page: int) -> Optional[Dict]:
+            # 每页使用独立的参数副本，保证并发请求互不干扰
+            page_params = dict(params, page=page)
+            logger.debug(f"    -> 正在获取Discover第 {page} 页...")
+            return discover_func(self.tmdb_api_key, page_params)
 
-                if not discover_data or not discover_data.get('results'):
-                    logger.info("    -> 在当前页未发现更多项目，获取结束。")
-                    break
+        def parse_items(discover_data: Optional[Dict]) -> List[Dict[str, str]]:
+            return [
+                {'id': str(item['id']), 'type': item_type_for_result}
+                for item in (discover_data or {}).get('results') or [] if item.get('id')
+            ]
 
-                if current_page == 1:
-                    total_pages = discover_data.get('total_pages', 1)
+        first_page_data = fetch_page_data(1)
+        first_page_items = parse_items(first_page_data)
+        if not first_page_items:
+            logger.info("    -> 在第 1 页未发现任何项目，获取结束。")
+            return []
+        if on_page:
+            on_page(1, first_page_items)
 
-                for item in discover_data['results']:
-                    tmdb_id = item.get('id')
-                    if tmdb_id and item_type_for_result:
-                        all_items.append({'id': str(tmdb_id), 'type': item_type_for_result})
-                
-                current_page += 1
+        total_pages = min(first_page_data.get('total_pages', 1) or 1, MAX_PAGES_TO_FETCH)
+        if max_items and max_items > 0:
+            total_pages = min(total_pages, -(-max_items // max(len(first_page_items), 1)))
 
-            except Exception as e:
-                logger.error(f"获取或解析TMDb Discover链接的第 {current_page} 页时出错: {e}")
-                break
+        pages_data = self._fetch_pages_concurrently(
+            list(range(2, total_pages + 1)), lambda page: parse_items(fetch_page_data(page)),
+            HOST_CONCURRENCY_LIMITS['themoviedb.org'], on_page
+        )
+        pages_data[1] = first_page_items
 
-        logger.info(f"  -> TMDb Discover 获取完成，从 {total_pages} 个页面中总共解析出 {len(all_items)} 个项目。")
+        all_items = [item for page in sorted(pages_data) for item in pages_data[page]]
+        logger.info(f"  -> TMDb Discover 获取完成，从 {len(pages_data)} 个页面中总共解析出 {len(all_items)} 个项目。")
         return all_items
     
-    def _get_titles_and_imdbids_from_url(self, url: str) -> Tuple[List[Dict[str, str]], str]:
+    def _fetch_source(self, url: str, on_page=None, max_items: Optional[int] = None, conditional: Optional[Dict[str, Any]] = None) -> Tuple[List[Dict[str, str]], str, Dict[str, Any]]:
+        """
+        获取榜单源内容；如果传入了共享缓存，相同 URL 只抓取一次。
+        on_page(page, items) 会在每页数据到达时被调用；若结果来自缓存，则整份列表作为一页回调一次。
+        conditional 为上次记录的 HTTP 校验信息 (etag/last_modified)，用于条件请求。
+        返回 (items, source_type, validators)，validators 中 not_modified=True 表示服务器返回了 304。
+        """
+        callback_state = {'called': False}
+        def tracking_on_page(page, page_items):
+            callback_state['called'] = True
+            if on_page: on_page(page, page_items)
+
+        def fetch():
+            validators = {}
+            items, source_type = self._get_titles_and_imdbids_from_url(
+                url, on_page=tracking_on_page, max_items=max_items, conditional=conditional, validators_out=validators
+            )
+            return items, source_type, validators
+
+        if self.source_cache is None:
+            return fetch()
+
+        conditional_key = (conditional or {}).get('etag'), (conditional or {}).get('last_modified')
+        items, source_type, validators = self.source_cache.get_or_fetch(('list', url, max_items, conditional_key), fetch)
+        if on_page and items and not callback_state['called']:
+            on_page(1, items)
+        # 返回副本，避免多个合集在各自的截断/匹配过程中互相影响
+        return list(items), source_type, dict(validators)
+
+    @staticmethod
+    def compute_source_fingerprint(definition: Dict, items: List[Dict[str, Any]], validators: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        生成榜单源指纹：
+        - etag / last_modified：服务器提供的 HTTP 校验信息（如果有）；
+        - content_hash：解析出的条目列表的哈希；
+        - definition_hash：影响结果的合集定义（URL、数量、类型）的哈希，定义被修改后指纹必然变化。
+        """
+        definition_key = {k: definition.get(k) for k in ('url', 'limit', 'item_type')}
+        definition_hash = hashlib.sha1(json.dumps(definition_key, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+        content_hash = hashlib.sha1(json.dumps(items, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+        validators = validators or {}
+        return {
+            'etag': validators.get('etag'),
+            'last_modified': validators.get('last_modified'),
+            'content_hash': content_hash,
+            'definition_hash': definition_hash,
+        }
+
+    @staticmethod
+    def mark_matched(fingerprint: Optional[Dict[str, Any]], unmatched: int = 0):
+        """记录标题匹配的时间和未匹配的条目数，用于判断指纹何时过期。"""
+        if fingerprint is not None:
+            fingerprint['matched_at'] = datetime.now().isoformat()
+            fingerprint['unmatched'] = unmatched
+
+    @staticmethod
+    def is_fingerprint_expired(fingerprint: Dict[str, Any]) -> bool:
+        """指纹超过最长有效期，或上次匹配有未匹配的条目且已超过重试间隔（没有匹配时间的旧指纹视为过期）。"""
+        try:
+            age = datetime.now() - datetime.fromisoformat(fingerprint.get('matched_at') or '')
+        except (TypeError, ValueError):
+            return True
+        max_age_hours = FINGERPRINT_UNMATCHED_RETRY_HOURS if fingerprint.get('unmatched') else FINGERPRINT_MAX_AGE_HOURS
+        return age > timedelta(hours=max_age_hours)
+
+    @staticmethod
+    def is_same_fingerprint(previous: Optional[Dict[str, Any]], current: Optional[Dict[str, Any]]) -> bool:
+        if not previous or not current or ListImporter.is_fingerprint_expired(previous):
+            return False
+        return (previous.get('definition_hash') == current.get('definition_hash')
+                and previous.get('content_hash') == current.get('content_hash'))
+
+    def _get_titles_and_imdbids_from_url(self, url: str, on_page=None, max_items: Optional[int] = None,
+                                         conditional: Optional[Dict[str, Any]] = None,
+                                         validators_out: Optional[Dict[str, Any]] = None) -> Tuple[List[Dict[str, str]], str]:
         source_type = 'list_rss' 
         items = []
 
         if 'themoviedb.org/discover/' in url:
             source_type = 'list_discover'
-            items = self._get_items_from_tmdb_discover(url)
+            items = self._get_items_from_tmdb_discover(url, on_page=on_page, max_items=max_items)
         elif 'themoviedb.org/list/' in url:
             source_type = 'list_tmdb'
-            items = self._get_items_from_tmdb_list(url)
+            items = self._get_items_from_tmdb_list(url, on_page=on_page, max_items=max_items)
         elif 'douban.com/doulist' in url:
             source_type = 'list_douban'
-            items = self._get_items_from_douban_doulist(url)
+            items = self._get_items_from_douban_doulist(url, on_page=on_page, max_items=max_items)
         else:
             logger.info(f"  -> 开始获取标准RSS榜单: {url}")
             try:
-                response = self.session.get(url, timeout=20)
+                # ★★★ 条件请求：带上上次记录的 ETag / Last-Modified，未变化时服务器会直接返回 304 ★★★
+                headers = {}
+                if conditional and conditional.get('etag'):
+                    headers['If-None-Match'] = conditional['etag']
+                if conditional and conditional.get('last_modified'):
+                    headers['If-Modified-Since'] = conditional['last_modified']
+                response = self.session.get(url, timeout=20, headers=headers)
+                if response.status_code == 304:
+                    logger.info("  -> RSS源返回 304 Not Modified，内容自上次同步后未变化。")
+                    if validators_out is not None:
+                        validators_out.update({'not_modified': True, 'etag': conditional.get('etag'), 'last_modified': conditional.get('last_modified')})
+                    return [], source_type
                 response.raise_for_status()
+                if validators_out is not None:
+                    validators_out.update({'etag': response.headers.get('ETag'), 'last_modified': response.headers.get('Last-Modified')})
                 content = response.text
                 if 'encoding="gb2312"' in content.lower():
                      content = response.content.decode('gb2312', errors='ignore')
@@ -393,6 +568,8 @@ class ListImporter:
                         items.append({'title': title.strip(), 'imdb_id': imdb_id, 'year': year, 'douban_link': douban_link})
             except Exception as e:
                 logger.error(f"从RSS URL '{url}' 获取榜单时出错: {e}")
+            if on_page and items:
+                on_page(1, items)
         
         return items, source_type
 
@@ -440,6 +617,17 @@ class ListImporter:
         return show_name, season_number
 
     def _match_title_to_tmdb(self, title: str, item_type: str, year: Optional[str] = None) -> Optional[Tuple[str, str]]:
+        """
+        【V3 - 匹配缓存版】
+        先查询持久化的标题匹配缓存（与猫眼榜单共享），未命中时才真正调用 TMDb 搜索。
+        返回一个元组 (tmdb_id, item_type)，或 None。
+        """
+        return tmdb_handler.match_title_with_cache(
+            title, item_type, year,
+            lambda: self._search_title_on_tmdb(title, item_type, year=year)
+        )
+
+    def _search_title_on_tmdb(self, title: str, item_type: str, year: Optional[str] = None) -> Optional[Tuple[str, str]]:
         """
         【V2 - 返回值修正版】
         现在返回一个元组 (tmdb_id, item_type)，以保持接口统一。
@@ -550,7 +738,15 @@ class ListImporter:
             
         return None
 
-    def process(self, definition: Dict) -> Tuple[List[Dict[str, str]], str]:
+    def process(self, definition: Dict, previous_fingerprint: Optional[Dict[str, Any]] = None) -> Tuple[List[Dict[str, str]], str]:
+        """
+        获取并匹配榜单。
+        传入 previous_fingerprint 时会进行条件刷新：若源指纹未变化，则跳过标题匹配，
+        设置 self.source_unchanged = True 并返回空列表，由调用方只复查缺失项的入库状态。
+        本次的源指纹保存在 self.source_fingerprint 中。
+        """
+        self.source_fingerprint = None
+        self.source_unchanged = False
         url = definition.get('url')
         # ★★★ 核心修改 1/2: 增加一个默认的 source_type ★★★
         source_type = 'list_rss' # 默认是普通榜单
@@ -564,25 +760,12 @@ class ListImporter:
         item_types = definition.get('item_type', ['Movie'])
         if isinstance(item_types, str): item_types = [item_types]
         limit = definition.get('limit')
-        
-        # ★★★ 核心修改 2/2: 接收 _get_titles_and_imdbids_from_url 返回的 source_type ★★★
-        items, source_type = self._get_titles_and_imdbids_from_url(url)
-        
-        if not items: return [], source_type
-        
-        if items and 'id' in items[0] and 'type' in items[0]:
-            logger.info(f"  -> 检测到来自TMDb源 ({source_type}) 的预匹配ID，将跳过标题匹配。")
-            if limit and isinstance(limit, int) and limit > 0:
-                items = items[:limit]
-            return items, source_type # 直接返回结果和类型
-
-        if limit and isinstance(limit, int) and limit > 0:
-            items = items[:limit]
+        limit = limit if (limit and isinstance(limit, int) and limit > 0) else None
         
         tmdb_items = []
         douban_api = DoubanApi()
 
-        with ThreadPoolExecutor(max_workers=5) as executor:
+        with task_context.ContextThreadPoolExecutor(max_workers=5) as executor:
             def find_first_match(item: Dict[str, str], types_to_check):
                 title = item.get('title')
                 year = item.get('year')
@@ -656,8 +839,62 @@ class ListImporter:
                 logger.error(f"  -> 彻底失败：所有方案都无法为 '{title}' 找到匹配项。")
                 return None
 
-            results_in_order = executor.map(lambda item: find_first_match(item, item_types), items)
+            # ★★★ 流式匹配：每页数据一到达就提交匹配任务，无需等待所有页面抓取完成 ★★★
+            # 有上次的源指纹时，源可能未变化：要等整份列表到达、比较指纹之后才能决定是否匹配，不做流式提交
+            stream_matches = not previous_fingerprint
+            match_futures = {}
+            def on_page(page: int, page_items: List[Dict[str, str]]):
+                if not stream_matches:
+                    return
+                for item in page_items:
+                    if 'id' in item and 'type' in item:
+                        continue # TMDb 源自带精确ID，无需匹配
+                    match_futures[id(item)] = executor.submit(find_first_match, item, item_types)
+
+            # ★★★ 接收 _get_titles_and_imdbids_from_url 返回的 source_type ★★★
+            items, source_type, validators = self._fetch_source(url, on_page=on_page, max_items=limit, conditional=previous_fingerprint)
+
+            # ★★★ 条件刷新：对比源指纹，未变化时跳过匹配 ★★★
+            if validators.get('not_modified'):
+                current_fingerprint = dict(previous_fingerprint or {})
+                current_fingerprint['definition_hash'] = self.compute_source_fingerprint(definition, [])['definition_hash']
+                if self.is_same_fingerprint(previous_fingerprint, current_fingerprint):
+                    self.source_fingerprint, self.source_unchanged = current_fingerprint, True
+                else:
+                    # 合集定义已被修改或指纹已过期，304 不能作为依据，重新无条件获取
+                    items, source_type, validators = self._fetch_source(url, on_page=on_page, max_items=limit)
+            if not self.source_unchanged:
+                self.source_fingerprint = self.compute_source_fingerprint(definition, items, validators)
+                self.source_unchanged = self.is_same_fingerprint(previous_fingerprint, self.source_fingerprint)
+
+            if self.source_unchanged:
+                # 保留上次匹配的时间和未匹配数：指纹的有效期从上次实际匹配时算起
+                self.source_fingerprint.update({key: previous_fingerprint.get(key) for key in ('matched_at', 'unmatched')})
+                logger.info("  -> 榜单源指纹未变化，跳过标题匹配。")
+                douban_api.close()
+                return [], source_type
+
+            if items and 'id' in items[0] and 'type' in items[0]:
+                logger.info(f"  -> 检测到来自TMDb源 ({source_type}) 的预匹配ID，将跳过标题匹配。")
+                self.mark_matched(self.source_fingerprint)
+                douban_api.close()
+                return (items[:limit] if limit else items), source_type # 直接返回结果和类型
+
+            if limit:
+                items = items[:limit]
+
+            # 超出数量限制的条目不再需要匹配，取消尚未开始的任务
+            wanted_keys = {id(item) for item in items}
+            for key, future in match_futures.items():
+                if key not in wanted_keys:
+                    future.cancel()
+
+            results_in_order = [
+                (match_futures.get(id(item)) or executor.submit(find_first_match, item, item_types)).result()
+                for item in items
+            ]
             tmdb_items = [result for result in results_in_order if result is not None]
+            self.mark_matched(self.source_fingerprint, len(results_in_order) - len(tmdb_items))
         
         douban_api.close()
         logger.info(f"  -> RSS匹配完成，成功获得 {len(tmdb_items)} 个TMDb项目。")
@@ -4,6 +4,7 @@ from psycopg2 import sql
 from psycopg2.extras import RealDictCursor, Json
 import json
 import pytz
+import time
 import logging
 from typing import Optional, Dict, Any, List, Tuple
 from flask import jsonify
@@ -12,10 +13,27 @@ from datetime import datetime, timezone
 import config_manager
 import emby_handler
 import constants # 确保常量模块被导入
+import task_metrics
 from utils import contains_chinese
 
 logger = logging.getLogger(__name__)
 
+class TimedRealDictCursor(RealDictCursor):
+    """RealDictCursor + 执行耗时统计，计入当前任务的运行指标 (task_metrics)。"""
+    def execute(self, query, vars=None):
+        start = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            task_metrics.record_db_time(time.perf_counter() - start)
+
+    def executemany(self, query, vars_list):
+        start = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            task_metrics.record_db_time(time.perf_counter() - start)
+
 # --- 初始化数据库 ---
 def init_db():
     """
@@ -70,6 +88,90 @@ def init_db():
                     )
                 """)
 
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS tmdb_match_cache (
+                        normalized_title TEXT NOT NULL,
+                        year TEXT NOT NULL DEFAULT '',
+                        item_type TEXT NOT NULL,
+                        tmdb_id TEXT, -- NULL 表示负缓存（上次搜索未匹配到）
+                        matched_type TEXT,
+                        last_updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+                        PRIMARY KEY (normalized_title, year, item_type)
+                    )
+                """)
+
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS cover_render_fingerprints (
+                        library_id TEXT PRIMARY KEY,
+                        fingerprint TEXT NOT NULL,
+                        last_rendered_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+                    )
+                """)
+
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS webhook_queue (
+                        item_id TEXT NOT NULL,
+                        action TEXT NOT NULL,
+                        item_name TEXT,
+                        payload_json JSONB,
+                        revision INTEGER NOT NULL DEFAULT 1,
+                        attempts INTEGER NOT NULL DEFAULT 0,
+                        next_attempt_at TIMESTAMP WITH TIME ZONE,
+                        enqueued_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+                        updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+                        PRIMARY KEY (item_id, action)
+                    )
+                """)
+
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS webhook_debounce_state (
+                        kind TEXT NOT NULL,
+                        item_id TEXT NOT NULL,
+                        item_name TEXT,
+                        item_type TEXT,
+                        payload_json JSONB,
+                        due_at TIMESTAMP WITH TIME ZONE NOT NULL,
+                        PRIMARY KEY (kind, item_id)
+                    )
+                """)
+
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS task_checkpoints (
+                        task_key TEXT PRIMARY KEY,
+                        cursor_json JSONB,
+                        stats_json JSONB,
+                        started_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+                        updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+                    )
+                """)
+
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS task_runs (
+                        id BIGSERIAL PRIMARY KEY,
+                        task_name TEXT NOT NULL,
+                        task_key TEXT,
+                        parent_task TEXT,
+                        lane TEXT,
+                        started_at TIMESTAMP WITH TIME ZONE NOT NULL,
+                        finished_at TIMESTAMP WITH TIME ZONE NOT NULL,
+                        duration_seconds REAL,
+                        status TEXT NOT NULL,
+                        stop_reason TEXT,
+                        items_processed INTEGER,
+                        emby_calls INTEGER DEFAULT 0,
+                        tmdb_calls INTEGER DEFAULT 0,
+                        douban_calls INTEGER DEFAULT 0,
+                        ai_calls INTEGER DEFAULT 0,
+                        db_queries INTEGER DEFAULT 0,
+                        db_seconds REAL DEFAULT 0,
+                        error_count INTEGER DEFAULT 0,
+                        last_error TEXT
+                    )
+                """)
+                cursor.execute("CREATE INDEX IF NOT EXISTS idx_task_runs_key_started ON task_runs (task_key, started_at DESC)")
+                # 运行记录只保留最近 90 天
+                cursor.execute("DELETE FROM task_runs WHERE started_at < NOW() - INTERVAL '90 days'")
+
                 cursor.execute("""
                     CREATE TABLE IF NOT EXISTS app_settings (
                         setting_key TEXT PRIMARY KEY,
@@ -333,7 +435,15 @@ def init_db():
                             "resubscribe_subtitle_effect_only": "BOOLEAN DEFAULT FALSE"
                         },
                         'custom_collections': {
-                            "generated_emby_ids_json": "JSONB DEFAULT '[]'::jsonb NOT NULL"
+                            "generated_emby_ids_json": "JSONB DEFAULT '[]'::jsonb NOT NULL",
+                            "source_fingerprint": "JSONB"
+                        },
+                        'cover_render_fingerprints': {
+                            "encoded_bytes": "INTEGER",
+                            "image_format": "TEXT"
+                        },
+                        'webhook_queue': {
+                            "next_attempt_at": "TIMESTAMP WITH TIME ZONE"
                         }
                     }
 
@@ -420,7 +530,7 @@ def get_db_connection() -> psycopg2.extensions.connection:
             user=cfg.get(constants.CONFIG_OPTION_DB_USER),
             password=cfg.get(constants.CONFIG_OPTION_DB_PASSWORD),
             dbname=cfg.get(constants.CONFIG_OPTION_DB_NAME),
-            cursor_factory=RealDictCursor  # ★★★ 关键：让返回的每一行都是字典
+            cursor_factory=TimedRealDictCursor  # ★★★ 关键：让返回的每一行都是字典（并统计执行耗时）
         )
         return conn
     except psycopg2.Error as e:
@@ -2783,4 +2893,422 @@ def batch_delete_cleanup_tasks(task_ids: List[int]) -> int:
             return deleted_count
     except Exception as e:
         logger.error(f"DB: 批量删除清理任务时失败: {e}", exc_info=True)
-        return 0
\ No newline at end of file
+        return 0
+
+# ======================================================================
+# 模块 11: TMDb 标题匹配缓存 (TMDb Title Match Cache Data Access)
+# ======================================================================
+
+def get_tmdb_match_cache(normalized_title: str, year: str, item_type: str, ttl_days: int, negative_ttl_days: int) -> Optional[Dict[str, Any]]:
+    """
+    读取一条未过期的标题匹配缓存。
+    - 命中返回 {'tmdb_id': ..., 'matched_type': ...}，其中 tmdb_id 为 None 表示负缓存。
+    - 未命中或已过期返回 None。
+    """
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            sql = """
+                SELECT tmdb_id, matched_type FROM tmdb_match_cache
+                WHERE normalized_title = %s AND year = %s AND item_type = %s
+                  AND last_updated_at > NOW() - (CASE WHEN tmdb_id IS NULL THEN %s ELSE %s END) * INTERVAL '1 day'
+            """
+            cursor.execute(sql, (normalized_title, year, item_type, negative_ttl_days, ttl_days))
+            row = cursor.fetchone()
+            return dict(row) if row else None
+    except Exception as e:
+        logger.error(f"DB: 读取标题匹配缓存 '{normalized_title}' 时失败: {e}")
+        return None
+
+def save_tmdb_match_cache(normalized_title: str, year: str, item_type: str, tmdb_id: Optional[str], matched_type: Optional[str]) -> bool:
+    """写入或刷新一条标题匹配缓存，tmdb_id 为 None 时记录为负缓存。"""
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            sql = """
+                INSERT INTO tmdb_match_cache (normalized_title, year, item_type, tmdb_id, matched_type, last_updated_at)
+                VALUES (%s, %s, %s, %s, %s, NOW())
+                ON CONFLICT (normalized_title, year, item_type) DO UPDATE SET
+                    tmdb_id = EXCLUDED.tmdb_id,
+                    matched_type = EXCLUDED.matched_type,
+                    last_updated_at = NOW();
+            """
+            cursor.execute(sql, (normalized_title, year, item_type, tmdb_id, matched_type))
+            conn.commit()
+            return True
+    except Exception as e:
+        logger.error(f"DB: 保存标题匹配缓存 '{normalized_title}' 时失败: {e}")
+        return False
+
+# ======================================================================
+# 模块 12: 封面渲染指纹 (Cover Render Fingerprint Data Access)
+# ======================================================================
+
+def get_cover_render_fingerprint(library_id: str, max_age_hours: Optional[float] = None) -> Optional[str]:
+    """
+    读取某个媒体库/合集上一次成功上传封面时的渲染指纹。
+    max_age_hours: 距上次渲染超过该时长的记录视为不存在（随机排序的封面定期换一批海报）。
+    """
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT fingerprint FROM cover_render_fingerprints WHERE library_id = %s "
+                "AND (%s::float IS NULL OR last_rendered_at > NOW() - %s::float * INTERVAL '1 hour')",
+                (library_id, max_age_hours, max_age_hours)
+            )
+            row = cursor.fetchone()
+            return row['fingerprint'] if row else None
+    except Exception as e:
+        logger.error(f"DB: 读取媒体库 '{library_id}' 的封面渲染指纹时失败: {e}")
+        return None
+
+def save_cover_render_fingerprint(library_id: str, fingerprint: str, encoded_bytes: Optional[int] = None, image_format: Optional[str] = None) -> bool:
+    """封面上传成功后记录渲染指纹，以及编码后的体积和格式。"""
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            sql = """
+                INSERT INTO cover_render_fingerprints (library_id, fingerprint, encoded_bytes, image_format, last_rendered_at)
+                VALUES (%s, %s, %s, %s, NOW())
+                ON CONFLICT (library_id) DO UPDATE SET
+                    fingerprint = EXCLUDED.fingerprint,
+                    encoded_bytes = EXCLUDED.encoded_bytes,
+                    image_format = EXCLUDED.image_format,
+                    last_rendered_at = NOW();
+            """
+            cursor.execute(sql, (library_id, fingerprint, encoded_bytes, image_format))
+            conn.commit()
+            return True
+    except Exception as e:
+        logger.error(f"DB: 保存媒体库 '{library_id}' 的封面渲染指纹时失败: {e}")
+        return False
+
+# ======================================================================
+# 模块 13: Webhook 持久化队列 (Webhook Queue Data Access)
+# ======================================================================
+
+def enqueue_webhook_item(item_id: str, action: str, item_name: Optional[str], payload: Optional[Dict[str, Any]]) -> Optional[int]:
+    """
+    登记一个 Webhook 产生的待处理项目，按 (item_id, action) 去重。
+    已存在时更新名称和参数并递增 revision、清零失败次数，返回最新的 revision；失败返回 None。
+    """
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            sql = """
+                INSERT INTO webhook_queue (item_id, action, item_name, payload_json, revision, attempts, next_attempt_at, enqueued_at, updated_at)
+                VALUES (%s, %s, %s, %s, 1, 0, NULL, NOW(), NOW())
+                ON CONFLICT (item_id, action) DO UPDATE SET
+                    item_name = EXCLUDED.item_name,
+                    payload_json = EXCLUDED.payload_json,
+                    revision = webhook_queue.revision + 1,
+                    attempts = 0,
+                    next_attempt_at = NULL,
+                    updated_at = NOW()
+                RETURNING revision;
+            """
+            cursor.execute(sql, (item_id, action, item_name, Json(payload or {})))
+            row = cursor.fetchone()
+            conn.commit()
+            return row['revision'] if row else None
+    except Exception as e:
+        logger.error(f"DB: 写入 Webhook 队列 (项目: {item_id}, 动作: {action}) 时失败: {e}")
+        return None
+
+def get_webhook_queue_items() -> List[Dict[str, Any]]:
+    """按入队时间返回 Webhook 队列中的所有待处理项目。"""
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT * FROM webhook_queue ORDER BY enqueued_at ASC")
+            return [dict(row) for row in cursor.fetchall()]
+    except Exception as e:
+        logger.error(f"DB: 读取 Webhook 队列时失败: {e}")
+        return []
+
+def count_webhook_backlog() -> int:
+    """
+    返回 Webhook 积压数量：持久化队列中等待处理的项目 + 仍在防抖等待中的事件。失败返回 0。
+    失败过（attempts > 0）或正在退避等待重试的项目不计入，它们不代表需要立即处理的工作。
+    """
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT (
+                    SELECT COUNT(*) FROM webhook_queue
+                    WHERE attempts = 0 AND (next_attempt_at IS NULL OR next_attempt_at <= NOW())
+                ) + (SELECT COUNT(*) FROM webhook_debounce_state) AS total
+            """)
+            row = cursor.fetchone()
+            return int(row['total']) if row else 0
+    except Exception as e:
+        logger.error(f"DB: 统计 Webhook 积压数量时失败: {e}")
+        return 0
+
+def get_webhook_queue_item(item_id: str, action: str) -> Optional[Dict[str, Any]]:
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT * FROM webhook_queue WHERE item_id = %s AND action = %s", (item_id, action))
+            row = cursor.fetchone()
+            return dict(row) if row else None
+    except Exception as e:
+        logger.error(f"DB: 读取 Webhook 队列项目 (项目: {item_id}, 动作: {action}) 时失败: {e}")
+        return None
+
+def complete_webhook_item(item_id: str, action: str, revision: int) -> bool:
+    """
+    处理完成后移除队列项目。只有 revision 未变时才删除；
+    处理期间又收到同一项目的新事件 (revision 已递增) 时保留该行并返回 False，由调用方重新调度。
+    """
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "DELETE FROM webhook_queue WHERE item_id = %s AND action = %s AND revision = %s",
+                (item_id, action, revision)
+            )
+            conn.commit()
+            return cursor.rowcount > 0
+    except Exception as e:
+        logger.error(f"DB: 移除 Webhook 队列项目 (项目: {item_id}, 动作: {action}) 时失败: {e}")
+        return False
+
+def record_webhook_item_failure(item_id: str, action: str, max_attempts: int, backoff_base_seconds: int, backoff_max_seconds: int) -> int:
+    """
+    记录一次处理失败并返回累计失败次数：下次重试时间按指数退避 (base * 2^(n-1)，不超过 max) 推后；
+    达到 max_attempts 时移出队列。
+    """
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                UPDATE webhook_queue SET
+                    attempts = attempts + 1,
+                    next_attempt_at = NOW() + make_interval(secs => LEAST(%s, %s * POWER(2, attempts))),
+                    updated_at = NOW()
+                WHERE item_id = %s AND action = %s RETURNING attempts
+            """, (backoff_max_seconds, backoff_base_seconds, item_id, action))
+            row = cursor.fetchone()
+            attempts = row['attempts'] if row else 0
+            if attempts >= max_attempts:
+                cursor.execute("DELETE FROM webhook_queue WHERE item_id = %s AND action = %s", (item_id, action))
+            conn.commit()
+            return attempts
+    except Exception as e:
+        logger.error(f"DB: 记录 Webhook 队列项目失败次数 (项目: {item_id}, 动作: {action}) 时失败: {e}")
+        return 0
+
+def defer_webhook_item(item_id: str, action: str, revision: int, delay_seconds: int) -> bool:
+    """把被中断的队列项目推迟 delay_seconds 秒后重试。revision 已变化（有新事件）时不推迟。"""
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                UPDATE webhook_queue SET next_attempt_at = NOW() + make_interval(secs => %s)
+                WHERE item_id = %s AND action = %s AND revision = %s
+            """, (delay_seconds, item_id, action, revision))
+            conn.commit()
+            return cursor.rowcount > 0
+    except Exception as e:
+        logger.error(f"DB: 推迟 Webhook 队列项目 (项目: {item_id}, 动作: {action}) 时失败: {e}")
+        return False
+
+def get_due_webhook_queue_items(stale_after_seconds: int, limit: int) -> List[Dict[str, Any]]:
+    """
+    返回到期需要重试的队列项目：失败/中断后退避时间已到的项目，
+    以及从未失败但超过 stale_after_seconds 仍未完成的项目（任务丢失或被中断）。
+    """
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT * FROM webhook_queue
+                WHERE COALESCE(next_attempt_at, updated_at + make_interval(secs => %s)) <= NOW()
+                ORDER BY enqueued_at ASC
+                LIMIT %s
+            """, (stale_after_seconds, limit))
+            return [dict(row) for row in cursor.fetchall()]
+    except Exception as e:
+        logger.error(f"DB: 读取到期的 Webhook 队列项目时失败: {e}")
+        return []
+
+# --- Webhook 防抖状态 ---
+def save_webhook_debounce_item(kind: str, item_id: str, item_name: Optional[str], item_type: Optional[str],
+                               payload: Optional[Dict[str, Any]], due_at: datetime) -> bool:
+    """记录一个正在防抖等待中的 Webhook 项目及其到期时间，同一 (kind, item_id) 以最新的为准。"""
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            sql = """
+                INSERT INTO webhook_debounce_state (kind, item_id, item_name, item_type, payload_json, due_at)
+                VALUES (%s, %s, %s, %s, %s, %s)
+                ON CONFLICT (kind, item_id) DO UPDATE SET
+                    item_name = EXCLUDED.item_name,
+                    item_type = EXCLUDED.item_type,
+                    payload_json = EXCLUDED.payload_json,
+                    due_at = EXCLUDED.due_at;
+            """
+            cursor.execute(sql, (kind, item_id, item_name, item_type, Json(payload or {}), due_at))
+            conn.commit()
+            return True
+    except Exception as e:
+        logger.error(f"DB: 保存 Webhook 防抖状态 (项目: {item_id}, 类型: {kind}) 时失败: {e}")
+        return False
+
+def delete_webhook_debounce_items(kind: str, item_ids: List[str]) -> bool:
+    """防抖到期、工作已移交后删除对应的防抖状态。"""
+    if not item_ids:
+        return True
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM webhook_debounce_state WHERE kind = %s AND item_id = ANY(%s)", (kind, list(item_ids)))
+            conn.commit()
+            return True
+    except Exception as e:
+        logger.error(f"DB: 删除 Webhook 防抖状态 (类型: {kind}) 时失败: {e}")
+        return False
+
+def get_webhook_debounce_items() -> List[Dict[str, Any]]:
+    """读取所有防抖等待中的 Webhook 项目，按到期时间排序。"""
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT * FROM webhook_debounce_state ORDER BY due_at ASC")
+            return [dict(row) for row in cursor.fetchall()]
+    except Exception as e:
+        logger.error(f"DB: 读取 Webhook 防抖状态时失败: {e}")
+        return []
+
+# ======================================================================
+# 模块 14: 长任务检查点 (Task Checkpoint Data Access)
+# ======================================================================
+
+def get_task_checkpoint(task_key: str) -> Optional[Dict[str, Any]]:
+    """读取长任务的检查点，不存在或失败时返回 None。"""
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT * FROM task_checkpoints WHERE task_key = %s", (task_key,))
+            row = cursor.fetchone()
+            return dict(row) if row else None
+    except Exception as e:
+        logger.error(f"DB: 读取任务检查点 '{task_key}' 时失败: {e}")
+        return None
+
+def save_task_checkpoint(task_key: str, cursor_value: Any, stats: Optional[Dict[str, Any]], started_at: datetime) -> bool:
+    """写入（覆盖）长任务的检查点：游标 + 阶段性统计。started_at 为这一轮任务最初开始的时间。"""
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            sql = """
+                INSERT INTO task_checkpoints (task_key, cursor_json, stats_json, started_at, updated_at)
+                VALUES (%s, %s, %s, %s, NOW())
+                ON CONFLICT (task_key) DO UPDATE SET
+                    cursor_json = EXCLUDED.cursor_json,
+                    stats_json = EXCLUDED.stats_json,
+                    started_at = EXCLUDED.started_at,
+                    updated_at = NOW();
+            """
+            cursor.execute(sql, (task_key, Json(cursor_value), Json(stats or {}), started_at))
+            conn.commit()
+            return True
+    except Exception as e:
+        logger.error(f"DB: 保存任务检查点 '{task_key}' 时失败: {e}")
+        return False
+
+def delete_task_checkpoint(task_key: str) -> bool:
+    """任务完整跑完后删除检查点，下次从头开始。"""
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM task_checkpoints WHERE task_key = %s", (task_key,))
+            conn.commit()
+            return True
+    except Exception as e:
+        logger.error(f"DB: 删除任务检查点 '{task_key}' 时失败: {e}")
+        return False
+
+# ======================================================================
+# 模块 15: 任务运行记录 (Task Run History Data Access)
+# ======================================================================
+
+TASK_RUN_COLUMNS = (
+    "task_name", "task_key", "parent_task", "lane", "started_at", "finished_at", "duration_seconds",
+    "status", "stop_reason", "items_processed", "emby_calls", "tmdb_calls", "douban_calls", "ai_calls",
+    "db_queries", "db_seconds", "error_count", "last_error",
+)
+
+def record_task_run(run: Dict[str, Any]) -> Optional[int]:
+    """写入一条任务运行记录，返回记录ID；失败返回 None。"""
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            columns = [col for col in TASK_RUN_COLUMNS if col in run]
+            sql_insert = f"INSERT INTO task_runs ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))}) RETURNING id"
+            cursor.execute(sql_insert, tuple(run[col] for col in columns))
+            row = cursor.fetchone()
+            conn.commit()
+            return row['id'] if row else None
+    except Exception as e:
+        logger.error(f"DB: 写入任务运行记录 '{run.get('task_name')}' 时失败: {e}")
+        return None
+
+def get_task_runs(task_key: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+    """按开始时间倒序返回最近的任务运行记录，可按 task_key 过滤。"""
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            if task_key:
+                cursor.execute("SELECT * FROM task_runs WHERE task_key = %s ORDER BY started_at DESC LIMIT %s", (task_key, limit))
+            else:
+                cursor.execute("SELECT * FROM task_runs ORDER BY started_at DESC LIMIT %s", (limit,))
+            return [dict(row) for row in cursor.fetchall()]
+    except Exception as e:
+        logger.error(f"DB: 读取任务运行记录时失败: {e}")
+        return []
+
+def get_task_run_trends(days: int = 30, task_key: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    按任务和天汇总最近 days 天的运行记录：次数、各结束状态次数、平均/最长耗时、
+    平均处理项目数、各 API 调用平均次数、平均数据库耗时和错误总数。
+    调度器记录的跳过/错过 (skipped / missed) 只计入各自的次数，不计入运行次数和平均值。
+    """
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            sql_trends = """
+                SELECT
+                    task_key,
+                    MAX(task_name) AS task_name,
+                    date_trunc('day', started_at) AS day,
+                    COUNT(*) FILTER (WHERE status NOT IN ('skipped', 'missed')) AS runs,
+                    COUNT(*) FILTER (WHERE status = 'completed') AS completed,
+                    COUNT(*) FILTER (WHERE status = 'stopped') AS stopped,
+                    COUNT(*) FILTER (WHERE status = 'preempted') AS preempted,
+                    COUNT(*) FILTER (WHERE status = 'failed') AS failed,
+                    COUNT(*) FILTER (WHERE status = 'skipped') AS skipped,
+                    COUNT(*) FILTER (WHERE status = 'missed') AS missed,
+                    AVG(duration_seconds) FILTER (WHERE status NOT IN ('skipped', 'missed')) AS avg_duration_seconds,
+                    MAX(duration_seconds) FILTER (WHERE status NOT IN ('skipped', 'missed')) AS max_duration_seconds,
+                    AVG(items_processed) FILTER (WHERE status NOT IN ('skipped', 'missed')) AS avg_items_processed,
+                    AVG(emby_calls) FILTER (WHERE status NOT IN ('skipped', 'missed')) AS avg_emby_calls,
+                    AVG(tmdb_calls) FILTER (WHERE status NOT IN ('skipped', 'missed')) AS avg_tmdb_calls,
+                    AVG(douban_calls) FILTER (WHERE status NOT IN ('skipped', 'missed')) AS avg_douban_calls,
+                    AVG(ai_calls) FILTER (WHERE status NOT IN ('skipped', 'missed')) AS avg_ai_calls,
+                    AVG(db_seconds) FILTER (WHERE status NOT IN ('skipped', 'missed')) AS avg_db_seconds,
+                    SUM(error_count) AS errors
+                FROM task_runs
+                WHERE started_at >= NOW() - (%s * INTERVAL '1 day')
+                  AND (%s::text IS NULL OR task_key = %s)
+                GROUP BY task_key, day
+                ORDER BY task_key, day
+            """
+            cursor.execute(sql_trends, (days, task_key, task_key))
+            return [dict(row) for row in cursor.fetchall()]
+    except Exception as e:
+        logger.error(f"DB: 汇总任务运行趋势时失败: {e}")
+        return []
@@ -15,6 +15,7 @@ from urllib import parse
 from datetime import datetime
 from random import choice
 import threading
+import task_metrics
 # --- 标准库导入结束 ---
 
 logger = logging.getLogger(__name__)
@@ -53,6 +54,7 @@ class DoubanApi:
             with DoubanApi._session_lock:
                 if DoubanApi._session is None:
                     DoubanApi._session = requests.Session()
+                    DoubanApi._session.hooks['response'].append(task_metrics.session_hook(task_metrics.API_DOUBAN))
                     logger.trace("DoubanApi requests.Session 已初始化。")
         
         if cooldown_seconds is not None and cooldown_seconds > 0:
@@ -83,6 +85,7 @@ class DoubanApi:
             with cls._session_lock: # 加锁确保只有一个线程创建 session
                 if cls._session is None: # 双重检查锁定模式
                     cls._session = requests.Session()
+                    cls._session.hooks['response'].append(task_metrics.session_hook(task_metrics.API_DOUBAN))
                     logger.trace("DoubanApi: requests.Session 已重新初始化 (ensure_session)。")
 
     @classmethod
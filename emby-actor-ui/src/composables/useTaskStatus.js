@@ -4,16 +4,63 @@ import { ref, computed, onMounted, onUnmounted } from 'vue';
 import axios from 'axios';
 
 // 将状态变量放在函数外部，确保它们在整个应用中是单例的
-const backgroundTaskStatus = ref({
+export const backgroundTaskStatus = ref({
   is_running: false,
   current_action: '无',
   progress: 0,
   message: '等待任务'
 });
 
+// ★★★ 事件流：后端通过 WebSocket (/api/events/ws) 推送日志和任务状态增量，不再轮询 ★★★
+// - 每个事件带递增的 seq，断线重连时带上最后收到的 seq，后端补发缺失的事件（或发送完整快照）；
+// - WebSocket 连续失败（如反向代理不转发 Upgrade）时改用 SSE (/api/status/stream)，事件格式相同；
+// - SSE 也连续失败时，退回到轮询 /api/status。
+const POLL_INTERVAL_MS = 2000;
+const MAX_CONNECT_FAILURES = 3;
+const MAX_RECONNECT_DELAY_MS = 15000;
+const MAX_CLIENT_LOGS = 1000;
+
+let socket = null;
+let eventSource = null;
 let statusInterval = null;
+let reconnectTimer = null;
+let connectFailures = 0;
+let lastSeq = null;
+let active = false;
+
+// 把一批事件合并到状态上，只触发一次响应式更新
+const applyEvents = (events) => {
+  if (!Array.isArray(events) || events.length === 0) return;
+  let status = { ...backgroundTaskStatus.value };
+  let logs = [...(status.logs || [])];
+  for (const event of events) {
+    if (event.type !== 'snapshot' && lastSeq !== null && event.seq <= lastSeq) continue; // 重复事件
+    switch (event.type) {
+      case 'snapshot':
+        if (event.data.status) status = { ...event.data.status };
+        logs = [...event.data.logs];
+        break;
+      case 'status': {
+        const { lanes, ...rest } = event.data;
+        status = { ...status, ...rest };
+        if (lanes) status.lanes = { ...(status.lanes || {}), ...lanes };
+        break;
+      }
+      case 'log':
+        logs.push(event.data);
+        break;
+      case 'logs_cleared':
+        logs = [];
+        break;
+    }
+    lastSeq = event.seq;
+  }
+  if (logs.length > MAX_CLIENT_LOGS) logs = logs.slice(-MAX_CLIENT_LOGS);
+  status.logs = logs;
+  backgroundTaskStatus.value = status;
+};
 
-// 获取状态的函数
+// 获取状态的函数（轮询模式）
 const fetchStatus = async () => {
   try {
     const response = await axios.get('/api/status');
@@ -24,24 +71,110 @@ const fetchStatus = async () => {
   }
 };
 
+const startPolling = () => {
+  if (statusInterval) return;
+  fetchStatus(); // 立即获取一次
+  statusInterval = setInterval(fetchStatus, POLL_INTERVAL_MS);
+};
+
+const connectSse = () => {
+  const query = lastSeq !== null ? `?since=${lastSeq}` : '';
+  eventSource = new EventSource(`/api/status/stream${query}`);
+  eventSource.onopen = () => { connectFailures = 0; };
+  eventSource.onmessage = (event) => {
+    try {
+      applyEvents([JSON.parse(event.data)]);
+    } catch (error) {
+      // 忽略无法解析的消息
+    }
+  };
+  eventSource.onerror = () => {
+    // EventSource 会自动重连（带 Last-Event-ID）；连续失败多次时改用轮询
+    connectFailures += 1;
+    if (connectFailures >= MAX_CONNECT_FAILURES) {
+      eventSource.close();
+      eventSource = null;
+      startPolling();
+    }
+  };
+};
+
+const connectWebSocket = () => {
+  const protocol = window.location.protocol === 'https:' ? 'wss' : 'ws';
+  const query = lastSeq !== null ? `?since=${lastSeq}` : '';
+  let opened = false;
+  const ws = new WebSocket(`${protocol}://${window.location.host}/api/events/ws${query}`);
+  socket = ws;
+  ws.onopen = () => {
+    opened = true;
+    connectFailures = 0;
+  };
+  ws.onmessage = (event) => {
+    try {
+      applyEvents(JSON.parse(event.data));
+    } catch (error) {
+      // 忽略无法解析的消息
+    }
+  };
+  ws.onclose = () => {
+    // 已被 stopTaskStatusUpdates 关闭或替换的旧连接不再重连
+    if (socket !== ws) return;
+    socket = null;
+    if (!active) return;
+    if (!opened) connectFailures += 1;
+    if (connectFailures >= MAX_CONNECT_FAILURES) {
+      connectFailures = 0;
+      if (window.EventSource) connectSse();
+      else startPolling();
+      return;
+    }
+    // 指数退避重连
+    const delay = Math.min(1000 * 2 ** connectFailures, MAX_RECONNECT_DELAY_MS);
+    reconnectTimer = setTimeout(connectWebSocket, delay);
+  };
+};
+
+// 启动状态更新（多次调用只会建立一个连接）
+export const startTaskStatusUpdates = () => {
+  if (active) return;
+  active = true;
+  connectFailures = 0;
+  if (typeof window === 'undefined') return;
+  if (window.WebSocket) connectWebSocket();
+  else if (window.EventSource) connectSse();
+  else startPolling();
+};
+
+export const stopTaskStatusUpdates = () => {
+  active = false;
+  if (reconnectTimer) {
+    clearTimeout(reconnectTimer);
+    reconnectTimer = null;
+  }
+  if (socket) {
+    socket.close();
+    socket = null;
+  }
+  if (eventSource) {
+    eventSource.close();
+    eventSource = null;
+  }
+  if (statusInterval) {
+    clearInterval(statusInterval);
+    statusInterval = null;
+  }
+};
+
 export function useTaskStatus() {
   // onMounted 会在组件第一次使用这个 composable 时被调用
   onMounted(() => {
-    // 只有在没有定时器的情况下才启动一个新的，防止重复启动
-    if (!statusInterval) {
-      fetchStatus(); // 立即获取一次
-      statusInterval = setInterval(fetchStatus, 2000); // 每2秒获取一次
-    }
+    startTaskStatusUpdates();
   });
 
   // onUnmounted 会在组件销毁时被调用
   onUnmounted(() => {
-    // 实际上，对于全局状态，我们通常不希望它停止
-    // 但为了代码的完整性，保留这个逻辑
-    // 如果你希望状态轮询在离开页面后停止，就保留它
-    // 如果希望它一直运行，可以注释掉下面的 clearInterval
-    // clearInterval(statusInterval);
-    // statusInterval = null;
+    // 对于全局状态，我们不希望离开页面后停止更新，
+    // 连接由 AppContent 在登出时统一关闭 (stopTaskStatusUpdates)
   });
 
   // 创建一个易于使用的计算属性
@@ -54,4 +187,4 @@ export function useTaskStatus() {
     backgroundTaskStatus,
     isBackgroundTaskRunning
   };
-}
\ No newline at end of file
+}
@@ -14,6 +14,7 @@ export default defineConfig({
       '/api': {
         target: 'http://localhost:5257',
         changeOrigin: true,
+        ws: true, // 前端事件推送 (/api/events/ws)
       },
       
       // ★★★ START: 3. 新增对 /image_proxy 的代理 ★★★
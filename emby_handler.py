@@ -10,6 +10,8 @@ import threading
 # ★★★ 核心修改 1/3: 导入我们需要的配置管理器和常量 ★★★
 import config_manager
 import constants
+import task_metrics
+import task_context
 from typing import Optional, List, Dict, Any, Generator, Tuple, Set
 import logging
 logger = logging.getLogger(__name__)
@@ -25,6 +27,11 @@ class SimpleLogger:
     def debug(self, msg): print(f"[EMBY_DEBUG] {msg}")
     def success(self, msg): print(f"[EMBY_SUCCESS] {msg}")
 _emby_id_cache = {}
+# ★★★ 共享的 Emby HTTP 会话：复用连接，供并发的合集同步、封面下载等任务共用 ★★★
+_emby_session = requests.Session()
+_emby_session.mount('http://', requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=20))
+_emby_session.hooks['response'].append(task_metrics.session_hook(task_metrics.API_EMBY))
+_emby_session.mount('https://', requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=20))
 _emby_season_cache = {}
 _emby_episode_cache = {}
 # ★★★ 模拟用户登录以获取临时 AccessToken 的辅助函数 ★★★
@@ -44,7 +51,7 @@ def _get_emby_access_token(emby_url, username, password) -> tuple[Optional[str],
     }
     
     try:
-        response = requests.post(auth_url, headers=headers, json=payload, timeout=15)
+        response = _emby_session.post(auth_url, headers=headers, json=payload, timeout=15)
         response.raise_for_status()
         data = response.json()
         access_token = data.get("AccessToken")
@@ -85,7 +92,7 @@ def get_item_count(base_url: str, api_key: str, user_id: Optional[str], item_typ
     try:
         # ★★★ 核心修改 3/3: 在所有 requests 调用中动态获取超时时间 ★★★
         api_timeout = config_manager.APP_CONFIG.get(constants.CONFIG_OPTION_EMBY_API_TIMEOUT, 60)
-        response = requests.get(api_url, params=params, timeout=api_timeout)
+        response = _emby_session.get(api_url, params=params, timeout=api_timeout)
         response.raise_for_status()
         data = response.json()
         
@@ -101,6 +108,10 @@ def get_item_count(base_url: str, api_key: str, user_id: Optional[str], item_typ
         logger.error(f"通过 API 获取 {item_type} 总数时失败: {e}")
         return None
 # ✨✨✨ 获取Emby项目详情 ✨✨✨
+# get_emby_item_details 默认请求的字段；批量获取时使用同一组字段，结果可以直接替代单项详情
+DEFAULT_ITEM_DETAIL_FIELDS = "ProviderIds,People,Path,OriginalTitle,DateCreated,PremiereDate,ProductionYear,ChildCount,RecursiveItemCount,Overview,CommunityRating,OfficialRating,Genres,Studios,Taglines,MediaStreams"
+DEFAULT_PERSON_FIELDS = "ImageTags,ProviderIds"
+
 def get_emby_item_details(item_id: str, emby_server_url: str, emby_api_key: str, user_id: str, fields: Optional[str] = None) -> Optional[Dict[str, Any]]:
     if not all([item_id, emby_server_url, emby_api_key, user_id]):
         logger.error("获取Emby项目详情参数不足：缺少ItemID、服务器URL、API Key或UserID。")
@@ -111,19 +122,19 @@ def get_emby_item_details(item_id: str, emby_server_url: str, emby_api_key: str,
     if fields:
         fields_to_request = fields
     else:
-        fields_to_request = "ProviderIds,People,Path,OriginalTitle,DateCreated,PremiereDate,ProductionYear,ChildCount,RecursiveItemCount,Overview,CommunityRating,OfficialRating,Genres,Studios,Taglines,MediaStreams"
+        fields_to_request = DEFAULT_ITEM_DETAIL_FIELDS
 
     params = {
         "api_key": emby_api_key,
         "Fields": fields_to_request
     }
     
-    params["PersonFields"] = "ImageTags,ProviderIds"
+    params["PersonFields"] = DEFAULT_PERSON_FIELDS
     
     try:
         # ★★★ 核心修改: 动态获取超时时间 ★★★
         api_timeout = config_manager.APP_CONFIG.get(constants.CONFIG_OPTION_EMBY_API_TIMEOUT, 60)
-        response = requests.get(url, params=params, timeout=api_timeout)
+        response = _emby_session.get(url, params=params, timeout=api_timeout)
 
         if response.status_code != 200:
             logger.trace(f"响应头部: {response.headers}")
@@ -282,7 +293,7 @@ def update_person_details(person_id: str, new_data: Dict[str, Any], emby_server_
         # ★★★ 核心修改: 动态获取超时时间 ★★★
         api_timeout = config_manager.APP_CONFIG.get(constants.CONFIG_OPTION_EMBY_API_TIMEOUT, 60)
         logger.trace(f"准备获取 Person 详情 (ID: {person_id}, UserID: {user_id}) at {api_url}")
-        response_get = requests.get(api_url, params=params, timeout=api_timeout)
+        response_get = _emby_session.get(api_url, params=params, timeout=api_timeout)
         response_get.raise_for_status()
         person_to_update = response_get.json()
     except requests.exceptions.RequestException as e:
@@ -299,7 +310,7 @@ def update_person_details(person_id: str, new_data: Dict[str, Any], emby_server_
     try:
         # ★★★ 核心修改: 动态获取超时时间 ★★★
         api_timeout = config_manager.APP_CONFIG.get(constants.CONFIG_OPTION_EMBY_API_TIMEOUT, 60)
-        response_post = requests.post(update_url, json=person_to_update, headers=headers, params=params, timeout=api_timeout)
+        response_post = _emby_session.post(update_url, json=person_to_update, headers=headers, params=params, timeout=api_timeout)
         response_post.raise_for_status()
         logger.trace(f"  -> 成功更新 Person (ID: {person_id}) 的信息。")
         return True
@@ -326,7 +337,7 @@ def update_emby_item_cast(item_id: str, new_cast_list_for_handler: List[Dict[str
     try:
         # ★★★ 核心修改: 动态获取超时时间 ★★★
         api_timeout = config_manager.APP_CONFIG.get(constants.CONFIG_OPTION_EMBY_API_TIMEOUT, 60)
-        response_get = requests.get(
+        response_get = _emby_session.get(
             current_item_url, params=params_get, timeout=api_timeout)
         response_get.raise_for_status()
         item_to_update = response_get.json()
@@ -401,7 +412,7 @@ def update_emby_item_cast(item_id: str, new_cast_list_for_handler: List[Dict[str
     try:
         # ★★★ 核心修改: 动态获取超时时间 ★★★
         api_timeout = config_manager.APP_CONFIG.get(constants.CONFIG_OPTION_EMBY_API_TIMEOUT, 60)
-        response_post = requests.post(
+        response_post = _emby_session.post(
             update_url, json=item_to_update, headers=headers, params=params_post, timeout=api_timeout)
         response_post.raise_for_status()
         logger.trace(f"成功更新Emby项目 {item_name_for_log} 的演员信息。")
@@ -422,7 +433,7 @@ def get_emby_libraries(emby_server_url, emby_api_key, user_id):
         # ★★★ 核心修改: 动态获取超时时间 ★★★
         api_timeout = config_manager.APP_CONFIG.get(constants.CONFIG_OPTION_EMBY_API_TIMEOUT, 60)
         logger.trace(f"  -> 正在从 {target_url} 获取媒体库和合集...")
-        response = requests.get(target_url, params=params, timeout=api_timeout)
+        response = _emby_session.get(target_url, params=params, timeout=api_timeout)
         response.raise_for_status()
         data = response.json()
         
@@ -471,7 +482,7 @@ def get_emby_library_items(
             "Limit": 100
         }
         try:
-            response = requests.get(api_url, params=params, timeout=api_timeout)
+            response = _emby_session.get(api_url, params=params, timeout=api_timeout)
             response.raise_for_status()
             items = response.json().get("Items", [])
             logger.info(f"搜索到 {len(items)} 个匹配项。")
@@ -517,7 +528,7 @@ def get_emby_library_items(
 
             logger.trace(f"Requesting items from library '{library_name}' (ID: {lib_id}) using URL: {api_url}.")
             
-            response = requests.get(api_url, params=params, timeout=api_timeout)
+            response = _emby_session.get(api_url, params=params, timeout=api_timeout)
             response.raise_for_status()
             items_in_lib = response.json().get("Items", [])
             
@@ -597,7 +608,7 @@ def refresh_emby_item_metadata(item_emby_id: str,
             update_url = f"{emby_server_url.rstrip('/')}/Items/{item_emby_id}"
             update_params = {"api_key": emby_api_key}
             headers = {'Content-Type': 'application/json'}
-            update_response = requests.post(update_url, json=item_data, headers=headers, params=update_params, timeout=api_timeout)
+            update_response = _emby_session.post(update_url, json=item_data, headers=headers, params=update_params, timeout=api_timeout)
             update_response.raise_for_status()
             logger.debug(f"  -> 成功更新 {log_identifier} 的锁状态。")
         else:
@@ -618,7 +629,7 @@ def refresh_emby_item_metadata(item_emby_id: str,
     }
     
     try:
-        response = requests.post(refresh_url, params=params, timeout=api_timeout)
+        response = _emby_session.post(refresh_url, params=params, timeout=api_timeout)
         if response.status_code == 204:
             logger.info(f"  -> 刷新请求已成功发送给 {log_identifier}。")
             return True
@@ -674,7 +685,7 @@ def get_all_persons_from_emby(
             logger.debug(f"  -> 获取 Person 批次: StartIndex={start_index}, Limit={batch_size}")
 
             try:
-                response = requests.get(api_url, headers=headers, params=request_params, timeout=api_timeout)
+                response = _emby_session.get(api_url, headers=headers, params=request_params, timeout=api_timeout)
                 response.raise_for_status()
                 data = response.json()
                 items = data.get("Items", [])
@@ -754,7 +765,7 @@ def get_series_children(
     try:
         # ★★★ 核心修改: 动态获取超时时间 ★★★
         api_timeout = config_manager.APP_CONFIG.get(constants.CONFIG_OPTION_EMBY_API_TIMEOUT, 60)
-        response = requests.get(api_url, params=params, timeout=api_timeout)
+        response = _emby_session.get(api_url, params=params, timeout=api_timeout)
         response.raise_for_status()
         data = response.json()
         children = data.get("Items", [])
@@ -810,6 +821,26 @@ def get_series_id_from_child_id(
     
     logger.warning(f"  -> 媒体项 '{name_for_log}' (类型: {item_type}) 的详情中未找到 'SeriesId' 字段，无法确定所属剧集。")
     return None
+
+def resolve_parent_series_ids(item_ids: List[str], base_url: str, api_key: str, user_id: str) -> Dict[str, Dict[str, Any]]:
+    """
+    批量版的 get_series_id_from_child_id：一次（分批）请求取回所有项目的类型和所属剧集。
+    返回 {原始项目ID: {"id": 需处理的顶层项目ID, "type": 原始类型, "name": 原始名称}}；
+    分集/季返回其所属剧集ID，电影/剧集返回自身ID；找不到的项目不出现在结果中。
+    """
+    items = get_emby_items_by_id(base_url, api_key, user_id, list(dict.fromkeys(item_ids)), fields="Type,SeriesId,Name")
+    resolved = {}
+    for item in items:
+        item_id, item_type = item.get("Id"), item.get("Type")
+        if item_type in ("Episode", "Season"):
+            series_id = item.get("SeriesId")
+            if not series_id:
+                logger.warning(f"  -> 媒体项 '{item.get('Name', item_id)}' (类型: {item_type}) 未找到所属剧集。")
+                continue
+            resolved[item_id] = {"id": str(series_id), "type": item_type, "name": item.get("SeriesName") or item.get("Name")}
+        else:
+            resolved[item_id] = {"id": item_id, "type": item_type, "name": item.get("Name")}
+    return resolved
 # ✨✨✨ 从 Emby 下载指定类型的图片并保存到本地 ✨✨✨
 def download_emby_image(
     item_id: str,
@@ -838,7 +869,7 @@ def download_emby_image(
     try:
         # ★★★ 核心修改: 动态获取超时时间 ★★★
         api_timeout = config_manager.APP_CONFIG.get(constants.CONFIG_OPTION_EMBY_API_TIMEOUT, 60)
-        with requests.get(image_url, params=params, stream=True, timeout=api_timeout) as r:
+        with _emby_session.get(image_url, params=params, stream=True, timeout=api_timeout) as r:
             r.raise_for_status()
             os.makedirs(os.path.dirname(save_path), exist_ok=True)
             with open(save_path, 'wb') as f:
@@ -871,7 +902,7 @@ def get_all_collections_from_emby_generic(base_url: str, api_key: str, user_id:
     try:
         # ★★★ 核心修改: 动态获取超时时间 ★★★
         api_timeout = config_manager.APP_CONFIG.get(constants.CONFIG_OPTION_EMBY_API_TIMEOUT, 60)
-        response = requests.get(api_url, params=params, timeout=api_timeout)
+        response = _emby_session.get(api_url, params=params, timeout=api_timeout)
         response.raise_for_status()
         all_collections = response.json().get("Items", [])
         logger.debug(f"  -> 成功从 Emby 获取到 {len(all_collections)} 个合集。")
@@ -899,7 +930,7 @@ def get_all_collections_with_items(base_url: str, api_key: str, user_id: str) ->
     api_timeout = config_manager.APP_CONFIG.get(constants.CONFIG_OPTION_EMBY_API_TIMEOUT, 60)
 
     try:
-        response = requests.get(api_url, params=params, timeout=api_timeout)
+        response = _emby_session.get(api_url, params=params, timeout=api_timeout)
         response.raise_for_status()
         all_collections_from_emby = response.json().get("Items", [])
         
@@ -926,7 +957,7 @@ def get_all_collections_with_items(base_url: str, api_key: str, user_id: str) ->
                 "Fields": "ProviderIds"
             }
             try:
-                children_response = requests.get(children_url, params=children_params, timeout=api_timeout)
+                children_response = _emby_session.get(children_url, params=children_params, timeout=api_timeout)
                 children_response.raise_for_status()
                 media_in_collection = children_response.json().get("Items", [])
                 
@@ -941,7 +972,7 @@ def get_all_collections_with_items(base_url: str, api_key: str, user_id: str) ->
                 collection['ExistingMovieTmdbIds'] = []
                 return collection
 
-        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+        with task_context.ContextThreadPoolExecutor(max_workers=2) as executor:
             future_to_collection = {}
             for coll in regular_collections:
                 future = executor.submit(_fetch_collection_children, coll)
@@ -972,7 +1003,7 @@ def get_emby_server_info(base_url: str, api_key: str) -> Optional[Dict[str, Any]
     try:
         # ★★★ 核心修改: 动态获取超时时间 ★★★
         api_timeout = config_manager.APP_CONFIG.get(constants.CONFIG_OPTION_EMBY_API_TIMEOUT, 60)
-        response = requests.get(api_url, params=params, timeout=api_timeout)
+        response = _emby_session.get(api_url, params=params, timeout=api_timeout)
         response.raise_for_status()
         data = response.json()
         return data
@@ -1000,7 +1031,7 @@ def get_collection_members(collection_id: str, base_url: str, api_key: str, user
     try:
         # ★★★ 核心修改: 动态获取超时时间 ★★★
         api_timeout = config_manager.APP_CONFIG.get(constants.CONFIG_OPTION_EMBY_API_TIMEOUT, 60)
-        response = requests.get(api_url, params=params, timeout=api_timeout)
+        response = _emby_session.get(api_url, params=params, timeout=api_timeout)
         response.raise_for_status()
         items = response.json().get("Items", [])
         return [item['Id'] for item in items]
@@ -1015,7 +1046,7 @@ def add_items_to_collection(collection_id: str, item_ids: List[str], base_url: s
     try:
         # ★★★ 核心修改: 动态获取超时时间 ★★★
         api_timeout = config_manager.APP_CONFIG.get(constants.CONFIG_OPTION_EMBY_API_TIMEOUT, 60)
-        response = requests.post(api_url, params=params, timeout=api_timeout)
+        response = _emby_session.post(api_url, params=params, timeout=api_timeout)
         response.raise_for_status()
         return True
     except requests.RequestException:
@@ -1112,7 +1143,7 @@ def create_or_update_collection_with_emby_ids(
             
             # ★★★ 核心修改: 动态获取超时时间 ★★★
             api_timeout = config_manager.APP_CONFIG.get(constants.CONFIG_OPTION_EMBY_API_TIMEOUT, 60)
-            response = requests.post(api_url, params=params, data=payload, timeout=api_timeout)
+            response = _emby_session.post(api_url, params=params, data=payload, timeout=api_timeout)
             response.raise_for_status()
             new_collection_info = response.json()
             emby_collection_id = new_collection_info.get('Id')
@@ -1128,7 +1159,8 @@ def get_emby_items_by_id(
     api_key: str,
     user_id: str,
     item_ids: List[str],
-    fields: Optional[str] = None
+    fields: Optional[str] = None,
+    person_fields: Optional[str] = None
 ) -> List[Dict[str, Any]]:
     """
     【V2 - 批量安全版】
@@ -1155,12 +1187,14 @@ def get_emby_items_by_id(
             "Ids": ",".join(batch_ids), # 只使用当前批次的ID
             "Fields": fields or "ProviderIds,UserData,Name,ProductionYear,CommunityRating,DateCreated,PremiereDate,Type,RecursiveItemCount,SortName"
         }
+        if person_fields:
+            params["PersonFields"] = person_fields
 
         try:
             api_timeout = config_manager.APP_CONFIG.get(constants.CONFIG_OPTION_EMBY_API_TIMEOUT, 60)
             
             logger.trace(f"  -> 正在请求批次 {i+1}/{len(id_chunks)} (包含 {len(batch_ids)} 个ID)...")
-            response = requests.get(api_url, params=params, timeout=api_timeout)
+            response = _emby_session.get(api_url, params=params, timeout=api_timeout)
             response.raise_for_status()
             
             data = response.json()
@@ -1188,7 +1222,7 @@ def append_item_to_collection(collection_id: str, item_emby_id: str, base_url: s
     try:
         # ★★★ 核心修改: 动态获取超时时间 ★★★
         api_timeout = config_manager.APP_CONFIG.get(constants.CONFIG_OPTION_EMBY_API_TIMEOUT, 60)
-        response = requests.post(api_url, params=params, timeout=api_timeout)
+        response = _emby_session.post(api_url, params=params, timeout=api_timeout)
         response.raise_for_status()
         
         logger.trace(f"成功发送追加请求：将项目 {item_emby_id} 添加到合集 {collection_id}。")
@@ -1211,7 +1245,7 @@ def get_all_libraries_with_paths(base_url: str, api_key: str) -> List[Dict[str,
         params = {"api_key": api_key}
         # ★★★ 核心修改: 动态获取超时时间 ★★★
         api_timeout = config_manager.APP_CONFIG.get(constants.CONFIG_OPTION_EMBY_API_TIMEOUT, 60)
-        response = requests.get(folders_url, params=params, timeout=api_timeout)
+        response = _emby_session.get(folders_url, params=params, timeout=api_timeout)
         response.raise_for_status()
         virtual_folders_data = response.json()
 
@@ -1299,7 +1333,7 @@ def update_emby_item_details(item_id: str, new_data: Dict[str, Any], emby_server
 
         # ★★★ 核心修改: 动态获取超时时间 ★★★
         api_timeout = config_manager.APP_CONFIG.get(constants.CONFIG_OPTION_EMBY_API_TIMEOUT, 60)
-        response_post = requests.post(update_url, json=item_to_update, headers=headers, params=params, timeout=api_timeout)
+        response_post = _emby_session.post(update_url, json=item_to_update, headers=headers, params=params, timeout=api_timeout)
         response_post.raise_for_status()
         
         logger.info(f"✅ 成功更新项目 '{item_name_for_log}' 的详情。")
@@ -1350,7 +1384,7 @@ def delete_item(item_id: str, emby_server_url: str, emby_api_key: str, user_id:
     api_timeout = cfg.get(constants.CONFIG_OPTION_EMBY_API_TIMEOUT, 60)
     
     try:
-        response = requests.post(api_url, headers=headers, params=params, timeout=api_timeout)
+        response = _emby_session.post(api_url, headers=headers, params=params, timeout=api_timeout)
         response.raise_for_status()
         logger.info(f"  -> ✅ 成功使用临时令牌删除 Emby 媒体项 ID: {item_id}。")
         return True
@@ -1404,7 +1438,7 @@ def delete_person_custom_api(base_url: str, api_key: str, person_id: str) -> boo
     
     try:
         # 这个接口是 POST 请求
-        response = requests.post(api_url, headers=headers, params=params, timeout=api_timeout)
+        response = _emby_session.post(api_url, headers=headers, params=params, timeout=api_timeout)
         response.raise_for_status()
         logger.info(f"  -> ✅ 成功使用临时令牌删除演员 ID: {person_id}。")
         return True
@@ -1445,7 +1479,7 @@ def check_user_has_visible_items_in_id_list(
 
     try:
         api_timeout = config_manager.APP_CONFIG.get(constants.CONFIG_OPTION_EMBY_API_TIMEOUT, 15)
-        response = requests.get(api_url, params=params, timeout=api_timeout)
+        response = _emby_session.get(api_url, params=params, timeout=api_timeout)
         response.raise_for_status()
         data = response.json()
         
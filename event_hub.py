@@ -0,0 +1,154 @@
+# event_hub.py
+
+import threading
+import time
+from collections import deque
+from typing import Dict, Any, Optional, List, Tuple
+
+# ==============================================================================
+# ✨ 前端事件中心 (Event Hub)
+# ------------------------------------------------------------------------------
+# 日志和任务状态通过发布/订阅推送给已连接的前端（WebSocket: /api/events/ws，SSE: /api/status/stream），
+# 取代前端轮询 /api/status 拉取 100 条日志队列的方式：
+# - 每个事件带递增的序号 seq：log（一条日志）、status（任务状态的增量，只包含变化的字段；
+#   lanes 只包含变化的通道）、logs_cleared（新任务开始时清空日志）；
+# - 重放缓冲区保留最近 REPLAY_BUFFER_SIZE 个事件，客户端重连时带上最后收到的 seq，
+#   仍在缓冲区内则补发缺失的事件，否则发送一个 snapshot（完整状态 + 最近的日志）；
+# - 背压：每个客户端有独立的有界队列，发布方从不阻塞。慢客户端的队列满了之后丢弃其积压的事件，
+#   下次读取时改为发送 snapshot，让它从当前状态继续，内存占用不会随慢客户端增长。
+# 中心的锁内不调用任何外部模块（不取任务调度锁），发布可以在任何线程、持有任何锁时进行。
+# 本模块不导入任何业务模块，logger_setup / task_manager 都可以使用。
+# ==============================================================================
+
+EVENT_LOG = 'log'
+EVENT_STATUS = 'status'
+EVENT_LOGS_CLEARED = 'logs_cleared'
+EVENT_SNAPSHOT = 'snapshot'
+
+REPLAY_BUFFER_SIZE = 2000
+CLIENT_QUEUE_SIZE = 1000
+LOG_TAIL_SIZE = 100
+
+def _status_delta(previous: Dict[str, Any], current: Dict[str, Any]) -> Dict[str, Any]:
+    """计算任务状态的增量：顶层变化的字段；lanes 只包含变化的通道。"""
+    delta = {}
+    for key, value in current.items():
+        if key == 'lanes' and isinstance(value, dict):
+            old_lanes = previous.get('lanes') or {}
+            changed = {lane: lane_status for lane, lane_status in value.items() if old_lanes.get(lane) != lane_status}
+            if changed:
+                delta['lanes'] = changed
+        elif previous.get(key) != value:
+            delta[key] = value
+    return delta
+
+class Subscription:
+    """一个已连接客户端的有界事件队列。"""
+    def __init__(self, hub: 'EventHub', max_size: int):
+        self._hub = hub
+        self._max_size = max_size
+        self._queue: deque = deque()
+        self._ready = threading.Event()
+        self.lagged = False
+        self.dropped = 0
+
+    def _offer(self, event: Dict[str, Any]):
+        """【需持有 hub 锁】"""
+        if self.lagged:
+            self.dropped += 1
+            return
+        if len(self._queue) >= self._max_size:
+            # 客户端跟不上：丢弃积压，下次读取时发送快照
+            self.dropped += len(self._queue) + 1
+            self._queue.clear()
+            self.lagged = True
+        else:
+            self._queue.append(event)
+        self._ready.set()
+
+    def next_batch(self, timeout: float) -> List[Dict[str, Any]]:
+        """等待并取出所有待发送的事件；超时返回空列表。落后过多时返回一个 snapshot 事件。"""
+        if not self._ready.wait(timeout):
+            return []
+        return self._hub._drain(self)
+
+class EventHub:
+    def __init__(self, replay_size: int = REPLAY_BUFFER_SIZE, client_queue_size: int = CLIENT_QUEUE_SIZE,
+                 log_tail_size: int = LOG_TAIL_SIZE):
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._buffer: deque = deque(maxlen=replay_size)
+        self._log_tail: deque = deque(maxlen=log_tail_size)
+        self._status: Dict[str, Any] = {}
+        self._subscribers: List[Subscription] = []
+        self._client_queue_size = client_queue_size
+
+    # --- 发布 ---
+    def _publish_locked(self, event_type: str, data: Any) -> Dict[str, Any]:
+        self._seq += 1
+        event = {"seq": self._seq, "type": event_type, "data": data, "ts": time.time()}
+        self._buffer.append(event)
+        for subscription in self._subscribers:
+            subscription._offer(event)
+        return event
+
+    def publish_log(self, entry: str):
+        with self._lock:
+            self._log_tail.append(entry)
+            self._publish_locked(EVENT_LOG, entry)
+
+    def clear_logs(self):
+        with self._lock:
+            self._log_tail.clear()
+            self._publish_locked(EVENT_LOGS_CLEARED, None)
+
+    def publish_status(self, status: Dict[str, Any]) -> bool:
+        """发布完整的任务状态，中心只推送与上一次相比的增量。无变化时返回 False。"""
+        with self._lock:
+            delta = _status_delta(self._status, status)
+            if not delta:
+                return False
+            self._status = status
+            self._publish_locked(EVENT_STATUS, delta)
+            return True
+
+    # --- 订阅 ---
+    def _snapshot_locked(self) -> Dict[str, Any]:
+        return {"seq": self._seq, "type": EVENT_SNAPSHOT, "ts": time.time(),
+                "data": {"status": self._status or None, "logs": list(self._log_tail)}}
+
+    def subscribe(self, since: Optional[int] = None) -> Tuple[Subscription, List[Dict[str, Any]]]:
+        """
+        登记一个客户端，返回 (订阅, 初始事件)。
+        since 为客户端最后收到的 seq：仍在重放缓冲区内时初始事件为缺失的事件，否则为一个 snapshot。
+        """
+        with self._lock:
+            subscription = Subscription(self, self._client_queue_size)
+            self._subscribers.append(subscription)
+            if since is not None and 0 <= since <= self._seq:
+                oldest = self._buffer[0]["seq"] if self._buffer else self._seq + 1
+                if since + 1 >= oldest:
+                    return subscription, [event for event in self._buffer if event["seq"] > since]
+            return subscription, [self._snapshot_locked()]
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            if subscription in self._subscribers:
+                self._subscribers.remove(subscription)
+
+    def _drain(self, subscription: Subscription) -> List[Dict[str, Any]]:
+        with self._lock:
+            subscription._ready.clear()
+            if subscription.lagged:
+                subscription.lagged = False
+                subscription._queue.clear()
+                return [self._snapshot_locked()]
+            events = list(subscription._queue)
+            subscription._queue.clear()
+            return events
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
+
+hub = EventHub()
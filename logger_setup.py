@@ -4,6 +4,8 @@ import sys
 from collections import deque
 import constants
 import os
+import task_metrics
+import event_hub
 from concurrent_log_handler import ConcurrentRotatingFileHandler
 
 # --- 定义常量 ---
@@ -24,6 +26,15 @@ logging.Logger.trace = trace
 
 # --- 前端队列和 Handler ---
 frontend_log_queue = deque(maxlen=100)
+# 新日志进入前端队列时调用的回调
+frontend_log_listeners = []
+
+def add_frontend_log_listener(listener):
+    if listener not in frontend_log_listeners:
+        frontend_log_listeners.append(listener)
+
+# 每条前端日志都发布到事件中心，由 WebSocket/SSE 推送给已连接的前端（不再受 100 条队列轮询间隔的限制）
+add_frontend_log_listener(event_hub.hub.publish_log)
 
 class FrontendQueueHandler(logging.Handler):
     def __init__(self, *args, **kwargs):
@@ -36,6 +47,8 @@ class FrontendQueueHandler(logging.Handler):
             # 前端只应显示 INFO 及以上级别，所以这里加一个判断
             if record.levelno >= logging.INFO:
                 frontend_log_queue.append(log_entry)
+                for listener in frontend_log_listeners:
+                    listener(log_entry)
         except Exception:
             self.handleError(record)
 
@@ -89,6 +102,9 @@ try:
 except Exception as e:
     logging.error(f"Failed to add FrontendQueueHandler: {e}", exc_info=True)
 
+# 3. 任务运行指标的错误计数 Handler（上面清空了根记录器的处理器，需要重新安装）
+task_metrics.install_error_handler()
+
 # ★★★ 新增部分 2: 获取 httpx logger 并应用过滤器 ★★★
 # 获取名为 'httpx' 的 logger
 httpx_logger = logging.getLogger('httpx')
@@ -1,28 +1,53 @@
-# maoyan_fetcher.py (V3.0 - 无 Playwright 终极版)
+# maoyan_fetcher.py (V4.0 - 进程内调用版)
 import logging
 import requests
 import argparse
 import json
 import random
+import threading
 from typing import List, Dict, Tuple
 import sys
 import os
 import time
-# ★★★ 不再需要 Playwright ★★★
 
-# -- 关键：确保可以导入项目中的其他模块 --
+# -- 关键：作为独立脚本运行时，确保可以导入项目中的其他模块 --
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-try:
-    import tmdb_handler
-except ImportError as e:
-    print(f"错误：缺少 tmdb_handler 模块。请确保路径正确。详细信息: {e}")
-    sys.exit(1)
+import tmdb_handler
 
-# --- 日志记录设置 ---
-logging.basicConfig(level=logging.INFO, format='[%(asctime)s] [%(levelname)s] - %(message)s')
 logger = logging.getLogger(__name__)
 
+# ★★★ 进程内调用：共享会话 + 榜单结果缓存 ★★★
+# 猫眼榜单数据更新频率不高，同一榜单在有效期内只请求一次；
+# 多个合集同时请求同一平台/类型时，只有第一个真正发起请求，其余等待并复用结果。
+MAOYAN_CACHE_TTL_SECONDS = 30 * 60
+_maoyan_session = requests.Session()
+_rank_cache: Dict[Tuple[str, str], Tuple[float, List[Dict]]] = {}
+_result_cache: Dict[Tuple, Tuple[float, List[Dict[str, str]]]] = {}
+_cache_locks: Dict[Tuple, threading.Lock] = {}
+_cache_locks_guard = threading.Lock()
+
+def _get_cache_lock(key: Tuple) -> threading.Lock:
+    with _cache_locks_guard:
+        lock = _cache_locks.get(key)
+        if lock is None:
+            lock = threading.Lock()
+            _cache_locks[key] = lock
+        return lock
+
+def _get_or_compute(cache: Dict, key: Tuple, compute_func):
+    """带有效期的缓存读取；同一 key 的并发调用会串行化，第二个调用者直接拿到第一个的结果。"""
+    with _get_cache_lock(key):
+        cached = cache.get(key)
+        if cached and time.time() - cached[0] < MAOYAN_CACHE_TTL_SECONDS:
+            logger.debug(f"  -> [猫眼缓存] 命中: {key}")
+            return cached[1]
+        value = compute_func()
+        # 只缓存非空结果，避免一次失败的请求在有效期内反复被复用
+        if value:
+            cache[key] = (time.time(), value)
+        return value
+
 def get_random_user_agent() -> str:
     user_agents = [
         "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36 Edg/121.0.0.0",
@@ -39,78 +64,88 @@ def get_cookies() -> Dict[str, str]:
     logger.debug("当前 API 无需 Cookie，跳过 Playwright 浏览器操作。")
     return {}
 
-def get_maoyan_rank_titles(types_to_fetch: List[str], platform: str, num: int) -> Tuple[List[Dict], List[Dict]]:
-    movies_list = []
-    tv_list = []
-    
+def _request_with_retries(url: str, description: str) -> Dict:
+    """带重试的 GET 请求，返回解析后的 JSON；彻底失败时返回空字典。"""
+    MAX_RETRIES = 3
+    RETRY_DELAY_SECONDS = 3
     headers = {'User-Agent': get_random_user_agent()}
     cookies = get_cookies()
 
+    for attempt in range(MAX_RETRIES):
+        try:
+            logger.info(f"正在获取{description} (第 {attempt + 1}/{MAX_RETRIES} 次尝试)...")
+            response = _maoyan_session.get(url, headers=headers, cookies=cookies, timeout=30)
+            response.raise_for_status()
+            logger.info(f"{description}获取成功。")
+            return response.json()
+        except Exception as e:
+            logger.warning(f"获取{description}失败 (第 {attempt + 1} 次尝试): {e}")
+            if attempt < MAX_RETRIES - 1:
+                delay = RETRY_DELAY_SECONDS * (attempt + 1)
+                logger.info(f"将在 {delay} 秒后重试...")
+                time.sleep(delay) # 这个sleep只在失败后触发，必须保留
+            else:
+                logger.error(f"获取{description}在多次重试后彻底失败。")
+    return {}
+
+def _fetch_rank_titles(rank_type: str, platform: str) -> List[Dict]:
+    """获取单个榜单的完整标题列表（不截断），结果按 (类型, 平台) 缓存。"""
     maoyan_url = 'https://piaofang.maoyan.com'
+    tv_heat_map = {'web-heat': '0', 'web-tv': '1', 'zongyi': '2'}
+    platform_code_map = {'all': '', 'tencent': '3', 'iqiyi': '2', 'youku': '1', 'mango': '7'}
 
-    MAX_RETRIES = 3
-    RETRY_DELAY_SECONDS = 3
+    if rank_type == 'movie':
+        # 电影票房榜与平台无关，所有平台共享同一份结果
+        def fetch_movie():
+            data = _request_with_retries(f'{maoyan_url}/dashboard-ajax/movie', "电影票房榜")
+            movie_list = data.get('movieList', {}).get('list', [])
+            return [
+                {"title": movie.get('movieInfo', {}).get('movieName')}
+                for movie in movie_list if movie.get('movieInfo', {}).get('movieName')
+            ]
+        return _get_or_compute(_rank_cache, ('movie', 'all'), fetch_movie)
+
+    if rank_type in tv_heat_map:
+        platform_code = platform_code_map.get(platform, '')
+        def fetch_tv():
+            url = f'{maoyan_url}/dashboard/webHeatData?seriesType={tv_heat_map[rank_type]}&platformType={platform_code}&showDate=2'
+            data = _request_with_retries(url, f"热度榜 (类型: {rank_type})")
+            heat_list = data.get('dataList', {}).get('list', [])
+            return [
+                {"title": item.get('seriesInfo', {}).get('name')}
+                for item in heat_list if item.get('seriesInfo', {}).get('name')
+            ]
+        return _get_or_compute(_rank_cache, (rank_type, platform), fetch_tv)
+
+    logger.warning(f"未知的猫眼榜单类型: '{rank_type}'，已跳过。")
+    return []
+
+def get_maoyan_rank_titles(types_to_fetch: List[str], platform: str, num: int) -> Tuple[List[Dict], List[Dict]]:
+    movies_list = []
+    tv_list = []
 
-    # --- 1. 获取电影票房榜 (只保留重试逻辑) ---
+    # --- 1. 获取电影票房榜 ---
     if 'movie' in types_to_fetch:
-        url = f'{maoyan_url}/dashboard-ajax/movie'
-        for attempt in range(MAX_RETRIES):
-            try:
-                logger.info(f"正在获取电影票房榜 (第 {attempt + 1}/{MAX_RETRIES} 次尝试)...")
-                response = requests.get(url, headers=headers, cookies=cookies, timeout=30)
-                response.raise_for_status()
-                data = response.json().get('movieList', {}).get('list', [])
-                movies_list.extend([
-                    {"title": movie.get('movieInfo', {}).get('movieName')}
-                    for movie in data if movie.get('movieInfo', {}).get('movieName')
-                ][:num])
-                logger.info("电影票房榜获取成功。")
-                break # 成功后立即跳出重试循环
-            except Exception as e:
-                logger.warning(f"获取电影票房榜失败 (第 {attempt + 1} 次尝试): {e}")
-                if attempt < MAX_RETRIES - 1:
-                    delay = RETRY_DELAY_SECONDS * (attempt + 1)
-                    logger.info(f"将在 {delay} 秒后重试...")
-                    time.sleep(delay) # 这个sleep只在失败后触发，必须保留
-                else:
-                    logger.error("获取电影票房榜在多次重试后彻底失败。")
-
-    # --- 2. 获取电视剧/综艺热度榜 (只保留重试逻辑) ---
-    tv_heat_map = {'web-heat': '0', 'web-tv': '1', 'zongyi': '2'}
-    platform_code_map = {'all': '', 'tencent': '3', 'iqiyi': '2', 'youku': '1', 'mango': '7'}
-    platform_code = platform_code_map.get(platform, '')
-    
-    tv_types_to_fetch = [t for t in types_to_fetch if t in tv_heat_map]
-    if tv_types_to_fetch:
-        for tv_type in tv_types_to_fetch:
-            series_type_code = tv_heat_map[tv_type]
-            url = f'{maoyan_url}/dashboard/webHeatData?seriesType={series_type_code}&platformType={platform_code}&showDate=2'
-            for attempt in range(MAX_RETRIES):
-                try:
-                    logger.info(f"正在获取热度榜 (类型: {tv_type}, 第 {attempt + 1}/{MAX_RETRIES} 次尝试)...")
-                    response = requests.get(url, headers=headers, cookies=cookies, timeout=30)
-                    response.raise_for_status()
-                    data = response.json().get('dataList', {}).get('list', [])
-                    tv_list.extend([
-                        {"title": item.get('seriesInfo', {}).get('name')}
-                        for item in data if item.get('seriesInfo', {}).get('name')
-                    ][:num])
-                    logger.info(f"热度榜 '{tv_type}' 获取成功。")
-                    break # 成功后立即跳出重试循环
-                except Exception as e:
-                    logger.warning(f"获取 {tv_type} 热度榜失败 (第 {attempt + 1} 次尝试): {e}")
-                    if attempt < MAX_RETRIES - 1:
-                        delay = RETRY_DELAY_SECONDS * (attempt + 1)
-                        logger.info(f"将在 {delay} 秒后重试...")
-                        time.sleep(delay) # 这个sleep只在失败后触发，必须保留
-                    else:
-                        logger.error(f"获取 {tv_type} 热度榜在多次重试后彻底失败。")
+        movies_list.extend(_fetch_rank_titles('movie', platform)[:num])
+
+    # --- 2. 获取电视剧/综艺热度榜 ---
+    for tv_type in [t for t in types_to_fetch if t != 'movie']:
+        tv_list.extend(_fetch_rank_titles(tv_type, platform)[:num])
 
     unique_tv_list = list({item['title']: item for item in tv_list}.values())
     return movies_list, unique_tv_list
 
-# ... main() 和 match_titles_to_tmdb() 函数保持不变 ...
+def _search_title_on_tmdb(title: str, item_type: str, tmdb_api_key: str):
+    results = tmdb_handler.search_media(title, tmdb_api_key, item_type)
+    if not results:
+        return None
+    best_match = results[0]
+    match_name = best_match.get('title') if item_type == 'Movie' else best_match.get('name')
+    logger.info(f"  -> 匹配成功: {match_name} (ID: {best_match.get('id')})")
+    return str(best_match.get('id')), item_type
+
 def match_titles_to_tmdb(titles: List[Dict], item_type: str, tmdb_api_key: str) -> List[Dict[str, str]]:
+    """逐个匹配标题，优先使用与 ListImporter 共享的持久化标题匹配缓存，只有新上榜的条目才会真正搜索。"""
     matched_items = []
     for item in titles:
         title = item.get('title')
@@ -118,19 +153,38 @@ def match_titles_to_tmdb(titles: List[Dict], item_type: str, tmdb_api_key: str)
             continue
         
         logger.info(f"正在为 {item_type} '{title}' 搜索TMDb匹配...")
-        results = tmdb_handler.search_media(title, tmdb_api_key, item_type)
-        if results:
-            best_match = results[0]
-            tmdb_id = str(best_match.get('id'))
-            match_name = best_match.get('title') if item_type == 'Movie' else best_match.get('name')
-            logger.info(f"  -> 匹配成功: {match_name} (ID: {tmdb_id})")
-            matched_items.append({'id': tmdb_id, 'type': item_type})
+        match_result = tmdb_handler.match_title_with_cache(
+            title, item_type, None,
+            lambda: _search_title_on_tmdb(title, item_type, tmdb_api_key)
+        )
+        if match_result:
+            matched_items.append({'id': match_result[0], 'type': item_type})
         else:
             logger.warning(f"  -> 未能为 '{title}' 找到任何TMDb匹配项。")
             
     return matched_items
 
+def fetch_maoyan_items(types_to_fetch: List[str], platform: str, num: int, tmdb_api_key: str) -> List[Dict[str, str]]:
+    """
+    【进程内入口】获取猫眼榜单并匹配为 TMDb 项目列表 [{'id': ..., 'type': ...}]。
+    直接在调用方的 worker (greenlet) 中运行，结果按 (类型, 平台, 数量) 缓存，
+    相同平台/类型的多个合集共享同一次抓取。
+    """
+    cache_key = (tuple(sorted(types_to_fetch)), platform, num)
+
+    def compute():
+        logger.info(f"开始执行猫眼榜单数据抓取和匹配任务 (平台: {platform}, 类型: {types_to_fetch})...")
+        movie_titles, tv_titles = get_maoyan_rank_titles(types_to_fetch, platform, num)
+        matched_movies = match_titles_to_tmdb(movie_titles, 'Movie', tmdb_api_key)
+        matched_series = match_titles_to_tmdb(tv_titles, 'Series', tmdb_api_key)
+        all_items = matched_movies + matched_series
+        return list({f"{item['type']}-{item['id']}": item for item in all_items}.values())
+
+    return [dict(item) for item in _get_or_compute(_result_cache, cache_key, compute)]
+
 def main():
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] [%(levelname)s] - %(message)s')
+
     parser = argparse.ArgumentParser(description="独立的猫眼榜单获取和TMDb匹配器。")
     parser.add_argument('--api-key', required=True, help="TMDb API Key。")
     parser.add_argument('--output-file', required=True, help="用于存储结果的JSON文件路径。")
@@ -139,15 +193,14 @@ def main():
     parser.add_argument('--platform', default='all', help="平台来源 (all, tencent, iqiyi, youku, mango)。")
     args = parser.parse_args()
 
-    logger.info(f"开始执行猫眼榜单数据抓取和匹配任务 (平台: {args.platform})...")
-    
-    movie_titles, tv_titles = get_maoyan_rank_titles(args.types, args.platform, args.num)
-    
-    matched_movies = match_titles_to_tmdb(movie_titles, 'Movie', args.api_key)
-    matched_series = match_titles_to_tmdb(tv_titles, 'Series', args.api_key)
+    # 加载应用配置，使独立进程也能访问数据库中的标题匹配缓存；失败时退化为直接搜索
+    try:
+        import config_manager
+        config_manager.load_config()
+    except Exception as e:
+        logger.warning(f"加载应用配置失败，将不使用标题匹配缓存: {e}")
     
-    all_items = matched_movies + matched_series
-    unique_items = list({f"{item['type']}-{item['id']}": item for item in all_items}.values())
+    unique_items = fetch_maoyan_items(args.types, args.platform, args.num, args.api_key)
     
     try:
         with open(args.output_file, 'w', encoding='utf-8') as f:
@@ -160,4 +213,4 @@ def main():
     logger.info("任务执行完毕。")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
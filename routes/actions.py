@@ -6,7 +6,7 @@ import logging
 # 导入底层和共享模块
 import task_manager
 import extensions
-from extensions import login_required, processor_ready_required, task_lock_required
+from extensions import login_required, processor_ready_required
 
 # 1. 创建蓝图
 actions_bp = Blueprint('actions', __name__, url_prefix='/api')
@@ -45,7 +45,6 @@ def api_reprocess_item(item_id):
 # ★★★ 重新处理所有待复核项 ★★★
 @actions_bp.route('/actions/reprocess_all_review_items', methods=['POST'])
 @login_required
-@task_lock_required
 @processor_ready_required
 def api_reprocess_all_review_items():
     from tasks import task_reprocess_all_review_items # 延迟导入
@@ -13,6 +13,7 @@ from tasks import get_task_registry
 import emby_handler
 from services.cover_generator.styles.badge_drawer import draw_badge
 from services.cover_generator import CoverGeneratorService 
+from services.cover_generator import render_primitives
 
 logger = logging.getLogger(__name__)
 
@@ -54,6 +55,23 @@ def get_default_config():
         "blur_size_multi_1": 50, "color_ratio_multi_1": 0.8,
         "multi_1_blur": False, "multi_1_use_main_font": False,
         "multi_1_use_primary": True,
+
+        # 取色方式: 'histogram' = 按出现次数取主色, 'kmeans' = k-means 聚类调色板
+        "palette_mode": "histogram",
+        # 背景模糊方式: 'fast' = 降采样后模糊再放大 (快), 'quality' = 全分辨率模糊
+        "blur_mode": "fast",
+        # 封面编码: 按优先级尝试的格式 (jpeg / webp / avif / png) 与体积上限 (KB)
+        "cover_formats": ["jpeg"],
+        "cover_max_kb": 400,
+
+        # 批量生成性能设置
+        "render_mode": "thread", # 'thread' = 在 I/O 线程中渲染, 'process_pool' = spawn 进程池并行渲染 (子进程会重新导入主程序)
+        "render_workers": 0, # 渲染进程数，0 表示自动 (min(4, CPU核数))
+        "io_workers": 4, # 下载/上传素材的并发线程数
+        "poster_download_workers": 6, # 多图模式下单个封面并发下载海报的线程数
+        "poster_cache_max_mb": 512, # 海报本地缓存上限 (MB)，超出后按最近最少使用淘汰
+        "cover_queue_window_seconds": 60, # 入库封面合并窗口 (秒)，窗口内同一媒体库的多次入库只生成一次封面
+        "random_refresh_hours": 24, # 随机排序的封面最长保留时间 (小时)，超过后即使输入未变化也重新随机渲染，0 表示不按时间刷新
     }
 
 # --- 获取封面生成器的配置 ---
@@ -89,6 +107,8 @@ def save_cover_generator_config():
         new_config = request.json
         # ★★★ 核心修改 4：将配置保存到数据库 ★★★
         db_handler.save_setting('cover_generator_config', new_config)
+        # 字体可能在原路径上被替换，清空按路径缓存的字体和渲染基元
+        render_primitives.clear_all()
         
         logger.info("封面生成器配置已保存到数据库。")
         return jsonify({"message": "配置已成功保存！"})
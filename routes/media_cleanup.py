@@ -1,7 +1,7 @@
 # routes/media_cleanup.py
 
 from flask import Blueprint, jsonify, request
-from extensions import task_lock_required, processor_ready_required
+from extensions import processor_ready_required
 import db_handler
 import task_manager
 import config_manager
@@ -22,7 +22,6 @@ def get_cleanup_tasks():
         return jsonify({"error": f"获取清理任务失败: {e}"}), 500
 
 @media_cleanup_bp.route('/api/cleanup/execute', methods=['POST'])
-@task_lock_required
 @processor_ready_required
 def execute_cleanup_tasks():
     """执行指定的清理任务。"""
@@ -9,7 +9,7 @@ import moviepilot_handler
 import config_manager
 import extensions
 import emby_handler
-from extensions import login_required, task_lock_required
+from extensions import login_required
 
 resubscribe_bp = Blueprint('resubscribe', __name__, url_prefix='/api/resubscribe')
 logger = logging.getLogger(__name__)
@@ -113,7 +113,6 @@ def get_library_status():
 
 @resubscribe_bp.route('/refresh_status', methods=['POST'])
 @login_required
-@task_lock_required
 def trigger_refresh_status():
     """触发缓存刷新任务。"""
     try:
@@ -128,7 +127,6 @@ def trigger_refresh_status():
 
 @resubscribe_bp.route('/resubscribe_all', methods=['POST'])
 @login_required
-@task_lock_required
 def trigger_resubscribe_all():
     """触发一键洗版全部的任务。"""
     try:
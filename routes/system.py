@@ -2,6 +2,7 @@
 
 from flask import Blueprint, jsonify, request, Response, stream_with_context
 import logging
+from typing import Optional
 import json
 import re
 import requests
@@ -10,6 +11,7 @@ import docker
 # 导入底层模块
 import task_manager
 from logger_setup import frontend_log_queue
+import event_hub
 import config_manager
 import db_handler
 import emby_handler
@@ -23,34 +25,104 @@ import github_handler
 system_bp = Blueprint('system', __name__, url_prefix='/api')
 logger = logging.getLogger(__name__)
 
+# 事件流空闲时的保活间隔
+EVENT_STREAM_KEEPALIVE_SECONDS = 15
+
 # 2. 定义路由
 
 # --- 任务状态与控制 ---
-@system_bp.route('/status', methods=['GET'])
-def api_get_task_status():
+def _build_status_payload() -> dict:
     status_data = task_manager.get_task_status()
     status_data['logs'] = list(frontend_log_queue)
-    return jsonify(status_data)
+    return status_data
+
+def _parse_since(value) -> Optional[int]:
+    try:
+        return int(value) if value not in (None, '') else None
+    except (TypeError, ValueError):
+        return None
+
+def _subscribe_events(since: Optional[int]):
+    task_manager.ensure_status_publisher()
+    return event_hub.hub.subscribe(since)
+
+@system_bp.route('/status', methods=['GET'])
+def api_get_task_status():
+    return jsonify(_build_status_payload())
+
+@system_bp.route('/events/ws')
+def api_events_websocket():
+    """
+    以 WebSocket 推送日志和任务状态增量（见 event_hub）。
+    客户端重连时通过 ?since=<最后收到的 seq> 补发断线期间的事件；每条消息是一个事件数组。
+    """
+    ws = request.environ.get('wsgi.websocket')
+    if not ws:
+        return jsonify({"error": "需要 WebSocket 连接"}), 400
+
+    subscription, initial_events = _subscribe_events(_parse_since(request.args.get('since')))
+    logger.trace(f"前端事件 WebSocket 已连接 (补发 {len(initial_events)} 个事件)。")
+    try:
+        if initial_events:
+            ws.send(json.dumps(initial_events, ensure_ascii=False, default=str))
+        while not ws.closed:
+            events = subscription.next_batch(EVENT_STREAM_KEEPALIVE_SECONDS)
+            # 空闲时发送空数组保活，连接已断开时 send 会抛出异常
+            ws.send(json.dumps(events, ensure_ascii=False, default=str))
+    except Exception as e:
+        logger.trace(f"前端事件 WebSocket 已断开: {e}")
+    finally:
+        event_hub.hub.unsubscribe(subscription)
+        if subscription.dropped:
+            logger.debug(f"前端事件客户端处理过慢，共丢弃 {subscription.dropped} 个事件（已用快照补齐）。")
+    return Response()
+
+@system_bp.route('/status/stream', methods=['GET'])
+def api_stream_task_status():
+    """
+    以 Server-Sent Events 推送日志和任务状态增量，供无法使用 WebSocket 的环境（如不转发 Upgrade 的反向代理）。
+    事件格式与 /api/events/ws 相同；浏览器重连时自动带上 Last-Event-ID，由事件中心补发缺失的事件。
+    """
+    since = _parse_since(request.headers.get('Last-Event-ID') or request.args.get('since'))
+
+    def generate_events():
+        subscription, initial_events = _subscribe_events(since)
+        try:
+            # 断线后浏览器 3 秒后自动重连
+            yield "retry: 3000\n\n"
+            events = initial_events
+            while True:
+                if not events:
+                    yield ": keep-alive\n\n"
+                for event in events:
+                    yield f"id: {event['seq']}\ndata: {json.dumps(event, ensure_ascii=False, default=str)}\n\n"
+                events = subscription.next_batch(EVENT_STREAM_KEEPALIVE_SECONDS)
+        finally:
+            event_hub.hub.unsubscribe(subscription)
+
+    response = Response(stream_with_context(generate_events()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 @system_bp.route('/trigger_stop_task', methods=['POST'])
 def api_handle_trigger_stop_task():
+    """停止任务：请求体带 task_id 时只停止该任务，否则停止所有正在运行的任务。"""
     logger.debug("API (Blueprint): Received request to stop current task.")
-    stopped_any = False
-    if extensions.media_processor_instance:
-        extensions.media_processor_instance.signal_stop()
-        stopped_any = True
-    if extensions.watchlist_processor_instance:
-        extensions.watchlist_processor_instance.signal_stop()
-        stopped_any = True
-    if extensions.actor_subscription_processor_instance:
-        extensions.actor_subscription_processor_instance.signal_stop()
-        stopped_any = True
-
-    if stopped_any:
-        return jsonify({"message": "已发送停止任务请求。"}), 200
-    else:
+    if not extensions.media_processor_instance:
         return jsonify({"error": "核心处理器未就绪"}), 503
 
+    task_id = (request.get_json(silent=True) or {}).get("task_id")
+    if task_id is not None:
+        try:
+            task_id = int(task_id)
+        except (TypeError, ValueError):
+            return jsonify({"error": "无效的 task_id"}), 400
+    stopped = task_manager.stop_task(task_id)
+    if task_id is not None and not stopped:
+        return jsonify({"error": "任务不存在或已结束"}), 404
+    return jsonify({"message": "已发送停止任务请求。", "stopped": stopped}), 200
+
 # --- API 端点：获取当前配置 ---
 @system_bp.route('/config', methods=['GET'])
 def api_get_config():
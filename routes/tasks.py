@@ -1,10 +1,13 @@
 # routes/tasks.py
 
 import logging
+from datetime import datetime
+from decimal import Decimal
 from flask import Blueprint, request, jsonify
 
 # 导入您项目中用于管理和执行任务的核心模块
 import task_manager 
+import db_handler
 from extensions import login_required, processor_ready_required
 # ★★★ 导入任务注册表，这是“翻译”的关键 ★★★
 from tasks import get_task_registry
@@ -44,11 +47,6 @@ def run_task():
     一个通用的、用于从前端触发后台任务的API端点。
     它会从任务注册表中查找任务所需处理器的类型，并精确地提交给任务管理器。
     """
-    if task_manager.is_task_running():
-        running_task_name = task_manager.get_task_status().get('current_action', '未知任务')
-        logger.warning(f"任务提交被拒绝：已有任务 '{running_task_name}' 正在运行。")
-        return jsonify({"error": f"任务提交失败，已有任务 '{running_task_name}' 正在运行。"}), 409
-
     data = request.get_json()
     if not data or 'task_name' not in data:
         return jsonify({"error": "请求体中缺少 'task_name' 参数"}), 400
@@ -75,8 +73,55 @@ def run_task():
         if success:
             return jsonify({"message": f"任务 '{task_description}' 已成功提交。"}), 202
         else:
-            return jsonify({"error": "任务提交失败，未知错误。"}), 500
+            return jsonify({"error": f"任务 '{task_description}' 已在排队或运行中。"}), 409
 
     except Exception as e:
         logger.error(f"提交任务 '{task_key}' 时出错: {e}", exc_info=True)
-        return jsonify({"error": f"服务器内部错误: {e}"}), 500
\ No newline at end of file
+        return jsonify({"error": f"服务器内部错误: {e}"}), 500
+
+# --- 任务运行记录与趋势 ---
+def _resolve_run_task_key(task_key):
+    """task_runs 以任务函数名记录，允许前端直接传注册表中的任务Key。"""
+    if not task_key:
+        return None
+    task_info = get_task_registry().get(task_key)
+    return task_info[0].__name__ if task_info else task_key
+
+def _serialize_run_row(row):
+    serialized = {}
+    for key, value in row.items():
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        elif isinstance(value, Decimal):
+            value = round(float(value), 3)
+        serialized[key] = value
+    return serialized
+
+@tasks_bp.route('/runs', methods=['GET'])
+@login_required
+def get_task_runs():
+    """返回最近的任务运行记录。参数: task_key (可选，任务Key或任务函数名), limit (默认100，最多1000)。"""
+    try:
+        limit = min(max(request.args.get('limit', 100, type=int), 1), 1000)
+        task_key = _resolve_run_task_key(request.args.get('task_key'))
+        runs = db_handler.get_task_runs(task_key=task_key, limit=limit)
+        return jsonify([_serialize_run_row(run) for run in runs]), 200
+    except Exception as e:
+        logger.error(f"获取任务运行记录时出错: {e}", exc_info=True)
+        return jsonify({"error": "无法获取任务运行记录"}), 500
+
+@tasks_bp.route('/trends', methods=['GET'])
+@login_required
+def get_task_trends():
+    """
+    按任务和天汇总的运行趋势：次数、各结束状态、平均/最长耗时、处理项目数、API 调用数、数据库耗时和错误数。
+    参数: days (默认30，最多365), task_key (可选)。
+    """
+    try:
+        days = min(max(request.args.get('days', 30, type=int), 1), 365)
+        task_key = _resolve_run_task_key(request.args.get('task_key'))
+        trends = db_handler.get_task_run_trends(days=days, task_key=task_key)
+        return jsonify({"days": days, "task_key": task_key, "trends": [_serialize_run_row(row) for row in trends]}), 200
+    except Exception as e:
+        logger.error(f"获取任务运行趋势时出错: {e}", exc_info=True)
+        return jsonify({"error": "无法获取任务运行趋势"}), 500
@@ -1,11 +1,15 @@
 # scheduler_manager.py
 
 import logging
+import time
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.date import DateTrigger
 from apscheduler.jobstores.base import JobLookupError
+from apscheduler.events import EVENT_JOB_MISSED, EVENT_JOB_MAX_INSTANCES
 import pytz
-from datetime import datetime
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional, Callable, List
 from croniter import croniter
 
 # 导入我们的任务链执行器和任务注册表
@@ -14,6 +18,9 @@ import config_manager # 导入配置管理器以读取配置
 import constants      # 导入常量以获取时区
 import extensions     # 导入 extensions 以获取共享的处理器实例
 import task_manager   # 导入 task_manager 以提交任务
+import task_metrics
+import webhook_queue
+import db_handler
 
 logger = logging.getLogger(__name__)
 
@@ -21,6 +28,24 @@ logger = logging.getLogger(__name__)
 CHAIN_JOB_ID = 'automated_task_chain_job'
 # 剧集复活检查
 REVIVAL_CHECK_JOB_ID = 'weekly_revival_check_job'
+REVIVAL_CHECK_CRON = '0 5 * * sun' # 每周日 (sun) 的 5点 (5) 0分 (0)
+
+# ==============================================================================
+# ✨ 计划运行策略
+# ------------------------------------------------------------------------------
+# - 不重叠 (max_instances=1)：上一次运行仍在排队或执行时，本次触发直接跳过，并以 skipped 记录到 task_runs，
+#   不再由 submit_task 报 "相同任务已在排队或运行中"；
+# - 随机延迟 (jitter)：触发时间在 [0, jitter] 秒内随机推迟，避免多个实例/任务同时打到 Emby/TMDb；
+# - 错过的运行合并补跑 (coalesce)：调度器繁忙时由 APScheduler 合并；停机期间错过的运行在启动时
+#   根据持久化的上次触发时间检测——无论错过几次都只补跑一次，且只在最近一次错过的时间仍在补跑时限内时补跑，
+#   超出时限的只记录为 missed；
+# - 空闲时运行：开启后，重型任务在有 Webhook 积压时延后，每 IDLE_RECHECK_SECONDS 检查一次，
+#   最多延后 IDLE_MAX_DEFER_SECONDS，之后无论是否空闲都开始执行，避免被持续的 Webhook 饿死。
+# ==============================================================================
+JOB_STATE_SETTING_KEY = 'scheduler_job_state'
+IDLE_RECHECK_SECONDS = 60
+IDLE_MAX_DEFER_SECONDS = 2 * 60 * 60
+MISSED_RUN_SCAN_LIMIT = 1000
 
 # --- 友好的CRON日志翻译函数】 ---
 def _get_next_run_time_str(cron_expression: str) -> str:
@@ -81,10 +106,13 @@ class SchedulerManager:
         # 从 web_app.py 迁移过来的调度器实例
         self.scheduler = BackgroundScheduler(
             timezone=str(pytz.timezone(constants.TIMEZONE)),
-            job_defaults={'misfire_grace_time': 60*5}
+            job_defaults={'misfire_grace_time': 60*5, 'coalesce': True, 'max_instances': 1}
         )
+        self.scheduler.add_listener(self._on_scheduler_event, EVENT_JOB_MISSED | EVENT_JOB_MAX_INSTANCES)
         # 获取共享的处理器实例
         self.processor = extensions.media_processor_instance
+        # 已设置的计划任务: job_id -> 任务规格
+        self._job_specs: Dict[str, Dict[str, Any]] = {}
 
     def start(self):
         """启动调度器并加载初始任务。"""
@@ -94,9 +122,9 @@ class SchedulerManager:
         try:
             self.scheduler.start()
             logger.info("定时任务调度器已启动。")
-            # 在启动时，就根据当前配置更新一次任务
-            self.update_task_chain_job()
-            self.update_revival_check_job()
+            # 在启动时，就根据当前配置更新一次任务，并检查停机期间错过的运行
+            self.update_task_chain_job(check_missed=True)
+            self.update_revival_check_job(check_missed=True)
         except Exception as e:
             logger.error(f"启动定时任务调度器失败: {e}", exc_info=True)
 
@@ -106,8 +134,188 @@ class SchedulerManager:
             self.scheduler.shutdown(wait=False)
             logger.info("定时任务调度器已关闭。")
 
+    # --- 计划运行策略 ---
+    def _build_cron_trigger(self, cron_str: str) -> CronTrigger:
+        """与 CronTrigger.from_crontab 相同，额外带上配置的随机延迟。CRON 表达式无效时抛出 ValueError。"""
+        parts = cron_str.split()
+        if len(parts) != 5:
+            raise ValueError(f"CRON 表达式必须有5个部分，实际为 {len(parts)} 个")
+        minute, hour, day, month, day_of_week = parts
+        jitter = int(config_manager.APP_CONFIG.get(constants.CONFIG_OPTION_SCHEDULER_JITTER_SECONDS, 0) or 0)
+        return CronTrigger(minute=minute, hour=hour, day=day, month=month, day_of_week=day_of_week,
+                           timezone=str(pytz.timezone(constants.TIMEZONE)), jitter=jitter if jitter > 0 else None)
+
+    def _misfire_grace_seconds(self) -> int:
+        minutes = int(config_manager.APP_CONFIG.get(constants.CONFIG_OPTION_SCHEDULER_MISFIRE_GRACE_MINUTES, 60) or 0)
+        return max(60, minutes * 60)
+
+    def _register_job(self, spec: Dict[str, Any], check_missed: bool):
+        """添加 (或替换) 一个计划任务。spec: job_id / name / cron / submit / dedupe_key / task_key / lane / heavy。"""
+        job_id = spec["job_id"]
+        self.scheduler.add_job(
+            func=self._fire_job,
+            args=[job_id],
+            trigger=self._build_cron_trigger(spec["cron"]),
+            id=job_id,
+            name=spec["name"],
+            replace_existing=True,
+            coalesce=True,
+            max_instances=1,
+            misfire_grace_time=self._misfire_grace_seconds()
+        )
+        self._job_specs[job_id] = spec
+        if check_missed:
+            self._catch_up_missed_runs(spec)
+        # 以当前时间作为新的计划基准：配置变更之前的时间不算错过
+        self._save_job_state(job_id, spec["cron"], datetime.now(pytz.timezone(constants.TIMEZONE)))
+
+    def _remove_job(self, job_id: str):
+        self._job_specs.pop(job_id, None)
+        for existing_id in (job_id, f"{job_id}_idle_retry"):
+            try:
+                self.scheduler.remove_job(existing_id)
+            except JobLookupError:
+                pass
+
+    def _fire_job(self, job_id: str):
+        """CronTrigger 的触发入口。"""
+        spec = self._job_specs.get(job_id)
+        if not spec:
+            return
+        logger.info(f"定时任务触发：{spec['name']}。")
+        self._save_job_state(job_id, spec["cron"], datetime.now(pytz.timezone(constants.TIMEZONE)))
+        if self.scheduler.get_job(f"{job_id}_idle_retry"):
+            logger.info(f"  -> '{spec['name']}' 已在等待空闲后执行，本次触发已合并。")
+            return
+        self._run_job(spec)
+
+    def _run_job(self, spec: Dict[str, Any], deferred_since: Optional[float] = None):
+        name = spec["name"]
+        # max_instances: 上一次运行仍在排队或执行时跳过本次
+        if task_manager.is_task_active(spec["dedupe_key"]):
+            logger.warning(f"  -> '{name}' 的上一次运行尚未结束，本次计划运行已跳过。")
+            self._record_schedule_event(spec, task_metrics.STATUS_SKIPPED, task_metrics.STOP_REASON_OVERLAP,
+                                        "上一次运行尚未结束")
+            return
+
+        if spec.get("heavy") and config_manager.APP_CONFIG.get(constants.CONFIG_OPTION_SCHEDULER_RUN_WHEN_IDLE, False):
+            backlog = webhook_queue.backlog_size()
+            if backlog:
+                now = time.monotonic()
+                deferred_since = deferred_since or now
+                waited = now - deferred_since
+                if waited < IDLE_MAX_DEFER_SECONDS:
+                    if not waited:
+                        logger.info(f"  -> 当前有 {backlog} 项 Webhook 积压，'{name}' 将在空闲后执行。")
+                    self.scheduler.add_job(
+                        func=self._retry_when_idle,
+                        args=[spec["job_id"], deferred_since],
+                        trigger=DateTrigger(run_date=datetime.now(pytz.timezone(constants.TIMEZONE)) + timedelta(seconds=IDLE_RECHECK_SECONDS)),
+                        id=f"{spec['job_id']}_idle_retry",
+                        name=f"{name} (等待空闲)",
+                        replace_existing=True
+                    )
+                    return
+                logger.warning(f"  -> '{name}' 已等待 Webhook 积压清空 {int(waited / 60)} 分钟，仍有 {backlog} 项积压，不再等待，开始执行。")
+            elif deferred_since:
+                logger.info(f"  -> Webhook 积压已清空，开始执行 '{name}'。")
+
+        spec["submit"]()
+
+    def _retry_when_idle(self, job_id: str, deferred_since: float):
+        spec = self._job_specs.get(job_id)
+        if spec:
+            self._run_job(spec, deferred_since=deferred_since)
+
+    def _on_scheduler_event(self, event):
+        """APScheduler 报告的错过运行 (调度器繁忙超出时限) 和实例数超限。"""
+        spec = self._job_specs.get(event.job_id)
+        if not spec:
+            return
+        # 错过事件带 scheduled_run_time，实例数超限事件带 scheduled_run_times 列表
+        scheduled = getattr(event, 'scheduled_run_time', None) or (getattr(event, 'scheduled_run_times', None) or [None])[0]
+        if event.code == EVENT_JOB_MISSED:
+            logger.warning(f"定时任务 '{spec['name']}' 错过了计划时间 {scheduled}，已超出补跑时限，本次不再执行。")
+            self._record_schedule_event(spec, task_metrics.STATUS_MISSED, task_metrics.STOP_REASON_MISFIRE,
+                                        f"计划时间 {scheduled} 已错过", scheduled_at=scheduled)
+        else:
+            logger.warning(f"定时任务 '{spec['name']}' 的上一次触发仍在处理中，计划时间 {scheduled} 的运行已跳过。")
+            self._record_schedule_event(spec, task_metrics.STATUS_SKIPPED, task_metrics.STOP_REASON_OVERLAP,
+                                        "上一次触发仍在处理中", scheduled_at=scheduled)
+
+    def _catch_up_missed_runs(self, spec: Dict[str, Any]):
+        """检查停机期间错过的计划运行：报告次数，最近一次仍在补跑时限内时合并补跑一次。"""
+        state = (db_handler.get_setting(JOB_STATE_SETTING_KEY) or {}).get(spec["job_id"]) or {}
+        if state.get("cron") != spec["cron"] or not state.get("last_scheduled"):
+            return
+        tz = pytz.timezone(constants.TIMEZONE)
+        try:
+            last_scheduled = datetime.fromisoformat(state["last_scheduled"])
+        except (TypeError, ValueError):
+            return
+        now = datetime.now(tz)
+        missed: List[datetime] = []
+        iterator = croniter(spec["cron"], last_scheduled.astimezone(tz))
+        while len(missed) < MISSED_RUN_SCAN_LIMIT:
+            fire_time = iterator.get_next(datetime)
+            if fire_time > now:
+                break
+            missed.append(fire_time)
+        if not missed:
+            return
+
+        count_text = f"{len(missed)}{'+' if len(missed) >= MISSED_RUN_SCAN_LIMIT else ''}"
+        latest = missed[-1]
+        if (now - latest).total_seconds() <= self._misfire_grace_seconds():
+            logger.warning(f"定时任务 '{spec['name']}' 在停机期间错过了 {count_text} 次计划运行 (最近一次: {latest:%Y-%m-%d %H:%M})，合并补跑一次。")
+            self._record_schedule_event(spec, task_metrics.STATUS_MISSED, task_metrics.STOP_REASON_MISFIRE,
+                                        f"停机期间错过 {count_text} 次，已合并补跑一次", scheduled_at=latest)
+            self._run_job(spec)
+        else:
+            logger.warning(f"定时任务 '{spec['name']}' 在停机期间错过了 {count_text} 次计划运行 (最近一次: {latest:%Y-%m-%d %H:%M})，已超出补跑时限，不再补跑。")
+            self._record_schedule_event(spec, task_metrics.STATUS_MISSED, task_metrics.STOP_REASON_MISFIRE,
+                                        f"停机期间错过 {count_text} 次，超出补跑时限", scheduled_at=latest)
+
+    def _save_job_state(self, job_id: str, cron_str: str, scheduled_at: datetime):
+        state = db_handler.get_setting(JOB_STATE_SETTING_KEY) or {}
+        state[job_id] = {"cron": cron_str, "last_scheduled": scheduled_at.isoformat()}
+        db_handler.save_setting(JOB_STATE_SETTING_KEY, state)
+
+    def _record_schedule_event(self, spec: Dict[str, Any], status: str, reason: str, note: str,
+                               scheduled_at: Optional[datetime] = None):
+        """把跳过/错过的计划运行写入 task_runs，与正常运行一起出现在运行记录和趋势中。"""
+        now = datetime.now(pytz.timezone(constants.TIMEZONE))
+        db_handler.record_task_run({
+            "task_name": spec["name"],
+            "task_key": spec["task_key"],
+            "lane": spec["lane"],
+            "started_at": scheduled_at or now,
+            "finished_at": scheduled_at or now,
+            "duration_seconds": 0,
+            "status": status,
+            "stop_reason": reason,
+            "error_count": 0,
+            "last_error": note,
+        })
+
+    def _make_spec(self, job_id: str, name: str, cron_str: str, task_function: Callable, processor_type: str,
+                   heavy: bool, **task_kwargs) -> Dict[str, Any]:
+        def submit():
+            task_manager.submit_task(task_function, name, processor_type, **task_kwargs)
+        lane, _ = task_manager.resolve_task_profile(task_function, processor_type, task_kwargs)
+        return {
+            "job_id": job_id,
+            "name": name,
+            "cron": cron_str,
+            "submit": submit,
+            "dedupe_key": name, # submit_task 默认以任务名去重
+            "task_key": task_function.__name__,
+            "lane": lane,
+            "heavy": heavy,
+        }
+
     # ★★★ 核心修改 4/4: 为复活检查任务创建一个专属的调度函数 ★★★
-    def update_revival_check_job(self):
+    def update_revival_check_job(self, check_missed: bool = False):
         """
         【新增】根据硬编码的规则，设置每周的剧集复活检查任务。
         """
@@ -117,16 +325,10 @@ class SchedulerManager:
 
         logger.trace("正在设置固定的'剧集复活检查'定时任务...")
 
-        try:
-            # 1. 同样，先移除旧的作业，防止重复
-            self.scheduler.remove_job(REVIVAL_CHECK_JOB_ID)
-        except JobLookupError:
-            pass # 没找到旧任务是正常的
+        # 1. 同样，先移除旧的作业，防止重复
+        self._remove_job(REVIVAL_CHECK_JOB_ID)
 
-        # 2. 定义我们的固定调度规则
-        cron_str = '0 5 * * sun' # 每周日 (sun) 的 5点 (5) 0分 (0)
-
-        # 3. 从 tasks.py 的注册表里获取任务信息
+        # 2. 从 tasks.py 的注册表里获取任务信息
         registry = tasks.get_task_registry()
         task_info = registry.get('revival-check')
         
@@ -136,29 +338,16 @@ class SchedulerManager:
             
         task_function, task_description, processor_type = task_info
 
-        # 4. 创建一个包装函数，用于提交任务到 task_manager
-        def scheduled_revival_check_wrapper():
-            logger.info(f"定时任务触发：{task_description}。")
-            task_manager.submit_task(
-                task_function=task_function,
-                task_name=task_description,
-                processor_type=processor_type
-            )
-
-        # 5. 添加新的作业
+        # 3. 添加新的作业
         try:
-            self.scheduler.add_job(
-                func=scheduled_revival_check_wrapper,
-                trigger=CronTrigger.from_crontab(cron_str, timezone=str(pytz.timezone(constants.TIMEZONE))),
-                id=REVIVAL_CHECK_JOB_ID,
-                name=task_description,
-                replace_existing=True
-            )
+            spec = self._make_spec(REVIVAL_CHECK_JOB_ID, task_description, REVIVAL_CHECK_CRON,
+                                   task_function, processor_type, heavy=True)
+            self._register_job(spec, check_missed)
             logger.trace(f"已成功设置'{task_description}'任务，执行计划: 每周日 05:00。")
         except ValueError as e:
-            logger.error(f"设置'{task_description}'任务失败：CRON表达式 '{cron_str}' 无效。错误: {e}")
+            logger.error(f"设置'{task_description}'任务失败：CRON表达式 '{REVIVAL_CHECK_CRON}' 无效。错误: {e}")
     
-    def update_task_chain_job(self):
+    def update_task_chain_job(self, check_missed: bool = False):
         """
         【核心函数】根据当前配置文件，更新任务链的定时作业。
         这个函数应该在程序启动和每次配置保存后被调用。
@@ -172,11 +361,9 @@ class SchedulerManager:
         logger.info("正在根据最新配置更新自动化任务链...")
 
         try:
-            # 1. 无论如何，先尝试移除旧的作业，防止重复或配置残留
-            self.scheduler.remove_job(CHAIN_JOB_ID)
-            logger.debug(f"已成功移除旧的任务链作业 (ID: {CHAIN_JOB_ID})。")
-        except JobLookupError:
-            logger.debug(f"没有找到旧的任务链作业 (ID: {CHAIN_JOB_ID})，无需移除。")
+            # 1. 无论如何，先尝试移除旧的作业（以及等待空闲的重试），防止重复或配置残留
+            self._remove_job(CHAIN_JOB_ID)
+            logger.debug(f"已移除旧的任务链作业 (ID: {CHAIN_JOB_ID})。")
         except Exception as e:
             logger.error(f"尝试移除旧任务作业时发生意外错误: {e}", exc_info=True)
 
@@ -192,22 +379,9 @@ class SchedulerManager:
             try:
                 # ★★★ 核心：我们不再直接调用 task_run_chain，而是通过 task_manager 提交 ★★★
                 # 这样做可以享受到任务锁、状态更新等所有 task_manager 的好处。
-                def scheduled_chain_task_wrapper():
-                    logger.info(f"定时任务触发：自动化任务链。")
-                    # 注意：这里我们传递 task_sequence 作为参数
-                    task_manager.submit_task(
-                        tasks.task_run_chain,
-                        "自动化任务链",
-                        task_sequence=task_sequence
-                    )
-
-                self.scheduler.add_job(
-                    func=scheduled_chain_task_wrapper, # 调用包装函数
-                    trigger=CronTrigger.from_crontab(cron_str, timezone=str(pytz.timezone(constants.TIMEZONE))),
-                    id=CHAIN_JOB_ID,
-                    name="自动化任务链",
-                    replace_existing=True
-                )
+                spec = self._make_spec(CHAIN_JOB_ID, "自动化任务链", cron_str, tasks.task_run_chain, 'media',
+                                       heavy=True, task_sequence=task_sequence)
+                self._register_job(spec, check_missed)
                 # 调用辅助函数来生成友好的日志
                 friendly_cron_str = _get_next_run_time_str(cron_str)
                 log_message = (
@@ -221,6 +395,12 @@ class SchedulerManager:
                 else:
                     # 如果未设置，可以明确告知用户
                     log_message += " (无时长限制)。"
+
+                jitter = int(config.get(constants.CONFIG_OPTION_SCHEDULER_JITTER_SECONDS, 0) or 0)
+                if jitter > 0:
+                    log_message += f" 随机延迟: 0-{jitter} 秒。"
+                if config.get(constants.CONFIG_OPTION_SCHEDULER_RUN_WHEN_IDLE, False):
+                    log_message += " 有 Webhook 积压时延后执行。"
                 
                 # ▼▼▼ 3. 使用新的日志字符串打印日志 ▼▼▼
                 logger.info(log_message)
@@ -1,23 +1,63 @@
 # services/cover_generator/__init__.py
 
 import logging
+import os
+import base64
+import json
+import hashlib
+import time
 import shutil
+import tempfile
+import threading
 import yaml
 import random
 import requests
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
-from typing import Dict, Any, List, Tuple, Optional
+from typing import Dict, Any, List, Tuple, Optional, Callable
 
 import config_manager
+import db_handler
+import task_context
 import emby_handler 
+from .poster_cache import get_poster_cache
+from .encoding import FORMAT_EXTENSIONS, FORMAT_MIME_TYPES, describe_base64_cover
 from .styles.style_single_1 import create_style_single_1
 from .styles.style_single_2 import create_style_single_2
 from .styles.style_multi_1 import create_style_multi_1
 
 logger = logging.getLogger(__name__)
 
+_STYLE_RENDERERS = {
+    'single_1': create_style_single_1,
+    'single_2': create_style_single_2,
+    'multi_1': create_style_multi_1,
+}
+
+def render_cover_job(job: Dict[str, Any]):
+    """
+    执行纯 CPU 的封面渲染。job 只包含可序列化的参数（风格名、图片路径、字体路径、配置），
+    因此既可以在当前进程调用，也可以被投递到进程池中执行。
+    """
+    renderer = _STYLE_RENDERERS.get(job.get('style'))
+    if not renderer:
+        return None
+    return renderer(*job['args'], **job['kwargs'])
+
+def _timed_render_cover_job(job: Dict[str, Any]) -> Tuple[Any, float]:
+    start_time = time.time()
+    return render_cover_job(job), time.time() - start_time
+
 class CoverGeneratorService:
     SORT_BY_DISPLAY_NAME = { "Random": "随机", "Latest": "最新添加" }
+    # 不影响最终画面的配置项，不计入渲染指纹
+    _NON_VISUAL_CONFIG_KEYS = {
+        "enabled", "transfer_monitor", "exclude_libraries", "sort_by", "tab", "title_config",
+        "covers_input", "covers_output", "render_mode", "render_workers", "io_workers",
+        "poster_download_workers", "poster_cache_max_mb", "random_refresh_hours",
+    }
 
     def __init__(self, config: Dict[str, Any]):
         self.config = config
@@ -34,61 +74,290 @@ class CoverGeneratorService:
         self.font_path = self.data_path / "fonts"
         self.covers_path.mkdir(parents=True, exist_ok=True)
         self.font_path.mkdir(parents=True, exist_ok=True)
+        self.poster_cache = get_poster_cache(self.data_path / "poster_cache", self.config.get("poster_cache_max_mb"))
         self.zh_font_path = None
         self.en_font_path = None
         self.zh_font_path_multi_1 = None
         self.en_font_path_multi_1 = None
         self._fonts_checked_and_ready = False
 
-    def generate_for_library(self, emby_server_id: str, library: Dict[str, Any], item_count: Optional[int] = None, content_types: Optional[List[str]] = None):
-        sort_by_name = self.SORT_BY_DISPLAY_NAME.get(self._sort_by, self._sort_by)
-        logger.info(f"  -> 开始以排序方式: {sort_by_name} 为媒体库 '{library['Name']}' 生成封面...")
-        self.__get_fonts()
-        image_data = self.__generate_image_data(emby_server_id, library, item_count, content_types)
+    def generate_for_library(self, emby_server_id: str, library: Dict[str, Any], item_count: Optional[int] = None, content_types: Optional[List[str]] = None, force: bool = False):
+        job = self.prepare_render_job(emby_server_id, library, item_count, content_types, force=force)
+        if not job:
+            logger.error(f"为媒体库 '{library['Name']}' 生成封面图片失败。")
+            return False
+        if job.get('skipped'):
+            return True
+        image_data = render_cover_job(job)
         if not image_data:
             logger.error(f"为媒体库 '{library['Name']}' 生成封面图片失败。")
             return False
+        return self.upload_cover(emby_server_id, library, image_data, job.get('fingerprint'))
+
+    def prepare_render_job(self, emby_server_id: str, library: Dict[str, Any], item_count: Optional[int] = None, content_types: Optional[List[str]] = None, force: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        I/O 阶段：准备字体、标题并下载素材图片，返回可交给 render_cover_job 的渲染参数。
+        若渲染指纹（海报、标题、角标、风格参数）与上次上传时一致，返回 {'skipped': True}，不再下载和渲染。
+        """
+        sort_by_name = self.SORT_BY_DISPLAY_NAME.get(self._sort_by, self._sort_by)
+        logger.info(f"  -> 开始以排序方式: {sort_by_name} 为媒体库 '{library['Name']}' 生成封面...")
+        self.__get_fonts()
+        return self.__generate_image_data(emby_server_id, library, item_count, content_types, force)
+
+    def upload_cover(self, emby_server_id: str, library: Dict[str, Any], image_data, fingerprint: Optional[str] = None) -> bool:
+        """I/O 阶段：把渲染好的封面上传到 Emby，成功后记录渲染指纹。"""
         success = self.__set_library_image(emby_server_id, library, image_data)
         if success:
-            logger.info(f"  -> ✅ 成功更新媒体库 '{library['Name']}' 的封面！")
+            image_format, encoded_bytes = describe_base64_cover(image_data)
+            logger.info(f"  -> ✅ 成功更新媒体库 '{library['Name']}' 的封面！({image_format.upper()}, {encoded_bytes / 1024:.0f} KB)")
+            library_id = library.get("Id") or library.get("ItemId")
+            if fingerprint and library_id:
+                db_handler.save_cover_render_fingerprint(library_id, fingerprint, encoded_bytes, image_format)
         else:
             logger.error(f"上传封面到媒体库 '{library['Name']}' 失败。")
         return success
 
-    def __generate_image_data(self, server_id: str, library: Dict[str, Any], item_count: Optional[int] = None, content_types: Optional[List[str]] = None) -> bytes:
+    def get_render_workers(self) -> int:
+        configured = self.config.get("render_workers") or 0
+        try:
+            configured = int(configured)
+        except (TypeError, ValueError):
+            configured = 0
+        return configured if configured > 0 else max(1, min(4, os.cpu_count() or 1))
+
+    def generate_for_libraries(self, targets: List[Dict[str, Any]],
+                               progress_callback: Optional[Callable[[int, int, str], None]] = None,
+                               stop_check: Optional[Callable[[], bool]] = None,
+                               force: bool = False) -> Dict[str, int]:
+        """
+        【批量并行生成】为多个媒体库/合集生成封面。
+        - 下载素材和上传封面在 I/O 线程池中进行；
+        - 渲染（create_style_*）默认在 I/O 线程中进行（render_mode='thread'）；
+          render_mode='process_pool' 时改用 spawn 进程池分摊到多个 CPU 核心，进程池不可用时自动回退为线程渲染。
+          注意 spawn 的子进程会重新导入主模块 (web_app)，启动开销较大，只建议在封面数量很多时开启。
+        targets 中每一项为 {'name': 显示名, 'resolve': 可选的回调，返回 {'library', 'item_count', 'content_types'}}，
+        或直接包含 'library' / 'item_count' / 'content_types'。
+        返回 {'total', 'success', 'skipped', 'failed'}，其中 skipped 为渲染指纹未变化而跳过的数量（也计入 success）。
+        """
+        total = len(targets)
+        stats = {'total': total, 'success': 0, 'skipped': 0, 'failed': 0}
+        if total == 0:
+            return stats
+
+        self.__get_fonts()
+        render_workers = self.get_render_workers()
+        io_workers = max(1, int(self.config.get("io_workers") or 4))
+        render_pool = None
+        if self.config.get("render_mode", "thread") == "process_pool" and render_workers > 1 and total > 1:
+            try:
+                render_pool = ProcessPoolExecutor(max_workers=render_workers, mp_context=multiprocessing.get_context('spawn'))
+            except Exception as e:
+                logger.warning(f"  -> 无法创建封面渲染进程池，将在当前进程中渲染: {e}")
+                render_pool = None
+        logger.info(f"  -> 批量生成封面：共 {total} 个，渲染模式: {'进程池 x ' + str(render_workers) if render_pool else 'I/O 线程'}，I/O 线程: {io_workers}。")
+
+        batch_start = time.time()
+        timings: Dict[int, Dict[str, float]] = {}
+        resolved: Dict[int, Dict[str, Any]] = {}
+        finished_count = 0
+
+        def timed(func, *args):
+            start_time = time.time()
+            return func(*args), time.time() - start_time
+
+        def prepare(index: int):
+            target = targets[index]
+            info = target['resolve']() if callable(target.get('resolve')) else target
+            if not info or not info.get('library'):
+                return None
+            resolved[index] = info
+            return self.prepare_render_job('main_emby', info['library'], info.get('item_count'), info.get('content_types'), force=force)
+
+        def finish(index: int, success: bool):
+            nonlocal finished_count
+            finished_count += 1
+            stats['success' if success else 'failed'] += 1
+            name = targets[index].get('name') or (resolved.get(index, {}).get('library') or {}).get('Name', '')
+            stage_timing = timings.get(index, {})
+            logger.info(f"  -> {'✅' if success else '❌'} ({finished_count}/{total}) 封面 '{name}' 耗时："
+                        f"准备 {stage_timing.get('prepare', 0):.2f}s / 渲染 {stage_timing.get('render', 0):.2f}s / 上传 {stage_timing.get('upload', 0):.2f}s")
+            if progress_callback:
+                progress_callback(finished_count, total, name)
+
+        try:
+            with task_context.ContextThreadPoolExecutor(max_workers=io_workers) as io_pool:
+                future_meta = {}
+                for index in range(total):
+                    future_meta[io_pool.submit(timed, prepare, index)] = ('prepare', index)
+                pending = set(future_meta)
+
+                while pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        stage, index = future_meta.pop(future)
+                        try:
+                            result, elapsed = future.result()
+                        except BrokenProcessPool as e:
+                            # 进程池损坏：回退为在 I/O 线程中重新渲染这一项及之后的所有封面
+                            logger.warning(f"  -> 封面渲染进程池不可用，回退为当前进程渲染: {e}")
+                            # 同一批次中可能有多个渲染任务因进程池损坏而失败，只需关闭一次
+                            if render_pool is not None:
+                                render_pool.shutdown(wait=False)
+                                render_pool = None
+                            retry = io_pool.submit(_timed_render_cover_job, resolved[index]['job'])
+                            future_meta[retry] = ('render', index)
+                            pending.add(retry)
+                            continue
+                        except Exception as e:
+                            logger.error(f"  -> 封面 '{targets[index].get('name', '')}' 在 {stage} 阶段出错: {e}", exc_info=True)
+                            finish(index, False)
+                            continue
+
+                        timings.setdefault(index, {})[stage] = elapsed
+                        if stage == 'prepare':
+                            if not result or (stop_check and stop_check()):
+                                finish(index, False)
+                                continue
+                            if result.get('skipped'):
+                                stats['skipped'] += 1
+                                finish(index, True)
+                                continue
+                            resolved[index]['job'] = result
+                            executor = render_pool or io_pool
+                            next_future = executor.submit(_timed_render_cover_job, result)
+                            future_meta[next_future] = ('render', index)
+                        elif stage == 'render':
+                            if not result:
+                                finish(index, False)
+                                continue
+                            next_future = io_pool.submit(timed, self.upload_cover, 'main_emby', resolved[index]['library'], result, resolved[index]['job'].get('fingerprint'))
+                            future_meta[next_future] = ('upload', index)
+                        else:
+                            finish(index, bool(result))
+                            continue
+                        pending.add(next_future)
+        finally:
+            if render_pool:
+                render_pool.shutdown(wait=True)
+
+        logger.info(f"  -> 批量生成封面完成：成功 {stats['success']} 个（其中 {stats['skipped']} 个未变化而跳过），失败 {stats['failed']} 个，总耗时 {time.time() - batch_start:.1f} 秒。")
+        return stats
+
+    def __generate_image_data(self, server_id: str, library: Dict[str, Any], item_count: Optional[int] = None, content_types: Optional[List[str]] = None, force: bool = False) -> Optional[Dict[str, Any]]:
         library_name = library['Name']
         title = self.__get_library_title_from_yaml(library_name)
         custom_image_paths = self.__check_custom_image(library_name)
         if custom_image_paths:
             logger.info(f"发现媒体库 '{library_name}' 的自定义图片，将使用路径模式生成。")
-            return self.__generate_image_from_path(library_name, title, custom_image_paths, item_count)
+            poster_keys = []
+            for path in custom_image_paths:
+                stat = os.stat(path)
+                poster_keys.append(f"{path}|{stat.st_mtime_ns}|{stat.st_size}")
+            fingerprint = self.__compute_render_fingerprint(title, poster_keys, item_count)
+            if not force and self.__is_render_unchanged(library, fingerprint):
+                return {'skipped': True}
+            job = self.__generate_image_from_path(library_name, title, custom_image_paths, item_count)
+            if job: job['fingerprint'] = fingerprint
+            return job
         logger.trace(f"未发现自定义图片，将从服务器 '{server_id}' 获取媒体项作为封面来源。")
-        return self.__generate_from_server(server_id, library, title, item_count, content_types)
+        return self.__generate_from_server(server_id, library, title, item_count, content_types, force)
+
+    @staticmethod
+    def _item_count_bucket(item_count: Optional[Any]) -> Optional[int]:
+        """
+        角标数量的分桶：新增少量媒体不改变指纹，避免每次入库都重新渲染。
+        10 以下精确，10~999 按 5 取整，四位数按 50，五位数按 500，依此类推。
+        """
+        try:
+            count = int(item_count)
+        except (TypeError, ValueError):
+            return None
+        if count < 10:
+            return count
+        step = 5 * 10 ** max(0, len(str(count)) - 3)
+        return count // step * step
+
+    def __compute_render_fingerprint(self, title: Tuple[str, str], poster_keys: List[str], item_count: Optional[Any]) -> str:
+        """渲染指纹 = 海报键（排序后）+ 标题 + 角标数量分桶 + 影响画面的风格参数 + 字体。"""
+        style_params = {k: v for k, v in self.config.items() if k not in self._NON_VISUAL_CONFIG_KEYS}
+        payload = {
+            'posters': sorted(poster_keys),
+            'title': list(title) if title else None,
+            'badge': self._item_count_bucket(item_count) if self.config.get("show_item_count") else None,
+            'style': style_params,
+            'fonts': [str(p) for p in (self.zh_font_path, self.en_font_path, self.zh_font_path_multi_1, self.en_font_path_multi_1)],
+        }
+        return hashlib.sha1(json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str).encode('utf-8')).hexdigest()
+
+    def __server_poster_keys(self, library: Dict[str, Any], poster_urls: List[str], required_items_count: int,
+                             content_types: Optional[List[str]]) -> List[str]:
+        """
+        服务器海报的指纹键。
+        - 随机排序：每次取到的海报本来就不同，用海报查询参数（媒体库、类型、数量）作为稳定的键，
+          标题、角标分桶或风格变化时重新渲染；此外指纹超过 random_refresh_hours 后失效（见 __render_max_age_hours），
+          定期换一批随机海报；
+        - 按最新添加：用实际使用的海报 URL（含 item id、图片类型和 tag）。
+        """
+        if self._sort_by == "Random":
+            library_id = library.get("Id") or library.get("ItemId")
+            return [f"query|{library_id}|{','.join(sorted(content_types or []))}|{library.get('CollectionType')}|Random|{required_items_count}"]
+        return [url for url in poster_urls if url]
+
+    def __render_max_age_hours(self) -> Optional[float]:
+        """随机排序的封面指纹有效期（小时）；其它排序方式的指纹不过期。"""
+        if self._sort_by != "Random":
+            return None
+        try:
+            hours = float(self.config.get("random_refresh_hours", 24) or 0)
+        except (TypeError, ValueError):
+            hours = 24
+        return hours if hours > 0 else None
+
+    def __is_render_unchanged(self, library: Dict[str, Any], fingerprint: str, max_age_hours: Optional[float] = None) -> bool:
+        library_id = library.get("Id") or library.get("ItemId")
+        if not library_id:
+            return False
+        if db_handler.get_cover_render_fingerprint(library_id, max_age_hours) == fingerprint:
+            logger.info(f"  -> 媒体库 '{library.get('Name')}' 的封面输入（海报/标题/角标/风格）未变化，跳过渲染和上传。")
+            return True
+        return False
 
-    def __generate_from_server(self, server_id: str, library: Dict[str, Any], title: Tuple[str, str], item_count: Optional[int] = None, content_types: Optional[List[str]] = None) -> bytes:
+    def __generate_from_server(self, server_id: str, library: Dict[str, Any], title: Tuple[str, str], item_count: Optional[int] = None, content_types: Optional[List[str]] = None, force: bool = False) -> Optional[Dict[str, Any]]:
         required_items_count = 1 if self._cover_style.startswith('single') else 9
-        items = self.__get_valid_items_from_library(server_id, library, required_items_count, content_types)
+        # 多图模式多取一些候选，个别海报下载失败或过慢时由后备候选补位
+        candidate_count = required_items_count if required_items_count == 1 else required_items_count * 2
+        items = self.__get_valid_items_from_library(server_id, library, candidate_count, content_types)
         if not items:
             logger.warning(f"在媒体库 '{library['Name']}' 中找不到任何带有可用图片的媒体项。")
             return None
+        # 预检查用首选的候选海报；实际渲染后按真正使用的海报重新计算并保存
+        expected_urls = [self.__get_image_url(item) for item in items[:required_items_count]]
+        fingerprint = self.__compute_render_fingerprint(
+            title, self.__server_poster_keys(library, expected_urls, required_items_count, content_types), item_count)
+        if not force and self.__is_render_unchanged(library, fingerprint, self.__render_max_age_hours()):
+            return {'skipped': True}
+        job, used_urls = self.__build_server_render_job(server_id, library, title, items, required_items_count, item_count)
+        if job:
+            job['fingerprint'] = self.__compute_render_fingerprint(
+                title, self.__server_poster_keys(library, used_urls, required_items_count, content_types), item_count)
+        return job
+
+    def __build_server_render_job(self, server_id: str, library: Dict[str, Any], title: Tuple[str, str], items: List[Dict[str, Any]], required_items_count: int, item_count: Optional[Any]) -> Tuple[Optional[Dict[str, Any]], List[str]]:
+        """返回 (渲染参数, 实际使用的海报 URL 列表)。"""
         if self._cover_style.startswith('single'):
             image_url = self.__get_image_url(items[0])
-            if not image_url: return None
+            if not image_url: return None, []
             image_path = self.__download_image(server_id, image_url, library['Name'], 1)
-            if not image_path: return None
-            return self.__generate_image_from_path(library['Name'], title, [image_path], item_count)
+            if not image_path: return None, []
+            return self.__generate_image_from_path(library['Name'], title, [image_path], item_count), [image_url]
         else:
-            image_paths = []
-            for i, item in enumerate(items[:9]):
-                image_url = self.__get_image_url(item)
-                if image_url:
-                    path = self.__download_image(server_id, image_url, library['Name'], i + 1)
-                    if path:
-                        image_paths.append(path)
-            if not image_paths:
+            downloaded = self.__download_posters_concurrently(server_id, items, library['Name'], required_items_count)
+            if not downloaded:
                 logger.warning(f"为多图模式下载图片失败。")
-                return None
-            return self.__generate_image_from_path(library['Name'], title, image_paths, item_count)
+                return None, []
+            image_paths = [path for path, _ in downloaded]
+            used_urls = [url for _, url in downloaded]
+            return self.__generate_image_from_path(library['Name'], title, image_paths, item_count), used_urls
 
     def __get_valid_items_from_library(self, server_id: str, library: Dict[str, Any], limit: int, content_types: Optional[List[str]] = None) -> List[Dict]:
         library_id = library.get("Id") or library.get("ItemId")
@@ -155,10 +424,78 @@ class CoverGeneratorService:
         else:
             return backdrop_url or primary_url
 
-    def __download_image(self, server_id: str, api_path: str, library_name: str, count: int) -> Path:
-        subdir = self.covers_path / library_name
+    def __download_posters_concurrently(self, server_id: str, items: List[Dict[str, Any]], library_name: str, required_count: int) -> List[Tuple[Path, str]]:
+        """
+        【并发下载】同时下载候选海报，凑够 required_count 张成功的图片后立即返回，不等待慢请求。
+        - 保留最先成功的图片，但按候选原有顺序（即排序方式）编号为 1..n.jpg；
+        - 候选下载到本次渲染专用的临时目录，剩余未开始的下载会被取消；
+        - 已在进行中的下载结束后（无论成功与否），由最后一个结束的下载删除临时目录及其中未使用的候选。
+        返回 [(图片路径, 海报 URL), ...]。
+        """
+        candidates = [(index, url) for index, url in ((i, self.__get_image_url(item)) for i, item in enumerate(items)) if url]
+        if not candidates:
+            return []
+        max_workers = max(1, min(int(self.config.get("poster_download_workers") or 6), len(candidates)))
+        start_time = time.time()
+        library_dir = self.covers_path / library_name
+        library_dir.mkdir(parents=True, exist_ok=True)
+        # 与最终文件位于同一目录下，保证 os.replace 是同文件系统内的原子移动
+        render_dir = Path(tempfile.mkdtemp(prefix=".download_", dir=library_dir))
+        succeeded: Dict[int, Path] = {}
+        cleanup_lock = threading.Lock()
+        cleanup_state = {"outstanding": len(candidates), "collected": False}
+
+        def cleanup_if_idle():
+            """【需持有 cleanup_lock】结果已取走且没有仍在进行的下载时删除临时目录。"""
+            if cleanup_state["collected"] and cleanup_state["outstanding"] == 0:
+                shutil.rmtree(render_dir, ignore_errors=True)
+
+        def on_download_done(_future):
+            with cleanup_lock:
+                cleanup_state["outstanding"] -= 1
+                cleanup_if_idle()
+
+        executor = task_context.ContextThreadPoolExecutor(max_workers=max_workers)
+        try:
+            future_to_index = {}
+            for index, url in candidates:
+                future = executor.submit(self.__download_image, server_id, url, library_name, index + 1,
+                                         f"candidate_{index + 1}.jpg", render_dir)
+                future_to_index[future] = index
+                future.add_done_callback(on_download_done)
+            for future in as_completed(future_to_index):
+                try:
+                    path = future.result()
+                except Exception as e:
+                    logger.debug(f"  -> 下载候选海报时出错: {e}")
+                    path = None
+                if path:
+                    succeeded[future_to_index[future]] = path
+                    if len(succeeded) >= required_count:
+                        break
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        candidate_urls = dict(candidates)
+        image_paths = []
+        for position, index in enumerate(sorted(succeeded)[:required_count], start=1):
+            target_path = library_dir / f"{position}.jpg"
+            try:
+                os.replace(succeeded[index], target_path)
+                image_paths.append((target_path, candidate_urls[index]))
+            except OSError as e:
+                logger.warning(f"  -> 整理海报文件 '{succeeded[index]}' 失败: {e}")
+        with cleanup_lock:
+            cleanup_state["collected"] = True
+            cleanup_if_idle()
+        logger.debug(f"  -> 媒体库 '{library_name}' 并发下载海报 {len(image_paths)}/{required_count} 张，耗时 {time.time() - start_time:.2f} 秒。")
+        return image_paths
+
+    def __download_image(self, server_id: str, api_path: str, library_name: str, count: int, filename: Optional[str] = None,
+                         target_dir: Optional[Path] = None) -> Path:
+        subdir = target_dir or self.covers_path / library_name
         subdir.mkdir(parents=True, exist_ok=True)
-        filepath = subdir / f"{count}.jpg"
+        filepath = subdir / (filename or f"{count}.jpg")
         try:
             base_url = config_manager.APP_CONFIG.get('emby_server_url')
             api_key = config_manager.APP_CONFIG.get('emby_api_key')
@@ -170,11 +507,24 @@ class CoverGeneratorService:
             if len(path_parts) >= 4 and path_parts[1] == 'Items' and path_parts[3] == 'Images':
                 item_id = path_parts[2]
                 image_type = path_parts[4]
-                success = emby_handler.download_emby_image(
-                    item_id=item_id, image_type=image_type, image_tag=image_tag,
-                    save_path=str(filepath), emby_server_url=base_url, emby_api_key=api_key
+                if not image_tag:
+                    success = emby_handler.download_emby_image(
+                        item_id=item_id, image_type=image_type, image_tag=image_tag,
+                        save_path=str(filepath), emby_server_url=base_url, emby_api_key=api_key
+                    )
+                    if success: return filepath
+                    return None
+                # ★★★ 有 image tag 时走内容寻址缓存：tag 不变则直接复用本地文件 ★★★
+                cached_path = self.poster_cache.get_or_download(
+                    item_id, image_type, image_tag,
+                    lambda tmp_path: emby_handler.download_emby_image(
+                        item_id=item_id, image_type=image_type, image_tag=image_tag,
+                        save_path=tmp_path, emby_server_url=base_url, emby_api_key=api_key
+                    )
                 )
-                if success: return filepath
+                if cached_path:
+                    shutil.copyfile(cached_path, filepath)
+                    return filepath
             else:
                 logger.error(f"无法从API路径解析有效的项目ID和图片类型: {api_path}")
         except Exception as e:
@@ -182,21 +532,21 @@ class CoverGeneratorService:
         return None
 
     # ... (文件末尾的 __generate_image_from_path, __set_library_image, __get_library_title_from_yaml, __prepare_multi_images, __check_custom_image, __download_file, __get_fonts 函数与您提供的原始文件一致，无需修改，此处省略以保持简洁) ...
-    def __generate_image_from_path(self, library_name: str, title: Tuple[str, str], image_paths: List[str], item_count: Optional[int] = None) -> bytes:
-        logger.trace(f"正在为 '{library_name}' 从本地路径生成封面...")
+    def __generate_image_from_path(self, library_name: str, title: Tuple[str, str], image_paths: List[str], item_count: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """构建渲染参数（不执行渲染），返回的 job 交给 render_cover_job 在当前进程或进程池中执行。"""
+        logger.trace(f"正在为 '{library_name}' 准备本地路径渲染参数...")
         zh_font_size = self.config.get("zh_font_size", 1)
         en_font_size = self.config.get("en_font_size", 1)
         blur_size = self.config.get("blur_size", 50)
         color_ratio = self.config.get("color_ratio", 0.8)
         font_size = (float(zh_font_size), float(en_font_size))
-        if self._cover_style == 'single_1':
-            return create_style_single_1(str(image_paths[0]), title, (str(self.zh_font_path), str(self.en_font_path)), 
-                                         font_size=font_size, blur_size=blur_size, color_ratio=color_ratio,
-                                         item_count=item_count, config=self.config)
-        elif self._cover_style == 'single_2':
-            return create_style_single_2(str(image_paths[0]), title, (str(self.zh_font_path), str(self.en_font_path)), 
-                                         font_size=font_size, blur_size=blur_size, color_ratio=color_ratio,
-                                         item_count=item_count, config=self.config)
+        if self._cover_style in ('single_1', 'single_2'):
+            return {
+                'style': self._cover_style,
+                'args': (str(image_paths[0]), title, (str(self.zh_font_path), str(self.en_font_path))),
+                'kwargs': dict(font_size=font_size, blur_size=blur_size, color_ratio=color_ratio,
+                               item_count=item_count, config=self.config),
+            }
         elif self._cover_style == 'multi_1':
             if self.zh_font_path_multi_1 and self.zh_font_path_multi_1.exists():
                 zh_font_path_multi = self.zh_font_path_multi_1
@@ -216,24 +566,29 @@ class CoverGeneratorService:
             color_ratio_multi = self.config.get("color_ratio_multi_1", 0.8)
             library_dir = self.covers_path / library_name
             self.__prepare_multi_images(library_dir, image_paths)
-            return create_style_multi_1(str(library_dir), title, font_path_multi, 
-                                      font_size=font_size_multi, is_blur=self._multi_1_blur, 
-                                      blur_size=blur_size_multi, color_ratio=color_ratio_multi,
-                                      item_count=item_count, config=self.config)
+            return {
+                'style': 'multi_1',
+                'args': (str(library_dir), title, font_path_multi),
+                'kwargs': dict(font_size=font_size_multi, is_blur=self._multi_1_blur,
+                               blur_size=blur_size_multi, color_ratio=color_ratio_multi,
+                               item_count=item_count, config=self.config),
+            }
         return None
 
-    def __set_library_image(self, server_id: str, library: Dict[str, Any], image_data: bytes) -> bool:
+    def __set_library_image(self, server_id: str, library: Dict[str, Any], image_data: str) -> bool:
         library_id = library.get("Id") or library.get("ItemId")
         base_url = config_manager.APP_CONFIG.get('emby_server_url')
         api_key = config_manager.APP_CONFIG.get('emby_api_key')
         upload_url = f"{base_url.rstrip('/')}/Items/{library_id}/Images/Primary?api_key={api_key}"
-        headers = {"Content-Type": "image/jpeg"}
+        # Emby 的图片上传接口要求 base64 请求体，Content-Type 标明解码后的真实格式
+        image_format, _ = describe_base64_cover(image_data)
+        headers = {"Content-Type": FORMAT_MIME_TYPES.get(image_format, "image/jpeg")}
         if self._covers_output:
             try:
-                save_path = Path(self._covers_output) / f"{library['Name']}.jpg"
+                save_path = Path(self._covers_output) / f"{library['Name']}.{FORMAT_EXTENSIONS.get(image_format, 'jpg')}"
                 save_path.parent.mkdir(parents=True, exist_ok=True)
                 with open(save_path, "wb") as f:
-                    f.write(image_data)
+                    f.write(base64.b64decode(image_data))
                 logger.info(f"封面已另存到: {save_path}")
             except Exception as e:
                 logger.error(f"另存封面失败: {e}")
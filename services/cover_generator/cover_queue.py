@@ -0,0 +1,163 @@
+# services/cover_generator/cover_queue.py
+
+import logging
+import threading
+import time
+from typing import Dict, Any, Optional
+
+import config_manager
+import db_handler
+import emby_handler
+
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# ✨ 封面任务队列 (Cover Job Queue)
+# ------------------------------------------------------------------------------
+# 入库 Webhook 不再在后台任务槽内同步生成封面，而是把 "某媒体库需要刷新封面" 的请求
+# 投递到这里，由独立的低优先级工人线程处理：
+# - 合并：同一媒体库在合并窗口内的多次请求只渲染一次（窗口从第一次请求开始计时，
+#   之后的请求只更新媒体库信息，不推迟截止时间，保证封面最迟在一个窗口后刷新）；
+# - 低优先级：到期时若有批量封面任务正在运行（占用 RESOURCE_COVERS），顺延等待，最多顺延 MAX_DEFER_SECONDS；
+# - 媒体数量 (get_item_count) 在渲染前实时查询，不再占用 Webhook 任务的时间。
+# ==============================================================================
+
+DEFAULT_WINDOW_SECONDS = 60
+BUSY_RECHECK_SECONDS = 5
+MAX_DEFER_SECONDS = 600
+SERVER_ID = 'main_emby'
+TYPE_MAP = {'movies': 'Movie', 'tvshows': 'Series', 'music': 'MusicAlbum', 'boxsets': 'BoxSet', 'mixed': 'Movie,Series'}
+
+class CoverJobQueue:
+    def __init__(self):
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._condition = threading.Condition()
+        self._worker: Optional[threading.Thread] = None
+        self._stopping = False
+
+    # --- 投递 ---
+    def request_library_cover(self, library: Dict[str, Any], window_seconds: Optional[float] = None, reason: str = "") -> bool:
+        """登记一次媒体库封面刷新请求。返回 True 表示新建了一个任务，False 表示合并进了已有任务。"""
+        library_id = library.get("Id")
+        if not library_id:
+            return False
+        if window_seconds is None:
+            window_seconds = DEFAULT_WINDOW_SECONDS
+        now = time.monotonic()
+        with self._condition:
+            job = self._pending.get(library_id)
+            if job:
+                job["library"] = library
+                job["requests"] += 1
+                created = False
+            else:
+                self._pending[library_id] = {
+                    "library": library,
+                    "due_at": now + max(0.0, float(window_seconds)),
+                    "first_requested_at": now,
+                    "requests": 1,
+                }
+                created = True
+            self._condition.notify()
+        self._ensure_worker()
+        library_name = library.get("Name", library_id)
+        if created:
+            logger.info(f"  -> [封面队列] 媒体库 '{library_name}' 已加入封面队列，将在 {int(window_seconds)} 秒后生成{f' ({reason})' if reason else ''}。")
+        else:
+            logger.debug(f"  -> [封面队列] 媒体库 '{library_name}' 已在队列中，本次请求已合并。")
+        return created
+
+    def pending_count(self) -> int:
+        with self._condition:
+            return len(self._pending)
+
+    def clear(self):
+        with self._condition:
+            dropped = len(self._pending)
+            self._pending.clear()
+        if dropped:
+            logger.info(f"[封面队列] 已清空 {dropped} 个待生成的封面任务。")
+
+    # --- 工人线程 ---
+    def _ensure_worker(self):
+        with self._condition:
+            if self._worker and self._worker.is_alive():
+                return
+            self._stopping = False
+            self._worker = threading.Thread(target=self._run, name="CoverJobWorker", daemon=True)
+            self._worker.start()
+
+    def stop(self, timeout: float = 5.0):
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+            worker = self._worker
+        if worker and worker.is_alive():
+            worker.join(timeout=timeout)
+        logger.debug("[封面队列] 工人线程已停止。")
+
+    def _next_due_job(self) -> Optional[Dict[str, Any]]:
+        """阻塞直到有任务到期（且主任务槽空闲或已顺延到上限），取出并返回；停止时返回 None。"""
+        with self._condition:
+            while not self._stopping:
+                if not self._pending:
+                    self._condition.wait()
+                    continue
+                library_id, job = min(self._pending.items(), key=lambda entry: entry[1]["due_at"])
+                now = time.monotonic()
+                if job["due_at"] > now:
+                    self._condition.wait(timeout=job["due_at"] - now)
+                    continue
+                if _is_cover_task_running() and now - job["due_at"] < MAX_DEFER_SECONDS:
+                    self._condition.wait(timeout=BUSY_RECHECK_SECONDS)
+                    continue
+                return self._pending.pop(library_id)
+            return None
+
+    def _run(self):
+        logger.trace("[封面队列] 工人线程已启动。")
+        while True:
+            job = self._next_due_job()
+            if job is None:
+                break
+            try:
+                _render_library_cover(job)
+            except Exception as e:
+                logger.error(f"[封面队列] 处理封面任务时发生错误: {e}", exc_info=True)
+
+def _is_cover_task_running() -> bool:
+    # 延迟导入，避免 services 包与 task_manager 的循环依赖
+    import task_manager
+    return task_manager.is_resource_in_use(task_manager.RESOURCE_COVERS)
+
+def _render_library_cover(job: Dict[str, Any]):
+    """渲染时重新读取封面配置，实时查询媒体数量后生成封面。"""
+    from . import CoverGeneratorService
+
+    library = job["library"]
+    library_id = library.get("Id")
+    library_name = library.get("Name", library_id)
+    cover_config = db_handler.get_setting('cover_generator_config') or {}
+    if not (cover_config.get("enabled") and cover_config.get("transfer_monitor")):
+        logger.debug(f"  -> [封面队列] 封面生成器或入库监控已关闭，丢弃媒体库 '{library_name}' 的封面任务。")
+        return
+    if f"{SERVER_ID}-{library_id}" in cover_config.get("exclude_libraries", []):
+        logger.info(f"  -> [封面队列] 媒体库 '{library_name}' 在忽略列表中，跳过。")
+        return
+
+    item_count = 0
+    item_type_to_query = TYPE_MAP.get(library.get('CollectionType'))
+    if item_type_to_query:
+        item_count = emby_handler.get_item_count(
+            base_url=config_manager.APP_CONFIG.get('emby_server_url'),
+            api_key=config_manager.APP_CONFIG.get('emby_api_key'),
+            user_id=config_manager.APP_CONFIG.get('emby_user_id'),
+            parent_id=library_id,
+            item_type=item_type_to_query
+        ) or 0
+
+    waited = time.monotonic() - job["first_requested_at"]
+    logger.info(f"  -> [封面队列] 正在为媒体库 '{library_name}' 生成封面 (合并了 {job['requests']} 次请求，等待 {waited:.0f} 秒，当前实时数量: {item_count})...")
+    CoverGeneratorService(config=cover_config).generate_for_library(emby_server_id=SERVER_ID, library=library, item_count=item_count)
+
+cover_job_queue = CoverJobQueue()
@@ -0,0 +1,104 @@
+# services/cover_generator/encoding.py
+
+import base64
+import logging
+from io import BytesIO
+from typing import Dict, Any, List, Optional, Tuple
+
+from PIL import Image, features
+
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# ✨ 封面编码 (Cover Encoding)
+# ------------------------------------------------------------------------------
+# 按配置的格式优先级和质量梯度编码封面，选出第一个不超过字节预算的结果；
+# 全部超出时取体积最小的一个。
+# Emby 的 POST /Items/{Id}/Images/{Type} 接口要求请求体为 base64 文本，
+# 因此最终仍返回 base64 字符串，但编码体积（即客户端实际下载的大小）大幅减小。
+# ==============================================================================
+
+DEFAULT_COVER_FORMATS = ["jpeg"]
+DEFAULT_COVER_MAX_KB = 400
+QUALITY_LADDER = (90, 85, 80, 75, 70, 60, 50)
+
+FORMAT_MIME_TYPES = {
+    "jpeg": "image/jpeg",
+    "png": "image/png",
+    "webp": "image/webp",
+    "avif": "image/avif",
+}
+FORMAT_EXTENSIONS = {"jpeg": "jpg", "png": "png", "webp": "webp", "avif": "avif"}
+
+def _format_supported(fmt: str) -> bool:
+    if fmt in ("jpeg", "png"):
+        return True
+    if fmt == "webp":
+        return features.check("webp")
+    if fmt == "avif":
+        try:
+            return bool(features.check("avif"))
+        except ValueError:
+            # 旧版 Pillow 不认识 avif 特性名；若安装了 pillow-avif-plugin，注册后即可保存
+            return "AVIF" in Image.SAVE
+    return False
+
+def _save(image: Image.Image, fmt: str, quality: Optional[int]) -> bytes:
+    buffer = BytesIO()
+    if fmt == "png":
+        image.save(buffer, format="PNG", compress_level=6)
+    elif fmt == "jpeg":
+        image.convert("RGB").save(buffer, format="JPEG", quality=quality, optimize=True, progressive=True, subsampling="4:2:0")
+    elif fmt == "webp":
+        image.save(buffer, format="WEBP", quality=quality, method=4)
+    elif fmt == "avif":
+        image.save(buffer, format="AVIF", quality=quality)
+    return buffer.getvalue()
+
+def encode_cover(image: Image.Image, config: Optional[Dict[str, Any]] = None) -> Tuple[bytes, str]:
+    """
+    编码封面，返回 (原始字节, 格式名)。
+    - config['cover_formats']: 格式优先级列表，可选 jpeg / webp / avif / png，默认 ['jpeg']；
+    - config['cover_max_kb']: 字节预算 (KB)，默认 400，<= 0 表示不限（取各格式的最高质量）。
+    """
+    config = config or {}
+    formats: List[str] = [str(f).lower() for f in (config.get("cover_formats") or DEFAULT_COVER_FORMATS)]
+    formats = [f for f in formats if f in FORMAT_MIME_TYPES and _format_supported(f)] or ["jpeg"]
+    try:
+        budget = int(float(config.get("cover_max_kb", DEFAULT_COVER_MAX_KB)) * 1024)
+    except (TypeError, ValueError):
+        budget = DEFAULT_COVER_MAX_KB * 1024
+
+    smallest: Optional[Tuple[bytes, str]] = None
+    for fmt in formats:
+        qualities = (None,) if fmt == "png" else QUALITY_LADDER
+        for quality in qualities:
+            data = _save(image, fmt, quality)
+            if smallest is None or len(data) < len(smallest[0]):
+                smallest = (data, fmt)
+            if budget <= 0 or len(data) <= budget:
+                return data, fmt
+    return smallest
+
+def encode_cover_base64(image: Image.Image, config: Optional[Dict[str, Any]] = None) -> str:
+    """编码封面并转为 Emby 上传所需的 base64 文本。"""
+    data, _ = encode_cover(image, config)
+    return base64.b64encode(data).decode("utf-8")
+
+def sniff_format(data: bytes) -> str:
+    """根据文件头识别图片格式，用于上传时设置 Content-Type。"""
+    if data[:3] == b"\xff\xd8\xff":
+        return "jpeg"
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        return "png"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp"
+    if data[4:12] in (b"ftypavif", b"ftypavis"):
+        return "avif"
+    return "png"
+
+def describe_base64_cover(image_data: str) -> Tuple[str, int]:
+    """返回 base64 封面的 (格式名, 解码后的字节数)。"""
+    head = base64.b64decode(image_data[:64])
+    padding = image_data[-2:].count("=")
+    return sniff_format(head), len(image_data) * 3 // 4 - padding
@@ -0,0 +1,148 @@
+# services/cover_generator/poster_cache.py
+
+import os
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POSTER_CACHE_MAX_MB = 512
+
+class PosterCache:
+    """
+    【内容寻址海报缓存】
+    - 以 (item_id, image_type, image_tag) 为键，Emby 的 image tag 变化即代表图片内容变化，因此同一个键对应的文件永远有效；
+    - 按总字节数做 LRU 淘汰，命中时刷新文件的访问顺序；
+    - 同一张海报被多个媒体库/合集并发请求时，只下载一次，其余请求等待结果。
+    """
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, int]" = OrderedDict()  # 文件名 -> 字节数，按最近使用排序
+        self._total_bytes = 0
+        self._in_flight: Dict[str, threading.Event] = {}
+        self._load_index()
+
+    def _load_index(self):
+        files = []
+        for path in self.root.glob("*.img"):
+            try:
+                stat = path.stat()
+                files.append((stat.st_mtime, path.name, stat.st_size))
+            except OSError:
+                continue
+        for _, name, size in sorted(files):
+            self._entries[name] = size
+            self._total_bytes += size
+        self._evict_locked()
+
+    @staticmethod
+    def _file_name(item_id: str, image_type: str, image_tag: str) -> str:
+        digest = hashlib.sha1(f"{item_id}|{image_type}|{image_tag}".encode("utf-8")).hexdigest()
+        return f"{digest}.img"
+
+    def _touch_locked(self, name: str) -> Optional[Path]:
+        path = self.root / name
+        if name not in self._entries:
+            return None
+        if not path.exists():
+            self._total_bytes -= self._entries.pop(name)
+            return None
+        self._entries.move_to_end(name)
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return path
+
+    def _add_locked(self, name: str):
+        path = self.root / name
+        try:
+            size = path.stat().st_size
+        except OSError:
+            return
+        if name in self._entries:
+            self._total_bytes -= self._entries.pop(name)
+        self._entries[name] = size
+        self._total_bytes += size
+        self._evict_locked()
+
+    def _evict_locked(self):
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            name, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            try:
+                (self.root / name).unlink()
+            except OSError:
+                pass
+            logger.trace(f"  -> 海报缓存超出上限，已淘汰: {name}")
+
+    def get_or_download(self, item_id: str, image_type: str, image_tag: str,
+                        download_func: Callable[[str], bool]) -> Optional[Path]:
+        """
+        返回缓存中的海报路径；未命中时调用 download_func(临时路径) 下载后入库。
+        download_func 返回 False 表示下载失败，此时返回 None。
+        """
+        name = self._file_name(item_id, image_type, image_tag)
+        while True:
+            with self._lock:
+                cached = self._touch_locked(name)
+                if cached:
+                    return cached
+                event = self._in_flight.get(name)
+                if event is None:
+                    event = threading.Event()
+                    self._in_flight[name] = event
+                    break
+            # 其他线程正在下载同一张海报，等它完成后重新检查缓存
+            event.wait()
+            with self._lock:
+                cached = self._touch_locked(name)
+                if cached:
+                    return cached
+                if name in self._in_flight:
+                    continue
+            return None
+
+        tmp_path = self.root / f"{name}.{threading.get_ident()}.part"
+        try:
+            if not download_func(str(tmp_path)):
+                return None
+            os.replace(tmp_path, self.root / name)
+            with self._lock:
+                self._add_locked(name)
+                return self._touch_locked(name)
+        finally:
+            if tmp_path.exists():
+                try:
+                    tmp_path.unlink()
+                except OSError:
+                    pass
+            with self._lock:
+                self._in_flight.pop(name, None)
+            event.set()
+
+_poster_cache: Optional[PosterCache] = None
+_poster_cache_lock = threading.Lock()
+
+def get_poster_cache(root: Path, max_mb: Optional[float] = None) -> PosterCache:
+    """获取进程内共享的海报缓存实例；上限变化时原地更新。"""
+    global _poster_cache
+    try:
+        max_bytes = int(float(max_mb if max_mb is not None else DEFAULT_POSTER_CACHE_MAX_MB) * 1024 * 1024)
+    except (TypeError, ValueError):
+        max_bytes = DEFAULT_POSTER_CACHE_MAX_MB * 1024 * 1024
+    with _poster_cache_lock:
+        if _poster_cache is None or _poster_cache.root != Path(root):
+            _poster_cache = PosterCache(root, max_bytes)
+        elif _poster_cache.max_bytes != max_bytes:
+            with _poster_cache._lock:
+                _poster_cache.max_bytes = max_bytes
+                _poster_cache._evict_locked()
+        return _poster_cache
@@ -0,0 +1,142 @@
+# services/cover_generator/render_primitives.py
+
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter, ImageFont, ImageOps
+
+# ==============================================================================
+# ✨ 渲染基元缓存 (Render Primitives Cache)
+# ------------------------------------------------------------------------------
+# 各封面风格在每次渲染时都会重建完全相同的中间素材：圆角遮罩、阴影核、画布尺寸的渐变遮罩、
+# 以及每个字号的 ImageFont.truetype 对象。这些素材只取决于参数本身，因此按参数缓存，
+# 批量渲染时（同一进程内的多个封面）只需构建一次。
+#
+# ★★★ 约定：缓存返回的 Image 对象是共享的，调用方只能读取（作为 mask / composite 源 / paste 源），
+#     不能原地修改；需要修改时请先 .copy()。
+# ==============================================================================
+
+_MAX_ENTRIES_PER_PRIMITIVE = 32
+
+def cached_primitive(maxsize: int = _MAX_ENTRIES_PER_PRIMITIVE, key_func=None):
+    """
+    按参数缓存渲染基元的装饰器（线程安全的 LRU）。
+    默认以参数本身为键（必须可哈希）；参数含图像时可通过 key_func 自定义键。
+    """
+    def decorator(func):
+        cache = OrderedDict()
+        lock = threading.Lock()
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            key = key_func(*args, **kwargs) if key_func else (args, tuple(sorted(kwargs.items())))
+            with lock:
+                if key in cache:
+                    cache.move_to_end(key)
+                    return cache[key]
+            value = func(*args, **kwargs)
+            with lock:
+                cache[key] = value
+                cache.move_to_end(key)
+                while len(cache) > maxsize:
+                    cache.popitem(last=False)
+            return value
+
+        def cache_clear():
+            with lock:
+                cache.clear()
+
+        wrapper.cache_clear = cache_clear
+        return wrapper
+    return decorator
+
+# --- 字体 ---
+@cached_primitive(maxsize=64)
+def get_font(font_path, size):
+    """按 (路径, 字号) 缓存的 ImageFont.truetype。"""
+    return ImageFont.truetype(str(font_path), size)
+
+# --- 遮罩 ---
+@cached_primitive()
+def rounded_rectangle_mask(size, radius):
+    """尺寸为 size 的圆角矩形 L 遮罩（与 ImageDraw.rounded_rectangle([(0,0), size]) 相同）。"""
+    mask = Image.new('L', size, 0)
+    ImageDraw.Draw(mask).rounded_rectangle([(0, 0), size], radius=radius, fill=255)
+    return mask
+
+@cached_primitive()
+def horizontal_power_gradient_mask(width, height, exponent=0.7):
+    """从左到右 0→255 的幂次渐变遮罩：值为 int(255 * (x / width) ** exponent)。"""
+    row = bytes(int(255.0 * (x / width) ** exponent) for x in range(width))
+    return Image.frombytes('L', (width, height), row * height)
+
+@cached_primitive()
+def horizontal_linear_gradient_mask(width, height, max_alpha):
+    """从左到右 0→max_alpha 的线性渐变遮罩：值为 int((x / width) * max_alpha)。"""
+    row = bytes(int((x / width) * max_alpha) for x in range(width))
+    return Image.frombytes('L', (width, height), row * height)
+
+# --- 阴影 ---
+@cached_primitive()
+def solid_shadow(size, offset, shadow_color, blur_radius):
+    """
+    矩形卡片的模糊阴影：只取决于卡片尺寸、偏移、颜色和模糊半径，与卡片内容无关。
+    返回尺寸为 (w + offset_x + 2r, h + offset_y + 2r) 的 RGBA 图层。
+    """
+    shadow = Image.new("RGBA", (size[0] + offset[0] + blur_radius * 2, size[1] + offset[1] + blur_radius * 2), (0, 0, 0, 0))
+    shadow.paste(Image.new("RGBA", size, shadow_color), (blur_radius + offset[0], blur_radius + offset[1]))
+    return shadow.filter(ImageFilter.GaussianBlur(blur_radius))
+
+def _alpha_shadow_key(alpha_mask, padding, opacity, radius, angle):
+    return (hashlib.md5(alpha_mask.tobytes()).digest(), alpha_mask.size, padding, opacity, radius, angle)
+
+@cached_primitive(key_func=_alpha_shadow_key)
+def rotated_alpha_shadow(alpha_mask, padding, opacity, radius, angle):
+    """
+    按卡片 alpha 形状生成的模糊+旋转阴影。相同形状（例如同尺寸的圆角卡片）的 alpha 内容相同，
+    以内容摘要为键即可复用，省去每张卡片一次的大半径高斯模糊。
+    """
+    width, height = alpha_mask.size
+    shadow = Image.new("RGBA", (width + padding * 2, height + padding * 2), (0, 0, 0, 0))
+    shadow.paste((0, 0, 0, int(255 * opacity)), (padding, padding, padding + width, padding + height), alpha_mask)
+    shadow = shadow.filter(ImageFilter.GaussianBlur(radius))
+    return shadow.rotate(angle, Image.BICUBIC, expand=True)
+
+# --- 背景模糊管线 ---
+# 'quality': 原始做法，在完整画布分辨率上做 GaussianBlur(blur_size)，float64 混色；
+# 'fast'   : 先缩小到 1/factor 再模糊（半径同比缩小），放大回画布尺寸，uint8 混色。
+#            大半径模糊本身就滤掉了高频细节，缩小/放大带来的差异在肉眼可接受的误差内。
+BLUR_MODE_QUALITY = "quality"
+BLUR_MODE_FAST = "fast"
+_FAST_BLUR_MIN_RADIUS = 8
+_FAST_BLUR_MAX_FACTOR = 8
+
+def blurred_background(img, size, blur_size, mode=BLUR_MODE_FAST):
+    """把 img 裁切填充到 size 并做高斯模糊。"""
+    blur_size = int(blur_size)
+    if mode != BLUR_MODE_FAST or blur_size < _FAST_BLUR_MIN_RADIUS:
+        return ImageOps.fit(img, size, method=Image.LANCZOS).filter(ImageFilter.GaussianBlur(radius=blur_size))
+    factor = min(_FAST_BLUR_MAX_FACTOR, max(2, blur_size // 6))
+    small_size = (max(1, size[0] // factor), max(1, size[1] // factor))
+    small = ImageOps.fit(img, small_size, method=Image.LANCZOS).filter(ImageFilter.GaussianBlur(radius=blur_size / factor))
+    return small.resize(size, Image.BILINEAR)
+
+def blend_with_color(img, color, ratio, mode=BLUR_MODE_FAST):
+    """img * (1 - ratio) + color * ratio，返回 RGB 图像。"""
+    img = img.convert('RGB')
+    color = tuple(int(c) for c in color[:3])
+    if mode == BLUR_MODE_FAST:
+        return Image.blend(img, Image.new('RGB', img.size, color), float(ratio))
+    img_array = np.array(img, dtype=float)
+    color_array = np.array([[color]], dtype=float)
+    blended = np.clip(img_array * (1 - float(ratio)) + color_array * float(ratio), 0, 255).astype(np.uint8)
+    return Image.fromarray(blended)
+
+def clear_all():
+    """清空所有渲染基元缓存（保存封面配置时调用，字体文件可能已在原路径上被替换）。"""
+    for primitive in (get_font, rounded_rectangle_mask, horizontal_power_gradient_mask,
+                      horizontal_linear_gradient_mask, solid_shadow, rotated_alpha_shadow):
+        primitive.cache_clear()
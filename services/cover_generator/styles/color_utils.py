@@ -0,0 +1,175 @@
+# services/cover_generator/styles/color_utils.py
+
+import numpy as np
+from PIL import Image
+
+# ========== 向量化颜色分析 ==========
+# 与各风格文件中原先的逐像素实现（list(getdata()) + Counter + colorsys）结果一致：
+# - 灰度/近黑/近白过滤改为数组运算；
+# - 颜色计数使用 24 位打包后的直方图，排序规则与 Counter.most_common 相同（次数降序，次数相同按首次出现顺序）；
+# - HSV 转换按 colorsys 的公式逐步向量化，浮点结果逐位相同。
+
+PALETTE_MODE_HISTOGRAM = "histogram"
+PALETTE_MODE_KMEANS = "kmeans"
+
+def _image_to_array(image, thumbnail_size):
+    img = image.copy()
+    img.thumbnail(thumbnail_size)
+    img = img.convert('RGB')
+    return np.asarray(img, dtype=np.int16).reshape(-1, 3)
+
+def colorful_pixel_mask(pixels, threshold=20, gray_diff_threshold=10):
+    """等价于 is_not_black_white_gray_near 的数组版本，pixels 形如 (N, 3)。"""
+    r, g, b = pixels[:, 0], pixels[:, 1], pixels[:, 2]
+    near_black = (r < threshold) & (g < threshold) & (b < threshold)
+    near_white = (r > 255 - threshold) & (g > 255 - threshold) & (b > 255 - threshold)
+    near_gray = (np.abs(r - g) < gray_diff_threshold) & (np.abs(g - b) < gray_diff_threshold) & (np.abs(r - b) < gray_diff_threshold)
+    return ~(near_black | near_white | near_gray)
+
+def most_common_colors(pixels, n):
+    """
+    统计出现次数最多的 n 个颜色，返回 [((r, g, b), count), ...]。
+    排序与 Counter(pixels).most_common(n) 完全相同。
+    """
+    if len(pixels) == 0:
+        return []
+    packed = (pixels[:, 0].astype(np.int32) << 16) | (pixels[:, 1].astype(np.int32) << 8) | pixels[:, 2].astype(np.int32)
+    values, first_index, counts = np.unique(packed, return_index=True, return_counts=True)
+    order = np.lexsort((first_index, -counts))[:n]
+    return [(((int(v) >> 16) & 0xFF, (int(v) >> 8) & 0xFF, int(v) & 0xFF), int(c)) for v, c in zip(values[order], counts[order])]
+
+def kmeans_palette(pixels, n, iterations=10, seed=0):
+    """
+    可选的 k-means 调色板：把像素聚成 n 类，按类大小降序返回 [((r, g, b), count), ...]。
+    初始中心取自出现次数最多的颜色，结果可复现。
+    """
+    if len(pixels) == 0:
+        return []
+    data = pixels.astype(np.float32)
+    initial = [color for color, _ in most_common_colors(pixels, n)]
+    if len(initial) < n:
+        rng = np.random.default_rng(seed)
+        extra = data[rng.choice(len(data), size=n - len(initial), replace=True)]
+        centers = np.vstack([np.array(initial, dtype=np.float32).reshape(-1, 3), extra])
+    else:
+        centers = np.array(initial, dtype=np.float32)
+    labels = np.zeros(len(data), dtype=np.int64)
+    for iteration in range(iterations):
+        distances = ((data[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2)
+        new_labels = distances.argmin(axis=1)
+        if iteration > 0 and np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+        for k in range(len(centers)):
+            members = data[labels == k]
+            if len(members):
+                centers[k] = members.mean(axis=0)
+    counts = np.bincount(labels, minlength=len(centers))
+    order = np.argsort(-counts, kind='stable')
+    return [(tuple(int(round(c)) for c in centers[k]), int(counts[k])) for k in order if counts[k] > 0]
+
+def rgb_to_hsv_array(colors):
+    """colorsys.rgb_to_hsv 的向量化版本，colors 为 0-255 的 (N, 3) 数组，返回 (h, s, v)。"""
+    rgb = np.asarray(colors, dtype=np.float64) / 255.0
+    r, g, b = rgb[:, 0], rgb[:, 1], rgb[:, 2]
+    maxc = rgb.max(axis=1)
+    minc = rgb.min(axis=1)
+    rangec = maxc - minc
+    v = maxc
+    gray = rangec == 0
+    safe_range = np.where(gray, 1.0, rangec)
+    safe_max = np.where(maxc == 0, 1.0, maxc)
+    s = np.where(gray, 0.0, rangec / safe_max)
+    rc = (maxc - r) / safe_range
+    gc = (maxc - g) / safe_range
+    bc = (maxc - b) / safe_range
+    h = np.where(r == maxc, bc - gc, np.where(g == maxc, 2.0 + rc - bc, 4.0 + gc - rc))
+    h = np.where(gray, 0.0, np.mod(h / 6.0, 1.0))
+    return h, s, v
+
+def hsv_to_rgb_array(h, s, v):
+    """colorsys.hsv_to_rgb 的向量化版本，返回截断为 int 的 (N, 3) 数组（与原 hsv_to_rgb 一致）。"""
+    h = np.asarray(h, dtype=np.float64)
+    s = np.asarray(s, dtype=np.float64)
+    v = np.asarray(v, dtype=np.float64)
+    i = (h * 6.0).astype(np.int64)
+    f = (h * 6.0) - i
+    p = v * (1.0 - s)
+    q = v * (1.0 - s * f)
+    t = v * (1.0 - s * (1.0 - f))
+    i = i % 6
+    r = np.choose(i, [v, q, p, p, t, v])
+    g = np.choose(i, [t, v, v, q, p, p])
+    b = np.choose(i, [p, p, t, v, v, q])
+    r = np.where(s == 0.0, v, r)
+    g = np.where(s == 0.0, v, g)
+    b = np.where(s == 0.0, v, b)
+    return (np.stack([r, g, b], axis=1) * 255).astype(np.int64)
+
+def candidate_colors(image, num_candidates, thumbnail_size, palette_mode=PALETTE_MODE_HISTOGRAM):
+    """缩略图 -> 过滤灰色 -> 按调色板模式取候选颜色。"""
+    pixels = _image_to_array(image, thumbnail_size)
+    pixels = pixels[colorful_pixel_mask(pixels)]
+    if palette_mode == PALETTE_MODE_KMEANS:
+        return kmeans_palette(pixels, num_candidates)
+    return most_common_colors(pixels, num_candidates)
+
+def find_dominant_vibrant_colors(image, num_colors=5, palette_mode=PALETTE_MODE_HISTOGRAM,
+                                 target_saturation_range=(0.2, 0.7), target_value_range=(0.55, 0.85)):
+    """single_2 / multi_1 使用的马卡龙化主色提取（色相相差 15° 以内视为相近）。"""
+    candidates = candidate_colors(image, num_colors * 3, (100, 100), palette_mode)
+    if not candidates:
+        return []
+    h, s, v = rgb_to_hsv_array([color for color, _ in candidates])
+    adjusted_s = np.clip(s, *target_saturation_range)
+    adjusted_v = np.clip(v, *target_value_range)
+    adjusted_rgb = [tuple(int(x) for x in row) for row in hsv_to_rgb_array(h, adjusted_s, adjusted_v)]
+    hue_degrees = (h * 360).astype(np.int64)
+    macaron_colors = []
+    seen_hues = []
+    for rgb, hue_degree in zip(adjusted_rgb, hue_degrees.tolist()):
+        is_similar_hue = any(abs(hue_degree - seen) < 15 for seen in seen_hues)
+        if not is_similar_hue and rgb not in macaron_colors:
+            macaron_colors.append(rgb)
+            seen_hues.append(hue_degree)
+            if len(macaron_colors) >= num_colors: break
+    return macaron_colors
+
+def find_dominant_macaron_colors(image, num_colors=5, palette_mode=PALETTE_MODE_HISTOGRAM,
+                                 target_saturation_range=(0.3, 0.7), target_value_range=(0.6, 0.85),
+                                 min_color_distance=0.15):
+    """single_1 使用的马卡龙化主色提取（按 HSV 距离去重）。"""
+    candidates = candidate_colors(image, num_colors * 5, (150, 150), palette_mode)
+    if not candidates:
+        return []
+    h, s, v = rgb_to_hsv_array([color for color, _ in candidates])
+    adjusted = hsv_to_rgb_array(h, np.clip(s, *target_saturation_range), np.clip(v, *target_value_range))
+    # 距离计算基于调整后颜色的 HSV
+    ah, as_, av = rgb_to_hsv_array(adjusted)
+    macaron_colors = []
+    selected = []
+    for index in range(len(adjusted)):
+        if selected:
+            idx = np.array(selected)
+            h_diff = np.abs(ah[idx] - ah[index])
+            h_dist = np.minimum(h_diff, 1 - h_diff)
+            distances = h_dist * 5 + np.abs(as_[idx] - as_[index]) + np.abs(av[idx] - av[index])
+            if (distances < min_color_distance).any():
+                continue
+        selected.append(index)
+        macaron_colors.append(tuple(int(x) for x in adjusted[index]))
+        if len(macaron_colors) >= num_colors: break
+    return macaron_colors
+
+def poster_primary_colors(image_path, n=10):
+    """multi_1 渐变背景取色：过滤透明/近黑/近白像素后的前 n 个颜色，返回 [((r, g, b, 255), count), ...]。"""
+    img = Image.open(image_path).resize((100, 150), Image.LANCZOS).convert('RGBA')
+    pixels = np.asarray(img, dtype=np.int16).reshape(-1, 4)
+    r, g, b, a = pixels[:, 0], pixels[:, 1], pixels[:, 2], pixels[:, 3]
+    mask = (a > 200) & ~((r < 30) & (g < 30) & (b < 30)) & ~((r > 220) & (g > 220) & (b > 220))
+    selected = pixels[mask]
+    if len(selected) == 0:
+        selected = pixels[a > 100]
+    if len(selected) == 0:
+        return [(150, 100, 50, 255)]
+    return [((r_, g_, b_, 255), count) for (r_, g_, b_), count in most_common_colors(selected[:, :3], n)]
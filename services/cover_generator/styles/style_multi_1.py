@@ -4,15 +4,19 @@ import logging
 import os
 import random
 import math
-import base64
-import io
 import colorsys
 from pathlib import Path
-from collections import Counter
 import numpy as np
-from PIL import Image, ImageDraw, ImageFont, ImageFilter, ImageOps
+from PIL import Image, ImageDraw, ImageFilter, ImageOps
 
 from .badge_drawer import draw_badge
+from ..encoding import encode_cover_base64
+from ..render_primitives import (
+    BLUR_MODE_FAST, blend_with_color, blurred_background,
+    get_font, rounded_rectangle_mask, horizontal_power_gradient_mask,
+    horizontal_linear_gradient_mask, solid_shadow
+)
+from .color_utils import PALETTE_MODE_HISTOGRAM, find_dominant_vibrant_colors as _find_dominant_vibrant_colors, poster_primary_colors
 
 logger = logging.getLogger(__name__)
 
@@ -24,51 +28,9 @@ POSTER_GEN_CONFIG = {
 }
 
 # ========== 辅助函数 (从单图风格文件中复制过来) ==========
-def is_not_black_white_gray_near(color, threshold=20):
-    r, g, b = color
-    if (r < threshold and g < threshold and b < threshold) or \
-       (r > 255 - threshold and g > 255 - threshold and b > 255 - threshold):
-        return False
-    gray_diff_threshold = 10
-    if abs(r - g) < gray_diff_threshold and abs(g - b) < gray_diff_threshold and abs(r - b) < gray_diff_threshold:
-        return False
-    return True
-
-def rgb_to_hsv(color):
-    r, g, b = [x / 255.0 for x in color]
-    return colorsys.rgb_to_hsv(r, g, b)
-
-def hsv_to_rgb(h, s, v):
-    r, g, b = colorsys.hsv_to_rgb(h, s, v)
-    return (int(r * 255), int(g * 255), int(b * 255))
-
-def adjust_to_macaron(h, s, v, target_saturation_range=(0.2, 0.7), target_value_range=(0.55, 0.85)):
-    adjusted_s = min(max(s, target_saturation_range[0]), target_saturation_range[1])
-    adjusted_v = min(max(v, target_value_range[0]), target_value_range[1])
-    return adjusted_s, adjusted_v
-
-def find_dominant_vibrant_colors(image, num_colors=5):
-    img = image.copy()
-    img.thumbnail((100, 100))
-    img = img.convert('RGB')
-    pixels = list(img.getdata())
-    filtered_pixels = [p for p in pixels if is_not_black_white_gray_near(p)]
-    if not filtered_pixels: return []
-    color_counter = Counter(filtered_pixels)
-    dominant_colors = color_counter.most_common(num_colors * 3)
-    macaron_colors = []
-    seen_hues = set()
-    for color, count in dominant_colors:
-        h, s, v = rgb_to_hsv(color)
-        adjusted_s, adjusted_v = adjust_to_macaron(h, s, v)
-        adjusted_rgb = hsv_to_rgb(h, adjusted_s, adjusted_v)
-        hue_degree = int(h * 360)
-        is_similar_hue = any(abs(hue_degree - seen) < 15 for seen in seen_hues)
-        if not is_similar_hue and adjusted_rgb not in macaron_colors:
-            macaron_colors.append(adjusted_rgb)
-            seen_hues.add(hue_degree)
-            if len(macaron_colors) >= num_colors: break
-    return macaron_colors
+def find_dominant_vibrant_colors(image, num_colors=5, palette_mode=PALETTE_MODE_HISTOGRAM):
+    # 向量化实现见 color_utils，结果与原逐像素实现一致
+    return _find_dominant_vibrant_colors(image, num_colors=num_colors, palette_mode=palette_mode)
 
 def darken_color(color, factor=0.7):
     r, g, b = color
@@ -81,12 +43,8 @@ def add_film_grain(image, intensity=0.05):
     return Image.fromarray(img_array)
 
 def add_shadow(img, offset=(5, 5), shadow_color=(0, 0, 0, 100), blur_radius=3):
-    shadow_width = img.width + offset[0] + blur_radius * 2
-    shadow_height = img.height + offset[1] + blur_radius * 2
-    shadow = Image.new("RGBA", (shadow_width, shadow_height), (0, 0, 0, 0))
-    shadow_layer = Image.new("RGBA", img.size, shadow_color)
-    shadow.paste(shadow_layer, (blur_radius + offset[0], blur_radius + offset[1]))
-    shadow = shadow.filter(ImageFilter.GaussianBlur(blur_radius))
+    # 阴影与海报内容无关，按尺寸/偏移/颜色/半径复用
+    shadow = solid_shadow(img.size, tuple(offset), tuple(shadow_color), blur_radius)
     result = Image.new("RGBA", shadow.size, (0, 0, 0, 0))
     result.paste(img, (blur_radius, blur_radius), img if img.mode == "RGBA" else None)
     return Image.alpha_composite(shadow, result)
@@ -97,7 +55,7 @@ def draw_text_on_image(image, text, position, font_path, default_font_path, font
     shadow_layer = Image.new('RGBA', img_copy.size, (0, 0, 0, 0))
     draw = ImageDraw.Draw(text_layer)
     shadow_draw = ImageDraw.Draw(shadow_layer)
-    font = ImageFont.truetype(font_path, font_size)
+    font = get_font(font_path, font_size)
     if shadow:
         fill_color = (fill_color[0], fill_color[1], fill_color[2], 229)
         if shadow_color is None:
@@ -116,7 +74,7 @@ def draw_multiline_text_on_image(image, text, position, font_path, default_font_
     img_copy = image.copy()
     text_layer = Image.new('RGBA', img_copy.size, (255, 255, 255, 0))
     draw = ImageDraw.Draw(text_layer)
-    font = ImageFont.truetype(font_path, font_size)
+    font = get_font(font_path, font_size)
     lines = text.split(" ")
     if shadow:
         fill_color = (fill_color[0], fill_color[1], fill_color[2], 229)
@@ -184,57 +142,39 @@ def create_gradient_background(width, height, color=None):
     color2 = (r2, g2, b2, 255)
     left_image = Image.new("RGBA", (width, height), color1)
     right_image = Image.new("RGBA", (width, height), color2)
-    mask = Image.new("L", (width, height), 0)
-    mask_data = [int(255.0 * (x / width) ** 0.7) for y in range(height) for x in range(width)]
-    mask.putdata(mask_data)
+    mask = horizontal_power_gradient_mask(width, height, 0.7)
     return Image.composite(right_image, left_image, mask)
 
 def get_poster_primary_color(image_path):
     try:
-        img = Image.open(image_path).resize((100, 150), Image.LANCZOS).convert('RGBA')
-        pixels = list(img.getdata())
-        filtered_pixels = [(r, g, b, 255) for r, g, b, a in pixels if a > 200 and not (r < 30 and g < 30 and b < 30) and not (r > 220 and g > 220 and b > 220)]
-        if not filtered_pixels: filtered_pixels = [(p[0], p[1], p[2], 255) for p in pixels if p[3] > 100]
-        if not filtered_pixels: return [(150, 100, 50, 255)]
-        return Counter(filtered_pixels).most_common(10)
+        return poster_primary_colors(image_path, 10)
     except Exception:
         return [(150, 100, 50, 255)]
 
-def create_blur_background(image_path, template_width, template_height, background_color, blur_size, color_ratio, lighten_gradient_strength=0.6):
+def create_blur_background(image_path, template_width, template_height, background_color, blur_size, color_ratio, lighten_gradient_strength=0.6, blur_mode=BLUR_MODE_FAST):
     # 【修复】从 RGBA 改为 RGB，避免通道不匹配
     original_img = Image.open(image_path).convert('RGB')
-    bg_img = ImageOps.fit(original_img.copy(), (template_width, template_height), method=Image.LANCZOS).filter(ImageFilter.GaussianBlur(radius=int(blur_size)))
+    bg_img = blurred_background(original_img, (template_width, template_height), blur_size, blur_mode)
     
     actual_color = darken_color(background_color, 0.85)
     # 确保 bg_color 是 3 通道
     bg_color = actual_color[:3]
     
-    # bg_img_array 现在是 (H, W, 3)
-    bg_img_array = np.array(bg_img, dtype=float)
-    # bg_color_array 是 (1, 1, 3)，形状匹配
-    bg_color_array = np.array([[bg_color]], dtype=float)
-    
-    blended_bg_array = np.clip(bg_img_array * (1 - float(color_ratio)) + bg_color_array * float(color_ratio), 0, 255).astype(np.uint8)
-    
-    # 【修复】从 RGB 数组创建图像，然后转换为 RGBA 以进行后续合成
-    blended_bg_img = Image.fromarray(blended_bg_array, 'RGB').convert('RGBA')
+    # 【修复】混色结果为 RGB，转换为 RGBA 以进行后续合成
+    blended_bg_img = blend_with_color(bg_img, bg_color, color_ratio, blur_mode).convert('RGBA')
 
     if lighten_gradient_strength > 0:
-        gradient_mask = Image.new("L", (template_width, template_height), 0)
-        draw_mask = ImageDraw.Draw(gradient_mask)
         max_alpha = int(255 * np.clip(lighten_gradient_strength, 0.0, 1.0))
-        for x in range(template_width):
-            draw_mask.line([(x, 0), (x, template_height)], fill=int((x / template_width) * max_alpha))
+        gradient_mask = horizontal_linear_gradient_mask(template_width, template_height, max_alpha)
         lighten_layer = Image.new("RGBA", (template_width, template_height), (255, 255, 255, 0))
         lighten_layer.putalpha(gradient_mask)
         blended_bg_img = Image.alpha_composite(blended_bg_img, lighten_layer)
         
     return add_film_grain(blended_bg_img, intensity=0.03)
 
-def image_to_base64(image):
-    buffer = io.BytesIO()
-    image.save(buffer, format="PNG", optimize=True)
-    return base64.b64encode(buffer.getvalue()).decode('utf-8')
+def image_to_base64(image, config=None):
+    # 按配置的格式/质量和字节预算编码（见 encoding.encode_cover）
+    return encode_cover_base64(image, config)
 
 # ========== 主函数 ==========
 def create_style_multi_1(library_dir, title, font_path, font_size=(1,1), is_blur=False, blur_size=50, color_ratio=0.8, item_count=None, config=None):
@@ -255,7 +195,7 @@ def create_style_multi_1(library_dir, title, font_path, font_size=(1,1), is_blur
         template_width, template_height = POSTER_GEN_CONFIG["CANVAS_WIDTH"], POSTER_GEN_CONFIG["CANVAS_HEIGHT"]
 
         color_img = Image.open(first_image_path).convert("RGB")
-        vibrant_colors = find_dominant_vibrant_colors(color_img)
+        vibrant_colors = find_dominant_vibrant_colors(color_img, palette_mode=(config or {}).get('palette_mode', PALETTE_MODE_HISTOGRAM))
         soft_colors = [(237, 159, 77), (255, 183, 197), (186, 225, 255), (255, 223, 186), (202, 231, 200), (245, 203, 255)]
         
         if vibrant_colors:
@@ -267,7 +207,7 @@ def create_style_multi_1(library_dir, title, font_path, font_size=(1,1), is_blur
         gradient_color = get_poster_primary_color(first_image_path)
 
         if is_blur:
-          colored_bg_img = create_blur_background(first_image_path, template_width, template_height, blur_color, blur_size, color_ratio)
+          colored_bg_img = create_blur_background(first_image_path, template_width, template_height, blur_color, blur_size, color_ratio, blur_mode=(config or {}).get('blur_mode', BLUR_MODE_FAST))
         else:
           colored_bg_img = create_gradient_background(template_width, template_height, gradient_color)
 
@@ -292,8 +232,7 @@ def create_style_multi_1(library_dir, title, font_path, font_size=(1,1), is_blur
                 try:
                     poster = ImageOps.fit(Image.open(poster_path), (cell_width, cell_height), method=Image.LANCZOS)
                     if corner_radius > 0:
-                        mask = Image.new("L", (cell_width, cell_height), 0)
-                        ImageDraw.Draw(mask).rounded_rectangle([(0, 0), (cell_width, cell_height)], radius=corner_radius, fill=255)
+                        mask = rounded_rectangle_mask((cell_width, cell_height), corner_radius)
                         poster_with_corners = Image.new("RGBA", poster.size, (0, 0, 0, 0))
                         poster_with_corners.paste(poster, (0, 0), mask)
                         poster = poster_with_corners
@@ -350,7 +289,7 @@ def create_style_multi_1(library_dir, title, font_path, font_size=(1,1), is_blur
                 base_color=base_color_for_badge
             )
 
-        return image_to_base64(result)
+        return image_to_base64(result, config)
 
     except Exception as e:
         logger.error(f"创建多图封面时出错: {e}", exc_info=True)
@@ -3,13 +3,16 @@
 import logging
 import colorsys
 import random
-import base64
-from io import BytesIO
-from collections import Counter
 import numpy as np
-from PIL import Image, ImageDraw, ImageFont, ImageFilter, ImageOps
+from PIL import Image, ImageDraw, ImageFilter
 
 from .badge_drawer import draw_badge
+from ..encoding import encode_cover_base64
+from ..render_primitives import (
+    BLUR_MODE_FAST, blend_with_color, blurred_background,
+    get_font, rounded_rectangle_mask, rotated_alpha_shadow
+)
+from .color_utils import PALETTE_MODE_HISTOGRAM, find_dominant_macaron_colors as _find_dominant_macaron_colors
 
 logger = logging.getLogger(__name__)
 
@@ -17,16 +20,6 @@ logger = logging.getLogger(__name__)
 canvas_size = (1920, 1080)
 
 # ========== 辅助函数 ==========
-def is_not_black_white_gray_near(color, threshold=20):
-    r, g, b = color
-    if (r < threshold and g < threshold and b < threshold) or \
-       (r > 255 - threshold and g > 255 - threshold and b > 255 - threshold):
-        return False
-    gray_diff_threshold = 10
-    if abs(r - g) < gray_diff_threshold and abs(g - b) < gray_diff_threshold and abs(r - b) < gray_diff_threshold:
-        return False
-    return True
-
 def rgb_to_hsv(color):
     r, g, b = [x / 255.0 for x in color]
     return colorsys.rgb_to_hsv(r, g, b)
@@ -35,39 +28,15 @@ def hsv_to_rgb(h, s, v):
     r, g, b = colorsys.hsv_to_rgb(h, s, v)
     return (int(r * 255), int(g * 255), int(b * 255))
 
-def adjust_color_macaron(color):
-    h, s, v = rgb_to_hsv(color)
-    target_saturation_range = (0.3, 0.7)
-    target_value_range = (0.6, 0.85)
-    if s < target_saturation_range[0]: s = target_saturation_range[0]
-    elif s > target_saturation_range[1]: s = target_saturation_range[1]
-    if v < target_value_range[0]: v = target_value_range[0]
-    elif v > target_value_range[1]: v = target_value_range[1]
-    return hsv_to_rgb(h, s, v)
-
 def color_distance(color1, color2):
     h1, s1, v1 = rgb_to_hsv(color1)
     h2, s2, v2 = rgb_to_hsv(color2)
     h_dist = min(abs(h1 - h2), 1 - abs(h1 - h2))
     return h_dist * 5 + abs(s1 - s2) + abs(v1 - v2)
 
-def find_dominant_macaron_colors(image, num_colors=5):
-    img = image.copy()
-    img.thumbnail((150, 150))
-    img = img.convert('RGB')
-    pixels = list(img.getdata())
-    filtered_pixels = [p for p in pixels if is_not_black_white_gray_near(p)]
-    if not filtered_pixels: return []
-    color_counter = Counter(filtered_pixels)
-    candidate_colors = color_counter.most_common(num_colors * 5)
-    macaron_colors = []
-    min_color_distance = 0.15
-    for color, _ in candidate_colors:
-        adjusted_color = adjust_color_macaron(color)
-        if not any(color_distance(adjusted_color, existing) < min_color_distance for existing in macaron_colors):
-            macaron_colors.append(adjusted_color)
-            if len(macaron_colors) >= num_colors: break
-    return macaron_colors
+def find_dominant_macaron_colors(image, num_colors=5, palette_mode=PALETTE_MODE_HISTOGRAM):
+    # 向量化实现见 color_utils，结果与原逐像素实现一致
+    return _find_dominant_macaron_colors(image, num_colors=num_colors, palette_mode=palette_mode)
 
 def darken_color(color, factor=0.7):
     r, g, b = color
@@ -92,9 +61,7 @@ def add_rounded_corners(img, radius=30):
     factor = 2
     width, height = img.size
     enlarged_img = img.resize((width * factor, height * factor), Image.Resampling.LANCZOS).convert("RGBA")
-    mask = Image.new('L', (width * factor, height * factor), 0)
-    draw = ImageDraw.Draw(mask)
-    draw.rounded_rectangle([(0, 0), (width * factor, height * factor)], radius=radius * factor, fill=255)
+    mask = rounded_rectangle_mask((width * factor, height * factor), radius * factor)
     background = Image.new("RGBA", (width * factor, height * factor), (255, 255, 255, 0))
     high_res_result = Image.composite(enlarged_img, background, mask)
     return high_res_result.resize((width, height), Image.Resampling.LANCZOS)
@@ -103,13 +70,9 @@ def add_shadow_and_rotate(canvas, img, angle, offset=(10, 10), radius=10, opacit
     width, height = img.size
     if center_pos is None: center_pos = (canvas.width // 2, canvas.height // 2)
     padding = max(radius * 4, 100)
-    shadow_size = (width + padding * 2, height + padding * 2)
-    shadow = Image.new("RGBA", shadow_size, (0, 0, 0, 0))
     shadow_mask = img.split()[3] if img.mode == "RGBA" else Image.new("L", (width, height), 255)
-    shadow_center = (padding, padding)
-    shadow.paste((0, 0, 0, int(255 * opacity)), (shadow_center[0], shadow_center[1], shadow_center[0] + width, shadow_center[1] + height), shadow_mask)
-    shadow = shadow.filter(ImageFilter.GaussianBlur(radius))
-    rotated_shadow = shadow.rotate(angle, Image.BICUBIC, expand=True)
+    # 阴影只取决于卡片的 alpha 形状和参数，同形状卡片复用同一份模糊+旋转结果
+    rotated_shadow = rotated_alpha_shadow(shadow_mask, padding, opacity, radius, angle)
     shadow_width, shadow_height = rotated_shadow.size
     shadow_x = center_pos[0] - shadow_width // 2 + offset[0]
     shadow_y = center_pos[1] - shadow_height // 2 + offset[1]
@@ -121,10 +84,9 @@ def add_shadow_and_rotate(canvas, img, angle, offset=(10, 10), radius=10, opacit
     canvas.paste(rotated_img, (img_x, img_y), rotated_img)
     return canvas
 
-def image_to_base64(image):
-    buffer = BytesIO()
-    image.save(buffer, format="PNG", optimize=True)
-    return base64.b64encode(buffer.getvalue()).decode('utf-8')
+def image_to_base64(image, config=None):
+    # 按配置的格式/质量和字节预算编码（见 encoding.encode_cover）
+    return encode_cover_base64(image, config)
 
 # ========== 主函数 ==========
 def create_style_single_1(image_path, title, font_path, font_size=(1,1), blur_size=50, color_ratio=0.8, item_count=None, config=None):
@@ -141,7 +103,7 @@ def create_style_single_1(image_path, title, font_path, font_size=(1,1), blur_si
         num_colors = 6
         original_img = Image.open(image_path).convert("RGB")
         
-        candidate_colors = find_dominant_macaron_colors(original_img, num_colors=num_colors)
+        candidate_colors = find_dominant_macaron_colors(original_img, num_colors=num_colors, palette_mode=(config or {}).get('palette_mode', PALETTE_MODE_HISTOGRAM))
         random.shuffle(candidate_colors)
         extracted_colors = candidate_colors[:num_colors]
             
@@ -162,11 +124,9 @@ def create_style_single_1(image_path, title, font_path, font_size=(1,1), blur_si
         # ==========================================================
         card_colors = [extracted_colors[1], extracted_colors[2]]
         
-        bg_img = ImageOps.fit(original_img.copy(), canvas_size, method=Image.LANCZOS).filter(ImageFilter.GaussianBlur(radius=int(blur_size)))
-        bg_img_array = np.array(bg_img, dtype=float)
-        bg_color_array = np.array([[bg_color]], dtype=float)
-        blended_bg = np.clip(bg_img_array * (1 - float(color_ratio)) + bg_color_array * float(color_ratio), 0, 255).astype(np.uint8)
-        blended_bg_img = Image.fromarray(blended_bg)
+        blur_mode = (config or {}).get('blur_mode', BLUR_MODE_FAST)
+        bg_img = blurred_background(original_img, canvas_size, blur_size, blur_mode)
+        blended_bg_img = blend_with_color(bg_img, bg_color, color_ratio, blur_mode)
         
         # ==================== 可微调旋钮 (颗粒) ====================
         # `add_film_grain` 的 intensity 参数 (0.0 - 1.0) 控制颗粒强度。值越大，颗粒越明显。
@@ -184,16 +144,12 @@ def create_style_single_1(image_path, title, font_path, font_size=(1,1), blur_si
         main_card = add_rounded_corners(square_img, radius=card_size//8).convert("RGBA")
         
         aux_card1_bg = square_img.copy().filter(ImageFilter.GaussianBlur(radius=8))
-        aux_card1_array = np.array(aux_card1_bg, dtype=float)
-        card_color1_array = np.array([[card_colors[0]]], dtype=float)
-        blended_card1 = np.clip(aux_card1_array * 0.5 + card_color1_array * 0.5, 0, 255).astype(np.uint8)
-        aux_card1 = add_rounded_corners(Image.fromarray(blended_card1), radius=card_size//8).convert("RGBA")
+        blended_card1 = blend_with_color(aux_card1_bg, card_colors[0], 0.5, blur_mode)
+        aux_card1 = add_rounded_corners(blended_card1, radius=card_size//8).convert("RGBA")
         
         aux_card2_bg = square_img.copy().filter(ImageFilter.GaussianBlur(radius=16))
-        aux_card2_array = np.array(aux_card2_bg, dtype=float)
-        card_color2_array = np.array([[card_colors[1]]], dtype=float)
-        blended_card2 = np.clip(aux_card2_array * 0.4 + card_color2_array * 0.6, 0, 255).astype(np.uint8)
-        aux_card2 = add_rounded_corners(Image.fromarray(blended_card2), radius=card_size//8).convert("RGBA")
+        blended_card2 = blend_with_color(aux_card2_bg, card_colors[1], 0.6, blur_mode)
+        aux_card2 = add_rounded_corners(blended_card2, radius=card_size//8).convert("RGBA")
         
         center_pos = (int(canvas_size[0] - canvas_size[1] * 0.5), int(canvas_size[1] * 0.5))
         rotation_angles = [36, 18, 0]
@@ -214,8 +170,8 @@ def create_style_single_1(image_path, title, font_path, font_size=(1,1), blur_si
         left_area_center_y = canvas_size[1] // 2
         zh_font_size = int(canvas_size[1] * 0.17 * float(zh_font_size_ratio))
         en_font_size = int(canvas_size[1] * 0.07 * float(en_font_size_ratio))
-        zh_font = ImageFont.truetype(zh_font_path, zh_font_size)
-        en_font = ImageFont.truetype(en_font_path, en_font_size)
+        zh_font = get_font(zh_font_path, zh_font_size)
+        en_font = get_font(en_font_path, en_font_size)
         
         text_color = (255, 255, 255, 229)
         text_shadow_color = darken_color(bg_color, 0.8) + (75,)
@@ -250,7 +206,7 @@ def create_style_single_1(image_path, title, font_path, font_size=(1,1), blur_si
                 base_color=base_color_for_badge
             )
 
-        return image_to_base64(combined)
+        return image_to_base64(combined, config)
         
     except Exception as e:
         logger.error(f"创建单图封面(style 1)时出错: {e}", exc_info=True)
@@ -1,15 +1,14 @@
 # services/cover_generator/styles/style_single_2.py
 
 import logging
-import colorsys
 import random
-import base64
-from io import BytesIO
-from collections import Counter
 import numpy as np
-from PIL import Image, ImageDraw, ImageFont, ImageFilter, ImageOps
+from PIL import Image, ImageDraw, ImageFilter
 
 from .badge_drawer import draw_badge
+from ..encoding import encode_cover_base64
+from ..render_primitives import BLUR_MODE_FAST, blend_with_color, blurred_background, cached_primitive, get_font
+from .color_utils import PALETTE_MODE_HISTOGRAM, find_dominant_vibrant_colors as _find_dominant_vibrant_colors
 
 logger = logging.getLogger(__name__)
 
@@ -17,51 +16,9 @@ logger = logging.getLogger(__name__)
 canvas_size = (1920, 1080)
 
 # ========== 辅助函数 ==========
-def is_not_black_white_gray_near(color, threshold=20):
-    r, g, b = color
-    if (r < threshold and g < threshold and b < threshold) or \
-       (r > 255 - threshold and g > 255 - threshold and b > 255 - threshold):
-        return False
-    gray_diff_threshold = 10
-    if abs(r - g) < gray_diff_threshold and abs(g - b) < gray_diff_threshold and abs(r - b) < gray_diff_threshold:
-        return False
-    return True
-
-def rgb_to_hsv(color):
-    r, g, b = [x / 255.0 for x in color]
-    return colorsys.rgb_to_hsv(r, g, b)
-
-def hsv_to_rgb(h, s, v):
-    r, g, b = colorsys.hsv_to_rgb(h, s, v)
-    return (int(r * 255), int(g * 255), int(b * 255))
-
-def adjust_to_macaron(h, s, v, target_saturation_range=(0.2, 0.7), target_value_range=(0.55, 0.85)):
-    adjusted_s = min(max(s, target_saturation_range[0]), target_saturation_range[1])
-    adjusted_v = min(max(v, target_value_range[0]), target_value_range[1])
-    return adjusted_s, adjusted_v
-
-def find_dominant_vibrant_colors(image, num_colors=5):
-    img = image.copy()
-    img.thumbnail((100, 100))
-    img = img.convert('RGB')
-    pixels = list(img.getdata())
-    filtered_pixels = [p for p in pixels if is_not_black_white_gray_near(p)]
-    if not filtered_pixels: return []
-    color_counter = Counter(filtered_pixels)
-    dominant_colors = color_counter.most_common(num_colors * 3)
-    macaron_colors = []
-    seen_hues = set()
-    for color, count in dominant_colors:
-        h, s, v = rgb_to_hsv(color)
-        adjusted_s, adjusted_v = adjust_to_macaron(h, s, v)
-        adjusted_rgb = hsv_to_rgb(h, adjusted_s, adjusted_v)
-        hue_degree = int(h * 360)
-        is_similar_hue = any(abs(hue_degree - seen) < 15 for seen in seen_hues)
-        if not is_similar_hue and adjusted_rgb not in macaron_colors:
-            macaron_colors.append(adjusted_rgb)
-            seen_hues.add(hue_degree)
-            if len(macaron_colors) >= num_colors: break
-    return macaron_colors
+def find_dominant_vibrant_colors(image, num_colors=5, palette_mode=PALETTE_MODE_HISTOGRAM):
+    # 向量化实现见 color_utils，结果与原逐像素实现一致
+    return _find_dominant_vibrant_colors(image, num_colors=num_colors, palette_mode=palette_mode)
 
 def darken_color(color, factor=0.7):
     r, g, b = color
@@ -103,6 +60,7 @@ def align_image_right(img, canvas_size):
     final_img.paste(cropped_img, (paste_x, 0))
     return final_img
 
+@cached_primitive()
 def create_diagonal_mask(size, split_top=0.5, split_bottom=0.33):
     mask = Image.new('L', size, 255)
     draw = ImageDraw.Draw(mask)
@@ -113,6 +71,7 @@ def create_diagonal_mask(size, split_top=0.5, split_bottom=0.33):
     draw.polygon([(0, 0), (top_x, 0), (bottom_x, height), (0, height)], fill=255)
     return mask
 
+@cached_primitive()
 def create_shadow_mask(size, split_top=0.5, split_bottom=0.33, feather_size=40):
     width, height = size
     top_x = int(width * split_top)
@@ -123,10 +82,9 @@ def create_shadow_mask(size, split_top=0.5, split_bottom=0.33, feather_size=40):
     draw.polygon([(top_x - 5, 0), (top_x - 5 + shadow_width, 0), (bottom_x - 5 + shadow_width, height), (bottom_x - 5, height)], fill=255)
     return mask.filter(ImageFilter.GaussianBlur(radius=feather_size//3))
 
-def image_to_base64(image):
-    buffer = BytesIO()
-    image.save(buffer, format="PNG", optimize=True)
-    return base64.b64encode(buffer.getvalue()).decode('utf-8')
+def image_to_base64(image, config=None):
+    # 按配置的格式/质量和字节预算编码（见 encoding.encode_cover）
+    return encode_cover_base64(image, config)
 
 # ========== 主函数 ==========
 def create_style_single_2(image_path, title, font_path, font_size=(1,1), blur_size=50, color_ratio=0.8, item_count=None, config=None):
@@ -146,7 +104,7 @@ def create_style_single_2(image_path, title, font_path, font_size=(1,1), blur_si
         fg_img_original = Image.open(image_path).convert("RGB")
         fg_img = align_image_right(fg_img_original, canvas_size)
         
-        vibrant_colors = find_dominant_vibrant_colors(fg_img)
+        vibrant_colors = find_dominant_vibrant_colors(fg_img, palette_mode=(config or {}).get('palette_mode', PALETTE_MODE_HISTOGRAM))
         soft_colors = [(237, 159, 77), (255, 183, 197), (186, 225, 255), (255, 223, 186), (202, 231, 200), (245, 203, 255)]
         
         if vibrant_colors:
@@ -163,7 +121,8 @@ def create_style_single_2(image_path, title, font_path, font_size=(1,1), blur_si
         # ===========================================================
         
         bg_img_original = Image.open(image_path).convert("RGB")
-        bg_img = ImageOps.fit(bg_img_original, canvas_size, method=Image.LANCZOS).filter(ImageFilter.GaussianBlur(radius=int(blur_size)))
+        blur_mode = (config or {}).get('blur_mode', BLUR_MODE_FAST)
+        bg_img = blurred_background(bg_img_original, canvas_size, blur_size, blur_mode)
 
         # ==================== 可微调旋鈕 (背景颜色) ====================
         # `darken_color` 的第二个参数 (0.0 - 1.0) 控制背景主色调的深浅。值越小，颜色越深。
@@ -171,10 +130,7 @@ def create_style_single_2(image_path, title, font_path, font_size=(1,1), blur_si
         bg_color = darken_color(bg_color, 0.85)
         # ===========================================================
         
-        bg_img_array = np.array(bg_img, dtype=float)
-        bg_color_array = np.array([[bg_color]], dtype=float)
-        blended_bg = np.clip(bg_img_array * (1 - float(color_ratio)) + bg_color_array * float(color_ratio), 0, 255).astype(np.uint8)
-        blended_bg_img = Image.fromarray(blended_bg)
+        blended_bg_img = blend_with_color(bg_img, bg_color, color_ratio, blur_mode)
         
         # ==================== 可微调旋鈕 (颗粒) ====================
         # `add_film_grain` 的 intensity 参数 (0.0 - 1.0) 控制颗粒强度。值越大，颗粒越明显。
@@ -201,8 +157,8 @@ def create_style_single_2(image_path, title, font_path, font_size=(1,1), blur_si
         left_area_center_y = canvas_size[1] // 2
         zh_font_size = int(canvas_size[1] * 0.17 * float(zh_font_size_ratio))
         en_font_size = int(canvas_size[1] * 0.07 * float(en_font_size_ratio))
-        zh_font = ImageFont.truetype(str(zh_font_path), zh_font_size)
-        en_font = ImageFont.truetype(str(en_font_path), en_font_size)
+        zh_font = get_font(zh_font_path, zh_font_size)
+        en_font = get_font(en_font_path, en_font_size)
         
         text_color = (255, 255, 255, 229)
         text_shadow_color = darken_color(bg_color, 0.8) + (75,)
@@ -237,7 +193,7 @@ def create_style_single_2(image_path, title, font_path, font_size=(1,1), blur_si
                 base_color=base_color_for_badge
             )
 
-        return image_to_base64(combined)
+        return image_to_base64(combined, config)
         
     except Exception as e:
         logger.error(f"创建单图封面(style 2)时出错: {e}", exc_info=True)
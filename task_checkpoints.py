@@ -0,0 +1,80 @@
+# task_checkpoints.py
+
+import logging
+from datetime import datetime, timezone, timedelta
+from typing import Dict, Any, Optional
+
+import db_handler
+
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# ✨ 长任务检查点 (Task Checkpoints)
+# ------------------------------------------------------------------------------
+# 全库缓存、全量扫描等长任务在每个批次/若干项目后把 "游标 + 阶段性统计" 写入 task_checkpoints 表：
+# - 任务被停止、超时或重启后再次运行时，从游标之后继续，而不是从头开始；
+# - 每个检查点也是一个让出点：有更高优先级的任务在等待本任务占用的资源或通道时，
+#   抛出 TaskPreempted，任务管理器把本任务放回队列，待高优先级任务完成后从检查点继续；
+# - 任务完整跑完后调用 clear() 删除检查点。
+# 游标的含义由各任务自己决定（通常是已按固定顺序排序的工作列表中最后一个完成的键）。
+# 本模块不在顶层导入 task_manager，core_processor 等底层模块也可以使用。
+# ==============================================================================
+
+DEFAULT_MAX_AGE_HOURS = 72
+
+class TaskPreempted(BaseException):
+    """
+    任务在检查点处让出执行权。
+    继承 BaseException，避免被任务内部 "except Exception" 的兜底逻辑吞掉。
+    """
+
+class TaskCheckpoint:
+    def __init__(self, task_key: str, max_age_hours: float = DEFAULT_MAX_AGE_HOURS):
+        self.task_key = task_key
+        self.cursor: Any = None
+        self.stats: Dict[str, Any] = {}
+        self.started_at = datetime.now(timezone.utc)
+        self.resumed = False
+
+        row = db_handler.get_task_checkpoint(task_key)
+        if not row:
+            return
+        updated_at = row.get('updated_at')
+        if updated_at and updated_at.tzinfo is None:
+            updated_at = updated_at.replace(tzinfo=timezone.utc)
+        if updated_at and datetime.now(timezone.utc) - updated_at > timedelta(hours=max_age_hours):
+            logger.info(f"  -> 任务 '{task_key}' 的检查点已超过 {max_age_hours} 小时，丢弃并从头开始。")
+            db_handler.delete_task_checkpoint(task_key)
+            return
+        self.cursor = row.get('cursor_json')
+        self.stats = row.get('stats_json') or {}
+        self.started_at = row.get('started_at') or self.started_at
+        self.resumed = self.cursor is not None
+        if self.resumed:
+            logger.info(f"  -> 发现任务 '{task_key}' 的检查点 (更新于 {updated_at})，将从上次中断处继续。")
+
+    def save(self, cursor: Any, stats: Optional[Dict[str, Any]] = None) -> bool:
+        """记录游标和阶段性统计。"""
+        self.cursor = cursor
+        if stats is not None:
+            self.stats = dict(stats)
+        return db_handler.save_task_checkpoint(self.task_key, self.cursor, self.stats, self.started_at)
+
+    def boundary(self, cursor: Any, stats: Optional[Dict[str, Any]] = None):
+        """
+        检查点边界：保存游标，然后检查是否需要让位给更高优先级的任务，需要时抛出 TaskPreempted。
+        只应在已完成的工作都已落库的位置调用。
+        """
+        self.save(cursor, stats)
+        # 延迟导入，避免与 task_manager 的循环依赖
+        import task_manager
+        if task_manager.should_yield_current_task():
+            logger.info(f"  -> 有更高优先级的任务在等待，'{self.task_key}' 在检查点处让出，稍后继续。")
+            raise TaskPreempted(self.task_key)
+
+    def clear(self):
+        """任务完整结束，删除检查点。"""
+        self.cursor = None
+        self.stats = {}
+        self.resumed = False
+        db_handler.delete_task_checkpoint(self.task_key)
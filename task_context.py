@@ -0,0 +1,64 @@
+# task_context.py
+
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any
+
+# ==============================================================================
+# ✨ 任务上下文 (Task Context)
+# ------------------------------------------------------------------------------
+# 多个任务可能同时使用同一个处理器实例（如两个媒体通道任务共用 media_processor_instance），
+# 处理器上的停止事件因此不能代表 "某一个任务被停止"。每个任务有自己的停止事件，
+# 由 task_manager 在任务线程（以及任务链的子任务线程）中绑定到上下文变量：
+# - 处理器的 is_stop_requested() / signal_stop() / clear_stop_signal() / get_stop_event()
+#   在任务上下文中只作用于当前任务自己的停止事件，停止一个任务不会中断同处理器上的其它任务；
+# - 在任务之外调用时退回到处理器自身的事件（旧行为）。
+# 当前执行的任务（以及任务链中的子任务Key）同样绑定在上下文变量上，
+# task_manager 据此把进度更新和检查点让位判断归属到正确的任务/子任务。
+# 任务内部的线程池使用 ContextThreadPoolExecutor：提交的函数在提交方上下文的副本中执行，
+# 工作线程因此继承任务的停止事件、当前任务和运行指标 (task_metrics)，不会把调用算到别的任务上。
+# 本模块不导入任何业务模块，core_processor 等底层模块也可以使用。
+# ==============================================================================
+
+_stop_event: contextvars.ContextVar[Optional[threading.Event]] = contextvars.ContextVar('task_stop_event', default=None)
+
+def bind_stop_event(event: Optional[threading.Event]) -> contextvars.Token:
+    """把任务的停止事件绑定到当前上下文，返回用于恢复的 token。"""
+    return _stop_event.set(event)
+
+def reset_stop_event(token: contextvars.Token):
+    _stop_event.reset(token)
+
+def current_stop_event() -> Optional[threading.Event]:
+    """当前任务的停止事件；不在任务中时返回 None。"""
+    return _stop_event.get()
+
+def stop_event_or(fallback: threading.Event) -> threading.Event:
+    """当前任务的停止事件，不在任务中时返回 fallback（处理器自身的事件）。"""
+    event = _stop_event.get()
+    return event if event is not None else fallback
+
+_current_task: contextvars.ContextVar[Optional[tuple]] = contextvars.ContextVar('task_current', default=None)
+
+def bind_task(task: Optional[Dict[str, Any]], subtask: Optional[str] = None) -> contextvars.Token:
+    """把任务（以及任务链中的子任务Key）绑定到当前上下文，返回用于恢复的 token。"""
+    return _current_task.set((task, subtask) if task is not None else None)
+
+def reset_task(token: contextvars.Token):
+    _current_task.reset(token)
+
+def current_task() -> Optional[Dict[str, Any]]:
+    """当前任务（子任务上下文中为所属的任务链）；不在任务中时返回 None。"""
+    bound = _current_task.get()
+    return bound[0] if bound else None
+
+def current_subtask() -> Optional[str]:
+    """当前子任务的Key；不在任务链子任务中时返回 None。"""
+    bound = _current_task.get()
+    return bound[1] if bound else None
+
+class ContextThreadPoolExecutor(ThreadPoolExecutor):
+    """提交的函数在提交方上下文的副本中执行（map 也经由 submit）。"""
+    def submit(self, fn, /, *args, **kwargs):
+        return super().submit(contextvars.copy_context().run, fn, *args, **kwargs)
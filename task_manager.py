@@ -1,180 +1,738 @@
-# task_manager.py (V2 - 精确调度版)
+# task_manager.py (V3 - 多通道并行版)
 import threading
 import logging
-from queue import Queue
-from typing import Optional, Callable, Union, Literal
+import itertools
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Optional, Callable, Union, Literal, Dict, Any, Iterable, List
 
 # 导入类型提示，注意使用字符串避免循环导入
 from core_processor import MediaProcessor
 from watchlist_processor import WatchlistProcessor
 from actor_subscription_processor import ActorSubscriptionProcessor
 import extensions
+import db_handler
+import task_metrics
+import task_context
+import event_hub
+from task_checkpoints import TaskPreempted
 
 logger = logging.getLogger(__name__)
+task_metrics.install_error_handler()
 
 # 定义处理器类型的字面量，提供类型提示和静态检查
 ProcessorType = Literal['media', 'watchlist', 'actor']
 
+# ==============================================================================
+# ✨ 任务通道 (Lanes) 与资源 (Resources)
+# ------------------------------------------------------------------------------
+# - 每个通道有独立的待执行队列和工人线程数；不同通道的任务可以同时运行。
+# - 任务声明它会读写的资源（见下方 RESOURCE_*）：资源有交集的任务串行执行，
+#   互不相干的任务并行执行。持有 RESOURCE_ALL 的任务与所有任务冲突（如数据库导入）。
+# - 未声明资源的任务默认占用其处理器 ("processor:<类型>")，与同处理器的其它未声明任务串行，
+#   行为与旧版的单线程队列一致。
+# - 通道内按提交顺序取任务；队首任务与正在运行的任务冲突时，允许后面不冲突的任务先执行。
+# ==============================================================================
+
+LANE_MEDIA = 'media'             # 单项目 / 交互式的媒体处理 (Webhook、手动处理)
+LANE_WATCHLIST = 'watchlist'     # 智能追剧
+LANE_ACTOR = 'actor'             # 演员订阅
+LANE_MAINTENANCE = 'maintenance' # 全库扫描、同步、封面、清理等批量维护任务
+
+# 每个通道的工人线程数
+LANE_WORKERS: Dict[str, int] = {
+    LANE_MEDIA: 2,
+    LANE_WATCHLIST: 1,
+    LANE_ACTOR: 1,
+    LANE_MAINTENANCE: 1,
+}
+DEFAULT_LANE_BY_PROCESSOR = {'media': LANE_MEDIA, 'watchlist': LANE_WATCHLIST, 'actor': LANE_ACTOR}
+
+RESOURCE_ALL = '*'
+RESOURCE_METADATA_CACHE = 'media_metadata'
+RESOURCE_LIBRARY_SCAN = 'library_scan'
+RESOURCE_ACTORS = 'actors'
+RESOURCE_WATCHLIST = 'watchlist'
+RESOURCE_ACTOR_SUBSCRIPTIONS = 'actor_subscriptions'
+RESOURCE_COLLECTIONS = 'collections'
+RESOURCE_RESUBSCRIBE = 'resubscribe'
+RESOURCE_SUBSCRIPTIONS = 'subscriptions'
+RESOURCE_IMAGE_BACKUP = 'image_backup'
+RESOURCE_COVERS = 'covers'
+RESOURCE_CLEANUP = 'cleanup'
+RESOURCE_TASK_CHAIN = 'task_chain' # 任务链本身只占用它；子任务的资源在子任务执行期间才占用 (见 acquire_subtask_resources)
+
+# 任务优先级：通道内优先取优先级高的任务，同优先级按提交顺序
+PRIORITY_LOW = -10    # 可被抢占的全库长任务，在检查点处让位给更高优先级的任务
+PRIORITY_NORMAL = 0
+PRIORITY_WEBHOOK = 10 # Webhook 产生的单项目任务，优先于同通道的手动/批量任务
+
+def item_resource(item_id: Any) -> str:
+    """单个媒体项目的资源名，同一项目的任务串行执行。"""
+    return f"item:{item_id}"
+
+def task_profile(lane: Optional[str] = None, resources: Union[Iterable[str], Callable[[Dict[str, Any]], Iterable[str]]] = (),
+                 priority: Optional[int] = None, preemptible: bool = False):
+    """
+    声明任务函数所属的通道和占用的资源。
+    resources 可以是资源名列表，也可以是接收任务 kwargs、返回资源名列表的函数（用于按参数决定资源）。
+    priority 为提交时的默认优先级；preemptible 表示任务会在检查点 (task_checkpoints) 处让位给更高优先级的任务。
+    """
+    def decorator(func):
+        func._task_lane = lane
+        func._task_resources = resources
+        func._task_priority = priority
+        func._task_preemptible = preemptible
+        return func
+    return decorator
+
+def resolve_task_profile(task_function: Callable, processor_type: str, kwargs: Optional[Dict[str, Any]] = None) -> tuple:
+    """返回任务的 (通道, 资源集合)。"""
+    lane = getattr(task_function, '_task_lane', None) or DEFAULT_LANE_BY_PROCESSOR.get(processor_type, LANE_MEDIA)
+    declared = getattr(task_function, '_task_resources', None)
+    if callable(declared):
+        declared = declared(kwargs or {})
+    resources = frozenset(declared or ()) or frozenset({f"processor:{processor_type}"})
+    return lane, resources
+
+def resources_conflict(a: frozenset, b: frozenset) -> bool:
+    """两组资源是否冲突（有交集，或任一方持有 RESOURCE_ALL）。"""
+    return RESOURCE_ALL in a or RESOURCE_ALL in b or not a.isdisjoint(b)
+
 # --- 任务状态和控制 ---
+# background_task_status 保持旧版结构，反映最早开始的那个正在运行的任务（前端状态栏使用）；
+# 各通道的详细状态见 get_task_status()['lanes']。
 background_task_status = {
     "is_running": False,
     "current_action": "无",
     "progress": 0,
     "message": "等待任务",
+    "counters": None,
+    "task_id": None,
     "last_action": None
 }
-task_lock = threading.Lock()
+_scheduler_condition = threading.Condition()
+_pending: Dict[str, deque] = {lane: deque() for lane in LANE_WORKERS}
+_running: Dict[int, Dict[str, Any]] = {}
+_task_ids = itertools.count(1)
 
-# --- 任务队列和工人线程 ---
-task_queue = Queue()
-task_worker_thread: Optional[threading.Thread] = None
+# --- 工人线程 ---
+_worker_threads: List[threading.Thread] = []
 task_worker_lock = threading.Lock()
+_shutting_down = False
 
-def update_status_from_thread(progress: int, message: str):
-    """由处理器或任务函数调用，用于更新任务状态。"""
-    if progress >= 0:
-        background_task_status["progress"] = progress
-    background_task_status["message"] = message
+def _idle_lane_status(lane: str) -> Dict[str, Any]:
+    return {"lane": lane, "workers": LANE_WORKERS[lane], "queued": len(_pending[lane]), "running": []}
 
-def get_task_status() -> dict:
-    """获取当前后台任务的状态。"""
-    return background_task_status.copy()
+# --- 状态推送 ---
+# 任务线程无锁改写自己的任务字典（单个键的赋值在 GIL 下是原子的），写入后递增 _status_version。
+# background_task_status 是所有任务共享的汇总状态，只在持有 _scheduler_condition 时由
+# _refresh_primary_status 重建：任务开始/结束时，以及 get_task_status 构建快照时。
+# 状态发布线程按 STATUS_PUSH_INTERVAL 检查版本号，有变化时构建一次状态发布到 event_hub
+# （中心计算增量推送给所有前端），两次发布之间的多次写入自然合并。
+STATUS_PUSH_INTERVAL = 0.5
+_status_version = 0
+_status_publisher: Optional[threading.Thread] = None
+_status_publisher_lock = threading.Lock()
 
-def is_task_running() -> bool:
-    """检查是否有后台任务正在运行。"""
-    return task_lock.locked()
-
-def _execute_task_with_lock(task_function: Callable, task_name: str, processor: Union[MediaProcessor, WatchlistProcessor, ActorSubscriptionProcessor], *args, **kwargs):
-    """【工人专用】通用后台任务执行器。"""
-    global background_task_status
-    
-    with task_lock:
-        if not processor:
-            logger.error(f"任务 '{task_name}' 无法启动：对应的处理器未初始化。")
-            return
+def notify_status_changed(*_args):
+    """标记任务状态（或前端日志）已变化，下一次推送时发送新的快照。"""
+    global _status_version
+    # 并发递增偶尔丢失一次也无妨：只要版本号与订阅者手里的不同，就会推送
+    _status_version += 1
+
+def get_status_version() -> int:
+    return _status_version
+
+def wait_for_status_change(since_version: int, timeout: float) -> int:
+    """阻塞直到状态版本号不同于 since_version 或超时，返回当前版本号（超时返回原值表示无变化）。"""
+    deadline = time.monotonic() + timeout
+    while _status_version == since_version:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        time.sleep(min(STATUS_PUSH_INTERVAL, remaining))
+    return _status_version
 
-        processor.clear_stop_signal()
+def _status_publisher_loop():
+    version = None
+    while True:
+        try:
+            current = get_status_version()
+            if current != version:
+                version = current
+                event_hub.hub.publish_status(get_task_status())
+            wait_for_status_change(version, 60)
+        except Exception as e:
+            logger.error(f"任务状态发布线程发生错误: {e}", exc_info=True)
+            time.sleep(STATUS_PUSH_INTERVAL)
 
+def ensure_status_publisher():
+    """启动状态发布线程（幂等），由前端事件流在有客户端连接时调用。"""
+    global _status_publisher
+    with _status_publisher_lock:
+        if _status_publisher and _status_publisher.is_alive():
+            return
+        _status_publisher = threading.Thread(target=_status_publisher_loop, name="TaskStatusPublisher", daemon=True)
+        _status_publisher.start()
+
+def _refresh_primary_status():
+    """【需持有 _scheduler_condition】用最早开始的运行中任务刷新 background_task_status。"""
+    running = list(_running.values())
+    if running:
+        primary = min(running, key=lambda task: task["id"])
         background_task_status.update({
-            "is_running": True, "current_action": task_name, "last_action": task_name,
-            "progress": 0, "message": f"{task_name} 初始化..."
+            "is_running": True,
+            "current_action": primary["name"],
+            "progress": primary["progress"],
+            "message": primary["message"],
+            "counters": primary.get("counters"),
+            "task_id": primary["id"],
         })
-        logger.info(f"--- 后台任务 '{task_name}' 开始执行 ---")
+    else:
+        background_task_status.update({
+            "is_running": False, "current_action": "无", "progress": 0, "message": "等待任务", "counters": None,
+            "task_id": None
+        })
+    notify_status_changed()
 
-        task_completed_normally = False
-        try:
-            if processor.is_stop_requested():
-                raise InterruptedError("任务被取消")
-
-            task_function(processor, *args, **kwargs)
-            
-            if not processor.is_stop_requested():
-                task_completed_normally = True
-        finally:
-            final_message = "未知结束状态"
-            current_progress = background_task_status["progress"]
-
-            if processor.is_stop_requested():
-                final_message = "任务已成功中断。"
-            elif task_completed_normally:
-                final_message = "处理完成。"
-                current_progress = 100
-            
-            update_status_from_thread(current_progress, final_message)
-            logger.info(f"--- 后台任务 '{task_name}' 结束，最终状态: {final_message} ---")
-
-            background_task_status.update({
-                "is_running": False, "current_action": "无", "progress": 0, "message": "等待任务"
+def update_status_from_thread(progress: int, message: str, counters: Optional[Dict[str, Any]] = None):
+    """
+    由处理器或任务函数调用，用于更新任务状态：更新绑定在当前上下文中的任务（见 task_context），
+    任务链的子任务更新对应的子任务；任务内部的线程池经 ContextThreadPoolExecutor 继承该绑定。
+    counters 为 task_progress.ProgressReporter 提供的结构化计数 {done, total, rate, eta_seconds}。
+    只无锁写入任务自己的状态字段并递增版本号，不持有 _scheduler_condition；
+    background_task_status 在构建状态快照时按运行中的任务重建，不会留下过期的 is_running: True。
+    进度和消息都没有变化时直接返回。主循环请优先使用 ProgressReporter 节流上报。
+    """
+    task = task_context.current_task()
+    subtask_key = task_context.current_subtask()
+    if task is None:
+        if progress >= 0:
+            background_task_status["progress"] = progress
+        background_task_status["message"] = message
+        notify_status_changed()
+        return
+    subtask = (task.get("subtasks") or {}).get(subtask_key) if subtask_key else None
+    target = subtask if subtask is not None else task
+    if (progress < 0 or target.get("progress") == progress) and target.get("message") == message and counters is None:
+        return
+    if progress >= 0:
+        target["progress"] = progress
+    target["message"] = message
+    if counters is not None:
+        target["counters"] = counters
+    if subtask is not None:
+        _aggregate_subtasks(task)
+    notify_status_changed()
+
+# --- 子任务 (任务链并行执行) ---
+# 任务链在自己的线程池中并行执行子任务。子任务线程通过 subtask_context 绑定到任务链，
+# 子任务内部的 update_status_from_thread 写入各自的子任务状态，任务链的总进度和消息由子任务汇总得出。
+SUBTASK_FINISHED_STATES = ('done', 'failed', 'stopped', 'skipped')
+
+def current_task() -> Optional[Dict[str, Any]]:
+    """返回调用方正在执行的任务（子任务线程返回所属的任务链）。"""
+    return task_context.current_task()
+
+def _aggregate_subtasks(task: Dict[str, Any]):
+    """根据子任务状态汇总任务的进度和消息（只读写该任务自己的字典，不要求持有锁）。"""
+    subtasks = list(task["subtasks"].values())
+    if not subtasks:
+        return
+    total = sum(100 if sub["state"] in SUBTASK_FINISHED_STATES else sub["progress"] for sub in subtasks)
+    task["progress"] = int(total / len(subtasks))
+    running = [f"{sub['description']}: {sub['message']}" for sub in subtasks if sub["state"] == 'running']
+    if running:
+        task["message"] = "；".join(running)
+
+def register_subtasks(task: Dict[str, Any], subtasks: List[tuple]):
+    """登记任务链的全部子任务 [(key, 描述), ...]，初始状态为 pending。"""
+    with _scheduler_condition:
+        task["subtasks"] = {
+            key: {"key": key, "description": description, "state": 'pending', "progress": 0, "message": ""}
+            for key, description in subtasks
+        }
+        task["base_resources"] = task["resources"]
+        task["subtask_profiles"] = {}
+
+# --- 子任务资源 ---
+# 任务链本身只占用 RESOURCE_TASK_CHAIN。子任务开始前通过 acquire_subtask_resources 取得它自己声明的资源，
+# 结束（或在检查点让位）后释放；持有的资源合并到任务链的 resources 中参与调度的冲突判断，
+# 因此 Webhook 等任务只需等待与它冲突的那个子任务，而不是整条任务链。
+
+def _refresh_task_resources(task: Dict[str, Any]):
+    """【需持有 _scheduler_condition】任务链的资源 = 自身资源 + 各子任务当前持有的资源。"""
+    task["resources"] = task["base_resources"].union(*(profile["resources"] for profile in task["subtask_profiles"].values()))
+
+def _subtask_resources_blocked(task: Dict[str, Any], profile: Dict[str, Any]) -> bool:
+    """【需持有 _scheduler_condition】子任务的资源与其它运行中任务冲突，或有与之冲突、优先级更高的排队任务。"""
+    resources = profile["resources"]
+    if any(resources_conflict(resources, running["resources"]) for running in _running.values() if running is not task):
+        return True
+    return any(waiting["priority"] > profile["priority"] and resources_conflict(resources, waiting["resources"])
+               for queue in _pending.values() for waiting in queue)
+
+def acquire_subtask_resources(task: Dict[str, Any], key: str, task_function: Callable, resources: Iterable[str]) -> bool:
+    """
+    阻塞直到子任务声明的资源可以占用，并登记到任务链上。优先级更高的排队任务（如 Webhook）先取得资源。
+    子任务的优先级和是否可抢占取自其任务函数的 @task_profile 声明。任务链被停止时返回 False。
+    """
+    priority = getattr(task_function, '_task_priority', None)
+    profile = {
+        "resources": frozenset(resources),
+        "priority": PRIORITY_NORMAL if priority is None else priority,
+        "preemptible": getattr(task_function, '_task_preemptible', False),
+    }
+    with _scheduler_condition:
+        while _subtask_resources_blocked(task, profile):
+            if task["stop_event"].is_set() or _shutting_down:
+                return False
+            # 停止任务不会唤醒条件变量，定期醒来检查停止事件
+            _scheduler_condition.wait(timeout=1)
+        if task["stop_event"].is_set():
+            return False
+        task["subtask_profiles"][key] = profile
+        _refresh_task_resources(task)
+    notify_status_changed()
+    return True
+
+def release_subtask_resources(task: Dict[str, Any], key: str):
+    """释放子任务持有的资源，唤醒等待这些资源的任务。"""
+    with _scheduler_condition:
+        if task["subtask_profiles"].pop(key, None) is None:
+            return
+        _refresh_task_resources(task)
+        _scheduler_condition.notify_all()
+    notify_status_changed()
+
+def set_subtask_state(task: Dict[str, Any], key: str, state: str, message: Optional[str] = None):
+    """更新子任务状态：pending / running / done / failed / stopped / skipped。"""
+    with _scheduler_condition:
+        subtask = (task.get("subtasks") or {}).get(key)
+        if subtask is None:
+            return
+        subtask["state"] = state
+        if message is not None:
+            subtask["message"] = message
+        if state == 'running':
+            subtask["started_at"] = time.time()
+        elif state in SUBTASK_FINISHED_STATES:
+            subtask["finished_at"] = time.time()
+        _aggregate_subtasks(task)
+        _refresh_primary_status()
+
+@contextmanager
+def subtask_context(task: Dict[str, Any], key: str, task_key: Optional[str] = None):
+    """
+    在子任务线程中使用：把线程绑定到父任务（包括父任务的停止事件）并把子任务标记为 running，正常退出时标记为 done，
+    在检查点让位 (TaskPreempted) 时标记回 pending 并继续抛出，由任务链释放资源后重新执行。
+    子任务有自己的运行指标（同时累加到父任务），结束后以 parent_task=任务链名 记录到 task_runs。
+    """
+    parent_metrics = task.get("metrics")
+    metrics = task_metrics.TaskRunMetrics(parent=parent_metrics)
+    started_at = datetime.now(timezone.utc)
+    task_token = task_context.bind_task(task, key)
+    task_metrics.bind(metrics)
+    # 子任务线程共用父任务的停止事件：停止任务链（或运行时长超限）时所有子任务一起停止
+    stop_token = task_context.bind_stop_event(task.get("stop_event"))
+    set_subtask_state(task, key, 'running')
+    preempted = False
+    try:
+        yield
+        if ((task.get("subtasks") or {}).get(key) or {}).get("state") == 'running':
+            set_subtask_state(task, key, 'done')
+    except TaskPreempted:
+        preempted = True
+        set_subtask_state(task, key, 'pending', "已在检查点让位给更高优先级的任务，稍后继续")
+        raise
+    finally:
+        task_context.reset_task(task_token)
+        task_metrics.bind(None)
+        task_context.reset_stop_event(stop_token)
+        subtask = (task.get("subtasks") or {}).get(key) or {}
+        status, stop_reason = {
+            'done': (task_metrics.STATUS_COMPLETED, None),
+            'failed': (task_metrics.STATUS_FAILED, task_metrics.STOP_REASON_EXCEPTION),
+        }.get(subtask.get("state"), (task_metrics.STATUS_STOPPED, None))
+        if preempted:
+            status, stop_reason = task_metrics.STATUS_PREEMPTED, task_metrics.STOP_REASON_PREEMPTED
+        elif status == task_metrics.STATUS_STOPPED:
+            stop_reason = metrics.stop_reason or (parent_metrics.stop_reason if parent_metrics else None) or task_metrics.STOP_REASON_USER
+        _record_task_run(subtask.get("description") or key, task_key or key, task["lane"], task["name"],
+                         started_at, metrics, status, stop_reason)
+
+def set_task_stop_reason(task: Dict[str, Any], reason: str):
+    """为任务记录停止原因（如任务链的运行时长限制），写入 task_runs。"""
+    metrics = task.get("metrics")
+    if metrics:
+        metrics.stop_reason = reason
+
+def _record_task_run(task_name: str, task_key: Optional[str], lane: Optional[str], parent_task: Optional[str],
+                     started_at: datetime, metrics: task_metrics.TaskRunMetrics, status: str, stop_reason: Optional[str]):
+    finished_at = datetime.now(timezone.utc)
+    run = {
+        "task_name": task_name,
+        "task_key": task_key,
+        "parent_task": parent_task,
+        "lane": lane,
+        "started_at": started_at,
+        "finished_at": finished_at,
+        "duration_seconds": round((finished_at - started_at).total_seconds(), 3),
+        "status": status,
+        "stop_reason": stop_reason,
+    }
+    run.update(metrics.to_record())
+    db_handler.record_task_run(run)
+
+def get_task_status() -> dict:
+    """获取后台任务的状态：旧版的总状态字段 + 按通道的详细状态。"""
+    with _scheduler_condition:
+        if _running:
+            # 任务无锁更新自己的进度，汇总状态在这里按最早开始的运行中任务重建
+            _refresh_primary_status()
+        status = background_task_status.copy()
+        lanes = {lane: _idle_lane_status(lane) for lane in LANE_WORKERS}
+        for task in sorted(_running.values(), key=lambda t: t["id"]):
+            lanes[task["lane"]]["running"].append({
+                "id": task["id"],
+                "name": task["name"],
+                "progress": task["progress"],
+                "message": task["message"],
+                "counters": task.get("counters"),
+                "resources": sorted(task["resources"]),
+                "started_at": task["started_at"],
+                "subtasks": [dict(subtask) for subtask in (task.get("subtasks") or {}).values()],
             })
-            processor.clear_stop_signal()
-            logger.trace(f"后台任务 '{task_name}' 状态已重置。")
+        status["lanes"] = lanes
+        status["running_count"] = len(_running)
+        status["queued_count"] = sum(len(queue) for queue in _pending.values())
+    return status
+
+def is_task_running() -> bool:
+    """检查是否有后台任务正在运行（任一通道）。"""
+    with _scheduler_condition:
+        return bool(_running)
+
+def is_resource_in_use(resource: str) -> bool:
+    """检查是否有运行中的任务（包括任务链正在执行的子任务）占用指定资源。"""
+    with _scheduler_condition:
+        return any(resources_conflict(frozenset({resource}), task["resources"]) for task in _running.values())
+
+def is_lane_busy(lane: str) -> bool:
+    """检查指定通道是否有任务正在运行或排队。"""
+    with _scheduler_condition:
+        return bool(_pending.get(lane)) or any(task["lane"] == lane for task in _running.values())
+
+def is_task_active(dedupe_key: str) -> bool:
+    """检查去重键 (默认为任务名) 相同的任务是否正在排队或运行。"""
+    with _scheduler_condition:
+        return any(task["dedupe_key"] == dedupe_key for task in _running.values()) or \
+               any(task["dedupe_key"] == dedupe_key for queue in _pending.values() for task in queue)
+
+def count_active_tasks(min_priority: int) -> int:
+    """统计优先级不低于 min_priority 的排队和运行中任务数（如积压的 Webhook 任务）。"""
+    with _scheduler_condition:
+        return sum(1 for task in _running.values() if task["priority"] >= min_priority) + \
+               sum(1 for queue in _pending.values() for task in queue if task["priority"] >= min_priority)
+
+def _blocked_waiting_ids(resources: frozenset, priority: int, blockers: List[frozenset], full_lane: Optional[str] = None) -> set:
+    """
+    【需持有 _scheduler_condition】优先级高于 priority、正被 resources 挡住（资源冲突，或所在通道 full_lane 的工人已占满），
+    且没有被 blockers 中任何资源、也没有被其它已占满的通道挡住的排队任务 id。
+    """
+    waiting_ids = set()
+    for queue in _pending.values():
+        for waiting in queue:
+            if waiting["priority"] <= priority:
+                continue
+            if not (resources_conflict(waiting["resources"], resources) or waiting["lane"] == full_lane):
+                continue
+            if waiting["lane"] != full_lane and \
+                    sum(1 for running in _running.values() if running["lane"] == waiting["lane"]) >= LANE_WORKERS[waiting["lane"]]:
+                continue
+            if any(resources_conflict(waiting["resources"], blocker) for blocker in blockers):
+                continue
+            waiting_ids.add(waiting["id"])
+    return waiting_ids
+
+def should_yield_current_task() -> bool:
+    """
+    【检查点专用】当前任务是否应该让出：当前任务可被抢占，且有优先级更高的排队任务正被它挡住
+    （资源冲突，或同通道的工人都已占满），而该排队任务没有被其它运行中任务挡住。
+    任务链的子任务按子任务自己的声明（是否可抢占、优先级、持有的资源）判断，让出时只释放该子任务的资源。
+    """
+    task = task_context.current_task()
+    if not task:
+        return False
+    subtask_key = task_context.current_subtask()
+    with _scheduler_condition:
+        others = [running["resources"] for running in _running.values() if running is not task]
+        if subtask_key:
+            profiles = task.get("subtask_profiles") or {}
+            profile = profiles.get(subtask_key)
+            if not profile or not profile["preemptible"]:
+                return False
+            # 同一任务链中其它子任务持有的资源不会因为本子任务让出而释放
+            others += [other["resources"] for key, other in profiles.items() if key != subtask_key]
+            return bool(_blocked_waiting_ids(profile["resources"], profile["priority"], others))
+        if not task.get("preemptible"):
+            return False
+        lane_full = sum(1 for running in _running.values() if running["lane"] == task["lane"]) >= LANE_WORKERS[task["lane"]]
+        waiting_ids = _blocked_waiting_ids(task["resources"], task["priority"], others, task["lane"] if lane_full else None)
+        if waiting_ids:
+            # 重新排队后，在这些任务开始之前不再被取出，避免抢先把资源拿回来
+            task["yield_to"] = waiting_ids
+            return True
+    return False
+
+def _get_processor(processor_type: str):
+    processor_map = {
+        'media': extensions.media_processor_instance,
+        'watchlist': extensions.watchlist_processor_instance,
+        'actor': extensions.actor_subscription_processor_instance
+    }
+    return processor_map.get(processor_type)
 
-def task_worker_function():
+def _execute_task(task: Dict[str, Any], processor: Union[MediaProcessor, WatchlistProcessor, ActorSubscriptionProcessor]):
+    """【工人专用】通用后台任务执行器。调用前任务已登记为运行中。"""
+    task_name = task["name"]
+
+    with _scheduler_condition:
+        background_task_status["last_action"] = task_name
+    # 任务有自己的停止事件，处理器的停止检查在本线程中只看这个事件（见 task_context）
+    stop_token = task_context.bind_stop_event(task["stop_event"])
+    logger.info(f"--- 后台任务 '{task_name}' 开始执行 (通道: {task['lane']}) ---")
+
+    task_token = task_context.bind_task(task)
+    task_completed_normally = False
+    task_failed = False
+    task["preempted"] = False
+    metrics = task_metrics.TaskRunMetrics()
+    task["metrics"] = metrics
+    task_metrics.activate(metrics)
+    started_at = datetime.now(timezone.utc)
+    try:
+        if processor.is_stop_requested():
+            raise InterruptedError("任务被取消")
+
+        task["function"](processor, *task["args"], **task["kwargs"])
+
+        if not processor.is_stop_requested():
+            task_completed_normally = True
+    except InterruptedError:
+        pass
+    except TaskPreempted:
+        task["preempted"] = True
+    except Exception as e:
+        task_failed = True
+        logger.error(f"后台任务 '{task_name}' 执行时发生未知错误: {e}", exc_info=True)
+    finally:
+        final_message = "未知结束状态"
+        stopped = processor.is_stop_requested()
+        if stopped:
+            final_message = "任务已成功中断。"
+        elif task["preempted"]:
+            final_message = "已在检查点让位给更高优先级的任务，稍后继续。"
+            update_status_from_thread(-1, final_message)
+        elif task_completed_normally:
+            final_message = "处理完成。"
+            update_status_from_thread(100, final_message)
+        logger.info(f"--- 后台任务 '{task_name}' 结束，最终状态: {final_message} ---")
+        task_context.reset_task(task_token)
+        task_metrics.deactivate(metrics)
+
+        if task["preempted"]:
+            status, stop_reason = task_metrics.STATUS_PREEMPTED, task_metrics.STOP_REASON_PREEMPTED
+        elif task_failed:
+            status, stop_reason = task_metrics.STATUS_FAILED, task_metrics.STOP_REASON_EXCEPTION
+        elif stopped or metrics.stop_reason or not task_completed_normally:
+            status, stop_reason = task_metrics.STATUS_STOPPED, metrics.stop_reason or task_metrics.STOP_REASON_USER
+        else:
+            status, stop_reason = task_metrics.STATUS_COMPLETED, None
+        _record_task_run(task_name, getattr(task["function"], '__name__', None), task["lane"], None,
+                         started_at, metrics, status, stop_reason)
+
+        task_context.reset_stop_event(stop_token)
+        logger.trace(f"后台任务 '{task_name}' 状态已重置。")
+
+def _take_runnable_task(lane: str) -> Optional[Dict[str, Any]]:
+    """【需持有 _scheduler_condition】取出通道内第一个与运行中任务不冲突的任务，并登记为运行中。"""
+    queue = _pending[lane]
+    waiting_ids = {waiting["id"] for pending in _pending.values() for waiting in pending}
+    for task in sorted(queue, key=lambda t: (-t["priority"], t["id"])):
+        if task.get("yield_to") and not task["yield_to"].isdisjoint(waiting_ids):
+            continue
+        if any(resources_conflict(task["resources"], running["resources"]) for running in _running.values()):
+            continue
+        queue.remove(task)
+        task.update({"started_at": time.time(), "progress": 0, "message": f"{task['name']} 初始化...", "counters": None})
+        _running[task["id"]] = task
+        _refresh_primary_status()
+        return task
+    return None
+
+def task_worker_function(lane: str):
     """
-    【V2 - 精确调度版】
-    通用工人线程，根据提交任务时指定的 processor_type 来精确选择处理器。
+    【V3 - 通道工人】
+    从所属通道取出不与运行中任务冲突的任务，根据 processor_type 选择处理器执行。
     """
-    logger.info("通用任务线程已启动，等待任务...")
+    logger.debug(f"任务通道 '{lane}' 的工人线程已启动，等待任务...")
     while True:
         try:
-            task_info = task_queue.get()
-            if task_info is None:
-                logger.info("工人线程收到停止信号，即将退出。")
-                break
-
-            task_function, task_name, processor_type, args, kwargs = task_info
-            
-            # ★★★ 核心修复：使用精确的、基于类型的调度逻辑 ★★★
-            processor_map = {
-                'media': extensions.media_processor_instance,
-                'watchlist': extensions.watchlist_processor_instance,
-                'actor': extensions.actor_subscription_processor_instance
-            }
-            
-            processor_to_use = processor_map.get(processor_type)
-            logger.trace(f"任务 '{task_name}' 请求使用 '{processor_type}' 处理器。")
-
-            if not processor_to_use:
-                logger.error(f"任务 '{task_name}' 无法执行：类型为 '{processor_type}' 的处理器未初始化或不存在。")
-                task_queue.task_done()
-                continue
+            with _scheduler_condition:
+                task = None
+                while not _shutting_down:
+                    task = _take_runnable_task(lane)
+                    if task:
+                        break
+                    _scheduler_condition.wait()
+                if _shutting_down:
+                    logger.debug(f"任务通道 '{lane}' 的工人线程收到停止信号，即将退出。")
+                    break
 
-            _execute_task_with_lock(task_function, task_name, processor_to_use, *args, **kwargs)
-            task_queue.task_done()
+            processor_to_use = _get_processor(task["processor_type"])
+            logger.trace(f"任务 '{task['name']}' 请求使用 '{task['processor_type']}' 处理器。")
+            try:
+                if not processor_to_use:
+                    logger.error(f"任务 '{task['name']}' 无法执行：类型为 '{task['processor_type']}' 的处理器未初始化或不存在。")
+                else:
+                    _execute_task(task, processor_to_use)
+            finally:
+                with _scheduler_condition:
+                    _running.pop(task["id"], None)
+                    if task.get("preempted") and not _shutting_down:
+                        # 让出的任务保留原 id 放回队列，让位的任务开始后按原顺序继续
+                        _pending[task["lane"]].append(task)
+                        logger.info(f"任务 '{task['name']}' 已重新排队，将从检查点继续。")
+                    _refresh_primary_status()
+                    # 资源已释放，唤醒所有通道重新检查排队任务
+                    _scheduler_condition.notify_all()
         except Exception as e:
-            logger.error(f"通用工人线程发生未知错误: {e}", exc_info=True)
+            logger.error(f"任务通道 '{lane}' 的工人线程发生未知错误: {e}", exc_info=True)
 
 def start_task_worker_if_not_running():
-    """安全地启动通用工人线程。"""
-    global task_worker_thread
+    """安全地启动各通道的工人线程。"""
+    global _shutting_down
     with task_worker_lock:
-        if task_worker_thread is None or not task_worker_thread.is_alive():
-            logger.trace("通用任务线程未运行，正在启动...")
-            task_worker_thread = threading.Thread(target=task_worker_function, daemon=True)
-            task_worker_thread.start()
-        else:
-            logger.debug("通用任务线程已在运行。")
+        _shutting_down = False
+        alive = [thread for thread in _worker_threads if thread.is_alive()]
+        _worker_threads[:] = alive
+        started = 0
+        for lane, worker_count in LANE_WORKERS.items():
+            lane_alive = sum(1 for thread in alive if thread.name.startswith(f"TaskWorker-{lane}-"))
+            for index in range(lane_alive, worker_count):
+                thread = threading.Thread(target=task_worker_function, args=(lane,), name=f"TaskWorker-{lane}-{index}", daemon=True)
+                thread.start()
+                _worker_threads.append(thread)
+                started += 1
+        if started:
+            logger.trace(f"已启动 {started} 个任务通道工人线程。")
 
-def submit_task(task_function: Callable, task_name: str, processor_type: ProcessorType = 'media', *args, **kwargs) -> bool:
+def submit_task(task_function: Callable, task_name: str, processor_type: ProcessorType = 'media', *args,
+                lane: Optional[str] = None, resources: Optional[Iterable[str]] = None,
+                priority: Optional[int] = None, dedupe_key: Optional[str] = None, **kwargs) -> bool:
     """
-    【V2 - 公共接口】将一个任务提交到通用队列中。
-    新增 processor_type 参数，用于精确指定任务所需的处理器。
+    【V3 - 公共接口】将一个任务提交到其所属通道的队列中。
+    - 通道和资源默认取自任务函数上的 @task_profile 声明，也可通过 lane / resources 参数覆盖；
+    - 与运行中任务冲突的任务会排队等待，而不是被拒绝；
+    - 通道内按 priority 从高到低取任务，priority 默认取自 @task_profile，未声明时为 PRIORITY_NORMAL；
+    - dedupe_key (默认为任务名) 相同的任务已在排队或运行时，不重复提交。
     """
     from logger_setup import frontend_log_queue # 延迟导入以避免循环
 
-    with task_lock:
-        if background_task_status["is_running"]:
-            logger.warning(f"任务 '{task_name}' 提交失败：已有任务正在运行。")
+    task_lane, task_resources = resolve_task_profile(task_function, processor_type, kwargs)
+    if lane:
+        task_lane = lane
+    if resources is not None:
+        task_resources = frozenset(resources)
+    if task_lane not in LANE_WORKERS:
+        logger.error(f"任务 '{task_name}' 提交失败：未知的任务通道 '{task_lane}'。")
+        return False
+    if priority is None:
+        priority = getattr(task_function, '_task_priority', None)
+        if priority is None:
+            priority = PRIORITY_NORMAL
+
+    with _scheduler_condition:
+        dedupe_key = dedupe_key or task_name
+        if any(task["dedupe_key"] == dedupe_key for task in _running.values()) or \
+           any(task["dedupe_key"] == dedupe_key for queue in _pending.values() for task in queue):
+            logger.warning(f"任务 '{task_name}' 提交失败：相同任务已在排队或运行中。")
             return False
 
-        frontend_log_queue.clear()
-        logger.info(f"任务 '{task_name}' 已提交到队列，并已清空前端日志。")
-        
-        # ★★★ 核心修复：将 processor_type 加入任务信息元组 ★★★
-        task_info = (task_function, task_name, processor_type, args, kwargs)
-        task_queue.put(task_info)
-        start_task_worker_if_not_running()
-        return True
+        if not _running and not any(_pending.values()):
+            frontend_log_queue.clear()
+            event_hub.hub.clear_logs()
+            logger.info(f"任务 '{task_name}' 已提交到通道 '{task_lane}'，并已清空前端日志。")
+        else:
+            logger.info(f"任务 '{task_name}' 已提交到通道 '{task_lane}'。")
+
+        _pending[task_lane].append({
+            "id": next(_task_ids),
+            "function": task_function,
+            "name": task_name,
+            "processor_type": processor_type,
+            "lane": task_lane,
+            "resources": task_resources,
+            "priority": priority,
+            "preemptible": getattr(task_function, '_task_preemptible', False),
+            "dedupe_key": dedupe_key,
+            "stop_event": threading.Event(),
+            "args": args,
+            "kwargs": kwargs,
+        })
+        _scheduler_condition.notify_all()
+    notify_status_changed()
+    start_task_worker_if_not_running()
+    return True
 
 def stop_task_worker():
-    """【公共接口】停止工人线程，用于应用退出。"""
-    global task_worker_thread
-    if task_worker_thread and task_worker_thread.is_alive():
-        logger.info("正在发送停止信号给任务工人线程...")
-        task_queue.put(None)
-        task_worker_thread.join(timeout=5)
-        if task_worker_thread.is_alive():
-            logger.warning("任务工人线程在5秒内未能正常退出。")
+    """【公共接口】停止所有通道的工人线程，用于应用退出。"""
+    global _shutting_down
+    with _scheduler_condition:
+        _shutting_down = True
+        _scheduler_condition.notify_all()
+    with task_worker_lock:
+        threads = [thread for thread in _worker_threads if thread.is_alive()]
+    if not threads:
+        return
+    logger.info(f"正在发送停止信号给 {len(threads)} 个任务工人线程...")
+    deadline = time.monotonic() + 5
+    for thread in threads:
+        thread.join(timeout=max(0.0, deadline - time.monotonic()))
+    still_alive = [thread.name for thread in threads if thread.is_alive()]
+    if still_alive:
+        logger.warning(f"以下任务工人线程在5秒内未能正常退出: {', '.join(still_alive)}")
+    else:
+        logger.info("任务工人线程已成功停止。")
+
+def stop_task(task_id: Optional[int] = None) -> int:
+    """
+    【公共接口】停止任务：只设置该任务自己的停止事件，同处理器上的其它任务不受影响。
+    task_id 为排队中的任务时，它开始执行时立即结束；task_id 为空时停止所有正在运行的任务。
+    返回收到停止信号的任务数。
+    """
+    with _scheduler_condition:
+        if task_id is None:
+            targets = list(_running.values())
         else:
-            logger.info("任务工人线程已成功停止。")
+            targets = [task for task in itertools.chain(_running.values(), *_pending.values()) if task["id"] == task_id]
+        for task in targets:
+            task["stop_event"].set()
+            logger.info(f"已向任务 '{task['name']}' 发送停止信号。")
+    return len(targets)
 
 def clear_task_queue():
-    """【公共接口】清空任务队列，用于应用退出。"""
-    if not task_queue.empty():
-        logger.info(f"队列中还有 {task_queue.qsize()} 个任务，正在清空...")
-        while not task_queue.empty():
-            try:
-                task_queue.get_nowait()
-            except Queue.Empty:
-                break
-        logger.info("任务队列已清空。")
\ No newline at end of file
+    """【公共接口】清空所有通道的排队任务，用于应用退出。"""
+    with _scheduler_condition:
+        queued = sum(len(queue) for queue in _pending.values())
+        if not queued:
+            return
+        logger.info(f"队列中还有 {queued} 个任务，正在清空...")
+        for queue in _pending.values():
+            queue.clear()
+    notify_status_changed()
+    logger.info("任务队列已清空。")
@@ -0,0 +1,180 @@
+# task_metrics.py
+
+import contextvars
+import functools
+import logging
+import threading
+import time
+from typing import Dict, Any, Optional
+
+# ==============================================================================
+# ✨ 任务运行指标 (Task Run Metrics)
+# ------------------------------------------------------------------------------
+# 每次任务执行时由 task_manager 创建一个 TaskRunMetrics 并绑定到执行线程，结束后写入 task_runs 表：
+# - 外部 API 调用次数：Emby / TMDb / 豆瓣 的共享 requests.Session 通过 response hook 计数，
+#   AI 翻译在各提供商的调用方法上计数；
+# - 数据库耗时：db_handler 的游标统计每次 execute 的耗时；
+# - 错误数：ErrorCountingHandler 统计任务期间的 ERROR 日志；
+# - 处理项目数：由任务在主循环中调用 record_items() 上报。
+# 指标绑定在上下文变量上：任务内部的线程池使用 task_context.ContextThreadPoolExecutor，
+# 工作线程在提交方上下文的副本中执行，调用计入提交它的任务；
+# 没有上下文的线程（如未经包装的后台线程）不计入任何任务。
+# 本模块不导入任何业务模块，emby_handler / db_handler 等底层模块都可以使用。
+# ==============================================================================
+
+API_EMBY = 'emby'
+API_TMDB = 'tmdb'
+API_DOUBAN = 'douban'
+API_AI = 'ai'
+
+# 结束状态
+STATUS_COMPLETED = 'completed'
+STATUS_STOPPED = 'stopped'
+STATUS_PREEMPTED = 'preempted'
+STATUS_FAILED = 'failed'
+STATUS_SKIPPED = 'skipped'  # 计划运行被跳过（上一次运行尚未结束）
+STATUS_MISSED = 'missed'    # 计划运行被错过（停机或调度器繁忙，超出补跑时限）
+
+# 停止原因
+STOP_REASON_USER = 'user_stop'
+STOP_REASON_TIMEOUT = 'timeout'
+STOP_REASON_PREEMPTED = 'preempted'
+STOP_REASON_EXCEPTION = 'exception'
+STOP_REASON_OVERLAP = 'overlap'
+STOP_REASON_MISFIRE = 'misfire'
+
+class TaskRunMetrics:
+    def __init__(self, parent: Optional['TaskRunMetrics'] = None):
+        self._lock = threading.Lock()
+        self.parent = parent
+        self.started_at = time.time()
+        self.api_calls: Dict[str, int] = {API_EMBY: 0, API_TMDB: 0, API_DOUBAN: 0, API_AI: 0}
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.items_processed: Optional[int] = None
+        self.error_count = 0
+        self.last_error: Optional[str] = None
+        self.stop_reason: Optional[str] = None
+
+    # 子任务（任务链）的计数同时累加到父任务上
+    def add_api_call(self, service: str):
+        with self._lock:
+            self.api_calls[service] = self.api_calls.get(service, 0) + 1
+        if self.parent:
+            self.parent.add_api_call(service)
+
+    def add_db_time(self, seconds: float):
+        with self._lock:
+            self.db_queries += 1
+            self.db_seconds += seconds
+        if self.parent:
+            self.parent.add_db_time(seconds)
+
+    def add_items(self, count: int):
+        with self._lock:
+            self.items_processed = (self.items_processed or 0) + count
+        if self.parent:
+            self.parent.add_items(count)
+
+    def add_error(self, message: str):
+        with self._lock:
+            self.error_count += 1
+            self.last_error = message[:500]
+        if self.parent:
+            self.parent.add_error(message)
+
+    def to_record(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "items_processed": self.items_processed,
+                "emby_calls": self.api_calls.get(API_EMBY, 0),
+                "tmdb_calls": self.api_calls.get(API_TMDB, 0),
+                "douban_calls": self.api_calls.get(API_DOUBAN, 0),
+                "ai_calls": self.api_calls.get(API_AI, 0),
+                "db_queries": self.db_queries,
+                "db_seconds": round(self.db_seconds, 3),
+                "error_count": self.error_count,
+                "last_error": self.last_error,
+            }
+
+_current_metrics: contextvars.ContextVar[Optional['TaskRunMetrics']] = contextvars.ContextVar('task_metrics', default=None)
+
+def activate(metrics: TaskRunMetrics):
+    """任务开始：把指标绑定到当前上下文。"""
+    bind(metrics)
+
+def deactivate(metrics: TaskRunMetrics):
+    bind(None)
+
+def bind(metrics: Optional[TaskRunMetrics]):
+    """把指标绑定到当前上下文（任务链的子任务线程绑定子任务自己的指标）。"""
+    _current_metrics.set(metrics)
+
+def current() -> Optional[TaskRunMetrics]:
+    return _current_metrics.get()
+
+# --- 上报接口 ---
+def record_api_call(service: str):
+    metrics = current()
+    if metrics:
+        metrics.add_api_call(service)
+
+def record_db_time(seconds: float):
+    metrics = current()
+    if metrics:
+        metrics.add_db_time(seconds)
+
+def record_items(count: int = 1):
+    """任务上报已处理的项目数。"""
+    metrics = current()
+    if metrics and count:
+        metrics.add_items(count)
+
+def set_stop_reason(reason: str):
+    metrics = current()
+    if metrics:
+        metrics.stop_reason = reason
+
+def session_hook(service: str):
+    """返回 requests.Session 的 response hook，每收到一个响应计一次 API 调用。"""
+    def hook(response, *args, **kwargs):
+        record_api_call(service)
+        return response
+    return hook
+
+def counts_api_call(service: str):
+    """装饰器：每次调用被装饰的方法计一次 API 调用。"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            record_api_call(service)
+            return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+class ErrorCountingHandler(logging.Handler):
+    """统计任务执行期间的 ERROR 日志。"""
+    def __init__(self):
+        super().__init__(level=logging.ERROR)
+
+    def emit(self, record: logging.LogRecord):
+        metrics = current()
+        if metrics:
+            try:
+                metrics.add_error(record.getMessage())
+            except Exception:
+                pass
+
+_error_handler: Optional[ErrorCountingHandler] = None
+
+def install_error_handler():
+    """
+    在根日志记录器上安装错误计数处理器（幂等）。
+    logger_setup 初始化时会清空根记录器的处理器，因此它在配置完成后也会调用一次。
+    """
+    global _error_handler
+    if _error_handler is None:
+        _error_handler = ErrorCountingHandler()
+    root = logging.getLogger()
+    if _error_handler not in root.handlers:
+        root.addHandler(_error_handler)
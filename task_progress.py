@@ -0,0 +1,68 @@
+# task_progress.py
+
+import time
+from typing import Dict, Any, Optional, Callable
+
+# ==============================================================================
+# ✨ 任务进度上报 (Progress Reporter)
+# ------------------------------------------------------------------------------
+# 长任务的主循环每处理一个项目都会上报进度，逐项调用 update_status_callback 既浪费又没有意义
+# （前端最多每 0.5 秒刷新一次）。ProgressReporter 在循环内按项目计数，按时间节流上报：
+# - 距上次上报不足 min_interval 秒时只更新计数，不调用回调；完成时（done == total）总是上报；
+# - 每次上报附带结构化计数 counters = {done, total, rate(项/秒), eta_seconds}，
+#   由 task_manager.update_status_from_thread 保存到任务状态中，前端据此显示速率和剩余时间；
+# - 百分比映射到 [start, end] 区间，方便接在 "阶段 1 占 0-30%" 之类的前置阶段之后。
+# 回调需要接受 (progress, message, counters) 三个参数，task_manager.update_status_from_thread 满足要求。
+# 本模块不导入任何业务模块，core_processor 等底层模块也可以使用。
+# ==============================================================================
+
+DEFAULT_MIN_INTERVAL = 0.5
+
+class ProgressReporter:
+    def __init__(self, callback: Optional[Callable[..., Any]], total: int, start: int = 0, end: int = 100,
+                 min_interval: float = DEFAULT_MIN_INTERVAL, initial_done: int = 0):
+        self.callback = callback
+        self.total = max(0, int(total))
+        self.start = start
+        self.end = end
+        self.min_interval = min_interval
+        self.done = initial_done
+        # 速率只按本次运行处理的项目计算（从检查点继续时跳过的项目不计入）
+        self._base_done = initial_done
+        self._started_at = time.monotonic()
+        self._last_report_at = 0.0
+
+    def set_total(self, total: int):
+        self.total = max(0, int(total))
+
+    def counters(self) -> Dict[str, Any]:
+        elapsed = time.monotonic() - self._started_at
+        rate = (self.done - self._base_done) / elapsed if elapsed > 0 else 0.0
+        remaining = max(0, self.total - self.done)
+        eta = int(remaining / rate) if rate > 0 else None
+        return {"done": self.done, "total": self.total, "rate": round(rate, 2), "eta_seconds": eta}
+
+    def progress(self) -> int:
+        if not self.total:
+            return self.end
+        return self.start + int(min(self.done, self.total) / self.total * (self.end - self.start))
+
+    def update(self, done: int, message: Optional[str] = None, force: bool = False) -> bool:
+        """设置已完成数量，到达节流间隔、完成或 force 时上报。返回是否实际调用了回调。"""
+        self.done = done
+        now = time.monotonic()
+        finished = self.total and self.done >= self.total
+        if not (force or finished or now - self._last_report_at >= self.min_interval):
+            return False
+        self._last_report_at = now
+        if self.callback:
+            self.callback(self.progress(), message or f"进度: {self.done}/{self.total}", self.counters())
+        return True
+
+    def advance(self, count: int = 1, message: Optional[str] = None) -> bool:
+        """完成了 count 个项目。message 只在实际上报时使用，可以传入最新项目的描述。"""
+        return self.update(self.done + count, message)
+
+    def finish(self, message: str):
+        """任务结束，立即上报最终状态。"""
+        self.update(max(self.done, self.total), message, force=True)
@@ -11,16 +11,16 @@ from psycopg2.extras import execute_values, Json
 import logging
 from typing import Dict, Any, Tuple, List
 import threading
+import contextlib
 from datetime import datetime, date, timezone
-from concurrent.futures import ThreadPoolExecutor, as_completed 
+from concurrent.futures import as_completed 
 import concurrent.futures
-import gevent
 # 导入类型提示
 from typing import Optional, List
 from core_processor import MediaProcessor
 from watchlist_processor import WatchlistProcessor
 from actor_subscription_processor import ActorSubscriptionProcessor
-from custom_collection_handler import ListImporter, FilterEngine
+from custom_collection_handler import ListImporter, FilterEngine, SourceFetchCache
 
 # 导入需要的底层模块和共享实例
 import db_handler
@@ -31,12 +31,16 @@ import config_manager
 import constants
 import extensions
 import task_manager
+import task_metrics
+import task_context
+from task_checkpoints import TaskCheckpoint, TaskPreempted
 from actor_utils import enrich_all_actor_aliases_task
 from actor_sync_handler import UnifiedSyncHandler
 from extensions import TASK_REGISTRY
 from custom_collection_handler import ListImporter, FilterEngine
 from core_processor import _read_local_json
 from services.cover_generator import CoverGeneratorService
+from services.cover_generator.cover_queue import cover_job_queue
 import utils
 from utils import get_country_translation_map, translate_country_list, get_unified_rating
 
@@ -59,6 +63,8 @@ AUDIO_SUBTITLE_KEYWORD_MAP = {
 }
 
 # ★★★ 全量处理任务 ★★★
+@task_manager.task_profile(lane=task_manager.LANE_MAINTENANCE, resources=[task_manager.RESOURCE_LIBRARY_SCAN, task_manager.RESOURCE_ACTORS],
+                           priority=task_manager.PRIORITY_LOW, preemptible=True)
 def task_run_full_scan(processor: MediaProcessor, force_reprocess: bool = False):
     """
     根据传入的 force_reprocess 参数，决定是执行标准扫描还是强制扫描。
@@ -78,6 +84,7 @@ def task_run_full_scan(processor: MediaProcessor, force_reprocess: bool = False)
     )
 
 # --- 同步演员映射表 ---
+@task_manager.task_profile(lane=task_manager.LANE_MAINTENANCE, resources=[task_manager.RESOURCE_ACTORS])
 def task_sync_person_map(processor):
     """
     【最终兼容版】任务：同步演员映射表。
@@ -111,6 +118,8 @@ def task_sync_person_map(processor):
         logger.error(f"'{task_name}' 执行过程中发生严重错误: {e}", exc_info=True)
         task_manager.update_status_from_thread(-1, f"错误：同步失败 ({str(e)[:50]}...)")
 # ✨✨✨ 演员数据补充函数 ✨✨✨
+@task_manager.task_profile(lane=task_manager.LANE_MAINTENANCE, resources=[task_manager.RESOURCE_ACTORS],
+                           priority=task_manager.PRIORITY_LOW, preemptible=True)
 def task_enrich_aliases(processor: MediaProcessor, force_full_update: bool = False):
     """
     【V4 - 支持深度模式】演员数据补充任务的入口点。
@@ -161,6 +170,8 @@ def task_enrich_aliases(processor: MediaProcessor, force_full_update: bool = Fal
         logger.error(f"'{task_name}' 执行过程中发生严重错误: {e}", exc_info=True)
         task_manager.update_status_from_thread(-1, f"错误：任务失败 ({str(e)[:50]}...)")
 # --- 使用手动编辑的结果处理媒体项 ---
+# 处理媒体项会写入演员映射表 (person_identity_map)
+@task_manager.task_profile(lane=task_manager.LANE_MEDIA, resources=lambda kwargs: [task_manager.item_resource(kwargs.get('item_id')), task_manager.RESOURCE_ACTORS])
 def task_manual_update(processor: MediaProcessor, item_id: str, manual_cast_list: list, item_name: str):
     """任务：使用手动编辑的结果处理媒体项"""
     processor.process_item_with_manual_cast(
@@ -169,6 +180,7 @@ def task_manual_update(processor: MediaProcessor, item_id: str, manual_cast_list
         item_name=item_name
     )
 # --- 扫描单个演员订阅的所有作品 ---
+@task_manager.task_profile(lane=task_manager.LANE_ACTOR, resources=[task_manager.RESOURCE_ACTOR_SUBSCRIPTIONS])
 def task_scan_actor_media(processor: ActorSubscriptionProcessor, subscription_id: int):
     """【新】后台任务：扫描单个演员订阅的所有作品。"""
     logger.trace(f"手动刷新任务(ID: {subscription_id})：开始准备Emby媒体库数据...")
@@ -197,28 +209,35 @@ def task_scan_actor_media(processor: ActorSubscriptionProcessor, subscription_id
     # 现在，带着准备好的 emby_tmdb_ids 调用函数
     processor.run_full_scan_for_actor(subscription_id, emby_tmdb_ids)
 # --- 演员订阅 ---
+@task_manager.task_profile(lane=task_manager.LANE_ACTOR, resources=[task_manager.RESOURCE_ACTOR_SUBSCRIPTIONS])
 def task_process_actor_subscriptions(processor: ActorSubscriptionProcessor):
     """【新】后台任务：执行所有启用的演员订阅扫描。"""
     processor.run_scheduled_task(update_status_callback=task_manager.update_status_from_thread)
 # ★★★ 处理webhook、用于编排任务的函数 ★★★
-def webhook_processing_task(processor: MediaProcessor, item_id: str, force_reprocess: bool):
+# 处理媒体项会写入演员映射表 (person_identity_map)
+@task_manager.task_profile(lane=task_manager.LANE_MEDIA, resources=lambda kwargs: [task_manager.item_resource(kwargs.get('item_id')), task_manager.RESOURCE_ACTORS])
+def webhook_processing_task(processor: MediaProcessor, item_id: str, force_reprocess: bool, item_details: Optional[Dict[str, Any]] = None):
     """
-    【V5 - 媒体库限制修复版】
+    【V6 - 批量共享详情版】
     - 调整了代码顺序，确保在匹配自定义合集时，能将媒体项所属的库ID传递给筛选引擎。
     - 修复了筛选类合集的媒体库限制在实时匹配时无效的BUG。
+    - item_details: Webhook 批量任务已获取的详情，提供时不再重复请求。
+    - 获取不到详情或元数据处理失败时抛出 RuntimeError，由 Webhook 队列记录失败并按退避重试，
+      而不是当作成功出队；因停止信号而未完成时正常返回，由调用方推迟。
     """
-    item_details = emby_handler.get_emby_item_details(item_id, processor.emby_url, processor.emby_api_key, processor.emby_user_id)
     if not item_details:
-        logger.error(f"  -> 无法获取项目 {item_id} 的详情，任务中止。")
-        return
+        item_details = emby_handler.get_emby_item_details(item_id, processor.emby_url, processor.emby_api_key, processor.emby_user_id)
+    if not item_details:
+        raise RuntimeError(f"无法获取项目 {item_id} 的详情")
 
     processor.check_and_add_to_watchlist(item_details)
 
-    processed_successfully = processor.process_single_item(item_id, force_reprocess_this_item=force_reprocess)
+    processed_successfully = processor.process_single_item(item_id, force_reprocess_this_item=force_reprocess, prefetched_details=item_details)
     
     if not processed_successfully:
-        logger.warning(f"  -> 项目 {item_id} 的元数据处理未成功完成，跳过自定义合集匹配。")
-        return
+        if processor.is_stop_requested():
+            return
+        raise RuntimeError(f"项目 {item_id} 的元数据处理未成功完成")
 
     try:
         tmdb_id = item_details.get("ProviderIds", {}).get("Tmdb")
@@ -293,51 +312,41 @@ def webhook_processing_task(processor: MediaProcessor, item_id: str, force_repro
     except Exception as e:
         logger.error(f"  -> 为新入库项目 {item_id} 匹配自定义合集时发生意外错误: {e}", exc_info=True)
 
-    # --- 封面生成逻辑 (保持不变) ---
+    # --- 封面生成：投递到低优先级封面队列，不占用当前任务槽 ---
     try:
         cover_config = db_handler.get_setting('cover_generator_config') or {}
 
         if cover_config.get("enabled") and cover_config.get("transfer_monitor"):
-            logger.info(f"  -> 检测到 '{item_details.get('Name')}' 入库，将为其所属媒体库生成新封面...")
-            
-            # ▼▼▼ 步骤 2: 复用已获取的 library_info，无需重复获取 ▼▼▼
             if not library_info:
                 logger.warning(f"  -> (封面生成) 无法为项目 {item_id} 定位到其所属的媒体库根，跳过封面生成。")
                 return
-            # ▲▲▲ 步骤 2: 完成 ▲▲▲
 
-            library_id = library_info.get("Id") # library_id 变量在这里被重新赋值，但不影响上面的逻辑
+            library_id = library_info.get("Id")
             library_name = library_info.get("Name", library_id)
             
             if library_info.get('CollectionType') not in ['movies', 'tvshows', 'boxsets', 'mixed', 'music']:
                 logger.debug(f"  -> 父级 '{library_name}' 不是一个常规媒体库，跳过封面生成。")
                 return
 
-            server_id = 'main_emby'
-            library_unique_id = f"{server_id}-{library_id}"
+            library_unique_id = f"main_emby-{library_id}"
             if library_unique_id in cover_config.get("exclude_libraries", []):
                 logger.info(f"  -> 媒体库 '{library_name}' 在忽略列表中，跳过。")
                 return
-            
-            TYPE_MAP = {'movies': 'Movie', 'tvshows': 'Series', 'music': 'MusicAlbum', 'boxsets': 'BoxSet', 'mixed': 'Movie,Series'}
-            collection_type = library_info.get('CollectionType')
-            item_type_to_query = TYPE_MAP.get(collection_type)
-            
-            item_count = 0
-            if library_id and item_type_to_query:
-                item_count = emby_handler.get_item_count(base_url=processor.emby_url, api_key=processor.emby_api_key, user_id=processor.emby_user_id, parent_id=library_id, item_type=item_type_to_query) or 0
-            
-            logger.info(f"  -> 正在为媒体库 '{library_name}' 生成封面 (当前实时数量: {item_count}) ---")
-            cover_service = CoverGeneratorService(config=cover_config)
-            cover_service.generate_for_library(emby_server_id=server_id, library=library_info, item_count=item_count)
+
+            cover_job_queue.request_library_cover(
+                library_info,
+                window_seconds=cover_config.get("cover_queue_window_seconds", 60),
+                reason=f"'{item_details.get('Name')}' 入库"
+            )
         else:
             logger.debug("  -> 封面生成器或入库监控未启用，跳过封面生成。")
 
     except Exception as e:
-        logger.error(f"  -> 在新入库后执行精准封面生成时发生错误: {e}", exc_info=True)
+        logger.error(f"  -> 投递入库封面任务时发生错误: {e}", exc_info=True)
 
     logger.trace(f"  -> Webhook 任务及所有后续流程完成: {item_id}")
 # --- 追剧 ---    
+@task_manager.task_profile(lane=task_manager.LANE_WATCHLIST, resources=[task_manager.RESOURCE_WATCHLIST])
 def task_process_watchlist(processor: WatchlistProcessor, item_id: Optional[str] = None):
     """
     【V9 - 启动器】
@@ -359,6 +368,7 @@ def task_process_watchlist(processor: WatchlistProcessor, item_id: Optional[str]
         logger.error(f"执行 '{task_name}' 时发生顶层错误: {e}", exc_info=True)
         progress_updater(-1, f"启动任务时发生错误: {e}")
 # ★★★ 只更新追剧列表中的一个特定项目 ★★★
+@task_manager.task_profile(lane=task_manager.LANE_WATCHLIST, resources=lambda kwargs: [task_manager.item_resource(kwargs.get('item_id'))])
 def task_refresh_single_watchlist_item(processor: WatchlistProcessor, item_id: str):
     """
     【V11 - 新增】后台任务：只刷新追剧列表中的一个特定项目。
@@ -378,6 +388,7 @@ def task_refresh_single_watchlist_item(processor: WatchlistProcessor, item_id: s
         logger.error(f"执行 '{task_name}' 时发生顶层错误: {e}", exc_info=True)
         progress_updater(-1, f"启动任务时发生错误: {e}")
 # ★★★ 低频任务 - 检查已完结剧集是否复活 ★★★
+@task_manager.task_profile(lane=task_manager.LANE_WATCHLIST, resources=[task_manager.RESOURCE_WATCHLIST])
 def task_run_revival_check(processor: WatchlistProcessor):
     """
     【低频任务】后台任务入口：检查所有已完结剧集是否“复活”。
@@ -477,6 +488,7 @@ def _overwrite_table_data(cursor, table_name: str, columns: List[str], data: Lis
     execute_values(cursor, insert_query, data, page_size=500)
     logger.info(f"成功向表 '{db_table_name}' 插入 {len(data)} 条记录。")
 
+@task_manager.task_profile(lane=task_manager.LANE_MEDIA, resources=lambda kwargs: [task_manager.item_resource(kwargs.get('item_id'))])
 def task_sync_metadata_cache(processor: MediaProcessor, item_id: str, item_name: str):
     """
     任务：为单个媒体项同步元数据到 media_metadata 数据库表。
@@ -490,6 +502,7 @@ def task_sync_metadata_cache(processor: MediaProcessor, item_id: str, item_name:
         # 根据需要，可以决定是否要重新抛出异常以标记任务失败
         raise
 
+@task_manager.task_profile(lane=task_manager.LANE_MEDIA, resources=lambda kwargs: [task_manager.item_resource(kwargs.get('item_id'))])
 def task_sync_assets(processor: MediaProcessor, item_id: str, update_description: str, sync_timestamp_iso: str):
     """
     任务：为单个媒体项同步图片和元数据文件到本地 override 目录。
@@ -503,6 +516,7 @@ def task_sync_assets(processor: MediaProcessor, item_id: str, update_description
         logger.error(f"任务失败：同步资源文件 for ID: {item_id} 时发生错误: {e}", exc_info=True)
         raise
 # --- 主任务函数 (V4 - 纯PG重构版) ---
+@task_manager.task_profile(lane=task_manager.LANE_MAINTENANCE, resources=[task_manager.RESOURCE_ALL])
 def task_import_database(processor, file_content: str, tables_to_import: List[str]):
     """
     【V4 - 纯净重构版】
@@ -597,6 +611,8 @@ def task_import_database(processor, file_content: str, tables_to_import: List[st
             except Exception as rollback_e:
                 logger.error(f"尝试回滚事务时发生额外错误: {rollback_e}")
 # ★★★ 重新处理单个项目 ★★★
+# 处理媒体项会写入演员映射表 (person_identity_map)
+@task_manager.task_profile(lane=task_manager.LANE_MEDIA, resources=lambda kwargs: [task_manager.item_resource(kwargs.get('item_id')), task_manager.RESOURCE_ACTORS])
 def task_reprocess_single_item(processor: MediaProcessor, item_id: str, item_name_for_ui: str):
     """
     【最终版 - 职责分离】后台任务。
@@ -621,6 +637,7 @@ def task_reprocess_single_item(processor: MediaProcessor, item_id: str, item_nam
         logger.error(f"后台任务处理 '{item_name_for_ui}' 时发生严重错误: {e}", exc_info=True)
         task_manager.update_status_from_thread(-1, f"处理失败: {item_name_for_ui}")
 # --- 翻译演员任务 ---
+@task_manager.task_profile(lane=task_manager.LANE_MAINTENANCE, resources=[task_manager.RESOURCE_ACTORS])
 def task_actor_translation_cleanup(processor):
     """
     【V3.2 - 并发写入版】
@@ -726,7 +743,7 @@ def task_actor_translation_cleanup(processor):
             logger.info(f"  -> 批次 {batch_num}/{total_batches}: 翻译完成，准备并发写入 {len(update_tasks)} 个更新...")
             
             # 2. 使用 ThreadPoolExecutor 执行并发更新
-            with ThreadPoolExecutor(max_workers=10) as executor:
+            with task_context.ContextThreadPoolExecutor(max_workers=10) as executor:
                 # 提交所有更新任务
                 future_to_task = {
                     executor.submit(
@@ -772,6 +789,7 @@ def task_actor_translation_cleanup(processor):
         logger.error(f"执行演员翻译任务时发生严重错误: {e}", exc_info=True)
         task_manager.update_status_from_thread(-1, f"任务失败: {e}")
 # ★★★ 重新处理所有待复核项 ★★★
+@task_manager.task_profile(lane=task_manager.LANE_MAINTENANCE, resources=[task_manager.RESOURCE_LIBRARY_SCAN])
 def task_reprocess_all_review_items(processor: MediaProcessor):
     """
     【已升级】后台任务：遍历所有待复核项并逐一以“强制在线获取”模式重新处理。
@@ -815,6 +833,7 @@ def task_reprocess_all_review_items(processor: MediaProcessor):
         logger.error(f"重新处理所有待复核项时发生严重错误: {e}", exc_info=True)
         task_manager.update_status_from_thread(-1, "任务失败")
 # ★★★ 同步覆盖缓存的任务函数 ★★★
+@task_manager.task_profile(lane=task_manager.LANE_MAINTENANCE, resources=[task_manager.RESOURCE_IMAGE_BACKUP])
 def task_full_image_sync(processor: MediaProcessor, force_full_update: bool = False):
     """
     后台任务：调用 processor 的方法来同步所有图片。
@@ -908,13 +927,14 @@ def _process_single_collection_concurrently(collection_data: dict, tmdb_api_key:
         "in_library_count": in_library_count
     }
 # ★★★ 刷新合集的后台任务函数 ★★★
+@task_manager.task_profile(lane=task_manager.LANE_MAINTENANCE, resources=[task_manager.RESOURCE_COLLECTIONS])
 def task_refresh_collections(processor: MediaProcessor):
     """
     【V2 - PG语法修正版】
     - 修复了数据库批量写入时使用 SQLite 特有语法 INSERT OR REPLACE 的问题。
     - 改为使用 PostgreSQL 标准的 ON CONFLICT ... DO UPDATE 语法，确保数据能被正确地插入或更新。
     """
-    from concurrent.futures import ThreadPoolExecutor, as_completed
+    from concurrent.futures import as_completed
 
     task_manager.update_status_from_thread(0, "正在获取 Emby 合集列表...")
     try:
@@ -945,7 +965,7 @@ def task_refresh_collections(processor: MediaProcessor):
         processed_count = 0
         all_results = []
         
-        with ThreadPoolExecutor(max_workers=5) as executor:
+        with task_context.ContextThreadPoolExecutor(max_workers=5) as executor:
             futures = {executor.submit(_process_single_collection_concurrently, collection, tmdb_api_key): collection for collection in emby_collections}
             
             for future in as_completed(futures):
@@ -1002,6 +1022,7 @@ def task_refresh_collections(processor: MediaProcessor):
         logger.error(f"刷新合集任务失败: {e}", exc_info=True)
         task_manager.update_status_from_thread(-1, f"错误: {e}")
 # ★★★ 带智能预判的自动订阅任务 ★★★
+@task_manager.task_profile(lane=task_manager.LANE_MAINTENANCE, resources=[task_manager.RESOURCE_SUBSCRIPTIONS])
 def task_auto_subscribe(processor: MediaProcessor):
     """
     【V6 - 全局配额终极版】
@@ -1235,6 +1256,7 @@ def task_auto_subscribe(processor: MediaProcessor):
         logger.error(f"智能订阅任务失败: {e}", exc_info=True)
         task_manager.update_status_from_thread(-1, f"错误: {e}")
 # ✨✨✨ 一键添加所有剧集到追剧列表的任务 ✨✨✨
+@task_manager.task_profile(lane=task_manager.LANE_WATCHLIST, resources=[task_manager.RESOURCE_WATCHLIST])
 def task_add_all_series_to_watchlist(processor: MediaProcessor):
     """
     【V3 - 并发获取与批量写入 PG 版】
@@ -1285,7 +1307,7 @@ def task_add_all_series_to_watchlist(processor: MediaProcessor):
                 return []
 
         # 使用线程池并发执行
-        with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
+        with task_context.ContextThreadPoolExecutor(max_workers=5) as executor:
             # 提交所有任务
             future_to_library = {executor.submit(fetch_series_from_library, lib_id): lib_id for lib_id in library_ids_to_process}
             for future in concurrent.futures.as_completed(future_to_library):
@@ -1374,95 +1396,142 @@ def task_add_all_series_to_watchlist(processor: MediaProcessor):
         logger.error(f"执行 '{task_name}' 任务时发生严重错误: {e}", exc_info=True)
         task_manager.update_status_from_thread(-1, f"任务失败: {e}")
 # --- 任务链 ---
+@task_manager.task_profile(lane=task_manager.LANE_MAINTENANCE, resources=[task_manager.RESOURCE_TASK_CHAIN])
 def task_run_chain(processor: MediaProcessor, task_sequence: list):
     """
-    【V5 - 及时刹车版】
-    - 使用一个独立的计时器线程来触发全局停止信号，实现对耗时子任务的及时中断。
+    【V6 - 并行DAG版】
+    - 子任务按 CHAIN_TASK_DEPENDENCIES 声明的依赖和各任务的资源声明排成有向无环图：
+      依赖都已完成、且与运行中子任务没有资源冲突的子任务并行执行，最多同时执行 task_chain_max_parallel 个。
+    - 任务链本身不占用子任务的资源：每个子任务开始时才占用它自己声明的资源，结束后立即释放，
+      其它任务（如 Webhook）只需等待与它冲突的那个子任务。
+    - 使用一个独立的计时器线程来触发本任务链的停止信号，实现对耗时子任务的及时中断；停止后不再启动新的子任务。
+      停止信号只作用于任务链自己（及其子任务），不影响同时运行的其它任务。
     """
     task_name = "自动化任务链"
-    total_tasks = len(task_sequence)
-    logger.info(f"--- '{task_name}' 已启动，共包含 {total_tasks} 个子任务 ---")
+    plan = _plan_chain(task_sequence)
+    total_tasks = len(plan)
+    max_parallel = max(1, int(processor.config.get(constants.CONFIG_OPTION_TASK_CHAIN_MAX_PARALLEL, 2) or 1))
+    logger.info(f"--- '{task_name}' 已启动，共包含 {total_tasks} 个子任务 (最大并行数: {max_parallel}) ---")
     task_manager.update_status_from_thread(0, f"任务链启动，共 {total_tasks} 个任务。")
 
+    chain_task = task_manager.current_task()
+    if chain_task:
+        task_manager.register_subtasks(chain_task, [(node["key"], node["description"]) for node in plan])
+
     # --- 准备计时器和停止信号 ---
     max_runtime_minutes = processor.config.get(constants.CONFIG_OPTION_TASK_CHAIN_MAX_RUNTIME_MINUTES, 0)
     timeout_seconds = max_runtime_minutes * 60 if max_runtime_minutes > 0 else None
     
-    processor.clear_stop_signal()
+    # 本任务链的停止事件（在任务线程中取得；计时器线程不在任务上下文中，直接持有该事件）
+    chain_stop_event = processor.get_stop_event()
     timeout_triggered = threading.Event()
+    chain_finished = threading.Event()
 
     def timeout_watcher():
         if timeout_seconds:
             logger.info(f"任务链运行时长限制为 {max_runtime_minutes} 分钟，计时器已启动。")
-            time.sleep(timeout_seconds)
+            if chain_finished.wait(timeout_seconds):
+                return
             
-            if not processor.is_stop_requested():
+            if not chain_stop_event.is_set():
                 logger.warning(f"任务链达到 {max_runtime_minutes} 分钟的运行时长限制，将发送停止信号...")
                 timeout_triggered.set()
-                processor.signal_stop()
+                if chain_task:
+                    task_manager.set_task_stop_reason(chain_task, task_metrics.STOP_REASON_TIMEOUT)
+                chain_stop_event.set()
 
     # 启动计时器线程
     timer_thread = threading.Thread(target=timeout_watcher, daemon=True)
     timer_thread.start()
 
     try:
-        # --- 主任务循环 ---
-        registry = get_task_registry()
-        for i, task_key in enumerate(task_sequence):
-            if processor.is_stop_requested():
-                if not timeout_triggered.is_set():
-                    logger.warning(f"'{task_name}' 被用户手动中止。")
-                break
-
-            task_info = registry.get(task_key)
-            if not task_info:
-                logger.error(f"任务链警告：在注册表中未找到任务 '{task_key}'，已跳过。")
-                continue
-
-            try:
-                # ▼▼▼ 核心修复 1/2：我们不再需要 processor_type 了 ▼▼▼
-                task_function, task_description, _ = task_info
-            except ValueError:
-                logger.error(f"任务链错误：任务 '{task_key}' 的注册信息格式不正确，已跳过。")
-                continue
-
-            progress = int((i / total_tasks) * 100)
-            status_message = f"({i+1}/{total_tasks}) 正在执行: {task_description}"
-            logger.info(f"--- {status_message} ---")
-            task_manager.update_status_from_thread(progress, status_message)
-
-            try:
-                # ▼▼▼ 核心修复 2/2：直接将 task_run_chain 收到的 processor 实例传递给子任务函数 ▼▼▼
-                # 所有子任务函数（如 task_run_full_scan）的第一个参数都是 processor
-                task_function(processor)
-                time.sleep(1)
-
-            except Exception as e:
-                # 检查异常是否是由于我们的“刹车”引起的
-                if isinstance(e, InterruptedError):
-                    logger.info(f"子任务 '{task_description}' 响应停止信号，已中断。")
-                    # 不需要再做什么，外层循环会处理
+        # --- 主调度循环 ---
+        pending = list(plan)
+        running = {}
+        finished = set()
+        started_count = 0
+        with task_context.ContextThreadPoolExecutor(max_workers=max_parallel, thread_name_prefix="TaskChain") as executor:
+            while pending or running:
+                if processor.is_stop_requested():
+                    if pending:
+                        if not timeout_triggered.is_set():
+                            logger.warning(f"'{task_name}' 被用户手动中止。")
+                        for node in pending:
+                            if chain_task:
+                                task_manager.set_subtask_state(chain_task, node["key"], 'skipped', "任务链已停止，未执行")
+                        pending.clear()
                 else:
-                    error_message = f"任务链中的子任务 '{task_description}' 执行失败: {e}"
-                    logger.error(error_message, exc_info=True)
-                    task_manager.update_status_from_thread(progress, f"子任务'{task_description}'失败，继续...")
-                    time.sleep(3)
-                continue
+                    for node in list(pending):
+                        if len(running) >= max_parallel:
+                            break
+                        if not node["after"] <= finished:
+                            continue
+                        pending.remove(node)
+                        started_count += 1
+                        logger.info(f"--- ({started_count}/{total_tasks}) 正在执行: {node['description']} ---")
+                        running[executor.submit(_run_chain_subtask, processor, chain_task, node)] = node
+
+                if not running:
+                    break
+                done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    finished.add(running.pop(future)["key"])
 
     finally:
         # --- 任务结束后的清理和状态报告 ---
+        chain_finished.set()
         final_message = f"'{task_name}' 执行完毕。"
         if processor.is_stop_requested():
             if timeout_triggered.is_set():
                 final_message = f"'{task_name}' 已达最长运行时限，自动结束。"
             else:
                 final_message = f"'{task_name}' 已被用户手动中止。"
+                if chain_task:
+                    task_manager.set_task_stop_reason(chain_task, task_metrics.STOP_REASON_USER)
         
         logger.info(f"--- {final_message} ---")
         task_manager.update_status_from_thread(100, final_message)
-        
-        # 确保在任务链结束后，清除停止信号，以免影响下一个手动任务
-        processor.clear_stop_signal()
+
+def _run_chain_subtask(processor: MediaProcessor, chain_task: Optional[Dict[str, Any]], node: Dict[str, Any]):
+    """
+    在任务链线程池中执行一个子任务：先占用子任务自己的资源，执行结束后释放。
+    可抢占的子任务在检查点让位给更高优先级的任务时，释放资源并重新等待，之后从检查点继续执行。
+    """
+    if not chain_task:
+        _run_chain_subtask_body(processor, None, node)
+        return
+    while True:
+        if not task_manager.acquire_subtask_resources(chain_task, node["key"], node["function"], node["resources"]):
+            task_manager.set_subtask_state(chain_task, node["key"], 'skipped', "任务链已停止，未执行")
+            return
+        try:
+            _run_chain_subtask_body(processor, chain_task, node)
+            return
+        except TaskPreempted:
+            logger.info(f"  -> 子任务 '{node['description']}' 已让位给更高优先级的任务，稍后从检查点继续。")
+        finally:
+            task_manager.release_subtask_resources(chain_task, node["key"])
+
+def _run_chain_subtask_body(processor: MediaProcessor, chain_task: Optional[Dict[str, Any]], node: Dict[str, Any]):
+    """执行子任务函数，进度写入任务链对应的子任务状态。"""
+    description = node["description"]
+    context = task_manager.subtask_context(chain_task, node["key"], task_key=node["function"].__name__) if chain_task else contextlib.nullcontext()
+    with context:
+        try:
+            # 所有子任务函数（如 task_run_full_scan）的第一个参数都是 processor
+            node["function"](processor)
+            time.sleep(1)
+            if processor.is_stop_requested() and chain_task:
+                task_manager.set_subtask_state(chain_task, node["key"], 'stopped', "已中断")
+        except InterruptedError:
+            logger.info(f"子任务 '{description}' 响应停止信号，已中断。")
+            if chain_task:
+                task_manager.set_subtask_state(chain_task, node["key"], 'stopped', "已中断")
+        except Exception as e:
+            logger.error(f"任务链中的子任务 '{description}' 执行失败: {e}", exc_info=True)
+            if chain_task:
+                task_manager.set_subtask_state(chain_task, node["key"], 'failed', f"执行失败: {e}")
+
 # --- 任务注册表 ---
 def get_task_registry(context: str = 'all'):
     """
@@ -1517,6 +1586,66 @@ def get_task_registry(context: str = 'all'):
         for key, info in full_registry.items()
     }
 
+# --- 任务链依赖 ---
+# 任务Key: 需要先完成的任务Key。只有两者都在同一条任务链中时才生效，依赖失败或中断不阻止后续任务。
+# 子任务的资源类别来自各任务函数的 @task_manager.task_profile 声明，资源有交集的子任务按配置顺序串行。
+CHAIN_TASK_DEPENDENCIES = {
+    'enrich-aliases': ('sync-person-map',),
+    'actor-cleanup': ('sync-person-map',),
+    'full-scan': ('sync-person-map', 'enrich-aliases'),
+    'populate-metadata': ('full-scan',),
+    'purge-ghost-actors': ('full-scan', 'actor-cleanup'),
+    'custom-collections': ('populate-metadata',),
+    'update-resubscribe-cache': ('populate-metadata',),
+    'resubscribe-library': ('update-resubscribe-cache',),
+    'auto-subscribe': ('refresh-collections', 'custom-collections', 'process-watchlist', 'actor-tracking'),
+    'generate-custom-collection-covers': ('custom-collections',),
+}
+
+def _plan_chain(task_sequence: list) -> List[Dict[str, Any]]:
+    """
+    把任务序列排成有向无环图，返回按执行顺序排列的节点列表，每个节点的 after 为必须先完成的任务Key。
+    1. 按声明的依赖做稳定拓扑排序（同等条件下保持配置顺序）；
+    2. 在排序结果中，与前面任务资源冲突的任务依赖于它们，所有边都指向后面，因此不会成环。
+    """
+    registry = get_task_registry()
+    nodes = {}
+    for task_key in task_sequence:
+        if task_key in nodes:
+            continue
+        task_info = registry.get(task_key)
+        if not task_info:
+            logger.error(f"任务链警告：在注册表中未找到任务 '{task_key}'，已跳过。")
+            continue
+        task_function, task_description, processor_type = task_info
+        nodes[task_key] = {
+            "key": task_key,
+            "function": task_function,
+            "description": task_description,
+            "resources": task_manager.resolve_task_profile(task_function, processor_type)[1],
+        }
+
+    declared = {key: {dep for dep in CHAIN_TASK_DEPENDENCIES.get(key, ()) if dep in nodes} for key in nodes}
+    ordered, remaining = [], list(nodes)
+    while remaining:
+        ready = next((key for key in remaining if declared[key] <= set(ordered)), None)
+        if ready is None:
+            logger.warning(f"任务链依赖存在循环 ({', '.join(remaining)})，这些任务按配置顺序执行。")
+            ordered.extend(remaining)
+            break
+        ordered.append(ready)
+        remaining.remove(ready)
+
+    plan = []
+    for index, key in enumerate(ordered):
+        node = nodes[key]
+        earlier = ordered[:index]
+        node["after"] = {dep for dep in declared[key] if dep in earlier} | {
+            other for other in earlier if task_manager.resources_conflict(node["resources"], nodes[other]["resources"])
+        }
+        plan.append(node)
+    return plan
+
 # ★★★ 用于统一处理自定义合集的角标逻辑 ★★★
 def _get_cover_badge_text_for_collection(collection_db_info: Dict[str, Any]) -> Any:
     """
@@ -1547,16 +1676,275 @@ def _get_cover_badge_text_for_collection(collection_db_info: Dict[str, Any]) ->
     # 如果不是榜单类型，或者榜单类型不匹配任何特殊规则，则返回数字角标
     return item_count_to_pass
 
+# --- 为自建合集生成封面（使用最新的数据库记录计算角标） ---
+def _generate_cover_for_custom_collection(processor: MediaProcessor, cover_service: CoverGeneratorService, collection_id: int, collection_name: str, emby_collection_id: str, item_types: List[str]):
+    logger.info(f"  -> 正在为合集 '{collection_name}' 生成封面...")
+    library_info = emby_handler.get_emby_item_details(emby_collection_id, processor.emby_url, processor.emby_api_key, processor.emby_user_id)
+    if not library_info:
+        logger.warning(f"无法获取 Emby 合集 {emby_collection_id} 的详情，跳过封面生成。")
+        return
+    # 使用刚刚更新过的最新数据库记录（包含 in_library_count）计算角标
+    latest_collection_info = db_handler.get_custom_collection_by_id(collection_id)
+    item_count_to_pass = _get_cover_badge_text_for_collection(latest_collection_info)
+    
+    cover_service.generate_for_library(
+        emby_server_id='main_emby',
+        library=library_info,
+        item_count=item_count_to_pass,
+        content_types=item_types
+    )
+
+# --- 榜单源未变化时的轻量刷新：只复查缺失/未上映项目的入库状态 ---
+def _refresh_unchanged_list_collection(
+    processor: MediaProcessor,
+    collection: Dict[str, Any],
+    tmdb_to_emby_item_map: Dict[str, Any],
+    cover_service: Optional[CoverGeneratorService]
+) -> Optional[bool]:
+    """
+    榜单源指纹未变化时调用：跳过标题匹配和 Emby 合集重建，
+    只检查上次记录中非“已入库”的项目现在是否已入库，并把新入库的项目追加到 Emby 合集。
+    指纹有有效期（见 ListImporter.is_fingerprint_expired），上次留下未匹配标题的榜单在重试间隔后重新完整匹配。
+    返回 True/False 表示处理结果；返回 None 表示无法轻量处理（有新入库项目但 Emby 合集尚不存在），需要完整同步。
+    """
+    collection_id = collection['id']
+    collection_name = collection['name']
+    emby_collection_id = collection.get('emby_collection_id')
+    media_list = [dict(m) for m in (collection.get('generated_media_info_json') or [])]
+    today_str = datetime.now().strftime('%Y-%m-%d')
+
+    newly_in_library_ids = []
+    for media in media_list:
+        if media.get('status') == 'in_library':
+            continue
+        emby_item = tmdb_to_emby_item_map.get(str(media.get('tmdb_id')))
+        if emby_item:
+            media['status'] = 'in_library'
+            media['emby_id'] = emby_item.get('Id')
+            newly_in_library_ids.append(emby_item.get('Id'))
+        elif media.get('status') == 'unreleased' and media.get('release_date') and media['release_date'] <= today_str:
+            media['status'] = 'missing'
+
+    if newly_in_library_ids and not emby_collection_id:
+        return None
+
+    try:
+        if newly_in_library_ids:
+            logger.info(f"  -> 合集 '{collection_name}' 有 {len(newly_in_library_ids)} 个缺失项目已入库，正在追加到Emby合集...")
+            if not emby_handler.add_items_to_collection(emby_collection_id, newly_in_library_ids, processor.emby_url, processor.emby_api_key):
+                raise RuntimeError("向Emby合集追加新入库项目失败。")
+
+        missing_count = sum(1 for m in media_list if m.get('status') == 'missing')
+        db_handler.update_custom_collection_after_sync(collection_id, {
+            "health_status": "has_missing" if missing_count else "ok",
+            "in_library_count": sum(1 for m in media_list if m.get('status') == 'in_library'),
+            "missing_count": missing_count,
+            "generated_media_info_json": json.dumps(media_list, ensure_ascii=False),
+            "last_synced_at": datetime.now(pytz.utc)
+        })
+        logger.info(f"  -> ✅ 合集 '{collection_name}' 榜单未变化，已完成缺失项复查（新入库 {len(newly_in_library_ids)} 个）。")
+
+        # 只有入库数量变化时才需要刷新封面角标
+        if cover_service and emby_collection_id and newly_in_library_ids:
+            item_types = collection['definition_json'].get('item_type', ['Movie'])
+            _generate_cover_for_custom_collection(processor, cover_service, collection_id, collection_name, emby_collection_id, item_types)
+        return True
+    except Exception as e:
+        logger.error(f"复查合集 '{collection_name}' (ID: {collection_id}) 的缺失项时发生错误: {e}", exc_info=True)
+        return False
+
+# --- 批量同步中处理单个自定义合集（供线程池并发调用） ---
+def _sync_one_custom_collection(
+    processor: MediaProcessor,
+    collection: Dict[str, Any],
+    tmdb_to_emby_item_map: Dict[str, Any],
+    prefetched_collection_map: Dict[str, Any],
+    cover_service: Optional[CoverGeneratorService],
+    source_cache
+) -> bool:
+    """
+    处理单个合集：获取榜单/执行筛选 -> 在 Emby 中创建/更新合集 -> 分析健康度 -> 生成封面。
+    各合集之间互不依赖，因此可以在线程池中并发执行。
+    返回 True 表示处理成功。
+    """
+    collection_id = collection['id']
+    collection_name = collection['name']
+    collection_type = collection['type']
+    definition = collection['definition_json']
+
+    try:
+        item_types_for_collection = definition.get('item_type', ['Movie'])
+        tmdb_items = []
+        source_type = 'filter' # 默认
+
+        source_fingerprint = None
+        if collection_type == 'list':
+            url = definition.get('url', '')
+            previous_fingerprint = collection.get('source_fingerprint') if collection.get('generated_media_info_json') else None
+            importer = ListImporter(processor.tmdb_api_key, source_cache=source_cache)
+            if url.startswith('maoyan://'):
+                source_type = 'list_maoyan'
+                tmdb_items = importer._execute_maoyan_fetch(definition)
+                source_fingerprint = importer.compute_source_fingerprint(definition, tmdb_items)
+                source_unchanged = importer.is_same_fingerprint(previous_fingerprint, source_fingerprint)
+                # 猫眼榜单每次获取时都已完成匹配
+                importer.mark_matched(source_fingerprint)
+            else:
+                tmdb_items, source_type = importer.process(definition, previous_fingerprint=previous_fingerprint)
+                source_fingerprint = importer.source_fingerprint
+                source_unchanged = importer.source_unchanged
+
+            # ★★★ 条件刷新：榜单内容未变化时，不再重建 Emby 合集，只复查缺失项的入库状态 ★★★
+            if source_unchanged:
+                refreshed = _refresh_unchanged_list_collection(processor, collection, tmdb_to_emby_item_map, cover_service)
+                if refreshed is not None:
+                    return refreshed
+                logger.info(f"  -> 合集 '{collection_name}' 有新入库项目但尚未在Emby中创建，转为完整同步。")
+                importer = ListImporter(processor.tmdb_api_key, source_cache=source_cache)
+                if not url.startswith('maoyan://'):
+                    tmdb_items, source_type = importer.process(definition)
+                    source_fingerprint = importer.source_fingerprint
+        elif collection_type == 'filter':
+            engine = FilterEngine()
+            tmdb_items = engine.execute_filter(definition)
+        
+        if not tmdb_items:
+            logger.warning(f"合集 '{collection_name}' 未能生成任何媒体ID，跳过。")
+            db_handler.update_custom_collection_after_sync(collection_id, {"emby_collection_id": None, "generated_media_info_json": "[]", "generated_emby_ids_json": "[]"})
+            return True
+
+        ordered_emby_ids_in_library = [
+            tmdb_to_emby_item_map[item['id']]['Id'] 
+            for item in tmdb_items if item['id'] in tmdb_to_emby_item_map
+        ]
+
+        emby_collection_id = None # 先初始化为 None
+        if not ordered_emby_ids_in_library:
+            logger.warning(f"榜单 '{collection_name}' 解析成功，但在您的媒体库中未找到任何匹配项目。将只更新数据库，不创建Emby合集。")
+        else:
+            emby_collection_id = emby_handler.create_or_update_collection_with_emby_ids(
+                collection_name=collection_name, 
+                emby_ids_in_library=ordered_emby_ids_in_library, 
+                base_url=processor.emby_url,
+                api_key=processor.emby_api_key, 
+                user_id=processor.emby_user_id,
+                prefetched_collection_map=prefetched_collection_map
+            )
+            if not emby_collection_id:
+                raise RuntimeError("在Emby中创建或更新合集失败，请检查Emby日志。")
+        
+        update_data = {
+            "emby_collection_id": emby_collection_id,
+            "item_type": json.dumps(definition.get('item_type', ['Movie'])),
+            "last_synced_at": datetime.now(pytz.utc)
+        }
+        if source_fingerprint:
+            update_data["source_fingerprint"] = json.dumps(source_fingerprint, ensure_ascii=False)
+
+        if collection_type == 'list':
+            previous_media_map = {}
+            try:
+                previous_media_list = collection.get('generated_media_info_json') or []
+                previous_media_map = {str(m.get('tmdb_id')): m for m in previous_media_list}
+            except TypeError:
+                logger.warning(f"解析合集 {collection_name} 的旧媒体JSON失败...")
+            
+            image_tag = None
+            if emby_collection_id:
+                emby_collection_details = emby_handler.get_emby_item_details(emby_collection_id, processor.emby_url, processor.emby_api_key, processor.emby_user_id)
+                image_tag = (emby_collection_details or {}).get("ImageTags", {}).get("Primary")
+            
+            all_media_details_unordered = []
+            with task_context.ContextThreadPoolExecutor(max_workers=5) as executor:
+                future_to_item = {executor.submit(tmdb_handler.get_movie_details if item['type'] != 'Series' else tmdb_handler.get_tv_details_tmdb, item['id'], processor.tmdb_api_key): item for item in tmdb_items}
+                for future in as_completed(future_to_item):
+                    try:
+                        detail = future.result()
+                        if detail: all_media_details_unordered.append(detail)
+                    except Exception as exc:
+                        logger.error(f"获取TMDb详情时线程内出错: {exc}")
+            
+            details_map = {str(d.get("id")): d for d in all_media_details_unordered}
+            all_media_details_ordered = [details_map[item['id']] for item in tmdb_items if item['id'] in details_map]
+
+            tmdb_id_to_season_map = {str(item['id']): item.get('season') for item in tmdb_items if item.get('type') == 'Series' and item.get('season') is not None}
+            all_media_with_status, has_missing, missing_count = [], False, 0
+            today_str = datetime.now().strftime('%Y-%m-%d')
+            
+            for media in all_media_details_ordered:
+                media_tmdb_id = str(media.get("id"))
+                emby_item = tmdb_to_emby_item_map.get(media_tmdb_id)
+                
+                release_date = media.get("release_date") or media.get("first_air_date", '')
+                media_status = "unknown"
+                if emby_item: media_status = "in_library"
+                elif previous_media_map.get(media_tmdb_id, {}).get('status') == 'subscribed': media_status = "subscribed"
+                elif release_date and release_date > today_str: media_status = "unreleased"
+                else: media_status, has_missing, missing_count = "missing", True, missing_count + 1
+                
+                final_media_item = {
+                    "tmdb_id": media_tmdb_id,
+                    "emby_id": emby_item.get('Id') if emby_item else None,
+                    "title": media.get("title") or media.get("name"),
+                    "release_date": release_date,
+                    "poster_path": media.get("poster_path"),
+                    "status": media_status
+                }
+
+                season_number = tmdb_id_to_season_map.get(media_tmdb_id)
+                if season_number is not None:
+                    final_media_item['season'] = season_number
+                    final_media_item['title'] = f"{final_media_item['title']} 第 {season_number} 季"
+                
+                all_media_with_status.append(final_media_item)
+
+            update_data.update({
+                "health_status": "has_missing" if has_missing else "ok",
+                "in_library_count": len(ordered_emby_ids_in_library),
+                "missing_count": missing_count,
+                "generated_media_info_json": json.dumps(all_media_with_status, ensure_ascii=False),
+                "poster_path": f"/Items/{emby_collection_id}/Images/Primary?tag={image_tag}" if image_tag and emby_collection_id else None
+            })
+        else: 
+            all_media_with_status = [
+                {
+                    'tmdb_id': item['id'],
+                    'emby_id': tmdb_to_emby_item_map.get(item['id'], {}).get('Id')
+                }
+                for item in tmdb_items
+            ]
+            update_data.update({
+                "health_status": "ok", 
+                "in_library_count": len(ordered_emby_ids_in_library),
+                "missing_count": 0, 
+                "generated_media_info_json": json.dumps(all_media_with_status, ensure_ascii=False), 
+                "poster_path": None
+            })
+        
+        db_handler.update_custom_collection_after_sync(collection_id, update_data)
+        logger.info(f"  -> ✅ 合集 '{collection_name}' 处理完成，并已更新数据库状态。")
+
+        if cover_service and emby_collection_id:
+            _generate_cover_for_custom_collection(processor, cover_service, collection_id, collection_name, emby_collection_id, item_types_for_collection)
+        return True
+    except Exception as e_coll:
+        logger.error(f"处理合集 '{collection_name}' (ID: {collection_id}) 时发生错误: {e_coll}", exc_info=True)
+        return False
+
 # ★★★ 一键生成所有合集的后台任务 ★★★
+@task_manager.task_profile(lane=task_manager.LANE_MAINTENANCE, resources=[task_manager.RESOURCE_COLLECTIONS])
 def task_process_all_custom_collections(processor: MediaProcessor):
     """
-    【V7 - 榜单类型识别 & 精确封面参数】
+    【V8 - 并发处理版】
+    - 各合集之间互不依赖，使用有界线程池并发处理，并发数由 custom_collection_max_workers 控制。
+    - 所有 worker 共享 TMDb 限流器、Emby 会话以及预加载的媒体/合集映射。
+    - 同一个榜单源 URL 在一次任务内只抓取一次。
+    - 按合集汇报进度与耗时。
     """
     task_name = "生成所有自建合集"
     logger.trace(f"--- 开始执行 '{task_name}' 任务 ---")
 
     try:
-        # ... (前面的代码都不变，直到 for 循环) ...
         task_manager.update_status_from_thread(0, "正在获取所有启用的合集定义...")
         active_collections = db_handler.get_all_active_custom_collections()
         if not active_collections:
@@ -1591,179 +1979,56 @@ def task_process_all_custom_collections(processor: MediaProcessor):
         except Exception as e_cover_init:
             logger.error(f"初始化封面生成器时失败: {e_cover_init}", exc_info=True)
 
+        # ★★★ 相同源 URL 的合集共享一次抓取结果 ★★★
+        source_cache = SourceFetchCache()
+        max_workers = max(1, int(processor.config.get(constants.CONFIG_OPTION_CUSTOM_COLLECTION_MAX_WORKERS, constants.DEFAULT_CUSTOM_COLLECTION_MAX_WORKERS) or 1))
+        logger.info(f"  -> 将使用 {max_workers} 个并发 worker 处理合集。")
 
-        for i, collection in enumerate(active_collections):
+        def _timed_worker(collection: Dict[str, Any]):
             if processor.is_stop_requested():
-                logger.warning("任务被用户中止。")
-                break
+                return None
+            start_time = time.time()
+            success = _sync_one_custom_collection(
+                processor, collection, tmdb_to_emby_item_map, prefetched_collection_map, cover_service, source_cache
+            )
+            return success, time.time() - start_time
 
-            collection_id = collection['id']
-            collection_name = collection['name']
-            collection_type = collection['type']
-            definition = collection['definition_json']
-            
-            progress = 10 + int((i / total) * 90)
-            task_manager.update_status_from_thread(progress, f"({i+1}/{total}) 正在处理: {collection_name}")
+        task_start_time = time.time()
+        processed_count, failed_count = 0, 0
+        executor = task_context.ContextThreadPoolExecutor(max_workers=max_workers)
+        try:
+            future_to_collection = {executor.submit(_timed_worker, coll): coll for coll in active_collections}
+            for future in as_completed(future_to_collection):
+                collection = future_to_collection[future]
+                if future.cancelled():
+                    continue
+                processed_count += 1
+                try:
+                    outcome = future.result()
+                except Exception as exc:
+                    logger.error(f"处理合集 '{collection['name']}' 时线程内出错: {exc}", exc_info=True)
+                    outcome = (False, 0.0)
 
-            try:
-                item_types_for_collection = definition.get('item_type', ['Movie'])
-                tmdb_items = []
-                source_type = 'filter' # 默认
-
-                if collection_type == 'list':
-                    url = definition.get('url', '')
-                    if url.startswith('maoyan://'):
-                        source_type = 'list_maoyan'
-                        importer = ListImporter(processor.tmdb_api_key)
-                        greenlet = gevent.spawn(importer._execute_maoyan_fetch, definition)
-                        tmdb_items = greenlet.get()
-                    else:
-                        importer = ListImporter(processor.tmdb_api_key)
-                        tmdb_items, source_type = importer.process(definition)
-                elif collection_type == 'filter':
-                    engine = FilterEngine()
-                    tmdb_items = engine.execute_filter(definition)
-                
-                # ... (后续代码直到封面生成部分) ...
-                if not tmdb_items:
-                    logger.warning(f"合集 '{collection_name}' 未能生成任何媒体ID，跳过。")
-                    db_handler.update_custom_collection_after_sync(collection_id, {"emby_collection_id": None, "generated_media_info_json": "[]", "generated_emby_ids_json": "[]"})
+                if outcome is None:
                     continue
+                success, elapsed = outcome
+                if not success: failed_count += 1
+                status_icon = "✅" if success else "❌"
+                logger.info(f"  -> {status_icon} ({processed_count}/{total}) 合集 '{collection['name']}' 耗时 {elapsed:.1f} 秒。")
 
-                ordered_emby_ids_in_library = [
-                    tmdb_to_emby_item_map[item['id']]['Id'] 
-                    for item in tmdb_items if item['id'] in tmdb_to_emby_item_map
-                ]
+                progress = 10 + int((processed_count / total) * 90)
+                task_manager.update_status_from_thread(progress, f"({processed_count}/{total}) 已完成: {collection['name']} ({elapsed:.1f}秒)")
 
-                emby_collection_id = None # 先初始化为 None
-                if not ordered_emby_ids_in_library:
-                    logger.warning(f"榜单 '{collection_name}' 解析成功，但在您的媒体库中未找到任何匹配项目。将只更新数据库，不创建Emby合集。")
-                else:
-                    emby_collection_id = emby_handler.create_or_update_collection_with_emby_ids(
-                        collection_name=collection_name, 
-                        emby_ids_in_library=ordered_emby_ids_in_library, 
-                        base_url=processor.emby_url,
-                        api_key=processor.emby_api_key, 
-                        user_id=processor.emby_user_id,
-                        prefetched_collection_map=prefetched_collection_map
-                    )
-                    if not emby_collection_id:
-                        raise RuntimeError("在Emby中创建或更新合集失败，请检查Emby日志。")
-                
-                update_data = {
-                    "emby_collection_id": emby_collection_id,
-                    "item_type": json.dumps(definition.get('item_type', ['Movie'])),
-                    "last_synced_at": datetime.now(pytz.utc)
-                }
+                if processor.is_stop_requested():
+                    logger.warning("任务被用户中止，正在取消尚未开始的合集...")
+                    for pending in future_to_collection:
+                        pending.cancel()
+        finally:
+            executor.shutdown(wait=True)
 
-                if collection_type == 'list':
-                    # ... (这部分健康度检查逻辑不变) ...
-                    previous_media_map = {}
-                    try:
-                        previous_media_list = collection.get('generated_media_info_json') or []
-                        previous_media_map = {str(m.get('tmdb_id')): m for m in previous_media_list}
-                    except TypeError:
-                        logger.warning(f"解析合集 {collection_name} 的旧媒体JSON失败...")
-                    
-                    image_tag = None
-                    if emby_collection_id:
-                        emby_collection_details = emby_handler.get_emby_item_details(emby_collection_id, processor.emby_url, processor.emby_api_key, processor.emby_user_id)
-                        image_tag = emby_collection_details.get("ImageTags", {}).get("Primary")
-                    
-                    all_media_details_unordered = []
-                    with ThreadPoolExecutor(max_workers=5) as executor:
-                        future_to_item = {executor.submit(tmdb_handler.get_movie_details if item['type'] != 'Series' else tmdb_handler.get_tv_details_tmdb, item['id'], processor.tmdb_api_key): item for item in tmdb_items}
-                        for future in as_completed(future_to_item):
-                            try:
-                                detail = future.result()
-                                if detail: all_media_details_unordered.append(detail)
-                            except Exception as exc:
-                                logger.error(f"获取TMDb详情时线程内出错: {exc}")
-                    
-                    details_map = {str(d.get("id")): d for d in all_media_details_unordered}
-                    all_media_details_ordered = [details_map[item['id']] for item in tmdb_items if item['id'] in details_map]
+        total_elapsed = time.time() - task_start_time
+        logger.info(f"  -> 合集批量处理结束：共 {total} 个，失败 {failed_count} 个，总耗时 {total_elapsed:.1f} 秒。")
 
-                    tmdb_id_to_season_map = {str(item['id']): item.get('season') for item in tmdb_items if item.get('type') == 'Series' and item.get('season') is not None}
-                    all_media_with_status, has_missing, missing_count = [], False, 0
-                    today_str = datetime.now().strftime('%Y-%m-%d')
-                    
-                    for media in all_media_details_ordered:
-                        media_tmdb_id = str(media.get("id"))
-                        emby_item = tmdb_to_emby_item_map.get(media_tmdb_id)
-                        
-                        release_date = media.get("release_date") or media.get("first_air_date", '')
-                        media_status = "unknown"
-                        if emby_item: media_status = "in_library"
-                        elif previous_media_map.get(media_tmdb_id, {}).get('status') == 'subscribed': media_status = "subscribed"
-                        elif release_date and release_date > today_str: media_status = "unreleased"
-                        else: media_status, has_missing, missing_count = "missing", True, missing_count + 1
-                        
-                        final_media_item = {
-                            "tmdb_id": media_tmdb_id,
-                            "emby_id": emby_item.get('Id') if emby_item else None,
-                            "title": media.get("title") or media.get("name"),
-                            "release_date": release_date,
-                            "poster_path": media.get("poster_path"),
-                            "status": media_status
-                        }
-
-                        season_number = tmdb_id_to_season_map.get(media_tmdb_id)
-                        if season_number is not None:
-                            final_media_item['season'] = season_number
-                            final_media_item['title'] = f"{final_media_item['title']} 第 {season_number} 季"
-                        
-                        all_media_with_status.append(final_media_item)
-
-                    update_data.update({
-                        "health_status": "has_missing" if has_missing else "ok",
-                        "in_library_count": len(ordered_emby_ids_in_library),
-                        "missing_count": missing_count,
-                        "generated_media_info_json": json.dumps(all_media_with_status, ensure_ascii=False),
-                        "poster_path": f"/Items/{emby_collection_id}/Images/Primary?tag={image_tag}" if image_tag and emby_collection_id else None
-                    })
-                else: 
-                    all_media_with_status = [
-                        {
-                            'tmdb_id': item['id'],
-                            'emby_id': tmdb_to_emby_item_map.get(item['id'], {}).get('Id')
-                        }
-                        for item in tmdb_items
-                    ]
-                    update_data.update({
-                        "health_status": "ok", 
-                        "in_library_count": len(ordered_emby_ids_in_library),
-                        "missing_count": 0, 
-                        "generated_media_info_json": json.dumps(all_media_with_status, ensure_ascii=False), 
-                        "poster_path": None
-                    })
-                
-                db_handler.update_custom_collection_after_sync(collection_id, update_data)
-                logger.info(f"  -> ✅ 合集 '{collection_name}' 处理完成，并已更新数据库状态。")
-
-                if cover_service and emby_collection_id:
-                    logger.info(f"  -> 正在为合集 '{collection_name}' 生成封面...")
-                    # 1. 获取最新的 Emby 合集详情
-                    library_info = emby_handler.get_emby_item_details(emby_collection_id, processor.emby_url, processor.emby_api_key, processor.emby_user_id)
-                    if library_info:
-                        # 2. 准备封面生成器需要的其他参数
-                        item_types_for_collection = definition.get('item_type', ['Movie'])
-                        
-                        # 3. 将数据库中最新的合集信息（包含in_library_count）传递给辅助函数
-                        #    我们使用 db_handler 重新获取一次，确保拿到的是刚刚更新过的最新数据
-                        latest_collection_info = db_handler.get_custom_collection_by_id(collection_id)
-                        item_count_to_pass = _get_cover_badge_text_for_collection(latest_collection_info)
-                        
-                        # 4. 调用封面生成服务
-                        cover_service.generate_for_library(
-                            emby_server_id='main_emby',
-                            library=library_info,
-                            item_count=item_count_to_pass, # <-- 使用计算好的角标参数
-                            content_types=item_types_for_collection
-                        )
-            except Exception as e_coll:
-                logger.error(f"处理合集 '{collection_name}' (ID: {collection_id}) 时发生错误: {e_coll}", exc_info=True)
-                continue
-        
         final_message = "所有启用的自定义合集均已处理完毕！"
         if processor.is_stop_requested(): final_message = "任务已中止。"
         
@@ -1776,6 +2041,7 @@ def task_process_all_custom_collections(processor: MediaProcessor):
 
 
 # --- 处理单个自定义合集的核心任务 ---
+@task_manager.task_profile(lane=task_manager.LANE_MAINTENANCE, resources=[task_manager.RESOURCE_COLLECTIONS])
 def task_process_custom_collection(processor: MediaProcessor, custom_collection_id: int):
     """
     【V12 - 榜单类型识别 & 精确封面参数】
@@ -1797,19 +2063,22 @@ def task_process_custom_collection(processor: MediaProcessor, custom_collection_
         
         tmdb_items = []
         source_type = 'filter' # 默认
+        source_fingerprint = None
 
         if collection_type == 'list':
             url = definition.get('url', '')
             if url.startswith('maoyan://'):
                 source_type = 'list_maoyan'
-                logger.info(f"检测到猫眼榜单 '{collection_name}'，将启动异步后台任务...")
-                task_manager.update_status_from_thread(10, f"正在后台获取猫眼榜单: {collection_name}...")
+                logger.info(f"检测到猫眼榜单 '{collection_name}'，开始获取...")
+                task_manager.update_status_from_thread(10, f"正在获取猫眼榜单: {collection_name}...")
                 importer = ListImporter(processor.tmdb_api_key)
-                greenlet = gevent.spawn(importer._execute_maoyan_fetch, definition)
-                tmdb_items = greenlet.get()
+                tmdb_items = importer._execute_maoyan_fetch(definition)
+                source_fingerprint = importer.compute_source_fingerprint(definition, tmdb_items)
+                importer.mark_matched(source_fingerprint)
             else:
                 importer = ListImporter(processor.tmdb_api_key)
                 tmdb_items, source_type = importer.process(definition)
+                source_fingerprint = importer.source_fingerprint
         elif collection_type == 'filter':
             engine = FilterEngine()
             tmdb_items = engine.execute_filter(definition)
@@ -1847,6 +2116,8 @@ def task_process_custom_collection(processor: MediaProcessor, custom_collection_
             "item_type": json.dumps(item_types_for_collection),
             "last_synced_at": datetime.now(pytz.utc)
         }
+        if source_fingerprint:
+            update_data["source_fingerprint"] = json.dumps(source_fingerprint, ensure_ascii=False)
 
         if collection_type == 'list':
             # ... (这部分健康度检查逻辑不变) ...
@@ -1865,7 +2136,7 @@ def task_process_custom_collection(processor: MediaProcessor, custom_collection_
                 image_tag = emby_collection_details.get("ImageTags", {}).get("Primary")
             
             all_media_details_unordered = []
-            with ThreadPoolExecutor(max_workers=5) as executor:
+            with task_context.ContextThreadPoolExecutor(max_workers=5) as executor:
                 future_to_item = {executor.submit(tmdb_handler.get_movie_details if item['type'] != 'Series' else tmdb_handler.get_tv_details_tmdb, item['id'], processor.tmdb_api_key): item for item in tmdb_items}
                 for future in as_completed(future_to_item):
                     try:
@@ -1963,6 +2234,8 @@ def task_process_custom_collection(processor: MediaProcessor, custom_collection_
         task_manager.update_status_from_thread(-1, f"任务失败: {e}")
 
 # ★★★ 轻量级的元数据缓存填充任务 ★★★
+@task_manager.task_profile(lane=task_manager.LANE_MAINTENANCE, resources=[task_manager.RESOURCE_METADATA_CACHE],
+                           priority=task_manager.PRIORITY_LOW, preemptible=True)
 def task_populate_metadata_cache(processor: 'MediaProcessor', batch_size: int = 50, force_full_update: bool = False):
     """
     【V4 - 增量与全量同步版】
@@ -1970,6 +2243,7 @@ def task_populate_metadata_cache(processor: 'MediaProcessor', batch_size: int =
     - 快速模式: 只同步 Emby 中新增的、本地数据库不存在的媒体项。
     - 深度模式: 强制同步 Emby 媒体库中的所有媒体项，覆盖本地数据。
     - 保留了高效的分批处理、并发获取和带 SAVEPOINT 的健壮数据库写入机制。
+    - 每个批次写库后保存检查点 (按 TMDb ID 排序后的游标)，中断或让位后从下一个批次继续。
     """
     task_name = "同步媒体元数据"
     sync_mode = "深度同步 (全量)" if force_full_update else "快速同步 (增量)"
@@ -2045,28 +2319,37 @@ def task_populate_metadata_cache(processor: 'MediaProcessor', batch_size: int =
             logger.info("任务在冗余数据清理后被中止。")
             return
 
-        items_to_process = [emby_items_map[tmdb_id] for tmdb_id in ids_to_process]
-        
-        total_to_process = len(items_to_process)
-        if total_to_process == 0:
+        # 按 TMDb ID 排序，保证检查点游标在多次运行之间含义一致
+        checkpoint = TaskCheckpoint(f"populate_metadata_cache:{'full' if force_full_update else 'quick'}")
+        sorted_ids = sorted(ids_to_process)
+        processed_count = 0
+        if checkpoint.resumed:
+            sorted_ids = [tmdb_id for tmdb_id in sorted_ids if tmdb_id > str(checkpoint.cursor)]
+            processed_count = checkpoint.stats.get("processed", 0)
+            logger.info(f"  -> 从检查点继续：上次已处理 {processed_count} 项，本次剩余 {len(sorted_ids)} 项。")
+        items_to_process = [emby_items_map[tmdb_id] for tmdb_id in sorted_ids]
+        
+        remaining_count = len(items_to_process)
+        total_to_process = processed_count + remaining_count
+        if remaining_count == 0:
+            checkpoint.clear()
             task_manager.update_status_from_thread(100, "数据库已是最新，无需同步。")
             return
 
-        logger.info(f"  -> 总共需要处理 {total_to_process} 项，将分 { (total_to_process + batch_size - 1) // batch_size } 个批次。")
+        logger.info(f"  -> 总共需要处理 {remaining_count} 项，将分 { (remaining_count + batch_size - 1) // batch_size } 个批次。")
 
         # ======================================================================
         # 步骤 2: 分批循环处理需要新增/更新的媒体项
         # ======================================================================
         
-        processed_count = 0
-        for i in range(0, total_to_process, batch_size):
+        for i in range(0, remaining_count, batch_size):
             if processor.is_stop_requested():
                 logger.info("任务在批次处理前被中止。")
                 break
 
             batch_items = items_to_process[i:i + batch_size]
             batch_number = (i // batch_size) + 1
-            total_batches = (total_to_process + batch_size - 1) // batch_size
+            total_batches = (remaining_count + batch_size - 1) // batch_size
             
             logger.info(f"--- 开始处理批次 {batch_number}/{total_batches} (包含 {len(batch_items)} 个项目) ---")
             task_manager.update_status_from_thread(
@@ -2095,7 +2378,7 @@ def task_populate_metadata_cache(processor: 'MediaProcessor', batch_size: int =
                     details = tmdb_handler.get_tv_details_tmdb(tmdb_id, processor.tmdb_api_key)
                 return tmdb_id, details
 
-            with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
+            with task_context.ContextThreadPoolExecutor(max_workers=5) as executor:
                 future_to_tmdb_id = {executor.submit(fetch_tmdb_details, item): item.get("ProviderIds", {}).get("Tmdb") for item in batch_items}
                 for future in concurrent.futures.as_completed(future_to_tmdb_id):
                     if processor.is_stop_requested():
@@ -2217,10 +2500,15 @@ def task_populate_metadata_cache(processor: 'MediaProcessor', batch_size: int =
                 logger.info(f"--- 批次 {batch_number}/{total_batches} 已成功写入数据库。---")
             
             processed_count += len(batch_items)
+            task_metrics.record_items(len(metadata_batch))
+            if not processor.is_stop_requested():
+                checkpoint.boundary(batch_items[-1]["ProviderIds"]["Tmdb"], {"processed": processed_count})
 
         final_message = f"同步完成！本次处理 {processed_count}/{total_to_process} 项, 删除 {len(items_to_delete_tmdb_ids)} 项。"
         if processor.is_stop_requested():
-            final_message = "任务已中止，部分数据可能未处理。"
+            final_message = "任务已中止，已完成的批次已记录检查点，下次从中断处继续。"
+        else:
+            checkpoint.clear()
         task_manager.update_status_from_thread(100, final_message)
         logger.trace(f"--- '{task_name}' 任务成功完成 ---")
 
@@ -2229,9 +2517,11 @@ def task_populate_metadata_cache(processor: 'MediaProcessor', batch_size: int =
         task_manager.update_status_from_thread(-1, f"任务失败: {e}")
 
 # ★★★ 立即生成所有媒体库封面的后台任务 ★★★
-def task_generate_all_covers(processor: MediaProcessor):
+@task_manager.task_profile(lane=task_manager.LANE_MAINTENANCE, resources=[task_manager.RESOURCE_COVERS])
+def task_generate_all_covers(processor: MediaProcessor, force: bool = False):
     """
     后台任务：为所有（未被忽略的）媒体库生成封面。
+    force=True（前端手动触发时）忽略渲染指纹，全部重新生成；任务链中运行时只重新生成输入有变化的封面。
     """
     task_name = "一键生成所有媒体库封面"
     logger.trace(f"--- 开始执行 '{task_name}' 任务 ---")
@@ -2284,7 +2574,7 @@ def task_generate_all_covers(processor: MediaProcessor):
             
         logger.info(f"  -> 将为 {total} 个媒体库生成封面: {[lib['Name'] for lib in libraries_to_process]}")
         
-        # 4. 实例化服务并循环处理
+        # 4. 实例化服务并批量处理
         cover_service = CoverGeneratorService(config=cover_config)
         
         TYPE_MAP = {
@@ -2296,13 +2586,8 @@ def task_generate_all_covers(processor: MediaProcessor):
             'audiobooks': 'AudioBook'  # <-- 增加有声读物的映射
         }
 
-        for i, library in enumerate(libraries_to_process):
-            if processor.is_stop_requested(): break
-            
-            progress = 10 + int((i / total) * 90)
-            task_manager.update_status_from_thread(progress, f"({i+1}/{total}) 正在处理: {library.get('Name')}")
-            
-            try:
+        def _build_library_target(library):
+            def _resolve():
                 library_id = library.get('Id')
                 collection_type = library.get('CollectionType')
                 item_type_to_query = None # 先重置
@@ -2328,15 +2613,20 @@ def task_generate_all_covers(processor: MediaProcessor):
                         parent_id=library_id,
                         item_type=item_type_to_query
                     ) or 0
-
-                cover_service.generate_for_library(
-                    emby_server_id='main_emby', # 这里的 server_id 只是一个占位符，不影响忽略逻辑
-                    library=library,
-                    item_count=item_count
-                )
-            except Exception as e_gen:
-                logger.error(f"为媒体库 '{library.get('Name')}' 生成封面时发生错误: {e_gen}", exc_info=True)
-                continue
+                return {'library': library, 'item_count': item_count}
+            return {'name': library.get('Name'), 'resolve': _resolve}
+
+        # ★★★ 并行生成：下载/上传走 I/O 线程池，渲染走进程池 ★★★
+        def _on_cover_done(done_count, total_count, name):
+            progress = 10 + int((done_count / total_count) * 90)
+            task_manager.update_status_from_thread(progress, f"({done_count}/{total_count}) 已处理: {name}")
+
+        cover_service.generate_for_libraries(
+            [_build_library_target(library) for library in libraries_to_process],
+            progress_callback=_on_cover_done,
+            stop_check=processor.is_stop_requested,
+            force=force
+        )
         
         final_message = "所有媒体库封面已处理完毕！"
         if processor.is_stop_requested(): final_message = "任务已中止。"
@@ -2347,9 +2637,11 @@ def task_generate_all_covers(processor: MediaProcessor):
         task_manager.update_status_from_thread(-1, f"任务失败: {e}")
 
 # ★★★ 只为所有自建合集生成封面的后台任务 ★★★
-def task_generate_all_custom_collection_covers(processor: MediaProcessor):
+@task_manager.task_profile(lane=task_manager.LANE_MAINTENANCE, resources=[task_manager.RESOURCE_COVERS])
+def task_generate_all_custom_collection_covers(processor: MediaProcessor, force: bool = False):
     """
     后台任务：为所有已启用、且已在Emby中创建的自定义合集生成封面。
+    force=True（前端手动触发时）忽略渲染指纹，全部重新生成。
     """
     task_name = "一键生成所有自建合集封面"
     logger.trace(f"--- 开始执行 '{task_name}' 任务 ---")
@@ -2380,23 +2672,18 @@ def task_generate_all_custom_collection_covers(processor: MediaProcessor):
         # 4. 实例化服务并循环处理
         cover_service = CoverGeneratorService(config=cover_config)
         
-        for i, collection_db_info in enumerate(collections_to_process):
-            if processor.is_stop_requested(): break
-            
+        def _build_collection_target(collection_db_info):
             collection_name = collection_db_info.get('name')
             emby_collection_id = collection_db_info.get('emby_collection_id')
-            
-            progress = 10 + int((i / total) * 90)
-            task_manager.update_status_from_thread(progress, f"({i+1}/{total}) 正在处理: {collection_name}")
-            
-            try:
+
+            def _resolve():
                 # a. 获取完整的Emby合集详情，这是封面生成器需要的
                 emby_collection_details = emby_handler.get_emby_item_details(
                     emby_collection_id, processor.emby_url, processor.emby_api_key, processor.emby_user_id
                 )
                 if not emby_collection_details:
                     logger.warning(f"无法获取合集 '{collection_name}' (Emby ID: {emby_collection_id}) 的详情，跳过。")
-                    continue
+                    return None
 
                 # 1. 从数据库记录中获取合集定义
                 definition = collection_db_info.get('definition_json', {})
@@ -2404,17 +2691,20 @@ def task_generate_all_custom_collection_covers(processor: MediaProcessor):
 
                 # 2. 直接将当前循环中的合集信息传递给辅助函数
                 item_count_to_pass = _get_cover_badge_text_for_collection(collection_db_info)
-
-                # 3. 调用封面生成服务
-                cover_service.generate_for_library(
-                    emby_server_id='main_emby',
-                    library=emby_collection_details,
-                    item_count=item_count_to_pass, # <-- 使用计算好的角标参数
-                    content_types=content_types
-                )
-            except Exception as e_gen:
-                logger.error(f"为自建合集 '{collection_name}' 生成封面时发生错误: {e_gen}", exc_info=True)
-                continue
+                return {'library': emby_collection_details, 'item_count': item_count_to_pass, 'content_types': content_types}
+            return {'name': collection_name, 'resolve': _resolve}
+
+        # ★★★ 并行生成：下载/上传走 I/O 线程池，渲染走进程池 ★★★
+        def _on_cover_done(done_count, total_count, name):
+            progress = 10 + int((done_count / total_count) * 90)
+            task_manager.update_status_from_thread(progress, f"({done_count}/{total_count}) 已处理: {name}")
+
+        cover_service.generate_for_libraries(
+            [_build_collection_target(c) for c in collections_to_process],
+            progress_callback=_on_cover_done,
+            stop_check=processor.is_stop_requested,
+            force=force
+        )
         
         final_message = "所有自建合集封面已处理完毕！"
         if processor.is_stop_requested(): final_message = "任务已中止。"
@@ -2690,6 +2980,7 @@ def _item_needs_resubscribe(item_details: dict, config: dict, media_metadata: Op
         return False, ""
 
 # ★★★ 精准批量订阅的后台任务 ★★★
+@task_manager.task_profile(lane=task_manager.LANE_MAINTENANCE, resources=[task_manager.RESOURCE_RESUBSCRIBE])
 def task_resubscribe_batch(processor: MediaProcessor, item_ids: List[str]):
     """【精准批量版】后台任务：只订阅列表中指定的一批媒体项。"""
     task_name = "批量媒体洗版"
@@ -2779,6 +3070,7 @@ def task_resubscribe_batch(processor: MediaProcessor, item_ids: List[str]):
         logger.error(f"执行 '{task_name}' 任务时发生严重错误: {e}", exc_info=True)
         task_manager.update_status_from_thread(-1, f"任务失败: {e}")
 
+@task_manager.task_profile(lane=task_manager.LANE_MAINTENANCE, resources=[task_manager.RESOURCE_RESUBSCRIBE])
 def task_resubscribe_library(processor: MediaProcessor):
     """ 后台任务：订阅成功后，根据规则删除或更新缓存。"""
     task_name = "媒体洗版"
@@ -2870,6 +3162,7 @@ def task_resubscribe_library(processor: MediaProcessor):
         task_manager.update_status_from_thread(-1, f"任务失败: {e}")
 
 # ★★★ 精准批量删除的后台任务 ★★★
+@task_manager.task_profile(lane=task_manager.LANE_MAINTENANCE, resources=[task_manager.RESOURCE_RESUBSCRIBE, task_manager.RESOURCE_METADATA_CACHE])
 def task_delete_batch(processor: MediaProcessor, item_ids: List[str]):
     """【精准批量版】后台任务：只删除列表中指定的一批媒体项。"""
     task_name = "批量删除媒体"
@@ -2918,10 +3211,13 @@ def task_delete_batch(processor: MediaProcessor, item_ids: List[str]):
         logger.error(f"执行 '{task_name}' 任务时发生严重错误: {e}", exc_info=True)
         task_manager.update_status_from_thread(-1, f"任务失败: {e}")
 
+@task_manager.task_profile(lane=task_manager.LANE_MAINTENANCE, resources=[task_manager.RESOURCE_RESUBSCRIBE],
+                           priority=task_manager.PRIORITY_LOW, preemptible=True)
 def task_update_resubscribe_cache(processor: MediaProcessor):
     """
     【V-Final Pro - 架构恢复最终版】
     - 恢复了简洁的函数结构，所有业务逻辑都通过调用正确的全局辅助函数完成。
+    - 按项目ID排序后分块分析，每块写入缓存表并保存检查点，中断或让位后从下一块继续。
     """
     task_name = "刷新洗版状态 (架构恢复最终版)"
     logger.info(f"--- 开始执行 '{task_name}' 任务 ---")
@@ -2953,9 +3249,18 @@ def task_update_resubscribe_cache(processor: MediaProcessor):
             task_manager.update_status_from_thread(100, "任务完成：在目标媒体库中未找到任何项目。")
             return
 
-        logger.info(f"  -> 将为 {total} 个媒体项目获取详情并按规则检查洗版状态...")
-        cache_update_batch = []
+        checkpoint = TaskCheckpoint("update_resubscribe_cache")
+        all_items_base_info.sort(key=lambda item: str(item.get('Id')))
         processed_count = 0
+        written_count = 0
+        if checkpoint.resumed:
+            all_items_base_info = [item for item in all_items_base_info if str(item.get('Id')) > str(checkpoint.cursor)]
+            processed_count = checkpoint.stats.get("processed", 0)
+            written_count = checkpoint.stats.get("written", 0)
+            total = processed_count + len(all_items_base_info)
+            logger.info(f"  -> 从检查点继续：上次已分析 {processed_count} 项，本次剩余 {len(all_items_base_info)} 项。")
+
+        logger.info(f"  -> 将为 {len(all_items_base_info)} 个媒体项目获取详情并按规则检查洗版状态...")
         library_to_rule_map = {}
         for rule in reversed(all_enabled_rules):
             target_libs = rule.get('target_library_ids')
@@ -3050,25 +3355,38 @@ def task_update_resubscribe_cache(processor: MediaProcessor):
                 logger.error(f"处理项目 '{item_name}' (ID: {item_id}) 时线程内发生错误: {e}", exc_info=True)
                 return None
 
-        with ThreadPoolExecutor(max_workers=10) as executor:
-            future_to_item = {executor.submit(process_item_for_cache, item): item for item in all_items_base_info}
-            for future in as_completed(future_to_item):
+        CHUNK_SIZE = 200
+        with task_context.ContextThreadPoolExecutor(max_workers=10) as executor:
+            for chunk_start in range(0, len(all_items_base_info), CHUNK_SIZE):
                 if processor.is_stop_requested(): break
-                result = future.result()
-                if result: cache_update_batch.append(result)
-                processed_count += 1
-                progress = int(20 + (processed_count / (total or 1)) * 80)
-                task_manager.update_status_from_thread(progress, f"({processed_count}/{total}) 正在分析: {future_to_item[future].get('Name')}")
+                chunk = all_items_base_info[chunk_start:chunk_start + CHUNK_SIZE]
+                cache_update_batch = []
+                future_to_item = {executor.submit(process_item_for_cache, item): item for item in chunk}
+                for future in as_completed(future_to_item):
+                    if processor.is_stop_requested(): break
+                    result = future.result()
+                    if result: cache_update_batch.append(result)
+                    processed_count += 1
+                    task_metrics.record_items()
+                    progress = int(20 + (processed_count / (total or 1)) * 80)
+                    task_manager.update_status_from_thread(progress, f"({processed_count}/{total}) 正在分析: {future_to_item[future].get('Name')}")
+
+                if cache_update_batch:
+                    logger.info(f"  -> 本块分析完成，正在将 {len(cache_update_batch)} 条记录写入缓存表...")
+                    db_handler.upsert_resubscribe_cache_batch(cache_update_batch)
+                    written_count += len(cache_update_batch)
+                if processor.is_stop_requested(): break
+                checkpoint.boundary(chunk[-1].get('Id'), {"processed": processed_count, "written": written_count})
 
-        if cache_update_batch:
-            logger.info(f"分析完成，正在将 {len(cache_update_batch)} 条记录写入缓存表...")
-            db_handler.upsert_resubscribe_cache_batch(cache_update_batch)
-            
+        if written_count:
             task_manager.update_status_from_thread(99, "缓存写入完成，即将刷新...")
             time.sleep(1) # 给前端一点反应时间，确保信号被接收
 
         final_message = "媒体洗版状态刷新完成！"
-        if processor.is_stop_requested(): final_message = "任务已中止。"
+        if processor.is_stop_requested():
+            final_message = "任务已中止，已完成的部分已记录检查点，下次从中断处继续。"
+        else:
+            checkpoint.clear()
         task_manager.update_status_from_thread(100, final_message)
 
     except Exception as e:
@@ -3281,6 +3599,7 @@ def _determine_best_version_by_rules(versions: List[Dict[str, Any]]) -> Tuple[Li
     # 返回原始版本信息和最佳ID
     return versions, best_version_id
 
+@task_manager.task_profile(lane=task_manager.LANE_MAINTENANCE, resources=[task_manager.RESOURCE_CLEANUP])
 def task_scan_for_cleanup_issues(processor: MediaProcessor):
     """
     【V15 - 特效支持版】
@@ -3355,6 +3674,7 @@ def task_scan_for_cleanup_issues(processor: MediaProcessor):
         logger.error(f"执行 '{task_name}' 任务时发生严重错误: {e}", exc_info=True)
         task_manager.update_status_from_thread(-1, f"任务失败: {e}")
 
+@task_manager.task_profile(lane=task_manager.LANE_MAINTENANCE, resources=[task_manager.RESOURCE_ACTORS])
 def task_purge_ghost_actors(processor: MediaProcessor):
     """
     【高危 V4 - 增强日志版】
@@ -3490,6 +3810,7 @@ def task_purge_ghost_actors(processor: MediaProcessor):
         logger.error(f"执行 '{task_name}' 任务时发生严重错误: {e}", exc_info=True)
         task_manager.update_status_from_thread(-1, f"任务失败: {e}")
 
+@task_manager.task_profile(lane=task_manager.LANE_MAINTENANCE, resources=[task_manager.RESOURCE_CLEANUP])
 def task_execute_cleanup(processor: MediaProcessor, task_ids: List[int], **kwargs):
     """
     后台任务：执行指定的一批媒体去重任务（删除多余文件）。
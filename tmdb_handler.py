@@ -2,12 +2,18 @@
 
 import requests
 import json
+import re
+import threading
+import unicodedata
 import concurrent.futures
+from requests.adapters import HTTPAdapter
 from utils import contains_chinese, normalize_name_for_matching
 from typing import Optional, List, Dict, Any
 import logging
 import config_manager
 import constants
+import task_metrics
+import task_context
 logger = logging.getLogger(__name__)
 
 def get_tmdb_api_base_url() -> str:
@@ -43,6 +49,24 @@ def get_tmdb_image_url(image_path: str, size: str = "w300") -> str:
 DEFAULT_LANGUAGE = "zh-CN"
 DEFAULT_REGION = "CN"
 
+# ★★★ 共享会话 + 并发限流器 ★★★
+# 多个合集/任务并行时，所有 TMDb 请求复用同一个连接池，并限制同时在途的请求数，避免触发 TMDb 的速率限制。
+TMDB_MAX_CONCURRENT_REQUESTS = 8
+_tmdb_session = requests.Session()
+_tmdb_session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=TMDB_MAX_CONCURRENT_REQUESTS))
+_tmdb_session.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=TMDB_MAX_CONCURRENT_REQUESTS))
+_tmdb_session.hooks['response'].append(task_metrics.session_hook(task_metrics.API_TMDB))
+_tmdb_request_limiter = threading.BoundedSemaphore(TMDB_MAX_CONCURRENT_REQUESTS)
+
+# 记录当前线程内失败的请求数，用于区分“确实搜不到”和“网络/接口出错”，后者不能写入负缓存
+_tmdb_request_errors = threading.local()
+
+def _record_tmdb_request_error():
+    _tmdb_request_errors.count = getattr(_tmdb_request_errors, 'count', 0) + 1
+
+def _get_tmdb_request_error_count() -> int:
+    return getattr(_tmdb_request_errors, 'count', 0)
+
 
 def _tmdb_request(endpoint: str, api_key: str, params: Optional[Dict[str, Any]] = None, use_default_language: bool = True) -> Optional[Dict[str, Any]]:
     """【V2.1 - 最终驱魔版】增加了 use_default_language 开关，用于控制是否添加默认语言参数。"""
@@ -63,7 +87,8 @@ def _tmdb_request(endpoint: str, api_key: str, params: Optional[Dict[str, Any]]
 
     try:
         proxies = config_manager.get_proxies_for_requests()
-        response = requests.get(full_url, params=base_params, timeout=15, proxies=proxies)
+        with _tmdb_request_limiter:
+            response = _tmdb_session.get(full_url, params=base_params, timeout=15, proxies=proxies)
         response.raise_for_status()
         data = response.json()
         return data
@@ -75,11 +100,14 @@ def _tmdb_request(endpoint: str, api_key: str, params: Optional[Dict[str, Any]]
         except json.JSONDecodeError:
             error_details = str(e)
         logger.error(f"TMDb API HTTP Error: {e.response.status_code} - {error_details}. URL: {full_url}", exc_info=False)
+        _record_tmdb_request_error()
         return None
     except requests.exceptions.RequestException as e:
         logger.error(f"TMDb API Request Error: {e}. URL: {full_url}", exc_info=False)
+        _record_tmdb_request_error()
         return None
     except json.JSONDecodeError as e:
+        _record_tmdb_request_error()
         logger.error(f"TMDb API JSON Decode Error: {e}. URL: {full_url}. Response: {response.text[:200] if response else 'N/A'}", exc_info=False)
         return None
 # --- 获取电影的详细信息 ---
@@ -235,7 +263,7 @@ def aggregate_full_series_data_from_tmdb(
 
     # --- 步骤 3: 使用线程池并发执行所有任务 ---
     results = {}
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+    with task_context.ContextThreadPoolExecutor(max_workers=max_workers) as executor:
         # 使用字典来映射 future 和它的任务描述，方便后续处理
         future_to_task = {}
         for task in tasks:
@@ -411,6 +439,56 @@ def search_media(query: str, api_key: str, item_type: str = 'movie', year: Optio
         data = _tmdb_request(endpoint, api_key, params)
 
     return data.get("results") if data else None
+# --- 标题匹配结果的持久化缓存 ---
+TITLE_MATCH_CACHE_TTL_DAYS = 90          # 命中结果的有效期
+TITLE_MATCH_NEGATIVE_CACHE_TTL_DAYS = 7  # 未匹配结果（负缓存）的有效期，较短以便新片上架后能被搜到
+
+def normalize_title_for_match_cache(title: str) -> str:
+    """生成匹配缓存使用的规范化标题：全半角统一、去除空白和常见标点、转小写。"""
+    if not title:
+        return ""
+    title = unicodedata.normalize('NFKC', title)
+    return re.sub(r'[\s:：·\-*\'!！,，?？.。、]+', '', title).lower()
+
+def match_title_with_cache(title: str, item_type: str, year: Optional[str], match_func) -> Optional[Any]:
+    """
+    【榜单匹配缓存】按 (规范化标题, 年份, 类型) 查询持久化缓存，未命中时调用 match_func 执行真正的 TMDb 搜索。
+    - match_func 无参数，返回 (tmdb_id, matched_type) 或 None。
+    - 命中的结果和“确实搜不到”的结果都会被缓存；搜索过程中出现请求错误时不写入负缓存。
+    - 数据库不可用时自动退化为直接搜索。
+    """
+    normalized_title = normalize_title_for_match_cache(title)
+    year_key = str(year) if year else ""
+    if not normalized_title:
+        return match_func()
+
+    try:
+        import db_handler
+        cached = db_handler.get_tmdb_match_cache(
+            normalized_title, year_key, item_type,
+            TITLE_MATCH_CACHE_TTL_DAYS, TITLE_MATCH_NEGATIVE_CACHE_TTL_DAYS
+        )
+    except Exception as e:
+        logger.debug(f"读取标题匹配缓存失败，将直接搜索: {e}")
+        db_handler, cached = None, None
+
+    if cached is not None:
+        if cached.get('tmdb_id'):
+            logger.debug(f"  -> [匹配缓存] 命中: '{title}' ({item_type}, {year_key or '无年份'}) -> {cached['tmdb_id']}")
+            return str(cached['tmdb_id']), cached.get('matched_type') or item_type
+        logger.debug(f"  -> [匹配缓存] 负缓存命中: '{title}' ({item_type}, {year_key or '无年份'})，跳过搜索。")
+        return None
+
+    errors_before = _get_tmdb_request_error_count()
+    result = match_func()
+
+    if db_handler is not None:
+        if result:
+            db_handler.save_tmdb_match_cache(normalized_title, year_key, item_type, str(result[0]), result[1])
+        elif _get_tmdb_request_error_count() == errors_before:
+            db_handler.save_tmdb_match_cache(normalized_title, year_key, item_type, None, None)
+    return result
+
 # --- 搜索演员 ---
 def search_person_tmdb(query: str, api_key: str) -> Optional[List[Dict[str, Any]]]:
     """
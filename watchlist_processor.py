@@ -8,6 +8,7 @@ from typing import Optional, Dict, Any, List
 from datetime import datetime, timedelta, timezone
 import threading
 import db_handler
+import task_context
 from db_handler import get_db_connection as get_central_db_connection
 # 导入我们需要的辅助模块
 import moviepilot_handler
@@ -62,9 +63,9 @@ class WatchlistProcessor:
         logger.trace("WatchlistProcessor 初始化完成。")
 
     # --- 线程控制 ---
-    def signal_stop(self): self._stop_event.set()
-    def clear_stop_signal(self): self._stop_event.clear()
-    def is_stop_requested(self) -> bool: return self._stop_event.is_set()
+    def signal_stop(self): task_context.stop_event_or(self._stop_event).set()
+    def clear_stop_signal(self): task_context.stop_event_or(self._stop_event).clear()
+    def is_stop_requested(self) -> bool: return task_context.stop_event_or(self._stop_event).is_set()
     def close(self): logger.trace("WatchlistProcessor closed.")
 
     # --- 数据库和文件辅助方法 ---
@@ -156,7 +157,7 @@ class WatchlistProcessor:
                         
                         # 使用并发获取所有剧集
                         all_emby_series_items = []
-                        with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
+                        with task_context.ContextThreadPoolExecutor(max_workers=5) as executor:
                             future_to_library = {
                                 executor.submit(emby_handler.get_emby_library_items, 
                                                 self.emby_url, self.emby_api_key, "Series", self.emby_user_id, [lib_id]): lib_id
@@ -234,7 +235,7 @@ class WatchlistProcessor:
                     return f"处理失败: {e}"
 
             # ★★★ 核心改造：使用5个并发的线程池 ★★★
-            with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
+            with task_context.ContextThreadPoolExecutor(max_workers=5) as executor:
                 # 创建一个 future 到 series 的映射，方便后续获取信息
                 future_to_series = {executor.submit(worker_process_series, series): series for series in active_series}
                 
@@ -5,7 +5,7 @@ import os
 import sys
 import shutil
 import threading
-from datetime import datetime, timezone # Added timezone for image.update
+from datetime import datetime, timezone, timedelta # Added timezone for image.update
 from jinja2 import Environment, FileSystemLoader
 from actor_sync_handler import UnifiedSyncHandler
 from db_handler import ActorDBManager
@@ -28,6 +28,8 @@ from datetime import datetime
 import requests
 import tmdb_handler
 import task_manager
+import webhook_queue
+from services.cover_generator.cover_queue import cover_job_queue
 from douban import DoubanApi
 from tasks import get_task_registry 
 from typing import Optional, Dict, Any, List, Tuple, Union # 确保 List 被导入
@@ -105,6 +107,122 @@ UPDATE_DEBOUNCE_TIMERS = {}
 UPDATE_DEBOUNCE_LOCK = threading.Lock()
 UPDATE_DEBOUNCE_TIME = 15 # 秒，等待事件风暴结束
 
+# --- Webhook 防抖 (状态持久化到 webhook_debounce_state 表，重启后由 initialize_processors 恢复) ---
+WEBHOOK_BATCH_DUE_AT = None
+
+def _process_batch_webhook_events():
+    """批量防抖到期：把收集到的新增/入库事件作为一个批量任务提交。"""
+    global WEBHOOK_BATCH_DEBOUNCER, WEBHOOK_BATCH_DUE_AT
+    with WEBHOOK_BATCH_LOCK:
+        items_to_process = list(dict.fromkeys(WEBHOOK_BATCH_QUEUE)) # 去重
+        WEBHOOK_BATCH_QUEUE.clear()
+        WEBHOOK_BATCH_DEBOUNCER = None # 重置 debouncer
+        WEBHOOK_BATCH_DUE_AT = None
+
+    if not items_to_process:
+        logger.debug("批量处理队列为空，无需处理。")
+        return
+
+    # 防抖状态由批量任务在把目标写入 Webhook 持久化队列后清除
+    logger.info(f"  -> 收集到 {len(items_to_process)} 个 Emby Webhook 新增/入库事件，提交为一个批量任务。")
+    if webhook_queue.enqueue_process_batch(items_to_process):
+        logger.info("  -> Webhook 批量任务已添加到后台任务队列。")
+    else:
+        logger.warning("  -> Webhook 批量任务提交失败：相同的批量任务已在排队或运行中。")
+
+def _add_to_webhook_batch(item_id: str, item_name: str, item_type: Optional[str], due_at: Optional[datetime] = None, persist: bool = True):
+    """把一个新增/入库事件加入批量队列；due_at 用于恢复时沿用原来的到期时间。"""
+    global WEBHOOK_BATCH_DEBOUNCER, WEBHOOK_BATCH_DUE_AT
+    now = datetime.now(timezone.utc)
+    with WEBHOOK_BATCH_LOCK:
+        WEBHOOK_BATCH_QUEUE.append((item_id, item_name, item_type))
+        if WEBHOOK_BATCH_DEBOUNCER is None or WEBHOOK_BATCH_DEBOUNCER.ready():
+            delay = WEBHOOK_BATCH_DEBOUNCE_TIME if due_at is None else max(0.0, (due_at - now).total_seconds())
+            logger.info(f"启动 Webhook 批量处理 debouncer，将在 {delay:.0f} 秒后执行。")
+            WEBHOOK_BATCH_DUE_AT = now + timedelta(seconds=delay)
+            WEBHOOK_BATCH_DEBOUNCER = spawn_later(delay, _process_batch_webhook_events)
+        batch_due_at = WEBHOOK_BATCH_DUE_AT
+    if persist:
+        db_handler.save_webhook_debounce_item(webhook_queue.DEBOUNCE_KIND_BATCH, item_id, item_name, item_type, None, batch_due_at)
+
+def _trigger_update_tasks(item_id, item_name, update_description, sync_timestamp_iso):
+    """
+    在防抖延迟结束后，将元数据和资源同步任务提交到 Webhook 持久化队列。
+    """
+    logger.info(f"防抖计时器到期，为 '{item_name}' (ID: {item_id}) 创建最终的同步任务。")
+    with UPDATE_DEBOUNCE_LOCK:
+        UPDATE_DEBOUNCE_TIMERS.pop(item_id, None)
+
+    # 任务1: 同步元数据到数据库缓存
+    webhook_queue.enqueue(item_id, webhook_queue.ACTION_METADATA_SYNC, item_name)
+
+    # 任务2: 同步媒体项到覆盖缓存
+    webhook_queue.enqueue(item_id, webhook_queue.ACTION_ASSET_SYNC, item_name, {
+        "update_description": update_description,
+        "sync_timestamp_iso": sync_timestamp_iso
+    })
+    db_handler.delete_webhook_debounce_items(webhook_queue.DEBOUNCE_KIND_UPDATE, [item_id])
+
+def _schedule_update_sync(item_id: str, item_name: str, update_description: str, sync_timestamp_iso: str,
+                          delay: float = UPDATE_DEBOUNCE_TIME, persist: bool = True):
+    """为 metadata/image update 事件设置（或重置）防抖计时器。"""
+    with UPDATE_DEBOUNCE_LOCK:
+        # 检查是否已有正在等待的计时器，如果有，取消它
+        old_timer = UPDATE_DEBOUNCE_TIMERS.get(item_id)
+        if old_timer:
+            old_timer.kill() # gevent 使用 kill() 来取消
+            logger.debug(f"已为 '{item_name}' 取消了旧的同步计时器，将以最新事件为准。")
+
+        logger.info(f"为 '{item_name}' 设置了 {delay:.0f} 秒的同步延迟，以合并连续的更新事件。")
+        UPDATE_DEBOUNCE_TIMERS[item_id] = spawn_later(
+            delay,
+            _trigger_update_tasks,
+            item_id=item_id,
+            item_name=item_name,
+            update_description=update_description,
+            sync_timestamp_iso=sync_timestamp_iso
+        )
+    if persist:
+        db_handler.save_webhook_debounce_item(
+            webhook_queue.DEBOUNCE_KIND_UPDATE, item_id, item_name, None,
+            {"update_description": update_description, "sync_timestamp_iso": sync_timestamp_iso},
+            datetime.now(timezone.utc) + timedelta(seconds=delay)
+        )
+
+def restore_webhook_debounce_state():
+    """
+    恢复重启前仍在防抖等待中的 Webhook 项目，沿用原来的到期时间（已过期的立即执行）。
+    重复调用是安全的：内存中已存在的项目不会重复加入。
+    """
+    rows = db_handler.get_webhook_debounce_items()
+    if not rows:
+        return
+    now = datetime.now(timezone.utc)
+    with WEBHOOK_BATCH_LOCK:
+        batched_ids = {entry[0] for entry in WEBHOOK_BATCH_QUEUE}
+    with UPDATE_DEBOUNCE_LOCK:
+        pending_update_ids = {item_id for item_id, timer in UPDATE_DEBOUNCE_TIMERS.items() if not timer.ready()}
+
+    restored = 0
+    for row in rows:
+        item_id = row['item_id']
+        item_name = row.get('item_name') or item_id
+        if row['kind'] == webhook_queue.DEBOUNCE_KIND_BATCH and item_id not in batched_ids:
+            _add_to_webhook_batch(item_id, item_name, row.get('item_type'), due_at=row['due_at'], persist=False)
+            restored += 1
+        elif row['kind'] == webhook_queue.DEBOUNCE_KIND_UPDATE and item_id not in pending_update_ids:
+            payload = row.get('payload_json') or {}
+            _schedule_update_sync(
+                item_id, item_name,
+                payload.get('update_description', 'Webhook Update'),
+                payload.get('sync_timestamp_iso') or now.isoformat(),
+                delay=max(0.0, (row['due_at'] - now).total_seconds()),
+                persist=False
+            )
+            restored += 1
+    if restored:
+        logger.info(f"已恢复 {restored} 个重启前处于防抖等待中的 Webhook 事件。")
+
 # --- 数据库辅助函数 ---
 def task_process_single_item(processor: MediaProcessor, item_id: str, force_reprocess: bool):
     """任务：处理单个媒体项"""
@@ -124,6 +242,7 @@ def save_config_and_reload(new_config: Dict[str, Any]):
         init_auth_from_blueprint()
         
         scheduler_manager.update_task_chain_job()
+        scheduler_manager.update_revival_check_job()
         
         logger.info("所有组件已根据新配置重新初始化完毕。")
         
@@ -187,6 +306,10 @@ def initialize_processors():
     extensions.actor_subscription_processor_instance = actor_subscription_processor_instance_local
     extensions.EMBY_SERVER_ID = server_id_local
 
+    # 恢复重启前未到期的 Webhook 防抖状态（需要处理器就绪后才能提交任务）
+    if media_processor_instance_local:
+        restore_webhook_debounce_state()
+
 # --- 生成Nginx配置 ---
 def ensure_nginx_config():
     """
@@ -278,13 +401,14 @@ def application_exit_handler():
     global media_processor_instance, task_worker_thread # 修正后的
     logger.info("应用程序正在退出 (atexit)，执行清理操作...")
 
-    # 1. 立刻通知当前正在运行的任务停止
-    if extensions.media_processor_instance: # 从 extensions 获取
-        logger.info("正在发送停止信号给当前任务...")
-        extensions.media_processor_instance.signal_stop()
+    # 1. 立刻通知所有正在运行的任务停止
+    logger.info("正在发送停止信号给当前任务...")
+    task_manager.stop_task()
 
     task_manager.clear_task_queue()
     task_manager.stop_task_worker()
+    cover_job_queue.clear()
+    cover_job_queue.stop()
 
     # 4. 关闭其他资源
     if extensions.media_processor_instance: # 从 extensions 获取
@@ -309,86 +433,6 @@ def emby_webhook():
     event_type = data.get("Event") if data else "未知事件"
     logger.info(f"收到Emby Webhook: {event_type}")
 
-    # --- 批量处理函数：处理队列中的所有新增/入库事件 (此函数不变) ---
-    def _process_batch_webhook_events():
-        # ... (这个函数的内部逻辑保持原样)
-        global WEBHOOK_BATCH_DEBOUNCER
-        with WEBHOOK_BATCH_LOCK:
-            items_to_process = list(set(WEBHOOK_BATCH_QUEUE)) # 去重
-            WEBHOOK_BATCH_QUEUE.clear()
-            WEBHOOK_BATCH_DEBOUNCER = None # 重置 debouncer
-
-        if not items_to_process:
-            logger.debug("批量处理队列为空，无需处理。")
-            return
-
-        logger.info(f"  -> 开始批量处理 {len(items_to_process)} 个 Emby Webhook 新增/入库事件。")
-        for item_id, item_name, item_type in items_to_process:
-            logger.info(f"  -> 批量处理中: '{item_name}'")
-            try:
-                id_to_process = item_id
-                if item_type == "Episode":
-                    series_id = emby_handler.get_series_id_from_child_id(
-                        item_id, extensions.media_processor_instance.emby_url,
-                        extensions.media_processor_instance.emby_api_key, extensions.media_processor_instance.emby_user_id, item_name=item_name
-                    )
-                    if not series_id:
-                        logger.warning(f"  -> 批量处理中，剧集 '{item_name}' 未找到所属剧集，跳过。")
-                        continue
-                    id_to_process = series_id
-                
-                full_item_details = emby_handler.get_emby_item_details(
-                    item_id=id_to_process, emby_server_url=extensions.media_processor_instance.emby_url,
-                    emby_api_key=extensions.media_processor_instance.emby_api_key, user_id=extensions.media_processor_instance.emby_user_id
-                )
-                if not full_item_details:
-                    logger.warning(f"  -> 批量处理中，无法获取 '{item_name}' 的详情，跳过。")
-                    continue
-                
-                final_item_name = full_item_details.get("Name", f"未知(ID:{id_to_process})")
-                if not full_item_details.get("ProviderIds", {}).get("Tmdb"):
-                    logger.warning(f"  -> 批量处理中，'{final_item_name}' 缺少 Tmdb ID，跳过。")
-                    continue
-                
-                task_manager.submit_task(
-                    webhook_processing_task,
-                    task_name=f"Webhook任务: {final_item_name}",
-                    processor_type='media',
-                    item_id=id_to_process,
-                    force_reprocess=True
-                )
-                logger.info(f"  -> 已将 '{final_item_name}' 添加到任务队列进行处理。")
-
-            except Exception as e:
-                logger.error(f"  -> 批量处理 '{item_name}' 时发生错误: {e}", exc_info=True)
-        logger.info("  -> 批量处理 Webhook任务 已添加到后台任务队列。")
-
-    # ★★★ 核心新增：这是防抖计时器到期后，真正执行任务的函数 ★★★
-    def _trigger_update_tasks(item_id, item_name, update_description, sync_timestamp_iso):
-        """
-        在防抖延迟结束后，将元数据和资源同步任务提交到队列。
-        """
-        logger.info(f"防抖计时器到期，为 '{item_name}' (ID: {item_id}) 创建最终的同步任务。")
-        
-        # 任务1: 同步元数据到数据库缓存
-        task_manager.submit_task(
-            task_sync_metadata_cache,
-            task_name=f"元数据缓存同步: {item_name}",
-            processor_type='media',
-            item_id=item_id,
-            item_name=item_name
-        )
-
-        # 任务2: 同步媒体项到覆盖缓存
-        task_manager.submit_task(
-            task_sync_assets,
-            task_name=f"覆盖缓存备份: {item_name}",
-            processor_type='media',
-            item_id=item_id,
-            update_description=update_description,
-            sync_timestamp_iso=sync_timestamp_iso
-        )
-
     # --- Webhook 事件分发逻辑 ---
     trigger_events = ["item.add", "library.new", "library.deleted", "metadata.update", "image.update"]
     if event_type not in trigger_events:
@@ -441,17 +485,8 @@ def emby_webhook():
     
     # --- 处理新增/入库事件 (使用批量处理, 逻辑不变) ---
     if event_type in ["item.add", "library.new"]:
-        global WEBHOOK_BATCH_DEBOUNCER
-        with WEBHOOK_BATCH_LOCK:
-            WEBHOOK_BATCH_QUEUE.append((original_item_id, original_item_name, original_item_type))
-            logger.debug(f"Webhook事件 '{event_type}' (项目: {original_item_name}) 已添加到批量队列。当前队列大小: {len(WEBHOOK_BATCH_QUEUE)}")
-            
-            if WEBHOOK_BATCH_DEBOUNCER is None or WEBHOOK_BATCH_DEBOUNCER.ready():
-                logger.info(f"启动 Webhook 批量处理 debouncer，将在 {WEBHOOK_BATCH_DEBOUNCE_TIME} 秒后执行。")
-                WEBHOOK_BATCH_DEBOUNCER = spawn_later(WEBHOOK_BATCH_DEBOUNCE_TIME, _process_batch_webhook_events)
-            else:
-                logger.debug("Webhook 批量处理 debouncer 正在运行中，事件已加入队列。")
-        
+        _add_to_webhook_batch(original_item_id, original_item_name, original_item_type)
+        logger.debug(f"Webhook事件 '{event_type}' (项目: {original_item_name}) 已添加到批量队列。")
         return jsonify({"status": "added_to_batch_queue", "item_id": original_item_id}), 202
 
     # ★★★ 核心修改：将 metadata.update 和 image.update 纳入防抖机制 ★★★
@@ -486,26 +521,7 @@ def emby_webhook():
                 name_for_task = full_series_details.get("Name", f"未知剧集(ID:{id_to_process})")
 
         # --- 防抖逻辑核心 ---
-        with UPDATE_DEBOUNCE_LOCK:
-            # 检查是否已有正在等待的计时器
-            if id_to_process in UPDATE_DEBOUNCE_TIMERS:
-                # 如果有，取消它
-                old_timer = UPDATE_DEBOUNCE_TIMERS[id_to_process]
-                old_timer.kill() # gevent 使用 kill() 来取消
-                logger.debug(f"已为 '{name_for_task}' 取消了旧的同步计时器，将以最新事件为准。")
-
-            # 创建一个新的计时器，延迟执行真正的任务提交函数
-            logger.info(f"为 '{name_for_task}' 设置了 {UPDATE_DEBOUNCE_TIME} 秒的同步延迟，以合并连续的更新事件。")
-            new_timer = spawn_later(
-                UPDATE_DEBOUNCE_TIME,
-                _trigger_update_tasks,
-                item_id=id_to_process,
-                item_name=name_for_task,
-                update_description=update_description,
-                sync_timestamp_iso=webhook_received_at_iso
-            )
-            # 存储新的计时器
-            UPDATE_DEBOUNCE_TIMERS[id_to_process] = new_timer
+        _schedule_update_sync(id_to_process, name_for_task, update_description, webhook_received_at_iso)
 
         return jsonify({"status": "update_task_debounced", "item_id": id_to_process}), 202
 
@@ -564,6 +580,8 @@ def main_app_start():
     init_auth_from_blueprint()
     initialize_processors()
     task_manager.start_task_worker_if_not_running()
+    webhook_queue.replay_pending()
+    webhook_queue.ensure_retry_worker()
     scheduler_manager.start()
     
     def run_proxy_server():
@@ -587,7 +605,8 @@ def main_app_start():
         def write(self, data): pass
         def flush(self): pass
 
-    main_server = WSGIServer(('0.0.0.0', main_app_port), app, log=NullLogger())
+    # 使用 WebSocketHandler 以支持前端事件推送 (/api/events/ws)
+    main_server = WSGIServer(('0.0.0.0', main_app_port), app, handler_class=WebSocketHandler, log=NullLogger())
     main_server.serve_forever()
 
 # ★★★ 核心修改 2: 新增的启动逻辑，用于处理命令行参数 ★★★
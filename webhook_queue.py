@@ -0,0 +1,337 @@
+# webhook_queue.py
+
+import hashlib
+import logging
+import threading
+import time
+from typing import Dict, Any, Optional, List, Tuple
+
+import constants
+import config_manager
+import db_handler
+import emby_handler
+import task_manager
+import task_metrics
+from core_processor import MediaProcessor
+
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# ✨ Webhook 持久化队列
+# ------------------------------------------------------------------------------
+# Webhook 产生的工作（新入库处理、元数据缓存同步、覆盖缓存备份）先写入 webhook_queue 表，
+# 再以高优先级提交到任务管理器：
+# - 按 (item_id, action) 去重，同一项目的重复事件只更新参数并递增 revision；
+# - 处理成功后才从表中删除；处理期间又来了新事件时 revision 不匹配，不删除并重新调度；
+# - 任务的去重键包含 revision；任务开始执行时重新读取队列中的最新 revision 和参数，
+#   排队期间收到的新事件不会被旧 revision 的任务重复处理（后到的任务发现项目已完成便跳过）；
+# - 处理失败的项目按指数退避 (RETRY_BASE_SECONDS * 2^(n-1)，最长 RETRY_MAX_SECONDS) 自动重试，
+#   连续失败 MAX_ATTEMPTS 次后移出队列；被中断或丢失的项目同样由重试线程定期重新提交；
+# - 程序重启后由 replay_pending() 把表中剩余的项目重新提交，不会因为重启而丢失。
+# - 新入库事件以批量任务处理 (enqueue_process_batch)：一次批量请求解析分集所属剧集、
+#   去重到唯一的剧集/电影，再批量获取详情并传给处理步骤，避免逐项重复请求。
+#   解析在提交前完成，批量任务按剧集/电影声明资源，同一剧集的批量任务和手动处理不会并发。
+# ==============================================================================
+
+ACTION_PROCESS = 'process'               # 新入库：完整处理
+ACTION_METADATA_SYNC = 'metadata_sync'   # 元数据更新：同步 media_metadata 缓存
+ACTION_ASSET_SYNC = 'asset_sync'         # 元数据/图片更新：同步覆盖缓存
+MAX_ATTEMPTS = 3
+RETRY_BASE_SECONDS = 60            # 第一次失败后的重试间隔，之后每次翻倍
+RETRY_MAX_SECONDS = 3600           # 重试间隔上限
+RETRY_SCAN_INTERVAL_SECONDS = 60   # 重试线程扫描到期项目的间隔
+STALE_ITEM_SECONDS = 600           # 从未失败但超过该时间仍未完成的项目视为丢失，重新提交
+RETRY_BATCH_LIMIT = 200            # 每次扫描最多重新提交的项目数
+
+# webhook_debounce_state 表中的防抖类型 (见 web_app 的 Webhook 防抖)
+DEBOUNCE_KIND_BATCH = 'batch'    # 新增/入库事件，等待批量处理
+DEBOUNCE_KIND_UPDATE = 'update'  # metadata/image update 事件，等待同步
+
+_ACTION_TASK_NAMES = {
+    ACTION_PROCESS: "Webhook任务",
+    ACTION_METADATA_SYNC: "元数据缓存同步",
+    ACTION_ASSET_SYNC: "覆盖缓存备份",
+}
+
+def _action_function(action: str):
+    # 延迟导入，避免与 tasks 的循环依赖
+    import tasks
+    return {
+        ACTION_PROCESS: tasks.webhook_processing_task,
+        ACTION_METADATA_SYNC: tasks.task_sync_metadata_cache,
+        ACTION_ASSET_SYNC: tasks.task_sync_assets,
+    }[action]
+
+def _action_kwargs(item_id: str, action: str, item_name: str, payload: Dict[str, Any], item_details: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    if action == ACTION_PROCESS:
+        return {"item_id": item_id, "force_reprocess": payload.get("force_reprocess", True), "item_details": item_details}
+    if action == ACTION_METADATA_SYNC:
+        return {"item_id": item_id, "item_name": item_name}
+    return {"item_id": item_id, "update_description": payload.get("update_description", "Webhook Update"),
+            "sync_timestamp_iso": payload.get("sync_timestamp_iso")}
+
+def _item_resources(kwargs: Dict[str, Any]) -> List[str]:
+    resources = [task_manager.item_resource(kwargs.get('item_id'))]
+    if kwargs.get('action') == ACTION_PROCESS:
+        # 完整处理会写入演员映射表
+        resources.append(task_manager.RESOURCE_ACTORS)
+    return resources
+
+@task_manager.task_profile(lane=task_manager.LANE_MEDIA, resources=_item_resources)
+def task_run_webhook_item(processor: MediaProcessor, item_id: str, action: str, item_name: str, payload: Dict[str, Any], revision: Optional[int]):
+    """任务：执行一个 Webhook 队列项目，成功后出队。"""
+    _execute_item(processor, item_id, action, item_name, payload, revision)
+
+def _execute_item(processor: MediaProcessor, item_id: str, action: str, item_name: str, payload: Dict[str, Any],
+                  revision: Optional[int], item_details: Optional[Dict[str, Any]] = None):
+    if revision is not None:
+        # 排队期间可能又收到了新事件（revision 已递增），或项目已被其它任务处理完
+        latest = db_handler.get_webhook_queue_item(item_id, action)
+        if not latest:
+            logger.debug(f"  -> Webhook 项目 '{item_name}' ({action}) 已处理完成，跳过。")
+            return
+        if latest['revision'] != revision:
+            revision = latest['revision']
+            item_name = latest.get('item_name') or item_name
+            payload = latest.get('payload_json') or payload
+    try:
+        _action_function(action)(processor, **_action_kwargs(item_id, action, item_name, payload, item_details))
+    except Exception as e:
+        if revision is not None:
+            attempts = db_handler.record_webhook_item_failure(item_id, action, MAX_ATTEMPTS, RETRY_BASE_SECONDS, RETRY_MAX_SECONDS)
+            if attempts >= MAX_ATTEMPTS:
+                logger.error(f"  -> Webhook 项目 '{item_name}' ({action}) 已连续失败 {attempts} 次，移出队列: {e}")
+            else:
+                logger.warning(f"  -> Webhook 项目 '{item_name}' ({action}) 处理失败 ({attempts}/{MAX_ATTEMPTS})，稍后将自动重试: {e}")
+        raise
+
+    if processor.is_stop_requested():
+        # 被中断的项目留在队列中，稍后由重试线程重新提交
+        if revision is not None:
+            db_handler.defer_webhook_item(item_id, action, revision, RETRY_BASE_SECONDS)
+        return
+    task_metrics.record_items()
+    if revision is None or db_handler.complete_webhook_item(item_id, action, revision):
+        return
+    latest = db_handler.get_webhook_queue_item(item_id, action)
+    if latest:
+        logger.info(f"  -> '{item_name}' 处理期间收到了新的 Webhook 事件，重新排队。")
+        _submit(latest['item_id'], action, latest.get('item_name') or item_name, latest.get('payload_json') or {}, latest['revision'])
+
+def _submit(item_id: str, action: str, item_name: str, payload: Dict[str, Any], revision: Optional[int]) -> bool:
+    return task_manager.submit_task(
+        task_run_webhook_item,
+        f"{_ACTION_TASK_NAMES[action]}: {item_name}",
+        'media',
+        priority=task_manager.PRIORITY_WEBHOOK,
+        # 去重键包含 revision：同一 revision 只排一个任务；新 revision 可以在旧任务仍在运行时排队
+        dedupe_key=f"webhook:{action}:{item_id}:{revision}",
+        item_id=item_id,
+        action=action,
+        item_name=item_name,
+        payload=payload,
+        revision=revision
+    )
+
+def enqueue(item_id: str, action: str, item_name: str, payload: Optional[Dict[str, Any]] = None) -> bool:
+    """持久化一个 Webhook 项目并提交处理。数据库不可用时仍直接提交（只是不具备重启恢复能力）。"""
+    payload = payload or {}
+    revision = db_handler.enqueue_webhook_item(item_id, action, item_name, payload)
+    if revision is None:
+        logger.warning(f"  -> '{item_name}' 未能写入 Webhook 持久化队列，将直接提交任务。")
+    if _submit(item_id, action, item_name, payload, revision):
+        return True
+    logger.debug(f"  -> '{item_name}' ({action}) 已在任务队列中，本次事件已合并。")
+    return False
+
+# --- 新入库批量处理 ---
+def _resolve_batch_targets(events: List[Tuple[str, str, Optional[str]]], base_url: str, api_key: str, user_id: str) -> Optional[Dict[str, str]]:
+    """
+    一次批量请求把新入库事件解析并去重到需处理的剧集/电影，返回 {目标ID: 名称}。
+    Emby 没有返回任何项目（通常是暂时不可用）时返回 None，由调用方稍后重试解析。
+    """
+    resolved = emby_handler.resolve_parent_series_ids([item_id for item_id, _, _ in events], base_url, api_key, user_id)
+    if not resolved:
+        return None
+    return _targets_from_resolved(events, resolved)
+
+def _targets_from_resolved(events: List[Tuple[str, str, Optional[str]]], resolved: Dict[str, Dict[str, Any]]) -> Dict[str, str]:
+    names = {item_id: name for item_id, name, _ in events}
+    targets: Dict[str, str] = {}
+    for item_id, _, _ in events:
+        info = resolved.get(item_id)
+        if not info:
+            logger.warning(f"  -> 批量处理中，无法定位 '{names.get(item_id, item_id)}' 的所属剧集或详情，跳过。")
+            # 重放时的遗留项目可能已被删除，移出持久化队列
+            stale = db_handler.get_webhook_queue_item(item_id, ACTION_PROCESS)
+            if stale:
+                db_handler.complete_webhook_item(item_id, ACTION_PROCESS, stale['revision'])
+            continue
+        targets.setdefault(info["id"], info.get("name") or names.get(item_id, item_id))
+    return targets
+
+def _batch_resources(kwargs: Dict[str, Any]) -> List[str]:
+    """
+    批量任务的资源：已解析的剧集/电影（与同一剧集的其它批量任务、手动重新处理互斥）；
+    提交时未能解析的，退回原始事件的项目ID。
+    """
+    targets = kwargs.get('targets')
+    if targets is not None:
+        resources = [task_manager.item_resource(target_id) for target_id in targets]
+    else:
+        resources = [task_manager.item_resource(event[0]) for event in kwargs.get('events') or []]
+    # 逐个执行 webhook_processing_task，会写入演员映射表
+    return resources + [task_manager.RESOURCE_ACTORS]
+
+@task_manager.task_profile(lane=task_manager.LANE_MEDIA, resources=_batch_resources)
+def task_run_webhook_batch(processor: MediaProcessor, events: List[Tuple[str, str, Optional[str]]], targets: Optional[Dict[str, str]] = None,
+                           retry: bool = False):
+    """
+    任务：批量处理一批新入库事件 [(项目ID, 名称, 类型), ...]。
+    1. 分集/季所属剧集通常已在提交时解析并去重为 targets（用于声明资源）；否则在这里解析；
+    2. 每个目标写入持久化队列；
+    3. 批量获取目标的完整详情，逐个处理并把详情传给 webhook_processing_task。
+    retry=True 表示由重放/失败重试提交：只处理仍在队列中的目标，不重新入队。
+    """
+    base_url, api_key, user_id = processor.emby_url, processor.emby_api_key, processor.emby_user_id
+
+    if targets is None:
+        # 任务中仍然一个都解析不到时，按全部无法定位处理（清理已删除项目的遗留队列项）
+        targets = _resolve_batch_targets(events, base_url, api_key, user_id)
+        if targets is None:
+            targets = _targets_from_resolved(events, {})
+    if not targets:
+        logger.info("  -> 本批 Webhook 事件没有需要处理的项目。")
+        db_handler.delete_webhook_debounce_items(DEBOUNCE_KIND_BATCH, [item_id for item_id, _, _ in events])
+        return
+    logger.info(f"  -> 本批 {len(events)} 个 Webhook 事件去重后共 {len(targets)} 个剧集/电影需要处理。")
+
+    if retry:
+        # 重试的事件本身就是队列中的目标：只处理仍在队列中的项目（已被其它任务完成的跳过），
+        # 不重新入队，保留已累计的失败次数
+        rows = {target_id: db_handler.get_webhook_queue_item(target_id, ACTION_PROCESS) for target_id in targets}
+        revisions = {target_id: row['revision'] for target_id, row in rows.items() if row}
+        targets = {target_id: name for target_id, name in targets.items() if target_id in revisions}
+        if not targets:
+            logger.debug("  -> 本批重试的 Webhook 项目均已处理完成。")
+            return
+    else:
+        revisions = {target_id: db_handler.enqueue_webhook_item(target_id, ACTION_PROCESS, name, {"force_reprocess": True})
+                     for target_id, name in targets.items()}
+    # 目标已写入持久化队列，原始事件的防抖状态可以清除
+    db_handler.delete_webhook_debounce_items(DEBOUNCE_KIND_BATCH, [item_id for item_id, _, _ in events])
+    details_by_id = {
+        item["Id"]: item
+        for item in emby_handler.get_emby_items_by_id(base_url, api_key, user_id, list(targets),
+                                                      fields=emby_handler.DEFAULT_ITEM_DETAIL_FIELDS + ",Type",
+                                                      person_fields=emby_handler.DEFAULT_PERSON_FIELDS)
+    }
+
+    total = len(targets)
+    for index, (target_id, name) in enumerate(targets.items()):
+        if processor.is_stop_requested():
+            logger.warning("  -> Webhook 批量任务被中止，剩余项目保留在持久化队列中。")
+            break
+        revision = revisions.get(target_id)
+        details = details_by_id.get(target_id)
+        final_name = (details or {}).get("Name") or name
+        task_manager.update_status_from_thread(int(index / total * 100), f"({index + 1}/{total}) 正在处理: {final_name}")
+        if details and not details.get("ProviderIds", {}).get("Tmdb"):
+            logger.warning(f"  -> 批量处理中，'{final_name}' 缺少 Tmdb ID，跳过。")
+            if revision is not None:
+                db_handler.complete_webhook_item(target_id, ACTION_PROCESS, revision)
+            continue
+        try:
+            _execute_item(processor, target_id, ACTION_PROCESS, final_name, {"force_reprocess": True}, revision, item_details=details)
+        except Exception as e:
+            logger.error(f"  -> 批量处理 '{final_name}' 时发生错误: {e}", exc_info=True)
+
+def enqueue_process_batch(events: List[Tuple[str, str, Optional[str]]], retry: bool = False) -> bool:
+    """提交一个新入库批量任务。events: [(项目ID, 名称, 类型), ...]，类型可为 None。"""
+    events = list(dict.fromkeys((str(item_id), name, item_type) for item_id, name, item_type in events))
+    if not events:
+        return False
+    # 提交前先解析所属剧集，任务才能按剧集声明资源
+    targets = None
+    try:
+        targets = _resolve_batch_targets(events, config_manager.APP_CONFIG.get(constants.CONFIG_OPTION_EMBY_SERVER_URL),
+                                         config_manager.APP_CONFIG.get(constants.CONFIG_OPTION_EMBY_API_KEY),
+                                         config_manager.APP_CONFIG.get(constants.CONFIG_OPTION_EMBY_USER_ID))
+    except Exception as e:
+        logger.warning(f"  -> 提交 Webhook 批量任务前解析所属剧集失败，将在任务中重新解析: {e}")
+    batch_key = hashlib.sha1(",".join(sorted(item_id for item_id, _, _ in events)).encode("utf-8")).hexdigest()[:12]
+    return task_manager.submit_task(
+        task_run_webhook_batch,
+        f"Webhook批量任务: {len(events)} 个项目",
+        'media',
+        priority=task_manager.PRIORITY_WEBHOOK,
+        dedupe_key=f"webhook:batch:{batch_key}",
+        events=events,
+        targets=targets,
+        retry=retry
+    )
+
+def backlog_size() -> int:
+    """
+    Webhook 积压的工作量：持久化队列中待处理（未失败、未在退避中）的项目和防抖等待中的事件，
+    加上排队/运行中的 Webhook 优先级任务。
+    两者可能有重叠，只用于判断 "是否空闲" 和日志展示。
+    """
+    return db_handler.count_webhook_backlog() + task_manager.count_active_tasks(task_manager.PRIORITY_WEBHOOK)
+
+def _resubmit_rows(rows: List[Dict[str, Any]], retry: bool) -> int:
+    """把队列中的项目重新提交，新入库项目合并为一个批量任务。返回提交数量。"""
+    submitted = 0
+    process_events = []
+    for row in rows:
+        if row['action'] not in _ACTION_TASK_NAMES:
+            logger.warning(f"Webhook 队列中存在未知动作 '{row['action']}' (项目: {row['item_id']})，已忽略。")
+            continue
+        if row['action'] == ACTION_PROCESS:
+            process_events.append((row['item_id'], row.get('item_name') or row['item_id'], None))
+            continue
+        if _submit(row['item_id'], row['action'], row.get('item_name') or row['item_id'], row.get('payload_json') or {}, row['revision']):
+            submitted += 1
+    if process_events and enqueue_process_batch(process_events, retry=retry):
+        submitted += len(process_events)
+    return submitted
+
+def replay_pending() -> int:
+    """启动时重新提交 webhook_queue 表中遗留的项目，返回提交数量。新入库项目合并为一个批量任务。"""
+    items = db_handler.get_webhook_queue_items()
+    if not items:
+        return 0
+    submitted = _resubmit_rows(items, retry=True)
+    logger.info(f"已从 Webhook 持久化队列恢复 {submitted} 个待处理项目。")
+    return submitted
+
+def retry_due_items() -> int:
+    """重新提交退避时间已到的失败/中断项目，以及长时间未完成的项目。返回提交数量。"""
+    rows = db_handler.get_due_webhook_queue_items(STALE_ITEM_SECONDS, RETRY_BATCH_LIMIT)
+    if not rows:
+        return 0
+    submitted = _resubmit_rows(rows, retry=True)
+    if submitted:
+        logger.info(f"  -> Webhook 持久化队列：重新提交了 {submitted} 个到期重试的项目。")
+    return submitted
+
+# --- 失败重试线程 ---
+_retry_worker: Optional[threading.Thread] = None
+_retry_worker_lock = threading.Lock()
+
+def _retry_worker_loop():
+    while True:
+        time.sleep(RETRY_SCAN_INTERVAL_SECONDS)
+        try:
+            retry_due_items()
+        except Exception as e:
+            logger.error(f"Webhook 重试线程发生错误: {e}", exc_info=True)
+
+def ensure_retry_worker():
+    """启动失败重试线程（幂等），在启动时重放遗留项目之后调用。"""
+    global _retry_worker
+    with _retry_worker_lock:
+        if _retry_worker and _retry_worker.is_alive():
+            return
+        _retry_worker = threading.Thread(target=_retry_worker_loop, name="WebhookRetryWorker", daemon=True)
+        _retry_worker.start()